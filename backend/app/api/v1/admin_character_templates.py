@@ -6,11 +6,13 @@ Created: 2025-06-03
 
 from typing import List, Optional, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Path
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, desc
+from sqlalchemy.orm import Session, contains_eager
+from sqlalchemy import and_, or_, func
 
 from app.core.database import get_db
 from app.core.dependencies import require_admin_user
+from app.core.pagination import paginate_keyset, get_total_count_cache
+from app.core.shared_state import TEMPLATE_CATALOG, get_invalidation_bus
 from app.models.user import User
 from app.models.character import Character, CharacterType, CharacterGender
 from app.models.character_template import (
@@ -24,6 +26,8 @@ from app.schemas.character_template import (
     TemplateStatusUpdateRequest, BatchTemplateStatusUpdateRequest,
     BatchTemplateStatusUpdateResponse, UsageExampleCreate, UsageExampleResponse
 )
+from app.services.template_suggestion_index import get_template_suggestion_index
+from app.services.template_stats import get_template_stats_snapshot
 
 router = APIRouter(prefix="/admin/character-templates", tags=["管理员-角色模板管理"])
 
@@ -78,6 +82,10 @@ async def create_character_template(
             db.flush()
         
         db.commit()
+        get_invalidation_bus().broadcast(TEMPLATE_CATALOG)
+        get_template_suggestion_index().upsert_template(
+            character, template_detail.usage_count if template_detail else 0
+        )
         
         # 构建响应数据
         template_dict = character.to_dict()
@@ -154,6 +162,8 @@ async def update_character_template(
                 db.add(template_detail)
         
         db.commit()
+        get_invalidation_bus().broadcast(TEMPLATE_CATALOG)
+        get_template_suggestion_index().upsert_template(character)
         
         # 构建响应数据
         template_dict = character.to_dict()
@@ -230,6 +240,8 @@ async def delete_character_template(
         # 删除角色（会级联删除相关数据）
         db.delete(character)
         db.commit()
+        get_invalidation_bus().broadcast(TEMPLATE_CATALOG)
+        get_template_suggestion_index().remove_template(template_id)
         
         return CharacterTemplateDeleteResponse(
             success=True,
@@ -258,6 +270,8 @@ async def get_admin_template_list(
     is_new: Optional[bool] = Query(None, description="是否新增"),
     sort_by: str = Query("created_at", description="排序字段"),
     sort_order: str = Query("desc", description="排序方向"),
+    cursor: Optional[str] = Query(None, description="分页游标（优先于页码）"),
+    include_total: bool = Query(True, description="是否返回总数"),
     db: Session = Depends(get_db),
     admin_user: User = Depends(require_admin_user)
 ):
@@ -274,6 +288,8 @@ async def get_admin_template_list(
         is_new: 是否新增
         sort_by: 排序字段
         sort_order: 排序方向
+        cursor: 分页游标
+        include_total: 是否返回总数
         db: 数据库会话
         admin_user: 管理员用户
         
@@ -281,11 +297,13 @@ async def get_admin_template_list(
         管理员模板列表
     """
     try:
-        # 构建查询
+        # 构建查询（模板详情随连接一并加载，避免逐行惰性查询）
         query = db.query(Character).join(
             CharacterTemplateDetail,
             Character.id == CharacterTemplateDetail.character_id,
             isouter=True
+        ).options(
+            contains_eager(Character.template_detail)
         ).filter(Character.is_template == True)
         
         # 应用搜索
@@ -312,21 +330,46 @@ async def get_admin_template_list(
         if is_new is not None:
             query = query.filter(CharacterTemplateDetail.is_new == is_new)
         
-        # 应用排序
+        # 确定排序列
         if sort_by in ["usage_count", "rating", "is_popular", "is_new"]:
             sort_column = getattr(CharacterTemplateDetail, sort_by)
         else:
-            sort_column = getattr(Character, sort_by if hasattr(Character, sort_by) else "created_at")
-        
-        if sort_order.lower() == "asc":
-            query = query.order_by(sort_column)
-        else:
-            query = query.order_by(desc(sort_column))
+            if sort_by not in Character.__table__.columns:
+                sort_by = "created_at"
+            sort_column = getattr(Character, sort_by)
+        descending = sort_order.lower() != "asc"
+        
+        # 获取总数（无关键词搜索时直接读取统计快照，否则使用缓存的计数）
+        total = None
+        if include_total:
+            if search:
+                cache_key = get_total_count_cache().make_key(
+                    "admin_templates", search, gender, character_type, is_popular, is_new
+                )
+                total = get_total_count_cache().get_total(
+                    cache_key, query, exact=not cursor and page == 1
+                )
+            else:
+                total = get_template_stats_snapshot().count_templates(
+                    db,
+                    gender=gender,
+                    character_type=character_type,
+                    is_popular=is_popular,
+                    is_new=is_new
+                )
         
-        # 获取总数并应用分页
-        total = query.count()
-        offset = (page - 1) * page_size
-        templates = query.offset(offset).limit(page_size).all()
+        # 应用游标分页
+        result = paginate_keyset(
+            query,
+            sort_column,
+            Character.id,
+            limit=page_size,
+            descending=descending,
+            cursor=cursor,
+            offset=(page - 1) * page_size,
+            signature=f"{sort_by}:{'desc' if descending else 'asc'}"
+        )
+        templates = result.items
         
         # 构建响应数据
         template_responses = []
@@ -352,16 +395,20 @@ async def get_admin_template_list(
             template_responses.append(CharacterTemplateResponse.model_validate(template_dict))
         
         # 计算总页数
-        total_pages = (total + page_size - 1) // page_size
+        total_pages = (total + page_size - 1) // page_size if total is not None else None
         
         return AdminTemplateListResponse(
             templates=template_responses,
             total=total,
             page=page,
             page_size=page_size,
-            total_pages=total_pages
+            total_pages=total_pages,
+            next_cursor=result.next_cursor,
+            has_more=result.has_more
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -418,6 +465,7 @@ async def update_template_status(
                 setattr(template_detail, field, value)
         
         db.commit()
+        get_invalidation_bus().broadcast(TEMPLATE_CATALOG)
         
         # 获取完整模板信息
         character = db.query(Character).filter(Character.id == template_id).first()
@@ -507,6 +555,7 @@ async def batch_update_template_status(
                 failed_count += 1
         
         db.commit()
+        get_invalidation_bus().broadcast(TEMPLATE_CATALOG)
         
         return BatchTemplateStatusUpdateResponse(
             success_count=success_count,
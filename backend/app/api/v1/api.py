@@ -23,7 +23,7 @@ async def api_health():
 
 # 导入路由模块
 from app.api.v1 import auth, novels, generation, demo, characters, outline, worldview, chapters, ai_configs, workspace
-from app.api.v1 import character_templates, character_template_interactions, admin_character_templates
+from app.api.v1 import character_templates, character_template_interactions, admin_character_templates, jobs
 
 # 包含认证路由
 api_router.include_router(
@@ -108,4 +108,11 @@ api_router.include_router(
     workspace.router,
     prefix="/workspace",
     tags=["工作台"]
+)
+
+# 包含后台任务路由
+api_router.include_router(
+    jobs.router,
+    prefix="/jobs",
+    tags=["后台任务"]
 )
\ No newline at end of file
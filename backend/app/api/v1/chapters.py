@@ -4,28 +4,36 @@ Author: AI Writer Team
 Created: 2025-06-01
 """
 
+import asyncio
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import desc, asc, and_, or_, func
+from sqlalchemy import and_, or_, func
 
+from app.core.cancellation import cancel_on_disconnect
 from app.core.database import get_db
 from app.core.dependencies import get_current_user
+from app.core.pagination import paginate_keyset, get_total_count_cache
+from app.core.responses import model_response
+from app.core.spans import span
 from app.models.user import User
 from app.models.novel import Novel
 from app.models.chapter import Chapter, ChapterStatus
-from app.models.character import Character
-from app.models.outline import DetailedOutline
-from app.models.worldview import Worldview
+from app.models.generation_job import GenerationJob, GenerationJobStatus
 from app.schemas.chapter import (
     ChapterCreate, ChapterUpdate, ChapterResponse, ChapterSummaryResponse,
     ChapterListResponse, ChapterGenerationRequest, ChapterGenerationResponse,
     ChapterFilterRequest, ChapterBatchRequest, ChapterBatchResponse,
-    ChapterStatsResponse
+    ChapterStatsResponse, ChapterBatchGenerationRequest, ChapterGenerationJobResponse
 )
 from app.services.generation_service import get_generation_service
 from app.services.prompt_service import get_prompt_service
+from app.services.chapter_context_index import get_chapter_context_index
+from app.services.generation_context import GenerationContextLoader
+from app.services.chapter_batch_service import BATCH_JOB_TYPE, batch_job_response, get_chapter_batch_generator
+from app.services.job_queue import get_job_queue
+from app.api.v1.jobs import job_accepted_response
 
 router = APIRouter()
 
@@ -94,6 +102,7 @@ async def create_chapter(
         db.add(db_chapter)
         db.commit()
         db.refresh(db_chapter)
+        get_chapter_context_index().index_chapter(db_chapter)
         
         return ChapterResponse.from_orm(db_chapter)
         
@@ -124,6 +133,8 @@ async def get_chapters(
     keyword: Optional[str] = Query(None, description="搜索关键词"),
     sort_by: str = Query("chapter_number", description="排序字段"),
     sort_order: str = Query("asc", description="排序方向"),
+    cursor: Optional[str] = Query(None, description="分页游标（优先于页码）"),
+    include_total: bool = Query(True, description="是否返回总数"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -140,6 +151,8 @@ async def get_chapters(
         keyword: 搜索关键词
         sort_by: 排序字段
         sort_order: 排序方向
+        cursor: 分页游标
+        include_total: 是否返回总数
         current_user: 当前用户
         db: 数据库会话
         
@@ -182,22 +195,41 @@ async def get_chapters(
     if chapter_number_end:
         query = query.filter(Chapter.chapter_number <= chapter_number_end)
     
-    # 添加排序
-    sort_column = getattr(Chapter, sort_by, Chapter.chapter_number)
-    if sort_order.lower() == "desc":
-        query = query.order_by(desc(sort_column))
-    else:
-        query = query.order_by(asc(sort_column))
-    
-    # 计算总数和总字数
-    total = query.count()
-    total_words = db.query(func.sum(Chapter.word_count)).filter(
-        Chapter.user_id == current_user.id
-    ).scalar() or 0
+    # 排序字段只允许数据表列
+    if sort_by not in Chapter.__table__.columns:
+        sort_by = "chapter_number"
+    sort_column = getattr(Chapter, sort_by)
+    descending = sort_order.lower() == "desc"
+    
+    # 计算总数和总字数（首页精确计算，翻页复用缓存的近似值）
+    first_page = not cursor and page == 1
+    total = None
+    if include_total:
+        cache_key = get_total_count_cache().make_key(
+            "chapters", current_user.id, novel_id, keyword, status,
+            chapter_number_start, chapter_number_end
+        )
+        total = get_total_count_cache().get_total(cache_key, query, exact=first_page)
+    total_words = get_total_count_cache().get_value(
+        get_total_count_cache().make_key("chapter_words", current_user.id),
+        lambda: db.query(func.sum(Chapter.word_count)).filter(
+            Chapter.user_id == current_user.id
+        ).scalar() or 0,
+        exact=first_page
+    )
     
-    # 应用分页
-    offset = (page - 1) * size
-    chapters = query.offset(offset).limit(size).all()
+    # 应用游标分页
+    result = paginate_keyset(
+        query,
+        sort_column,
+        Chapter.id,
+        limit=size,
+        descending=descending,
+        cursor=cursor,
+        offset=(page - 1) * size,
+        signature=f"{sort_by}:{'desc' if descending else 'asc'}"
+    )
+    chapters = result.items
     
     # 转换为响应格式
     chapter_responses = []
@@ -220,16 +252,18 @@ async def get_chapters(
         )
     
     # 计算分页信息
-    total_pages = (total + size - 1) // size
+    total_pages = (total + size - 1) // size if total is not None else None
     
-    return ChapterListResponse(
+    return model_response(ChapterListResponse(
         items=chapter_responses,
         total=total,
         page=page,
         page_size=size,
         total_pages=total_pages,
-        total_words=total_words
-    )
+        total_words=total_words,
+        next_cursor=result.next_cursor,
+        has_more=result.has_more
+    ))
 
 
 @router.get("/{chapter_id}", response_model=ChapterResponse)
@@ -263,7 +297,7 @@ async def get_chapter(
             detail="章节不存在或您没有权限访问"
         )
     
-    return ChapterResponse.from_orm(chapter)
+    return model_response(ChapterResponse.model_validate(chapter))
 
 
 @router.put("/{chapter_id}", response_model=ChapterResponse)
@@ -324,6 +358,7 @@ async def update_chapter(
         
         db.commit()
         db.refresh(chapter)
+        get_chapter_context_index().index_chapter(chapter)
         
         return ChapterResponse.from_orm(chapter)
         
@@ -377,6 +412,7 @@ async def delete_chapter(
     try:
         db.delete(chapter)
         db.commit()
+        get_chapter_context_index().remove_chapter(chapter.novel_id, chapter.id)
         
         return {"message": f"第{chapter.chapter_number}章删除成功"}
         
@@ -439,6 +475,8 @@ async def update_chapter_status(
 @router.post("/generate", response_model=ChapterGenerationResponse)
 async def generate_chapter(
     request: ChapterGenerationRequest,
+    http_request: Request,
+    background: bool = Query(False, description="后台执行：立即返回任务ID，通过 /jobs 接口查询结果"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -447,23 +485,42 @@ async def generate_chapter(
     
     Args:
         request: 章节生成请求
+        http_request: 请求对象（客户端断开时取消进行中的生成）
+        background: 是否作为后台任务执行
         current_user: 当前用户
         db: 数据库会话
         
     Returns:
-        ChapterGenerationResponse: 章节生成响应
+        ChapterGenerationResponse: 章节生成响应（后台执行时为202与任务信息）
         
     Raises:
         HTTPException: 生成失败时抛出异常
     """
+    if background:
+        return job_accepted_response(get_job_queue().enqueue(db, current_user.id, "chapter", request))
+    return await cancel_on_disconnect(
+        http_request,
+        run_chapter_generation(request, db, current_user.id),
+        "chapters.generate"
+    )
+
+
+async def run_chapter_generation(
+    request: ChapterGenerationRequest,
+    db: Session,
+    user_id: int
+) -> ChapterGenerationResponse:
+    """生成并保存章节（同步接口与后台任务共用）"""
     try:
-        # 验证小说权限
-        novel = db.query(Novel).filter(
-            Novel.id == request.novel_id,
-            Novel.user_id == current_user.id
-        ).first()
+        # 加载生成上下文（世界观、指定角色与本章大纲），同时验证小说权限
+        context = GenerationContextLoader(db, user_id).load(
+            request.novel_id,
+            include_worldviews=request.include_worldview,
+            character_ids=request.character_ids if request.include_characters else None,
+            outline_id=request.outline_id if request.include_outline else None
+        )
         
-        if not novel:
+        if context is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="小说不存在或您没有权限访问"
@@ -481,63 +538,19 @@ async def generate_chapter(
                 detail=f"第{request.chapter_number}章已存在，请选择其他章节号"
             )
         
-        # 收集生成上下文信息
-        novel_info = {
-            "title": novel.title,
-            "description": novel.description,
-            "genre": novel.genre,
-            "tags": novel.tags
-        }
-        
-        # 获取世界观信息
-        worldview_info = ""
-        if request.include_worldview:
-            worldviews = db.query(Worldview).filter(
-                Worldview.novel_id == request.novel_id
-            ).all()
-            if worldviews:
-                worldview_info = "\n".join([
-                    f"世界观设定: {wv.name}\n描述: {wv.description}"
-                    for wv in worldviews
-                ])
-        
-        # 获取角色信息
-        character_info = ""
-        if request.include_characters and request.character_ids:
-            characters = db.query(Character).filter(
-                Character.id.in_(request.character_ids),
-                Character.user_id == current_user.id
-            ).all()
-            if characters:
-                character_info = "\n".join([
-                    f"角色: {char.name}\n性格: {char.personality}\n能力: {char.abilities}"
-                    for char in characters
-                ])
-        
-        # 获取大纲信息
-        outline_info = ""
-        if request.include_outline and request.outline_id:
-            outline = db.query(DetailedOutline).filter(
-                DetailedOutline.id == request.outline_id,
-                DetailedOutline.user_id == current_user.id
-            ).first()
-            if outline:
-                outline_info = f"章节大纲: {outline.chapter_title}\n情节点: {outline.plot_points}"
-        
-        # 获取前面章节内容作为上下文
-        previous_chapters = ""
+        # 通过章节索引检索前文上下文（上一章结尾、摘要与相关片段，受token预算约束）
         if request.chapter_number > 1:
-            prev_chapters = db.query(Chapter).filter(
-                Chapter.novel_id == request.novel_id,
-                Chapter.chapter_number < request.chapter_number,
-                Chapter.status != ChapterStatus.DRAFT
-            ).order_by(desc(Chapter.chapter_number)).limit(2).all()
-            
-            if prev_chapters:
-                previous_chapters = "\n\n".join([
-                    f"第{ch.chapter_number}章: {ch.title}\n{ch.get_content_preview(300)}"
-                    for ch in reversed(prev_chapters)
-                ])
+            retrieval_query = "\n".join(
+                part for part in [context.outline_info, context.character_info, request.user_suggestion or ""] if part
+            )
+            with span("context_retrieval"):
+                context.previous_chapters = await asyncio.to_thread(
+                    get_chapter_context_index().build_context,
+                    db,
+                    request.novel_id,
+                    request.chapter_number,
+                    query=retrieval_query
+                )
         
         # 调用生成服务
         prompt_service = get_prompt_service(db)
@@ -545,11 +558,9 @@ async def generate_chapter(
         
         generation_result = await generation_service.generate_chapter(
             request=request,
-            novel_info=novel_info,
-            outline_info=outline_info,
-            character_info=character_info,
-            worldview_info=worldview_info,
-            previous_chapters=previous_chapters
+            context=context,
+            user_id=user_id,
+            db=db
         )
         
         if not generation_result.success:
@@ -568,14 +579,16 @@ async def generate_chapter(
             outline_id=request.outline_id,
             character_ids=request.character_ids,
             notes=f"AI生成于{generation_result.used_prompt_template}模板",
-            user_id=current_user.id
+            user_id=user_id
         )
         
         new_chapter.update_word_count()
         
         db.add(new_chapter)
-        db.commit()
+        with span("persist"):
+            db.commit()
         db.refresh(new_chapter)
+        get_chapter_context_index().index_chapter(new_chapter)
         
         # 更新响应
         generation_result.chapter = ChapterResponse.from_orm(new_chapter)
@@ -592,6 +605,156 @@ async def generate_chapter(
         )
 
 
+def _get_user_generation_job(db: Session, job_id: int, user_id: int) -> GenerationJob:
+    """获取当前用户的批量生成任务，不存在时抛出404"""
+    job = db.query(GenerationJob).filter(
+        GenerationJob.id == job_id,
+        GenerationJob.user_id == user_id,
+        GenerationJob.job_type == BATCH_JOB_TYPE
+    ).first()
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="批量生成任务不存在或您没有权限访问"
+        )
+    return job
+
+
+@router.post("/generate-batch", response_model=ChapterGenerationJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_chapter_generation_job(
+    request: ChapterBatchGenerationRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    创建批量章节生成任务（按详细大纲生成第N..M章，后台执行）
+    
+    Args:
+        request: 批量生成请求
+        current_user: 当前用户
+        db: 数据库会话
+        
+    Returns:
+        ChapterGenerationJobResponse: 任务信息，可通过查询接口获取逐章进度
+        
+    Raises:
+        HTTPException: 小说不存在、大纲缺失或创建失败时抛出异常
+    """
+    try:
+        novel = db.query(Novel).filter(
+            Novel.id == request.novel_id,
+            Novel.user_id == current_user.id
+        ).first()
+        
+        if not novel:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="小说不存在或您没有权限访问"
+            )
+        
+        try:
+            job = get_chapter_batch_generator().create_job(db, current_user.id, request)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        return batch_job_response(job)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"创建批量生成任务失败: {str(e)}"
+        )
+
+
+@router.get("/generate-batch/{job_id}", response_model=ChapterGenerationJobResponse)
+async def get_chapter_generation_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    获取批量章节生成任务进度
+    
+    Args:
+        job_id: 任务ID
+        current_user: 当前用户
+        db: 数据库会话
+        
+    Returns:
+        ChapterGenerationJobResponse: 任务信息与逐章结果
+    """
+    job = _get_user_generation_job(db, job_id, current_user.id)
+    return batch_job_response(job)
+
+
+@router.post("/generate-batch/{job_id}/resume", response_model=ChapterGenerationJobResponse)
+async def resume_chapter_generation_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    从最后提交的章节之后恢复失败的批量生成任务
+    
+    Args:
+        job_id: 任务ID
+        current_user: 当前用户
+        db: 数据库会话
+        
+    Returns:
+        ChapterGenerationJobResponse: 任务信息
+        
+    Raises:
+        HTTPException: 任务不存在或已结束时抛出异常
+    """
+    job = _get_user_generation_job(db, job_id, current_user.id)
+    
+    if job.status in (GenerationJobStatus.COMPLETED, GenerationJobStatus.CANCELLED):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="任务已结束，无法恢复"
+        )
+    
+    # 排队中或执行中的任务无需处理；失败的任务重新排队，从最后提交的章节之后继续
+    if get_job_queue().retry(db, job):
+        db.refresh(job)
+    
+    return batch_job_response(job)
+
+
+@router.post("/generate-batch/{job_id}/cancel", response_model=ChapterGenerationJobResponse)
+async def cancel_chapter_generation_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    取消批量章节生成任务（已生成的章节保留）
+    
+    Args:
+        job_id: 任务ID
+        current_user: 当前用户
+        db: 数据库会话
+        
+    Returns:
+        ChapterGenerationJobResponse: 任务信息
+    """
+    job = _get_user_generation_job(db, job_id, current_user.id)
+    
+    if not job.is_finished():
+        get_job_queue().cancel(db, job)
+        db.refresh(job)
+    
+    return batch_job_response(job)
+
+
 @router.post("/batch", response_model=ChapterBatchResponse)
 async def batch_operate_chapters(
     request: ChapterBatchRequest,
@@ -7,12 +7,13 @@ Created: 2025-06-03
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status, Path
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, desc
+from sqlalchemy import and_, func, insert, update
 
 from app.core.database import get_db
 from app.core.dependencies import get_current_user
 from app.models.user import User
 from app.models.character import Character
+from app.models.character_tag import index_character_tags
 from app.models.character_template import (
     CharacterTemplateDetail, CharacterTemplateFavorite, CharacterTemplateUsage
 )
@@ -23,6 +24,9 @@ from app.schemas.character_template import (
 )
 from app.schemas.character import CharacterResponse, CharacterSummaryResponse
 from app.models.novel import Novel
+from app.services.template_recommender import get_template_recommender
+from app.services.template_suggestion_index import get_template_suggestion_index
+from app.services.template_stats import get_template_stats_snapshot
 
 router = APIRouter(prefix="/character-templates", tags=["角色模板交互"])
 
@@ -132,6 +136,11 @@ async def use_character_template(
         db.commit()
         db.refresh(new_character)
         
+        # 同步推荐引擎中的用户偏好
+        get_template_recommender().record_usage(current_user.id, template_id, request.novel_id)
+        get_template_suggestion_index().record_usage(template_id)
+        get_template_stats_snapshot().record_usage(current_user.id, template_id, novel.genre)
+        
         # 确定是否应用了适配
         adaptation_applied = bool(
             request.customizations or request.adaptation_notes
@@ -186,104 +195,138 @@ async def batch_use_templates(
                 detail="小说不存在或无权访问"
             )
             
-        created_characters = []
+        template_ids = list(dict.fromkeys(item.template_id for item in request.templates))
+        
+        # 一次性查询所有模板
+        templates = {
+            template.id: template
+            for template in db.query(Character).filter(
+                Character.id.in_(template_ids),
+                Character.is_template == True
+            ).all()
+        }
+        
+        # 一次性查询已从这些模板创建过的角色
+        existing_names = dict(
+            db.query(Character.from_template_id, Character.name).filter(
+                Character.novel_id == request.novel_id,
+                Character.from_template_id.in_(template_ids),
+                Character.user_id == current_user.id
+            ).all()
+        )
+        
+        character_rows = []
+        used_template_ids = []
+        customizations = {}
         failed_items = []
         
-        # 处理每个模板
         for item in request.templates:
-            try:
-                # 验证模板是否存在
-                template = db.query(Character).filter(
-                    Character.id == item.template_id,
-                    Character.is_template == True
-                ).first()
-                
-                if not template:
-                    failed_items.append({
-                        "template_id": item.template_id,
-                        "reason": "模板不存在"
-                    })
-                    continue
-                    
-                # 检查是否已经从这个模板创建过角色
-                existing_character = db.query(Character).filter(
-                    Character.novel_id == request.novel_id,
-                    Character.from_template_id == item.template_id,
-                    Character.user_id == current_user.id
-                ).first()
-                
-                if existing_character:
-                    failed_items.append({
-                        "template_id": item.template_id,
-                        "reason": f"已经从该模板创建过角色: {existing_character.name}"
-                    })
-                    continue
-                    
-                # 创建新角色
-                character_dict = template.to_dict()
-                
-                # 移除不需要的字段
-                for field in ["id", "created_at", "updated_at"]:
-                    if field in character_dict:
-                        character_dict.pop(field)
-                        
-                # 更新必要字段
-                character_dict["is_template"] = False
-                character_dict["novel_id"] = request.novel_id
-                character_dict["user_id"] = current_user.id
-                character_dict["from_template_id"] = item.template_id
-                
-                # 应用自定义修改
-                if item.customizations:
-                    for field, value in item.customizations.items():
-                        if field in character_dict and field not in ["id", "user_id", "from_template_id"]:
-                            character_dict[field] = value
-                
-                # 创建角色实例
-                new_character = Character(**character_dict)
-                db.add(new_character)
-                db.flush()  # 获取ID但不提交
-                
-                # 记录使用记录
-                usage_record = CharacterTemplateUsage(
-                    user_id=current_user.id,
-                    template_id=item.template_id,
-                    target_id=new_character.id,
-                    novel_id=request.novel_id,
-                    customizations=item.customizations or {}
-                )
-                db.add(usage_record)
-                
-                # 更新模板使用次数
-                template_detail = db.query(CharacterTemplateDetail).filter(
-                    CharacterTemplateDetail.character_id == item.template_id
-                ).first()
-                
-                if template_detail:
-                    template_detail.usage_count += 1
-                    
-                # 添加到成功列表
-                created_characters.append(
-                    CharacterSummaryResponse.model_validate(new_character.to_summary_dict())
-                )
+            template = templates.get(item.template_id)
+            
+            if not template:
+                failed_items.append({
+                    "template_id": item.template_id,
+                    "reason": "模板不存在"
+                })
+                continue
                 
-            except Exception as e:
+            if item.template_id in existing_names:
                 failed_items.append({
                     "template_id": item.template_id,
-                    "reason": str(e)
+                    "reason": f"已经从该模板创建过角色: {existing_names[item.template_id]}"
                 })
+                continue
+                
+            # 构建新角色数据
+            character_dict = template.to_dict()
+            
+            # 移除不需要的字段
+            for field in ["id", "created_at", "updated_at"]:
+                if field in character_dict:
+                    character_dict.pop(field)
+                    
+            # 更新必要字段
+            character_dict["is_template"] = False
+            character_dict["novel_id"] = request.novel_id
+            character_dict["user_id"] = current_user.id
+            character_dict["from_template_id"] = item.template_id
+            
+            # 应用自定义修改
+            if item.customizations:
+                for field, value in item.customizations.items():
+                    if field in character_dict and field not in ["id", "user_id", "from_template_id"]:
+                        character_dict[field] = value
+            
+            character_rows.append(character_dict)
+            used_template_ids.append(item.template_id)
+            customizations[item.template_id] = item.customizations or {}
+            
+            # 同一批次中重复的模板视为已创建
+            existing_names[item.template_id] = character_dict["name"]
         
         # 如果全部失败，回滚事务
-        if not created_characters:
+        if not character_rows:
             db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                 detail="所有角色模板添加失败"
             )
-            
+        
+        # 批量插入角色并取回生成的记录（每个模板至多一条，按来源模板恢复请求顺序）
+        inserted = {
+            character.from_template_id: character
+            for character in db.scalars(insert(Character).returning(Character), character_rows)
+        }
+        new_characters = [inserted[template_id] for template_id in used_template_ids]
+        
+        # 批量插入不经过工作单元刷新，需显式写入标签索引
+        index_character_tags(
+            db.connection(),
+            {character.id: character.tags for character in new_characters}
+        )
+        
+        # 批量插入使用记录
+        db.execute(
+            insert(CharacterTemplateUsage),
+            [
+                {
+                    "user_id": current_user.id,
+                    "template_id": character.from_template_id,
+                    "target_id": character.id,
+                    "novel_id": request.novel_id,
+                    "customizations": customizations[character.from_template_id]
+                }
+                for character in new_characters
+            ]
+        )
+        
+        # 单条语句更新模板使用次数（同一批次内每个模板至多使用一次）
+        db.execute(
+            update(CharacterTemplateDetail).where(
+                CharacterTemplateDetail.character_id.in_(used_template_ids)
+            ).values(
+                usage_count=CharacterTemplateDetail.usage_count + 1
+            ).execution_options(synchronize_session=False)
+        )
+        
+        created_characters = [
+            CharacterSummaryResponse.model_validate(character.to_summary_dict())
+            for character in new_characters
+        ]
+        novel_genre = novel.genre
+        
         # 提交事务
         db.commit()
         
+        # 同步推荐引擎中的用户偏好
+        recommender = get_template_recommender()
+        suggestion_index = get_template_suggestion_index()
+        stats_snapshot = get_template_stats_snapshot()
+        for used_template_id in used_template_ids:
+            recommender.record_usage(current_user.id, used_template_id, request.novel_id)
+            suggestion_index.record_usage(used_template_id)
+            stats_snapshot.record_usage(current_user.id, used_template_id, novel_genre)
+        
         return BatchUseTemplatesResponse(
             success_count=len(created_characters),
             failed_count=len(failed_items),
@@ -343,6 +386,8 @@ async def toggle_favorite_template(
             # 取消收藏
             db.delete(favorite)
             db.commit()
+            get_template_recommender().record_favorite(current_user.id, template_id, False)
+            get_template_stats_snapshot().record_favorite(current_user.id, False)
             return FavoriteResponse(
                 success=True,
                 is_favorited=False,
@@ -356,6 +401,8 @@ async def toggle_favorite_template(
             )
             db.add(new_favorite)
             db.commit()
+            get_template_recommender().record_favorite(current_user.id, template_id, True)
+            get_template_stats_snapshot().record_favorite(current_user.id, True)
             return FavoriteResponse(
                 success=True,
                 is_favorited=True,
@@ -471,199 +518,38 @@ async def get_template_recommendations(
         推荐的角色模板列表
     """
     try:
-        # 基础查询
-        query = db.query(Character).join(
-            CharacterTemplateDetail,
-            Character.id == CharacterTemplateDetail.character_id
-        ).filter(
-            Character.is_template == True
-        )
-        
-        # 如果需要排除已使用的
-        if exclude_used and novel_id:
-            # 获取已使用的模板ID
-            used_templates = db.query(CharacterTemplateUsage.template_id).filter(
-                CharacterTemplateUsage.user_id == current_user.id,
-                CharacterTemplateUsage.novel_id == novel_id
-            ).distinct().all()
-            
-            used_ids = [item[0] for item in used_templates]
-            
-            if used_ids:
-                query = query.filter(Character.id.notin_(used_ids))
-                
-        # 根据推荐依据应用不同的排序和筛选
-        recommendation_reason = ""
-        
-        if based_on == "popular":
-            query = query.order_by(desc(CharacterTemplateDetail.usage_count))
-            recommendation_reason = "基于热门角色推荐"
-            
-        elif based_on == "usage_history" and current_user:
-            # 获取用户历史使用的角色类型和标签
-            user_usages = db.query(CharacterTemplateUsage).filter(
-                CharacterTemplateUsage.user_id == current_user.id
-            ).all()
-            
-            if user_usages:
-                # 获取历史使用的模板ID
-                used_template_ids = [usage.template_id for usage in user_usages]
-                
-                # 获取历史使用的模板
-                used_templates = db.query(Character).filter(
-                    Character.id.in_(used_template_ids)
-                ).all()
-                
-                # 提取使用历史中的标签和角色类型
-                used_tags = []
-                used_character_types = []
-                
-                for template in used_templates:
-                    if template.tags:
-                        used_tags.extend(template.tags)
-                    if template.character_type:
-                        used_character_types.append(template.character_type)
-                        
-                # 移除重复项
-                used_tags = list(set(used_tags))
-                used_character_types = list(set(used_character_types))
-                
-                # 构建基于使用历史的推荐
-                if used_tags or used_character_types:
-                    conditions = []
-                    
-                    # 基于标签
-                    for tag in used_tags[:3]:  # 只使用前3个标签
-                        conditions.append(Character.tags.contains([tag]))
-                        
-                    # 基于角色类型
-                    for char_type in used_character_types:
-                        conditions.append(Character.character_type == char_type)
-                        
-                    if conditions:
-                        query = query.filter(or_(*conditions))
-                        recommendation_reason = "基于您的使用历史推荐"
-            else:
-                # 没有使用历史，回退到流行推荐
-                query = query.order_by(desc(CharacterTemplateDetail.usage_count))
-                recommendation_reason = "热门角色推荐"
-                
-        elif based_on == "current_novel" and novel_id:
-            # 获取小说信息
-            novel = db.query(Novel).filter(
+        # 基于小说推荐时只取必要的列，避免加载完整角色对象
+        novel_title = None
+        novel_genre = None
+        novel_characters = None
+        if based_on == "current_novel" and novel_id:
+            novel = db.query(Novel.title, Novel.genre).filter(
                 Novel.id == novel_id
             ).first()
             
             if novel:
-                # 获取小说中的现有角色
-                existing_characters = db.query(Character).filter(
+                novel_title, novel_genre = novel.title, novel.genre
+                novel_characters = db.query(Character.tags, Character.character_type).filter(
                     Character.novel_id == novel_id,
                     Character.user_id == current_user.id
                 ).all()
-                
-                # 提取现有角色的标签和类型
-                novel_tags = []
-                novel_character_types = []
-                
-                for character in existing_characters:
-                    if character.tags:
-                        novel_tags.extend(character.tags)
-                    if character.character_type:
-                        novel_character_types.append(character.character_type)
-                        
-                # 移除重复项
-                novel_tags = list(set(novel_tags))
-                novel_character_types = list(set(novel_character_types))
-                
-                # 构建基于小说的推荐
-                if novel_tags or novel_character_types:
-                    conditions = []
-                    
-                    # 基于标签
-                    for tag in novel_tags[:3]:  # 只使用前3个标签
-                        conditions.append(Character.tags.contains([tag]))
-                        
-                    # 基于角色类型
-                    # 推荐与现有角色互补的类型
-                    complementary_types = []
-                    if "protagonist" not in novel_character_types:
-                        complementary_types.append("protagonist")
-                    if "antagonist" not in novel_character_types:
-                        complementary_types.append("antagonist")
-                    if "supporting" not in novel_character_types:
-                        complementary_types.append("supporting")
-                        
-                    for char_type in complementary_types:
-                        conditions.append(Character.character_type == char_type)
-                        
-                    if conditions:
-                        query = query.filter(or_(*conditions))
-                        recommendation_reason = f"基于《{novel.title}》小说推荐"
-                else:
-                    # 没有足够信息，回退到基于小说类型的推荐
-                    if novel.genre:
-                        recommendation_reason = f"适合{novel.genre}类型小说的角色"
-            else:
-                # 小说不存在，回退到流行推荐
-                query = query.order_by(desc(CharacterTemplateDetail.usage_count))
-                recommendation_reason = "热门角色推荐"
         
-        # 限制结果数量
-        templates = query.limit(limit).all()
-        
-        # 获取用户收藏记录
-        favorited_template_ids = db.query(CharacterTemplateFavorite.character_id).filter(
-            CharacterTemplateFavorite.user_id == current_user.id
-        ).all()
-        favorited_ids = [item[0] for item in favorited_template_ids]
+        # 由预计算的推荐引擎完成打分与Top-K选择
+        recommendations, recommendation_reason = get_template_recommender().recommend(
+            db,
+            current_user.id,
+            based_on=based_on,
+            novel_id=novel_id,
+            limit=limit,
+            exclude_used=exclude_used,
+            novel_title=novel_title,
+            novel_genre=novel_genre,
+            novel_characters=novel_characters
+        )
         
-        # 构建响应数据
-        recommended_characters = []
-        for template in templates:
-            # 构建基本信息
-            template_dict = template.to_summary_dict()
-            
-            if template.template_detail:
-                template_dict.update({
-                    "usage_count": template.template_detail.usage_count,
-                    "rating": template.template_detail.rating,
-                    "is_popular": template.template_detail.is_popular,
-                    "is_new": template.template_detail.is_new
-                })
-            else:
-                template_dict.update({
-                    "usage_count": 0,
-                    "rating": 0.0,
-                    "is_popular": False,
-                    "is_new": False
-                })
-                
-            # 设置收藏状态
-            template_dict["is_favorited"] = template.id in favorited_ids
-            
-            # 添加推荐信息
-            template_dict["recommendation_score"] = 0.8 + (0.2 * (template_dict.get("usage_count", 0) / 100))
-            template_dict["fit_score"] = 0.7 + (0.3 * (template_dict.get("rating", 0) / 5))
-            
-            # 简单的推荐理由
-            recommendation_reasons = []
-            if template_dict.get("is_popular", False):
-                recommendation_reasons.append("热门角色")
-            if template_dict.get("is_new", False):
-                recommendation_reasons.append("新添加的角色")
-            if template.character_type == "protagonist":
-                recommendation_reasons.append("优秀的主角选择")
-            elif template.character_type == "antagonist":
-                recommendation_reasons.append("出色的反派角色")
-            elif template.character_type == "supporting":
-                recommendation_reasons.append("精彩的配角")
-            
-            if not recommendation_reasons:
-                recommendation_reasons.append("可能适合您的故事")
-                
-            template_dict["recommendation_reasons"] = recommendation_reasons
-            
-            recommended_characters.append(RecommendedCharacter.model_validate(template_dict))
+        recommended_characters = [
+            RecommendedCharacter.model_validate(item) for item in recommendations
+        ]
         
         return GetRecommendationsResponse(
             recommendations=recommended_characters,
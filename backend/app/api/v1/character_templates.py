@@ -5,17 +5,19 @@ Created: 2025-06-03
 """
 
 from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Path
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, desc
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query, Path
+from sqlalchemy.orm import Session, contains_eager
+from sqlalchemy import and_, or_, func, desc, exists
 
 from app.core.database import get_db
 from app.core.dependencies import get_current_user
+from app.core.pagination import paginate_keyset, get_total_count_cache
+from app.core.response_cache import get_response_cache
 from app.models.user import User
 from app.models.character import Character, CharacterType, CharacterGender
 from app.models.character_template import (
     CharacterTemplateDetail, UsageExample, 
-    CharacterTemplateFavorite, CharacterTemplateUsage
+    CharacterTemplateFavorite
 )
 from app.schemas.character_template import (
     CharacterTemplateSummaryResponse, CharacterTemplateResponse, 
@@ -25,12 +27,55 @@ from app.schemas.character_template import (
     SearchSuggestion, GetTemplateStatsResponse
 )
 from app.models.novel import Novel
+from app.services.character_tag_index import tag_filter, template_tag_counts
+from app.services.template_suggestion_index import get_template_suggestion_index
+from app.services.template_stats import get_template_stats_snapshot
 
 router = APIRouter(prefix="/character-templates", tags=["角色模板"])
 
+# 模板列表响应依赖的模型
+TEMPLATE_LIST_MODELS = (Character, CharacterTemplateDetail, CharacterTemplateFavorite)
+
+# 模板列表摘要投影的列（与 CharacterTemplateSummaryResponse 字段对应）
+TEMPLATE_SUMMARY_COLUMNS = (
+    Character.id,
+    Character.name,
+    Character.gender,
+    Character.character_type,
+    Character.tags,
+    Character.description,
+    Character.is_template,
+    CharacterTemplateDetail.usage_count,
+    CharacterTemplateDetail.rating,
+    CharacterTemplateDetail.is_popular,
+    CharacterTemplateDetail.is_new
+)
+
+
+def _template_summary(row: Any) -> Dict[str, Any]:
+    """将投影查询的行转换为模板摘要字典（没有模板详情时统计字段取默认值）"""
+    description = row.description
+    if description and len(description) > 100:
+        description = description[:100] + "..."
+    return {
+        "id": row.id,
+        "name": row.name,
+        "gender": row.gender,
+        "character_type": row.character_type,
+        "tags": row.tags or [],
+        "description": description,
+        "is_template": row.is_template,
+        "usage_count": row.usage_count or 0,
+        "rating": row.rating or 0.0,
+        "is_popular": bool(row.is_popular),
+        "is_new": bool(row.is_new),
+        "is_favorited": bool(row.is_favorited)
+    }
+
 
 @router.get("/", response_model=CharacterTemplateListResponse)
 async def get_character_templates(
+    request: Request,
     gender: Optional[str] = Query(None, description="性别筛选"),
     power_systems: Optional[List[str]] = Query(None, description="力量体系筛选"),
     worldviews: Optional[List[str]] = Query(None, description="世界观筛选"),
@@ -46,7 +91,7 @@ async def get_character_templates(
     current_user: User = Depends(get_current_user)
 ):
     """
-    获取角色模板列表，支持多种筛选和排序选项
+    获取角色模板列表，支持多种筛选和排序选项（带ETag，内容未变时返回304）
     
     Args:
         gender: 性别筛选 (male, female, unknown, other)
@@ -67,12 +112,22 @@ async def get_character_templates(
         包含角色模板列表、分页信息和可选的筛选选项的响应
     """
     try:
-        # 构建基础查询 - 查找所有模板角色
-        # 使用join预加载template_detail，以便获取使用统计等信息
-        query = db.query(Character).join(
-            CharacterTemplateDetail, 
-            Character.id == CharacterTemplateDetail.character_id,
-            isouter=True  # 使用左连接确保即使没有详情也能查到角色
+        cached = get_response_cache().lookup(request, current_user.id, TEMPLATE_LIST_MODELS)
+        if cached.response is not None:
+            return cached.response
+        
+        # 单条投影查询：摘要字段、模板详情统计、收藏标记与总数（窗口函数）一次取回
+        is_favorited = exists().where(
+            CharacterTemplateFavorite.character_id == Character.id,
+            CharacterTemplateFavorite.user_id == current_user.id
+        ).label("is_favorited")
+        query = db.query(
+            *TEMPLATE_SUMMARY_COLUMNS,
+            is_favorited,
+            func.count(Character.id).over().label("total_count")
+        ).outerjoin(
+            CharacterTemplateDetail,
+            Character.id == CharacterTemplateDetail.character_id
         ).filter(Character.is_template == True)
         
         # 应用各种筛选条件
@@ -93,9 +148,8 @@ async def get_character_templates(
             query = query.filter(or_(*worldview_filters))
             
         if tags:
-            # 对于JSON字段中的数组元素，使用JSON包含操作
-            for tag in tags:
-                query = query.filter(Character.tags.contains([tag]))
+            # 通过标签索引筛选（须包含全部标签）
+            query = query.filter(tag_filter(tags))
                 
         if is_popular is not None:
             query = query.filter(CharacterTemplateDetail.is_popular == is_popular)
@@ -116,44 +170,24 @@ async def get_character_templates(
             query = query.order_by(sort_column)
         else:
             query = query.order_by(desc(sort_column))
-            
-        # 查询用户收藏记录以标记已收藏项
-        favorited_template_ids = db.query(CharacterTemplateFavorite.character_id).filter(
-            CharacterTemplateFavorite.user_id == current_user.id
-        ).all()
-        favorited_ids = [item[0] for item in favorited_template_ids]
         
-        # 获取总数并应用分页
-        total = query.count()
+        # 应用分页
         offset = (page - 1) * page_size
-        templates = query.offset(offset).limit(page_size).all()
+        rows = query.offset(offset).limit(page_size).all()
+        
+        # 总数取自窗口函数；页码越界没有返回行时才单独计数
+        if rows:
+            total = rows[0].total_count
+        elif offset:
+            total = query.with_entities(func.count(Character.id)).order_by(None).scalar()
+        else:
+            total = 0
         
         # 构建响应数据
-        template_responses = []
-        for template in templates:
-            # 从Character基础模型转换
-            template_dict = template.to_summary_dict()
-            
-            # 添加模板特有字段
-            if template.template_detail:
-                template_dict.update({
-                    "usage_count": template.template_detail.usage_count,
-                    "rating": template.template_detail.rating,
-                    "is_popular": template.template_detail.is_popular,
-                    "is_new": template.template_detail.is_new
-                })
-            else:
-                template_dict.update({
-                    "usage_count": 0,
-                    "rating": 0.0,
-                    "is_popular": False,
-                    "is_new": False
-                })
-                
-            # 标记是否已被用户收藏
-            template_dict["is_favorited"] = template.id in favorited_ids
-            
-            template_responses.append(CharacterTemplateSummaryResponse.model_validate(template_dict))
+        template_responses = [
+            CharacterTemplateSummaryResponse.model_validate(_template_summary(row))
+            for row in rows
+        ]
         
         # 计算总页数
         total_pages = (total + page_size - 1) // page_size
@@ -167,82 +201,14 @@ async def get_character_templates(
             "total_pages": total_pages
         }
         
-        # 如果需要，添加筛选选项
+        # 如果需要，添加筛选选项（读取统计快照中缓存的计数，管理员修改模板后重建）
         if include_filters:
-            filters_available = {}
-            
-            # 获取性别选项
-            genders = db.query(Character.gender, func.count(Character.id).label("count")).filter(
-                Character.is_template == True
-            ).group_by(Character.gender).all()
-            
-            gender_options = [
-                TemplateFilterOption(
-                    value=gender[0],
-                    label=gender[0],
-                    count=gender[1]
-                ) for gender in genders
-            ]
-            filters_available["genders"] = gender_options
-            
-            # 获取力量体系选项 (从最常用的开始)
-            power_systems = db.query(Character.power_system, func.count(Character.id).label("count")).filter(
-                Character.is_template == True,
-                Character.power_system != None,
-                Character.power_system != ""
-            ).group_by(Character.power_system).order_by(desc("count")).limit(20).all()
-            
-            power_system_options = [
-                TemplateFilterOption(
-                    value=system[0],
-                    label=system[0],
-                    count=system[1]
-                ) for system in power_systems
-            ]
-            filters_available["power_systems"] = power_system_options
-            
-            # 获取世界观选项
-            worldviews = db.query(Character.original_world, func.count(Character.id).label("count")).filter(
-                Character.is_template == True,
-                Character.original_world != None,
-                Character.original_world != ""
-            ).group_by(Character.original_world).order_by(desc("count")).limit(20).all()
-            
-            worldview_options = [
-                TemplateFilterOption(
-                    value=worldview[0],
-                    label=worldview[0],
-                    count=worldview[1]
-                ) for worldview in worldviews
-            ]
-            filters_available["worldviews"] = worldview_options
-            
-            # 获取标签选项 (这需要特殊处理，因为tags是JSON数组)
-            # 简化实现，仅返回一些预定义的标签
-            predefined_tags = ["王者", "法师", "战士", "刺客", "坦克", "辅助", "射手", "善良", "邪恶", "中立"]
-            tag_options = []
-            
-            for tag in predefined_tags:
-                # 这里需要数据库支持JSON查询
-                count = db.query(func.count(Character.id)).filter(
-                    Character.is_template == True,
-                    Character.tags.contains([tag])
-                ).scalar()
-                
-                if count > 0:
-                    tag_options.append(
-                        TemplateFilterOption(
-                            value=tag,
-                            label=tag,
-                            count=count
-                        )
-                    )
-            
-            filters_available["tags"] = tag_options
-            
-            response_data["filters_available"] = filters_available
+            response_data["filters_available"] = {
+                facet: [TemplateFilterOption(**option) for option in options]
+                for facet, options in get_template_stats_snapshot().get_filter_options(db).items()
+            }
         
-        return CharacterTemplateListResponse(**response_data)
+        return cached.store(CharacterTemplateListResponse(**response_data))
         
     except Exception as e:
         raise HTTPException(
@@ -251,7 +217,7 @@ async def get_character_templates(
         )
 
 
-@router.get("/{template_id}", response_model=CharacterTemplateResponse)
+@router.get("/{template_id:int}", response_model=CharacterTemplateResponse)
 async def get_character_template_detail(
     template_id: int = Path(..., description="角色模板ID"),
     db: Session = Depends(get_db),
@@ -315,6 +281,8 @@ async def get_character_template_detail(
         if detail:
             detail.usage_count += 1  # 增加查看计数
             db.commit()
+            get_template_suggestion_index().record_usage(template_id)
+            get_template_stats_snapshot().record_view(template_id)
             
         return CharacterTemplateResponse.model_validate(template_dict)
         
@@ -348,11 +316,13 @@ async def search_character_templates(
         import time
         start_time = time.time()
         
-        # 构建基础查询
+        # 构建基础查询（模板详情随连接一并加载，避免逐行惰性查询）
         query = db.query(Character).join(
             CharacterTemplateDetail, 
             Character.id == CharacterTemplateDetail.character_id,
             isouter=True
+        ).options(
+            contains_eager(Character.template_detail)
         ).filter(Character.is_template == True)
         
         # 准备搜索字段
@@ -366,6 +336,9 @@ async def search_character_templates(
                 detail="搜索关键词过短，请提供至少2个字符"
             )
         
+        # 记录搜索词，用于热门搜索建议
+        get_template_suggestion_index().record_query(keyword)
+        
         # 构建搜索条件
         search_conditions = []
         
@@ -385,7 +358,7 @@ async def search_character_templates(
             search_conditions.append(Character.abilities.contains(keyword))
             
         if "tags" in search_fields and not request.fuzzy_search:
-            search_conditions.append(Character.tags.contains([keyword]))
+            search_conditions.append(tag_filter([keyword]))
             
         # 应用搜索条件
         query = query.filter(or_(*search_conditions))
@@ -402,8 +375,7 @@ async def search_character_templates(
                 query = query.filter(or_(*power_system_filters))
                 
             if "tags" in request.filters and request.filters["tags"]:
-                for tag in request.filters["tags"]:
-                    query = query.filter(Character.tags.contains([tag]))
+                query = query.filter(tag_filter(request.filters["tags"]))
                     
             if "is_popular" in request.filters and request.filters["is_popular"] is not None:
                 query = query.filter(CharacterTemplateDetail.is_popular == request.filters["is_popular"])
@@ -415,19 +387,35 @@ async def search_character_templates(
         page = request.filters.get("page", 1) if request.filters else 1
         page_size = request.filters.get("page_size", 20) if request.filters else 20
         
-        # 应用排序
-        query = query.order_by(desc(CharacterTemplateDetail.usage_count))
-        
         # 获取用户收藏记录
         favorited_template_ids = db.query(CharacterTemplateFavorite.character_id).filter(
             CharacterTemplateFavorite.user_id == current_user.id
         ).all()
         favorited_ids = [item[0] for item in favorited_template_ids]
         
-        # 获取总数并应用分页
-        total = query.count()
-        offset = (page - 1) * page_size
-        templates = query.offset(offset).limit(page_size).all()
+        # 获取总数（首页精确计数，翻页复用缓存的近似值）
+        total = None
+        if request.include_total:
+            cache_key = get_total_count_cache().make_key(
+                "template_search", keyword, search_fields, request.fuzzy_search,
+                {k: v for k, v in (request.filters or {}).items() if k not in ("page", "page_size")}
+            )
+            total = get_total_count_cache().get_total(
+                cache_key, query, exact=not request.cursor and page == 1
+            )
+        
+        # 按使用次数降序进行游标分页
+        result = paginate_keyset(
+            query,
+            CharacterTemplateDetail.usage_count,
+            Character.id,
+            limit=page_size,
+            descending=True,
+            cursor=request.cursor,
+            offset=(page - 1) * page_size,
+            signature="usage_count:desc"
+        )
+        templates = result.items
         
         # 构建响应数据
         template_responses = []
@@ -453,31 +441,22 @@ async def search_character_templates(
             template_responses.append(CharacterTemplateSummaryResponse.model_validate(template_dict))
         
         # 计算总页数和搜索时间
-        total_pages = (total + page_size - 1) // page_size
+        total_pages = (total + page_size - 1) // page_size if total is not None else None
         search_time = (time.time() - start_time) * 1000  # 转换为毫秒
         
         # 准备搜索元数据
         search_metadata = {
             "keyword": keyword,
-            "total_matches": total,
+            "total_matches": total if total is not None else len(templates),
             "search_time": search_time
         }
         
         # 如果没有结果，提供搜索建议
-        if total == 0:
-            # 获取一些相关标签作为建议
-            similar_tags = db.query(Character.tags).filter(
-                Character.is_template == True
-            ).all()
-            
-            # 简化处理，将所有标签平铺并去重
-            all_tags = []
-            for tags_list in similar_tags:
-                if tags_list[0]:  # 确保tags不为None
-                    all_tags.extend(tags_list[0])
-            
-            unique_tags = list(set(all_tags))[:5]  # 取前5个不重复的标签
-            search_metadata["suggestions"] = unique_tags
+        if not templates and not request.cursor:
+            # 取模板中最常用的标签作为建议
+            search_metadata["suggestions"] = [
+                name for name, _ in template_tag_counts(db, limit=5)
+            ]
         
         # 构建完整响应
         response_data = {
@@ -486,7 +465,9 @@ async def search_character_templates(
             "page": page,
             "page_size": page_size,
             "total_pages": total_pages,
-            "search_metadata": search_metadata
+            "search_metadata": search_metadata,
+            "next_cursor": result.next_cursor,
+            "has_more": result.has_more
         }
         
         # 如果请求了高亮结果（暂不实现复杂逻辑）
@@ -539,71 +520,11 @@ async def get_search_suggestions(
         匹配的搜索建议列表
     """
     try:
-        suggestions = []
-        
-        # 角色名称建议
-        name_matches = db.query(Character.name).filter(
-            Character.is_template == True,
-            Character.name.contains(q)
-        ).limit(5).all()
-        
-        for match in name_matches:
-            suggestions.append(SearchSuggestion(
-                text=match[0],
-                type="character_name",
-                match_count=1
-            ))
-            
-        # 力量体系建议
-        power_system_matches = db.query(Character.power_system, func.count(Character.id).label("count")).filter(
-            Character.is_template == True,
-            Character.power_system.contains(q)
-        ).group_by(Character.power_system).order_by(desc("count")).limit(3).all()
-        
-        for match in power_system_matches:
-            suggestions.append(SearchSuggestion(
-                text=match[0],
-                type="power_system",
-                match_count=match[1]
-            ))
-            
-        # 简化的标签建议（实际实现需要更复杂的JSON查询）
-        # 这里只是示例实现
-        tag_matches = []
-        all_templates = db.query(Character).filter(
-            Character.is_template == True,
-            Character.tags != None
-        ).limit(100).all()
-        
-        tag_count = {}
-        for template in all_templates:
-            for tag in template.tags or []:
-                if q.lower() in tag.lower():
-                    tag_count[tag] = tag_count.get(tag, 0) + 1
-        
-        # 排序并限制结果
-        sorted_tags = sorted(tag_count.items(), key=lambda x: x[1], reverse=True)[:3]
-        
-        for tag, count in sorted_tags:
-            suggestions.append(SearchSuggestion(
-                text=tag,
-                type="tag",
-                match_count=count
-            ))
-            
-        # 世界观建议
-        worldview_matches = db.query(Character.original_world, func.count(Character.id).label("count")).filter(
-            Character.is_template == True,
-            Character.original_world.contains(q)
-        ).group_by(Character.original_world).order_by(desc("count")).limit(2).all()
-        
-        for match in worldview_matches:
-            if match[0]:  # 确保不是None
-                suggestions.append(SearchSuggestion(
-                    text=match[0],
-                    type="worldview",
-                    match_count=match[1]
-                ))
+        # 由内存中的后缀索引直接给出建议，不访问数据库
+        suggestions = [
+            SearchSuggestion(**item)
+            for item in get_template_suggestion_index().suggest(db, q)
+        ]
         
         return suggestions
         
@@ -630,77 +551,9 @@ async def get_template_stats(
         角色模板统计信息
     """
     try:
-        # 获取模板总数
-        total_templates = db.query(func.count(Character.id)).filter(
-            Character.is_template == True
-        ).scalar() or 0
-        
-        # 获取总使用次数
-        total_usages = db.query(func.sum(CharacterTemplateDetail.usage_count)).scalar() or 0
-        
-        # 获取热门模板 (前5个)
-        popular_templates_query = db.query(Character).join(
-            CharacterTemplateDetail,
-            Character.id == CharacterTemplateDetail.character_id
-        ).filter(
-            Character.is_template == True
-        ).order_by(desc(CharacterTemplateDetail.usage_count)).limit(5)
-        
-        popular_templates = []
-        for template in popular_templates_query:
-            template_dict = template.to_summary_dict()
-            
-            if template.template_detail:
-                template_dict.update({
-                    "usage_count": template.template_detail.usage_count,
-                    "rating": template.template_detail.rating,
-                    "is_popular": template.template_detail.is_popular,
-                    "is_new": template.template_detail.is_new
-                })
-                
-            popular_templates.append(CharacterTemplateSummaryResponse.model_validate(template_dict))
-            
-        # 获取流行标签
-        # 简化实现，使用预定义标签
-        trending_tags = ["王者", "法师", "战士", "刺客", "坦克"]
-        
-        # 按类型使用统计
-        # 这里假设novel.genre已经映射到了Character
-        usage_by_genre = [
-            {"genre": "玄幻", "usage_count": 120},
-            {"genre": "武侠", "usage_count": 85},
-            {"genre": "仙侠", "usage_count": 65},
-            {"genre": "科幻", "usage_count": 45},
-            {"genre": "奇幻", "usage_count": 30}
-        ]
-        
-        # 获取用户统计
-        user_templates_used = db.query(func.count(CharacterTemplateUsage.id)).filter(
-            CharacterTemplateUsage.user_id == current_user.id
-        ).scalar() or 0
-        
-        user_favorite_count = db.query(func.count(CharacterTemplateFavorite.id)).filter(
-            CharacterTemplateFavorite.user_id == current_user.id
-        ).scalar() or 0
-        
-        # 获取用户最常用的标签
-        # 简化实现
-        user_most_used_tags = ["战士", "王者", "邪恶"]
-        
-        user_stats = {
-            "templates_used": user_templates_used,
-            "favorite_count": user_favorite_count,
-            "most_used_tags": user_most_used_tags
-        }
-        
-        return GetTemplateStatsResponse(
-            total_templates=total_templates,
-            total_usages=total_usages,
-            popular_templates=popular_templates,
-            trending_tags=trending_tags,
-            usage_by_genre=usage_by_genre,
-            user_stats=user_stats
-        )
+        # 直接读取物化的统计快照
+        stats = get_template_stats_snapshot().get_stats(db, current_user.id)
+        return GetTemplateStatsResponse(**stats)
         
     except Exception as e:
         raise HTTPException(
@@ -12,6 +12,7 @@ import logging
 
 from app.core.database import get_db
 from app.core.dependencies import get_current_user
+from app.core.spans import span
 from app.models.user import User
 from app.models.character import Character, CharacterType, CharacterGender
 from app.schemas.character import (
@@ -22,8 +23,10 @@ from app.schemas.character import (
 )
 from app.services.generation_service import get_generation_service
 from app.services.prompt_service import get_prompt_service
+from app.services.generation_context import GenerationContextLoader
+from app.services.job_queue import get_job_queue
+from app.api.v1.jobs import job_accepted_response
 from app.models.novel import Novel
-from app.models.worldview import Worldview
 
 router = APIRouter(prefix="/characters", tags=["角色管理"])
 logger = logging.getLogger(__name__)
@@ -402,6 +405,7 @@ async def batch_add_characters(
 @router.post("/generate", response_model=CharacterGenerationResponse)
 async def generate_characters(
     request: CharacterGenerationRequest,
+    background: bool = Query(False, description="后台执行：立即返回任务ID，通过 /jobs 接口查询结果"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -410,47 +414,47 @@ async def generate_characters(
     
     Args:
         request: 角色生成请求
+        background: 是否作为后台任务执行
         db: 数据库会话
         current_user: 当前用户
         
     Returns:
-        CharacterGenerationResponse: 角色生成响应
+        CharacterGenerationResponse: 角色生成响应（后台执行时为202与任务信息）
     """
+    if background:
+        return job_accepted_response(get_job_queue().enqueue(db, current_user.id, "characters", request))
+    return await run_character_generation(request, db, current_user.id)
+
+
+async def run_character_generation(
+    request: CharacterGenerationRequest,
+    db: Session,
+    user_id: int
+) -> CharacterGenerationResponse:
+    """生成并保存角色（同步接口与后台任务共用）"""
     try:
-        # 验证小说是否属于当前用户
-        novel = db.query(Novel).filter(
-            and_(Novel.id == request.novel_id, Novel.user_id == current_user.id)
-        ).first()
-        if not novel:
+        # 加载生成上下文（同时验证小说是否属于当前用户），已有角色用于避免重复
+        context = GenerationContextLoader(db, user_id).load(
+            request.novel_id,
+            include_worldviews=request.include_worldview and request.worldview_id is None,
+            worldview_id=request.worldview_id if request.include_worldview else None,
+            include_characters=True
+        )
+        if context is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="小说不存在或无权访问"
             )
         
-        # 获取世界观信息（如果需要）
-        worldview_info = ""
-        if request.include_worldview and request.worldview_id:
-            worldview = db.query(Worldview).filter(
-                and_(Worldview.id == request.worldview_id, Worldview.user_id == current_user.id)
-            ).first()
-            if worldview:
-                worldview_info = f"世界名称: {worldview.name}\n世界描述: {worldview.description or '无'}"
-        
-        # 准备小说信息
-        novel_info = {
-            "title": novel.title,
-            "genre": novel.genre.value if novel.genre else "通用",
-            "description": novel.description or ""
-        }
-        
         # 调用生成服务
         prompt_service = get_prompt_service(db)
         generation_service = get_generation_service(prompt_service)
         
         generation_result = await generation_service.generate_characters(
             request=request,
-            novel_info=novel_info,
-            worldview_info=worldview_info
+            context=context,
+            user_id=user_id,
+            db=db
         )
         
         if not generation_result.success:
@@ -486,19 +490,21 @@ async def generate_characters(
                     abilities=character_data.get("abilities", ""),
                     novel_id=request.novel_id,
                     worldview_id=request.worldview_id,
-                    user_id=current_user.id,
+                    user_id=user_id,
                     is_template=False
                 )
                 
                 db.add(character)
-                db.flush()  # 获取ID但不提交
+                with span("persist"):
+                    db.flush()  # 获取ID但不提交
                 created_characters.append(CharacterResponse.model_validate(character))
                 
             except Exception as e:
                 logger.error(f"创建角色失败: {str(e)}")
                 continue
         
-        db.commit()
+        with span("persist"):
+            db.commit()
         
         return CharacterGenerationResponse(
             success=True,
@@ -508,10 +514,12 @@ async def generate_characters(
             generation_data=generation_result.generation_data
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         logger.error(f"角色生成失败: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"角色生成失败: {str(e)}"
-        )
\ No newline at end of file
+        )
@@ -5,13 +5,16 @@ Created: 2025-06-01
 """
 
 import logging
-from typing import Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Dict, Any, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
+from app.core.cancellation import cancel_on_disconnect
 from app.core.database import get_db
 from app.core.dependencies import get_current_user
+from app.core.response_cache import get_response_cache
+from app.models.ai_model_config import AIModelConfig
 from app.models.user import User
 from app.services.prompt_service import get_prompt_service
 from app.services.generation_service import get_generation_service
@@ -38,13 +41,18 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 @router.get("/status")
 async def get_generation_status(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    获取AI生成服务状态
+    获取AI生成服务状态（带ETag，AI配置未变时返回304）
     """
     try:
+        cached = get_response_cache().lookup(request, current_user.id, (AIModelConfig,))
+        if cached.response is not None:
+            return cached.response
+        
         # 获取服务实例
         prompt_service = get_prompt_service(db)
         generation_service = get_generation_service(prompt_service)
@@ -69,7 +77,7 @@ async def get_generation_status(
             available_adapters = []
             default_adapter = None
         
-        return {
+        return cached.store({
             "success": True,
             "code": 200,
             "message": "获取服务状态成功",
@@ -78,7 +86,7 @@ async def get_generation_status(
                 "available_adapters": available_adapters,
                 "default_adapter": default_adapter
             }
-        }
+        })
         
     except Exception as e:
         logger.error(f"获取服务状态失败: {str(e)}")
@@ -96,13 +104,18 @@ async def get_generation_status(
 
 @router.get("/prompt-types")
 async def get_prompt_types(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    获取可用的提示词类型
+    获取可用的提示词类型（内容固定，带ETag）
     """
     try:
+        cached = get_response_cache().lookup(request, current_user.id)
+        if cached.response is not None:
+            return cached.response
+        
         # 获取服务实例
         prompt_service = get_prompt_service(db)
         
@@ -130,12 +143,12 @@ async def get_prompt_types(
             }
         ]
         
-        return {
+        return cached.store({
             "success": True,
             "code": 200,
             "message": "获取提示词类型成功",
             "data": prompt_types
-        }
+        })
         
     except Exception as e:
         logger.error(f"获取提示词类型失败: {str(e)}")
@@ -184,6 +197,8 @@ async def generate_novel_name(
         logger.info(f"用户 {current_user.username} 生成小说名成功")
         return result
         
+    except HTTPException:
+        raise
     except AIServiceError as e:
         logger.error(f"小说名生成失败: {str(e)}")
         raise HTTPException(
@@ -234,6 +249,8 @@ async def generate_novel_idea(
         logger.info(f"用户 {current_user.username} 生成小说创意成功")
         return result
         
+    except HTTPException:
+        raise
     except AIServiceError as e:
         logger.error(f"小说创意生成失败: {str(e)}")
         raise HTTPException(
@@ -289,6 +306,8 @@ async def generate_worldview(
         logger.info(f"用户 {current_user.username} 生成世界观成功")
         return result
         
+    except HTTPException:
+        raise
     except AIServiceError as e:
         logger.error(f"世界观生成失败: {str(e)}")
         raise HTTPException(
@@ -306,13 +325,14 @@ async def generate_worldview(
 @router.post("/brain-storm", response_model=BrainStormResponse)
 async def generate_brain_storm_new(
     request: NewBrainStormRequest,
+    http_request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     脑洞生成器 - 新版本
     
-    根据设计文档实现的完整脑洞生成器功能
+    根据设计文档实现的完整脑洞生成器功能，客户端断开时取消进行中的生成
     """
     try:
         logger.info(f"用户 {current_user.username} 请求脑洞生成: {request.topic}")
@@ -322,11 +342,17 @@ async def generate_brain_storm_new(
         brain_storm_service = get_brain_storm_service(prompt_service, db)
         
         # 生成脑洞创意
-        result = await brain_storm_service.generate_brain_storm(request, current_user.id)
+        result = await cancel_on_disconnect(
+            http_request,
+            brain_storm_service.generate_brain_storm(request, current_user.id),
+            "generation.brain_storm"
+        )
         
         logger.info(f"用户 {current_user.username} 脑洞生成成功")
         return result
         
+    except HTTPException:
+        raise
     except AIServiceError as e:
         logger.error(f"脑洞生成失败: {str(e)}")
         raise HTTPException(
@@ -345,6 +371,8 @@ async def generate_brain_storm_new(
 async def get_brain_storm_history(
     limit: int = 20,
     offset: int = 0,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -360,11 +388,15 @@ async def get_brain_storm_history(
         result = await brain_storm_service.get_generation_history(
             user_id=current_user.id,
             limit=limit,
-            offset=offset
+            offset=offset,
+            cursor=cursor,
+            include_total=include_total
         )
         
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取脑洞生成历史异常: {str(e)}")
         raise HTTPException(
@@ -0,0 +1,33 @@
+"""
+后台生成任务处理函数注册
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+from app.api.v1.chapters import run_chapter_generation
+from app.api.v1.characters import run_character_generation
+from app.api.v1.outline import run_detailed_outline_generation
+from app.api.v1.worldview import run_worldview_generation
+from app.schemas.chapter import ChapterBatchGenerationRequest, ChapterGenerationRequest
+from app.schemas.character import CharacterGenerationRequest
+from app.schemas.outline import DetailedOutlineGenerationRequest
+from app.schemas.worldview import WorldviewGenerationRequest
+from app.services.chapter_batch_service import BATCH_JOB_TYPE, get_chapter_batch_generator
+from app.services.job_queue import JobQueue
+
+
+def register_job_handlers(queue: JobQueue) -> None:
+    """
+    注册所有后台任务类型
+
+    API 服务与独立 worker 进程（scripts/worker.py）启动时都需调用，
+    未注册的任务类型既不能提交也不会被认领。
+
+    Args:
+        queue: 后台任务队列
+    """
+    queue.register("chapter", ChapterGenerationRequest, run_chapter_generation)
+    queue.register("characters", CharacterGenerationRequest, run_character_generation)
+    queue.register("detailed_outline", DetailedOutlineGenerationRequest, run_detailed_outline_generation)
+    queue.register("worldview", WorldviewGenerationRequest, run_worldview_generation)
+    queue.register(BATCH_JOB_TYPE, ChapterBatchGenerationRequest, get_chapter_batch_generator().run)
@@ -0,0 +1,169 @@
+"""
+后台生成任务API
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import logging
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal, get_db
+from app.core.dependencies import get_current_user
+from app.core.responses import model_response
+from app.core.sse import SSE_HEADERS, format_sse_comment, format_sse_event
+from app.models.generation_job import FINISHED_STATUSES, GenerationJob, GenerationJobStatus
+from app.models.user import User
+from app.schemas.job import GenerationJobResponse
+from app.services.job_queue import get_job_queue
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# 任务事件流无事件时发送保活注释的间隔（秒）
+KEEPALIVE_SECONDS = 15.0
+
+
+def job_accepted_response(job: GenerationJob) -> Response:
+    """
+    生成接口以后台任务执行时的响应（202，Location 指向任务查询接口）
+
+    Args:
+        job: 已提交的任务
+
+    Returns:
+        任务信息响应
+    """
+    return model_response(
+        GenerationJobResponse.model_validate(job),
+        status_code=status.HTTP_202_ACCEPTED,
+        headers={"Location": f"{settings.API_V1_PREFIX}/jobs/{job.id}"}
+    )
+
+
+def _get_user_job(db: Session, job_id: int, user_id: int) -> GenerationJob:
+    """获取当前用户的任务，不存在时抛出404"""
+    job = db.query(GenerationJob).filter(
+        GenerationJob.id == job_id,
+        GenerationJob.user_id == user_id
+    ).first()
+
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在或您没有权限访问"
+        )
+    return job
+
+
+@router.get("/{job_id}", response_model=GenerationJobResponse)
+async def get_generation_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    获取后台生成任务的状态与结果
+
+    Args:
+        job_id: 任务ID
+        current_user: 当前用户
+        db: 数据库会话
+
+    Returns:
+        GenerationJobResponse: 任务信息，完成后 result 为对应生成接口的响应
+    """
+    job = _get_user_job(db, job_id, current_user.id)
+    return GenerationJobResponse.model_validate(job)
+
+
+@router.get("/{job_id}/events")
+async def stream_generation_job(
+    job_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    以SSE事件流推送任务进度
+
+    状态或进度变化时发送 progress 事件；任务结束时发送 completed / failed /
+    cancelled 事件（数据为完整的任务信息）并关闭连接。
+
+    Args:
+        job_id: 任务ID
+        request: 请求对象（用于检测客户端断开）
+        current_user: 当前用户
+        db: 数据库会话
+    """
+    _get_user_job(db, job_id, current_user.id)
+    user_id = current_user.id
+    queue = get_job_queue()
+
+    def load() -> GenerationJobResponse:
+        # 每次使用独立的短会话，不在事件流期间占用连接与读事务
+        session = SessionLocal()
+        try:
+            return GenerationJobResponse.model_validate(_get_user_job(session, job_id, user_id))
+        finally:
+            session.close()
+
+    async def event_stream():
+        last_state = None
+        last_sent = time.monotonic()
+        while True:
+            try:
+                job = load()
+            except HTTPException as e:
+                yield format_sse_event("error", {"detail": e.detail})
+                return
+
+            if job.status in FINISHED_STATUSES:
+                yield format_sse_event(GenerationJobStatus(job.status).value, job.model_dump(mode="json"))
+                return
+
+            state = (job.status, job.progress, job.attempts)
+            if state != last_state:
+                last_state = state
+                last_sent = time.monotonic()
+                yield format_sse_event("progress", job.model_dump(mode="json", exclude={"result"}))
+            elif time.monotonic() - last_sent >= KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield format_sse_comment()
+
+            if await request.is_disconnected():
+                return
+            await queue.wait_for_update(job_id, settings.JOB_POLL_SECONDS)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.post("/{job_id}/cancel", response_model=GenerationJobResponse)
+async def cancel_generation_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    取消后台生成任务
+
+    Args:
+        job_id: 任务ID
+        current_user: 当前用户
+        db: 数据库会话
+
+    Returns:
+        GenerationJobResponse: 任务信息
+    """
+    job = _get_user_job(db, job_id, current_user.id)
+
+    if not job.is_finished():
+        get_job_queue().cancel(db, job)
+        db.refresh(job)
+
+    return GenerationJobResponse.model_validate(job)
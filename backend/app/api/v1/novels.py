@@ -7,26 +7,37 @@ Created: 2025-06-01
 import logging
 import json
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import desc, asc, and_, or_
+from sqlalchemy import desc, and_, or_
 
 from app.core.database import get_db
 from app.core.dependencies import get_current_user, validate_pagination_params
+from app.core.pagination import paginate_keyset, get_total_count_cache
+from app.core.response_cache import get_response_cache
+from app.core.responses import ORJSONResponse
 from app.models.user import User
 from app.models.novel import Novel
+from app.models.chapter import Chapter
+from app.models.character import Character
+from app.models.outline import RoughOutline, DetailedOutline
+from app.models.worldview import Worldview
 from app.schemas.novel import (
     NovelCreate, NovelUpdate, NovelResponse, NovelListResponse,
     NovelSearchParams, NovelStats, NovelStatus, NovelGenre,
     NovelDetailResponse, NovelDetailStats, NovelContentOverview,
     NovelStatsDetailResponse, Activity, RecentActivitiesResponse
 )
+from app.services.chapter_context_index import get_chapter_context_index
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 小说详情响应依赖的模型（统计与内容概览涉及的表）
+NOVEL_DETAIL_MODELS = (Novel, Chapter, Worldview, Character, RoughOutline, DetailedOutline)
+
 
 @router.post("", status_code=status.HTTP_201_CREATED)
 async def create_novel(
@@ -191,6 +202,8 @@ async def get_novels(
     sort_order: str = Query("desc", description="排序方向"),
     date_from: Optional[str] = Query(None, description="创建时间起始"),
     date_to: Optional[str] = Query(None, description="创建时间结束"),
+    cursor: Optional[str] = Query(None, description="分页游标（优先于页码）"),
+    include_total: bool = Query(True, description="是否返回总数"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -207,6 +220,8 @@ async def get_novels(
         sort_order: 排序方向
         date_from: 创建时间起始
         date_to: 创建时间结束
+        cursor: 分页游标
+        include_total: 是否返回总数
         current_user: 当前用户
         db: 数据库会话
         
@@ -238,19 +253,34 @@ async def get_novels(
         if date_to:
             query = query.filter(Novel.created_at <= date_to)
         
-        # 添加排序
-        sort_column = getattr(Novel, sort_by, Novel.updated_at)
-        if sort_order.lower() == "asc":
-            query = query.order_by(asc(sort_column))
-        else:
-            query = query.order_by(desc(sort_column))
-        
-        # 计算总数
-        total = query.count()
+        # 排序字段只允许数据表列
+        if sort_by not in Novel.__table__.columns:
+            sort_by = "updated_at"
+        sort_column = getattr(Novel, sort_by)
+        descending = sort_order.lower() != "asc"
+        
+        # 计算总数（首页精确计数，翻页复用缓存的近似值）
+        total = None
+        if include_total:
+            cache_key = get_total_count_cache().make_key(
+                "novels", current_user.id, search, status, genre, date_from, date_to
+            )
+            total = get_total_count_cache().get_total(
+                cache_key, query, exact=not cursor and page == 1
+            )
         
-        # 应用分页
-        offset = (page - 1) * page_size
-        novels = query.offset(offset).limit(page_size).all()
+        # 应用游标分页
+        result = paginate_keyset(
+            query,
+            sort_column,
+            Novel.id,
+            limit=page_size,
+            descending=descending,
+            cursor=cursor,
+            offset=(page - 1) * page_size,
+            signature=f"{sort_by}:{'desc' if descending else 'asc'}"
+        )
+        novels = result.items
         
         # 获取章节统计
         from app.models.chapter import Chapter
@@ -289,20 +319,24 @@ async def get_novels(
             novels_data.append(novel_data)
         
         # 计算分页信息
-        total_pages = (total + page_size - 1) // page_size
+        total_pages = (total + page_size - 1) // page_size if total is not None else None
         
-        return {
+        return ORJSONResponse({
             "status": "success",
             "data": {
                 "novels": novels_data,
                 "total": total,
                 "page": page,
                 "page_size": page_size,
-                "total_pages": total_pages
+                "total_pages": total_pages,
+                "next_cursor": result.next_cursor,
+                "has_more": result.has_more
             },
             "message": "小说列表获取成功"
-        }
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取小说列表失败: {str(e)}")
         raise HTTPException(
@@ -383,6 +417,7 @@ async def get_recent_novels(
 @router.get("/{novel_id}", response_model=NovelDetailResponse)
 async def get_novel(
     novel_id: int,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -395,12 +430,16 @@ async def get_novel(
         db: 数据库会话
         
     Returns:
-        NovelDetailResponse: 扩展的小说详情
+        NovelDetailResponse: 扩展的小说详情（带ETag，内容未变时返回304）
         
     Raises:
         HTTPException: 小说不存在或无权限时抛出异常
     """
     try:
+        cached = get_response_cache().lookup(request, current_user.id, NOVEL_DETAIL_MODELS)
+        if cached.response is not None:
+            return cached.response
+        
         novel = db.query(Novel).filter(
             Novel.id == novel_id,
             Novel.user_id == current_user.id
@@ -434,7 +473,7 @@ async def get_novel(
             except:
                 tags = []
         
-        return NovelDetailResponse(
+        return cached.store(NovelDetailResponse(
             id=novel.id,
             title=novel.title,
             description=novel.description,
@@ -456,7 +495,7 @@ async def get_novel(
             last_chapter_title=latest_chapter.title if latest_chapter else None,
             stats=stats,
             content_overview=content_overview
-        )
+        ))
         
     except HTTPException:
         raise
@@ -573,6 +612,7 @@ async def delete_novel(
         novel_title = novel.title
         db.delete(novel)
         db.commit()
+        get_chapter_context_index().remove_novel(novel_id)
         
         return {
             "status": "success",
@@ -619,9 +659,11 @@ async def batch_delete_novels(
         failed_count = 0
         failed_items = []
         
+        deleted_ids = []
         for novel in novels:
             try:
                 db.delete(novel)
+                deleted_ids.append(novel.id)
                 success_count += 1
             except Exception as e:
                 failed_count += 1
@@ -631,6 +673,8 @@ async def batch_delete_novels(
                 })
         
         db.commit()
+        for novel_id in deleted_ids:
+            get_chapter_context_index().remove_novel(novel_id)
         
         return {
             "status": "success",
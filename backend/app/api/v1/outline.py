@@ -7,11 +7,15 @@ Created: 2025-06-01
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import and_, or_, insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import logging
 
 from app.core.database import get_db
 from app.core.dependencies import get_current_user
+from app.core.spans import span
 from app.models.user import User
 from app.models.novel import Novel
 from app.models.outline import RoughOutline, DetailedOutline, OutlineType
@@ -25,8 +29,9 @@ from app.schemas.outline import (
 )
 from app.services.generation_service import get_generation_service
 from app.services.prompt_service import get_prompt_service
-from app.models.worldview import Worldview
-from app.models.character import Character
+from app.services.generation_context import GenerationContextLoader
+from app.services.job_queue import get_job_queue
+from app.api.v1.jobs import job_accepted_response
 
 router = APIRouter(prefix="/outline", tags=["大纲管理"])
 logger = logging.getLogger(__name__)
@@ -285,6 +290,15 @@ async def create_detailed_outline(
         
         return DetailedOutlineResponse.model_validate(outline)
         
+    except HTTPException:
+        raise
+    except IntegrityError:
+        # 并发创建同一章节号时由唯一索引拦截
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"章节 {outline_data.chapter_number} 的详细大纲已存在"
+        )
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -396,8 +410,22 @@ async def update_detailed_outline(
                 detail="详细大纲不存在"
             )
         
-        # 更新大纲信息
+        # 修改章节号时检查目标章节号是否已有大纲
         update_data = outline_data.model_dump(exclude_unset=True)
+        chapter_number = update_data.pop("chapter_number", None)
+        if chapter_number is not None and chapter_number != outline.chapter_number:
+            existing_outline = db.query(DetailedOutline.id).filter(
+                DetailedOutline.novel_id == outline.novel_id,
+                DetailedOutline.chapter_number == chapter_number
+            ).first()
+            if existing_outline:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"章节 {chapter_number} 的详细大纲已存在"
+                )
+            outline.chapter_number = chapter_number
+        
+        # 更新大纲信息
         outline.update_from_dict(update_data)
         
         db.commit()
@@ -405,6 +433,15 @@ async def update_detailed_outline(
         
         return DetailedOutlineResponse.model_validate(outline)
         
+    except HTTPException:
+        raise
+    except IntegrityError:
+        # 并发修改为同一章节号时由唯一索引拦截
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"章节 {outline_data.chapter_number} 的详细大纲已存在"
+        )
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -446,6 +483,82 @@ async def delete_detailed_outline(
 
 # ============ 大纲生成 API ============
 
+# 详细大纲批量写入时允许的字段及默认值
+DETAILED_OUTLINE_FIELDS = {
+    "chapter_title": "未命名章节",
+    "plot_points": "",
+    "participating_characters": [],
+    "entering_characters": [],
+    "exiting_characters": [],
+    "chapter_summary": "",
+    "is_plot_end": False,
+    "is_new_plot": False,
+    "new_plot_summary": ""
+}
+
+
+def bulk_create_detailed_outlines(
+    db: Session,
+    novel_id: int,
+    user_id: int,
+    outline_items: List[dict]
+) -> List[DetailedOutline]:
+    """
+    批量创建详细大纲，已存在章节号的条目跳过
+    
+    一次查询取出已有章节号，新条目通过一条批量 INSERT ... ON CONFLICT DO NOTHING
+    写入并返回创建的行，语句数量与章节数无关。
+    
+    Args:
+        db: 数据库会话
+        novel_id: 小说ID
+        user_id: 用户ID
+        outline_items: 生成的章节大纲数据列表
+        
+    Returns:
+        List[DetailedOutline]: 新创建的详细大纲（按章节号排序），调用方负责提交
+    """
+    existing_numbers = {
+        row.chapter_number for row in db.query(DetailedOutline.chapter_number).filter(
+            DetailedOutline.novel_id == novel_id
+        )
+    }
+    
+    rows = []
+    for item in outline_items:
+        try:
+            chapter_number = int(item.get("chapter_number", 1))
+        except (TypeError, ValueError):
+            logger.warning(f"详细大纲章节号无效，跳过: {item.get('chapter_number')}")
+            continue
+        if chapter_number in existing_numbers:
+            logger.warning(f"章节 {chapter_number} 的详细大纲已存在，跳过创建")
+            continue
+        existing_numbers.add(chapter_number)
+        
+        row = {
+            field: item.get(field) if item.get(field) is not None else default
+            for field, default in DETAILED_OUTLINE_FIELDS.items()
+        }
+        row.update(novel_id=novel_id, chapter_number=chapter_number, user_id=user_id)
+        rows.append(row)
+    
+    if not rows:
+        return []
+    
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        statement = sqlite_insert(DetailedOutline).on_conflict_do_nothing()
+    elif dialect == "postgresql":
+        statement = postgresql_insert(DetailedOutline).on_conflict_do_nothing()
+    else:
+        statement = insert(DetailedOutline)
+    
+    created = list(db.scalars(statement.returning(DetailedOutline), rows))
+    created.sort(key=lambda outline: outline.chapter_number)
+    return created
+
+
 @router.post("/generate/rough", response_model=OutlineGenerationResponse)
 async def generate_rough_outline(
     request: RoughOutlineGenerationRequest,
@@ -464,46 +577,27 @@ async def generate_rough_outline(
         OutlineGenerationResponse: 大纲生成响应
     """
     try:
-        # 验证小说是否属于当前用户
-        novel = db.query(Novel).filter(
-            and_(Novel.id == request.novel_id, Novel.user_id == current_user.id)
-        ).first()
-        if not novel:
+        # 加载生成上下文（同时验证小说是否属于当前用户）
+        context = GenerationContextLoader(db, current_user.id).load(
+            request.novel_id,
+            include_worldviews=request.include_worldview,
+            include_characters=request.include_novel_idea
+        )
+        if context is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="小说不存在或无权访问"
             )
         
-        # 获取世界观信息（如果需要）
-        worldview_info = ""
-        character_info = ""
-        
-        if request.include_worldview:
-            worldviews = db.query(Worldview).filter(
-                and_(Worldview.novel_id == request.novel_id, Worldview.user_id == current_user.id)
-            ).all()
-            if worldviews:
-                worldview_info = "\n".join([f"世界名称: {w.name}\n世界描述: {w.description or '无'}" for w in worldviews])
-        
-        if request.include_novel_idea:
-            character_info = "包含小说创意信息"  # 这里可以进一步扩展
-        
-        # 准备小说信息
-        novel_info = {
-            "title": novel.title,
-            "genre": novel.genre.value if novel.genre else "通用",
-            "description": novel.description or ""
-        }
-        
         # 调用生成服务
         prompt_service = get_prompt_service(db)
         generation_service = get_generation_service(prompt_service)
         
         generation_result = await generation_service.generate_rough_outline(
             request=request,
-            novel_info=novel_info,
-            worldview_info=worldview_info,
-            character_info=character_info
+            context=context,
+            user_id=current_user.id,
+            db=db
         )
         
         if not generation_result.success:
@@ -517,7 +611,9 @@ async def generate_rough_outline(
                 outline_type_mapping = {
                     "storyline": OutlineType.STORYLINE,
                     "character_growth": OutlineType.CHARACTER_GROWTH,
+                    "major_event": OutlineType.MAJOR_EVENT,
                     "major_events": OutlineType.MAJOR_EVENT,
+                    "plot_point": OutlineType.PLOT_POINT,
                     "plot_points": OutlineType.PLOT_POINT
                 }
                 
@@ -551,6 +647,8 @@ async def generate_rough_outline(
             generation_data=generation_result.generation_data
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -561,6 +659,7 @@ async def generate_rough_outline(
 @router.post("/generate/detailed", response_model=OutlineGenerationResponse)
 async def generate_detailed_outline(
     request: DetailedOutlineGenerationRequest,
+    background: bool = Query(False, description="后台执行：立即返回任务ID，通过 /jobs 接口查询结果"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -569,112 +668,62 @@ async def generate_detailed_outline(
     
     Args:
         request: 详细大纲生成请求
+        background: 是否作为后台任务执行
         db: 数据库会话
         current_user: 当前用户
         
     Returns:
-        OutlineGenerationResponse: 大纲生成响应
+        OutlineGenerationResponse: 大纲生成响应（后台执行时为202与任务信息）
     """
+    if background:
+        return job_accepted_response(get_job_queue().enqueue(db, current_user.id, "detailed_outline", request))
+    return await run_detailed_outline_generation(request, db, current_user.id)
+
+
+async def run_detailed_outline_generation(
+    request: DetailedOutlineGenerationRequest,
+    db: Session,
+    user_id: int
+) -> OutlineGenerationResponse:
+    """生成并保存详细大纲（同步接口与后台任务共用）"""
     try:
-        # 验证小说是否属于当前用户
-        novel = db.query(Novel).filter(
-            and_(Novel.id == request.novel_id, Novel.user_id == current_user.id)
-        ).first()
-        if not novel:
+        # 加载生成上下文（同时验证小说是否属于当前用户）
+        context = GenerationContextLoader(db, user_id).load(
+            request.novel_id,
+            include_worldviews=request.include_worldview,
+            include_rough_outlines=request.include_rough_outline,
+            include_characters=request.include_characters
+        )
+        if context is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="小说不存在或无权访问"
             )
         
-        # 获取相关信息
-        worldview_info = ""
-        rough_outline_info = ""
-        character_info = ""
-        
-        if request.include_worldview:
-            worldviews = db.query(Worldview).filter(
-                and_(Worldview.novel_id == request.novel_id, Worldview.user_id == current_user.id)
-            ).all()
-            if worldviews:
-                worldview_info = "\n".join([f"世界名称: {w.name}\n世界描述: {w.description or '无'}" for w in worldviews])
-        
-        if request.include_rough_outline:
-            rough_outlines = db.query(RoughOutline).filter(
-                and_(RoughOutline.novel_id == request.novel_id, RoughOutline.user_id == current_user.id)
-            ).all()
-            if rough_outlines:
-                rough_outline_info = "\n".join([f"大纲类型: {ro.outline_type}\n标题: {ro.title}\n内容: {ro.content}" for ro in rough_outlines])
-        
-        if request.include_characters:
-            characters = db.query(Character).filter(
-                and_(Character.novel_id == request.novel_id, Character.user_id == current_user.id)
-            ).all()
-            if characters:
-                character_info = "\n".join([f"角色名: {c.name}\n类型: {c.character_type}\n描述: {c.description or '无'}" for c in characters])
-        
-        # 准备小说信息
-        novel_info = {
-            "title": novel.title,
-            "genre": novel.genre.value if novel.genre else "通用",
-            "description": novel.description or ""
-        }
-        
         # 调用生成服务
         prompt_service = get_prompt_service(db)
         generation_service = get_generation_service(prompt_service)
         
         generation_result = await generation_service.generate_detailed_outline(
             request=request,
-            novel_info=novel_info,
-            worldview_info=worldview_info,
-            rough_outline_info=rough_outline_info,
-            character_info=character_info
+            context=context,
+            user_id=user_id,
+            db=db
         )
         
         if not generation_result.success:
             return generation_result
         
-        # 将生成的数据转换为详细大纲对象并保存到数据库
-        created_outlines = []
-        for outline_data in generation_result.generation_data or []:
-            try:
-                # 检查章节号是否已存在
-                existing_outline = db.query(DetailedOutline).filter(
-                    and_(
-                        DetailedOutline.novel_id == request.novel_id,
-                        DetailedOutline.chapter_number == outline_data.get("chapter_number"),
-                        DetailedOutline.user_id == current_user.id
-                    )
-                ).first()
-                
-                if existing_outline:
-                    logger.warning(f"章节 {outline_data.get('chapter_number')} 的详细大纲已存在，跳过创建")
-                    continue
-                
-                detailed_outline = DetailedOutline(
-                    novel_id=request.novel_id,
-                    chapter_number=outline_data.get("chapter_number", 1),
-                    chapter_title=outline_data.get("chapter_title", "未命名章节"),
-                    plot_points=outline_data.get("plot_points", ""),
-                    participating_characters=outline_data.get("participating_characters", []),
-                    entering_characters=outline_data.get("entering_characters", []),
-                    exiting_characters=outline_data.get("exiting_characters", []),
-                    chapter_summary=outline_data.get("chapter_summary", ""),
-                    is_plot_end=outline_data.get("is_plot_end", False),
-                    is_new_plot=outline_data.get("is_new_plot", False),
-                    new_plot_summary=outline_data.get("new_plot_summary", ""),
-                    user_id=current_user.id
-                )
-                
-                db.add(detailed_outline)
-                db.flush()  # 获取ID但不提交
-                created_outlines.append(DetailedOutlineResponse.model_validate(detailed_outline))
-                
-            except Exception as e:
-                logger.error(f"创建详细大纲失败: {str(e)}")
-                continue
-        
-        db.commit()
+        # 批量写入新章节的详细大纲（已存在的章节号跳过）
+        with span("persist"):
+            created = bulk_create_detailed_outlines(
+                db,
+                request.novel_id,
+                user_id,
+                generation_result.generation_data or []
+            )
+            created_outlines = [DetailedOutlineResponse.model_validate(outline) for outline in created]
+            db.commit()
         
         return OutlineGenerationResponse(
             success=True,
@@ -685,6 +734,8 @@ async def generate_detailed_outline(
             generation_data=generation_result.generation_data
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
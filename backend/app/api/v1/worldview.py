@@ -5,13 +5,18 @@ Created: 2025-06-01
 Updated: 2025-06-03
 """
 
+import logging
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, update
 
 from app.core.database import get_db
 from app.core.dependencies import get_current_user
+from app.core.response_cache import get_response_cache
+from app.core.responses import ORJSONResponse
+from app.core.sse import SSE_HEADERS, format_sse_event
 from app.models.user import User
 from app.models.novel import Novel
 from app.models.worldview import (
@@ -25,8 +30,16 @@ from app.schemas.worldview import (
     FactionCreate, FactionUpdate, FactionResponse,
     WorldviewListResponse, WorldMapListResponse,
     CultivationSystemListResponse, HistoryListResponse, FactionListResponse,
-    WorldviewGenerationRequest, WorldviewGenerationResponse
+    WorldviewGenerationRequest, WorldviewGenerationResponse,
+    WorldMapTreeGenerationRequest
 )
+from app.services.world_map_generator import get_world_map_tree_generator
+from app.services.worldview_converter import WorldviewConverter
+from app.services.worldview_tree import load_worldview_tree
+from app.services.job_queue import get_job_queue
+from app.api.v1.jobs import job_accepted_response
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/worldview", tags=["世界观管理"])
 
@@ -89,11 +102,16 @@ async def create_worldview(
 @router.get("/novel/{novel_id}")
 async def get_worldviews_by_novel(
     novel_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取小说的世界观列表"""
+    """获取小说的世界观列表（带ETag，内容未变时返回304）"""
     try:
+        cached = get_response_cache().lookup(request, current_user.id, (Novel, Worldview))
+        if cached.response is not None:
+            return cached.response
+        
         # 验证小说是否属于当前用户
         novel = db.query(Novel).filter(
             and_(Novel.id == novel_id, Novel.user_id == current_user.id)
@@ -117,7 +135,7 @@ async def get_worldviews_by_novel(
             for worldview in worldviews
         ]
         
-        return {
+        return cached.store({
             "success": True,
             "code": 200,
             "message": "获取世界观列表成功",
@@ -125,7 +143,7 @@ async def get_worldviews_by_novel(
                 "items": worldview_responses,
                 "total": len(worldview_responses)
             }
-        }
+        })
         
     except Exception as e:
         return {
@@ -156,6 +174,40 @@ async def get_worldview(
     return WorldviewResponse.model_validate(worldview)
 
 
+@router.get("/{worldview_id}/full")
+async def get_worldview_full(
+    worldview_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取世界观及其全部子数据（地图区域树、修炼体系、历史事件、阵营势力）
+    
+    一次请求替代分别获取世界观与四类子数据的五次请求。
+    """
+    try:
+        data = load_worldview_tree(db, worldview_id, current_user.id)
+        if data is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="世界观不存在"
+            )
+        
+        # 数据已是纯字典，直接序列化，跳过 jsonable_encoder
+        return ORJSONResponse({
+            "success": True,
+            "code": 200,
+            "message": "获取世界观完整数据成功",
+            "data": data
+        })
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"获取世界观完整数据失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"获取世界观完整数据失败: {str(e)}")
+
+
 @router.put("/{worldview_id}")
 async def update_worldview(
     worldview_id: int,
@@ -934,14 +986,26 @@ async def delete_faction(
 @router.post("/generate", response_model=WorldviewGenerationResponse)
 async def generate_worldview(
     request: WorldviewGenerationRequest,
+    background: bool = Query(False, description="后台执行：立即返回任务ID，通过 /jobs 接口查询结果"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """AI生成世界观"""
+    """AI生成世界观（background=true 时作为后台任务执行，返回202与任务信息）"""
+    if background:
+        return job_accepted_response(get_job_queue().enqueue(db, current_user.id, "worldview", request))
+    return await run_worldview_generation(request, db, current_user.id)
+
+
+async def run_worldview_generation(
+    request: WorldviewGenerationRequest,
+    db: Session,
+    user_id: int
+) -> WorldviewGenerationResponse:
+    """生成世界观（同步接口与后台任务共用）"""
     try:
         # 验证小说是否属于当前用户
         novel = db.query(Novel).filter(
-            and_(Novel.id == request.novel_id, Novel.user_id == current_user.id)
+            and_(Novel.id == request.novel_id, Novel.user_id == user_id)
         ).first()
         if not novel:
             raise HTTPException(
@@ -958,12 +1022,14 @@ async def generate_worldview(
         
         result = await generation_service.generate_worldview(
             request=request,
-            user_id=current_user.id,
+            user_id=user_id,
             db=db
         )
         
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1033,6 +1099,8 @@ async def generate_world_maps(
             "data": result
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         return {
             "success": False,
@@ -1040,6 +1108,53 @@ async def generate_world_maps(
             "message": f"生成地图失败: {str(e)}",
             "data": None
         }
+
+
+@router.post("/{worldview_id}/maps/generate-tree")
+async def generate_world_map_tree(
+    worldview_id: int,
+    request: WorldMapTreeGenerationRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    AI逐层生成并保存层级地图，以SSE事件流返回每层进度
+    
+    同一层所有区域的子区域并发生成，每层生成完成后批量保存。
+    """
+    try:
+        worldview = db.query(Worldview).filter(
+            and_(Worldview.id == worldview_id, Worldview.user_id == current_user.id)
+        ).first()
+        if not worldview:
+            raise HTTPException(status_code=404, detail="世界观不存在或无权访问")
+        
+        if request.root_region_id:
+            root_region = db.query(WorldMap.id).filter(
+                and_(
+                    WorldMap.id == request.root_region_id,
+                    WorldMap.worldview_id == worldview_id,
+                    WorldMap.user_id == current_user.id
+                )
+            ).first()
+            if not root_region:
+                raise HTTPException(status_code=404, detail="起始区域不存在")
+        
+        generator = get_world_map_tree_generator()
+        
+        async def event_stream():
+            async for progress in generator.expand(worldview_id, current_user.id, request):
+                yield format_sse_event(progress["event"], progress["data"])
+        
+        return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"启动层级地图生成失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"启动层级地图生成失败: {str(e)}")
+
+
 @router.post("/{worldview_id}/cultivation/generate")
 async def generate_cultivation_system(
     worldview_id: int,
@@ -1082,6 +1197,8 @@ async def generate_cultivation_system(
             "data": result
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         return {
             "success": False,
@@ -1122,60 +1239,22 @@ async def save_generated_cultivation(
                 "data": None
             }
         
-        saved_count = 0
-        saved_systems = []
-        
-        # 保存生成的修炼体系
+        # 所有体系的等级行一次性批量插入
+        rows = []
         for system_data in generated_systems:
-            try:
-                system_name = system_data.get("system_name", "未命名修炼体系")
-                levels = system_data.get("levels", [])
-                
-                # 为每个等级创建记录
-                for idx, level_data in enumerate(levels):
-                    if isinstance(level_data, dict):
-                        level_name = level_data.get("name", f"第{idx+1}级")
-                        level_desc = level_data.get("description", "")
-                        cultivation_method = level_data.get("cultivation_method", "")
-                        required_resources = level_data.get("required_resources", "")
-                        breakthrough_condition = level_data.get("breakthrough_condition", "")
-                        power_description = level_data.get("power_description", "")
-                    else:
-                        level_name = str(level_data)
-                        level_desc = f"{level_name}等级"
-                        cultivation_method = ""
-                        required_resources = ""
-                        breakthrough_condition = ""
-                        power_description = ""
-                    
-                    cultivation_level = CultivationSystem(
-                        system_name=system_name,
-                        level_name=level_name,
-                        description=level_desc,
-                        level_order=idx + 1,
-                        cultivation_method=cultivation_method,
-                        required_resources=required_resources,
-                        breakthrough_condition=breakthrough_condition,
-                        power_description=power_description,
-                        worldview_id=worldview_id,
-                        user_id=current_user.id
-                    )
-                    
-                    db.add(cultivation_level)
-                    db.flush()  # 获取ID
-                    
-                    saved_systems.append({
-                        "id": cultivation_level.id,
-                        "system_name": cultivation_level.system_name,
-                        "level_name": cultivation_level.level_name,
-                        "level_order": cultivation_level.level_order
-                    })
-                    saved_count += 1
-                    
-            except Exception as e:
-                print(f"保存修炼体系时出错: {e}")
+            if not isinstance(system_data, dict):
+                logger.warning(f"跳过无效的修炼体系数据: {system_data!r}")
                 continue
-        
+            rows.extend(WorldviewConverter.convert_cultivation_levels(
+                system_data.get("system_name") or "未命名修炼体系",
+                system_data.get("levels") or []
+            ))
+
+        saved_systems = WorldviewConverter.insert_rows(
+            db, "cultivation_systems", rows, worldview_id, current_user.id,
+            returning=("system_name", "level_name", "level_order")
+        )
+        saved_count = len(saved_systems)
         db.commit()
         
         return {
@@ -1230,9 +1309,6 @@ async def save_generated_maps(
                 "data": None
             }
         
-        saved_count = 0
-        saved_maps = []
-        
         # 确定子区域的层级
         parent_level = 1
         if parent_region_id:
@@ -1249,38 +1325,13 @@ async def save_generated_maps(
         child_level = parent_level + 1
         
         # 保存生成的地图区域
-        for map_data in generated_maps:
-            try:
-                world_map = WorldMap(
-                    region_name=map_data.get("name", ""),
-                    description=map_data.get("description", ""),
-                    climate=map_data.get("climate", ""),
-                    terrain=map_data.get("terrain", ""),
-                    resources=map_data.get("resources", ""),
-                    population=map_data.get("population", ""),
-                    culture=map_data.get("culture", ""),
-                    parent_region_id=parent_region_id,
-                    level=child_level,
-                    worldview_id=worldview_id,
-                    user_id=current_user.id
-                )
-                
-                db.add(world_map)
-                db.flush()  # 获取ID
-                
-                saved_maps.append({
-                    "id": world_map.id,
-                    "region_name": world_map.region_name,
-                    "description": world_map.description,
-                    "level": world_map.level,
-                    "parent_region_id": world_map.parent_region_id
-                })
-                saved_count += 1
-                
-            except Exception as e:
-                print(f"保存地图区域时出错: {e}")
-                continue
-        
+        saved_maps = WorldviewConverter.insert_rows(
+            db, "world_maps",
+            WorldviewConverter.convert_map_regions(generated_maps, child_level, parent_region_id),
+            worldview_id, current_user.id,
+            returning=("region_name", "description", "level", "parent_region_id")
+        )
+        saved_count = len(saved_maps)
         db.commit()
         
         return {
@@ -1315,13 +1366,10 @@ async def save_generated_worldview(
         novel_id = request.get("novel_id")
         generated_data = request.get("generated_data", {})
         
-        print(f"接收到的参数 - novel_id: {novel_id}")
-        print(f"generated_data keys: {list(generated_data.keys()) if isinstance(generated_data, dict) else type(generated_data)}")
-        
         if not novel_id:
             raise HTTPException(status_code=400, detail="缺少 novel_id 参数")
         
-        if not generated_data:
+        if not generated_data or not isinstance(generated_data, dict):
             raise HTTPException(status_code=400, detail="缺少 generated_data 参数")
         
         # 验证小说归属
@@ -1332,17 +1380,23 @@ async def save_generated_worldview(
         if not novel:
             raise HTTPException(status_code=404, detail="小说不存在或无权访问")
         
-        # 检查是否已存在主世界观，如果有则将其设为非主世界观
-        existing_primary = db.query(Worldview).filter(
-            and_(Worldview.novel_id == novel_id, Worldview.is_primary == True)
-        ).first()
-        if existing_primary:
-            existing_primary.is_primary = False
+        # 先完成数据转换，转换失败时不会产生任何写入
+        try:
+            database_data = WorldviewConverter.convert_generated_to_database_format(generated_data)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # 将已有的主世界观设为非主世界观
+        db.execute(
+            update(Worldview)
+            .where(Worldview.novel_id == novel_id, Worldview.is_primary == True)
+            .values(is_primary=False)
+        )
         
         # 创建主世界观
-        worldview_data = generated_data.get("worldview", {})
+        worldview_data = generated_data.get("worldview") or {}
         worldview = Worldview(
-            name=worldview_data.get("name", "AI生成世界观"),
+            name=worldview_data.get("name") or "AI生成世界观",
             description=worldview_data.get("description", ""),
             novel_id=novel_id,
             user_id=current_user.id,
@@ -1352,142 +1406,16 @@ async def save_generated_worldview(
         db.add(worldview)
         db.flush()  # 获取 worldview.id
         
-        saved_count = 1  # 世界观本身
-        
-        # 保存世界地图
-        world_maps = generated_data.get("world_maps", [])
-        for map_data in world_maps:
-            try:
-                # 处理notable_features
-                notable_features = map_data.get("notable_features", [])
-                description = map_data.get("description", "")
-                if notable_features and isinstance(notable_features, list):
-                    features_str = ", ".join(str(f) for f in notable_features)
-                    description += f"\n\n特色地点：{features_str}"
-                
-                world_map = WorldMap(
-                    region_name=map_data.get("name", ""),
-                    description=description,
-                    climate=map_data.get("climate", ""),
-                    terrain=None,
-                    resources=None,
-                    population=None,
-                    culture=None,
-                    parent_region_id=None,
-                    worldview_id=worldview.id,
-                    user_id=current_user.id,
-                    level=1
-                )
-                db.add(world_map)
-                saved_count += 1
-            except Exception as e:
-                print(f"保存世界地图时出错: {e}")
-                continue
-        
-        # 保存修炼体系
-        cultivation_system = generated_data.get("cultivation_system", {})
-        if cultivation_system:
-            try:
-                system_name = cultivation_system.get("name", "未命名修炼体系")
-                system_description = cultivation_system.get("description", "")
-                levels = cultivation_system.get("levels", [])
-                
-                # 处理额外信息
-                unique_features = cultivation_system.get("unique_features", [])
-                cultivation_methods = cultivation_system.get("cultivation_methods", [])
-                
-                if unique_features:
-                    system_description += f"\n\n特色功能：{', '.join(str(f) for f in unique_features)}"
-                if cultivation_methods:
-                    system_description += f"\n\n修炼方法：{', '.join(str(m) for m in cultivation_methods)}"
-                
-                # 为每个等级创建记录
-                for idx, level_data in enumerate(levels):
-                    if isinstance(level_data, dict):
-                        level_name = level_data.get("name", f"第{idx+1}级")
-                        level_desc = level_data.get("description", "")
-                    else:
-                        level_name = str(level_data)
-                        level_desc = f"{level_name}等级"
-                    
-                    # 创建修炼体系记录，包含所有字段
-                    cultivation_level = CultivationSystem(
-                        system_name=system_name,
-                        level_name=level_name,
-                        description=level_desc,
-                        level_order=idx + 1,
-                        worldview_id=worldview.id,
-                        user_id=current_user.id,
-                        cultivation_method=system_description,
-                        required_resources=None,
-                        breakthrough_condition=None,
-                        power_description=None
-                    )
-                    db.add(cultivation_level)
-                    saved_count += 1
-                    
-            except Exception as e:
-                print(f"保存修炼体系时出错: {e}")
-        
-        # 保存历史事件
-        histories = generated_data.get("histories", [])
-        for idx, history_data in enumerate(histories):
-            try:
-                # 处理major_events
-                major_events = history_data.get("major_events", [])
-                description = history_data.get("description", "")
-                
-                if major_events and isinstance(major_events, list):
-                    events_str = "; ".join(str(e) for e in major_events)
-                    description += f"\n\n重大事件：{events_str}"
-                
-                history = History(
-                    event_name=history_data.get("name", f"历史事件{idx+1}"),
-                    background=description,  # 使用 background 字段（NOT NULL）
-                    description=description,  # 保留新的 description 字段
-                    time_period=history_data.get("time_period", ""),
-                    event_type=None,
-                    participants=None,
-                    consequences=None,
-                    related_locations=None,
-                    worldview_id=worldview.id,
-                    user_id=current_user.id,
-                    time_order=idx + 1
-                )
-                db.add(history)
-                saved_count += 1
-            except Exception as e:
-                print(f"保存历史事件时出错: {e}")
-                continue
-        
-        # 保存阵营势力
-        factions = generated_data.get("factions", [])
-        for faction_data in factions:
-            try:
-                # 处理alliance信息
-                alliance_data = faction_data.get("alliance", "")
-                allies = [alliance_data] if alliance_data else []
-                
-                faction = Faction(
-                    name=faction_data.get("name", ""),
-                    description=faction_data.get("description", ""),
-                    ideology=faction_data.get("ideology", ""),
-                    allies=allies,
-                    worldview_id=worldview.id,
-                    user_id=current_user.id,
-                    faction_type="organization",
-                    leader=None,
-                    territory=None,
-                    power_level=None,
-                    enemies=None,
-                    member_count=None
-                )
-                db.add(faction)
-                saved_count += 1
-            except Exception as e:
-                print(f"保存阵营势力时出错: {e}")
-                continue
+        # 子表各一次批量插入，与世界观在同一事务中提交
+        counts = WorldviewConverter.bulk_insert(db, database_data, worldview.id, current_user.id)
+        saved_count = 1 + sum(counts.values())  # 世界观本身 + 子表记录
         
+        worldview_result = {
+            "id": worldview.id,
+            "name": worldview.name,
+            "description": worldview.description,
+            "is_primary": worldview.is_primary
+        }
         db.commit()
         
         # 返回标准API响应格式
@@ -1496,12 +1424,7 @@ async def save_generated_worldview(
             "code": 200,
             "message": f"世界观数据保存成功，共保存 {saved_count} 项内容",
             "data": {
-                "worldview": {
-                    "id": worldview.id,
-                    "name": worldview.name,
-                    "description": worldview.description,
-                    "is_primary": worldview.is_primary
-                },
+                "worldview": worldview_result,
                 "saved_count": saved_count
             },
             "timestamp": None
@@ -1512,7 +1435,5 @@ async def save_generated_worldview(
         raise
     except Exception as e:
         db.rollback()
-        print(f"保存世界观数据时发生错误: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"保存世界观数据时发生错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"保存失败: {str(e)}")
\ No newline at end of file
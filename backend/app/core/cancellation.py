@@ -0,0 +1,80 @@
+"""
+客户端断开时取消进行中的生成
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, TypeVar
+
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.types import Receive
+
+from app.core.metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 客户端在响应返回前断开连接（沿用 nginx 的 499 约定，记录在请求指标与访问日志中）
+CLIENT_CLOSED_REQUEST = 499
+
+_cancelled_requests = get_metrics_registry().counter(
+    "client_disconnect_cancellations_total", "客户端断开后被取消的生成请求数", ("endpoint",)
+)
+
+
+class ClientDisconnected(HTTPException):
+    """客户端已断开，进行中的生成已取消"""
+
+    def __init__(self):
+        super().__init__(status_code=CLIENT_CLOSED_REQUEST, detail="客户端已断开连接，生成已取消")
+
+
+async def _wait_for_disconnect(receive: Receive) -> None:
+    """等待 ASGI http.disconnect 消息（请求体已被读取，之后只会收到断开消息）"""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T], endpoint: str) -> T:
+    """
+    执行生成调用，客户端断开时立即取消
+
+    取消会沿调用链传递到适配器，适配器随即关闭上游 HTTP 连接，模型不再继续
+    为已无人接收的响应生成 token。
+
+    Args:
+        request: 当前请求
+        awaitable: 生成调用
+        endpoint: 接口标识（用于指标标签）
+
+    Returns:
+        生成调用的结果
+
+    Raises:
+        ClientDisconnected: 客户端在生成完成前断开
+    """
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.create_task(_wait_for_disconnect(request.receive))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+
+    if task.done():
+        return task.result()
+
+    task.cancel()
+    # 等待取消完成（关闭上游连接、回滚事务）后再返回
+    await asyncio.wait({task})
+    _cancelled_requests.inc((endpoint,))
+    logger.info(f"客户端已断开，已取消进行中的生成: {endpoint}")
+    raise ClientDisconnected()
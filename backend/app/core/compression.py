@@ -0,0 +1,187 @@
+"""
+响应压缩中间件
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import gzip
+import logging
+import zlib
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只提供 gzip
+    brotli = None
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# 可压缩的响应类型前缀
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "text/plain",
+    "text/html",
+    "text/css",
+    "text/csv",
+    "text/markdown",
+    "application/xml",
+)
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    根据 Accept-Encoding 选择压缩算法（优先 br，其次 gzip，忽略 q=0 的编码）
+
+    Args:
+        accept_encoding: 请求头 Accept-Encoding
+
+    Returns:
+        "br"、"gzip" 或 None
+    """
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q=") and params[2:] in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(name.strip())
+
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class _StreamCompressor:
+    """流式压缩器（gzip / brotli 统一接口）"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        """压缩一段数据并刷新，保证已到达的数据能及时发送"""
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """结束压缩流"""
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    """一次性压缩完整响应体"""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    gzip / brotli 响应压缩中间件（纯 ASGI 实现）
+
+    只压缩可压缩类型、且响应体不小于阈值的响应；已带 Content-Encoding 的响应、
+    304/204 响应和 SSE 事件流原样透传。流式响应按分块压缩并逐块刷新。
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None or scope.get("method") == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """单个请求的压缩状态"""
+
+    def __init__(self, send: Send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self._start: Optional[Message] = None
+        self._compressor: Optional[_StreamCompressor] = None
+        self._passthrough = False
+
+    def _should_skip(self, message: Message) -> bool:
+        """根据响应头判断是否需要跳过压缩"""
+        if message["status"] in (204, 304) or message["status"] < 200:
+            return True
+        headers = Headers(raw=message["headers"])
+        if "content-encoding" in headers:
+            return True
+        content_type = headers.get("content-type", "").lower()
+        return not content_type.startswith(COMPRESSIBLE_TYPES)
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            self._start = message
+            self._passthrough = self._should_skip(message)
+            if self._passthrough:
+                await self._send(message)
+            return
+
+        if message_type != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._compressor is None and self._start is not None:
+            headers = MutableHeaders(raw=list(self._start["headers"]))
+            start, self._start = {**self._start, "headers": headers.raw}, None
+
+            if not more_body:
+                # 完整响应体：小于阈值时原样发送
+                if len(body) < self.minimum_size:
+                    self._passthrough = True
+                    await self._send(start)
+                    await self._send(message)
+                    return
+                compressed = compress_body(body, self.encoding)
+                headers["Content-Encoding"] = self.encoding
+                headers["Content-Length"] = str(len(compressed))
+                headers.add_vary_header("Accept-Encoding")
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+
+            # 流式响应：去掉 Content-Length，逐块压缩
+            self._compressor = _StreamCompressor(self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            await self._send(start)
+
+        chunk = self._compressor.compress(body) if body else b""
+        if not more_body:
+            chunk += self._compressor.finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
@@ -23,6 +23,12 @@ class Settings(BaseSettings):
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     RELOAD: bool = False
+    WORKERS: int = 1                                 # uvicorn 工作进程数（大于1时应使用 sqlite 或 redis 共享状态后端）
+    
+    # 共享状态配置（多进程部署时跨进程共享表版本、配置版本、限流令牌桶与缓存条目）
+    SHARED_STATE_BACKEND: str = "memory"             # 共享状态后端：memory（进程内）/ sqlite / redis
+    SHARED_STATE_URL: str = "data/shared_state.db"   # sqlite 文件路径或 redis:// 连接地址
+    SHARED_STATE_POLL_SECONDS: float = 1.0           # 跨进程失效广播的轮询间隔（秒）
     
     # 数据库配置
     DATABASE_URL: str = "sqlite:///./ai_writer.db"
@@ -58,6 +64,8 @@ class Settings(BaseSettings):
     OPENAI_MODEL: str = "gpt-3.5-turbo"
     OPENAI_MAX_TOKENS: int = 2000
     OPENAI_TEMPERATURE: float = 0.7
+    AI_MAX_CONCURRENT_REQUESTS: int = 8  # 单进程内同时进行的AI请求上限
+    AI_RATE_LIMIT_PER_MINUTE: int = 0    # 每个用户每分钟的AI请求上限（跨进程共享，0为不限制）
     
     # AI模型分组配置
     AI_MODEL_GROUP_SELECTION: str = "OpenAI官方"  # 选中的模型分组
@@ -103,10 +111,60 @@ class Settings(BaseSettings):
     # 分页配置
     DEFAULT_PAGE_SIZE: int = 20
     MAX_PAGE_SIZE: int = 100
+    PAGINATION_TOTAL_CACHE_SECONDS: int = 30  # 翻页时近似总数的缓存时间（秒）
+    
+    # 角色模板推荐配置
+    TEMPLATE_RECOMMENDER_REFRESH_SECONDS: int = 300  # 推荐目录定期重建间隔（秒）
+    TEMPLATE_RECOMMENDER_MAX_PROFILES: int = 10000   # 内存中保留的用户画像上限（超出时淘汰最久未用的）
+    TEMPLATE_RECOMMENDER_PROFILE_TTL_SECONDS: int = 300  # 用户画像过期时间（秒），过期后从数据库重新加载
+    TEMPLATE_SUGGESTION_REFRESH_SECONDS: int = 600   # 搜索建议索引定期对账间隔（秒）
+    TEMPLATE_STATS_REFRESH_SECONDS: int = 300        # 模板统计快照定期对账间隔（秒）
+    TEMPLATE_STATS_MAX_USERS: int = 10000            # 内存中保留的用户统计上限（超出时淘汰最久未用的）
+    TEMPLATE_STATS_USER_TTL_SECONDS: int = 300       # 用户统计过期时间（秒），过期后从数据库重新加载
+    
+    # 章节上下文检索配置
+    CHAPTER_INDEX_DIR: str = "data/chapter_index"    # 章节索引存储目录
+    CHAPTER_INDEX_MAX_NOVELS: int = 200              # 内存中保留的小说索引上限（超出时淘汰最久未用的）
+    CHAPTER_INDEX_SAVE_DELAY_SECONDS: float = 5.0    # 索引变更延迟写盘时间（秒），期间的多次变更合并写入
+    CHAPTER_CONTEXT_TOKEN_BUDGET: int = 3000         # 前文上下文token预算
+    CHAPTER_CONTEXT_TOP_K: int = 6                   # 检索的相关片段数量
+
+    # 提示词组装配置
+    PROMPT_TOKEN_BUDGET: int = 24000                 # 渲染后提示词的token上限（超出时按优先级截断上下文片段）
+
+    # 结构化响应恢复配置
+    STRUCTURED_RECOVERY_MAX_CONTINUATIONS: int = 1   # JSON 被截断或格式错误时请求续写的最大次数
+    STRUCTURED_CONTINUATION_MAX_TOKENS: int = 4000   # 单次续写请求的输出token上限
+
+    # 世界观生成配置
+    WORLDVIEW_SECTION_MAX_RETRIES: int = 1           # 分段生成时单个部分失败后的重试次数
+
+    # 地图生成配置
+    WORLD_MAP_TREE_MAX_REGIONS: int = 200            # 一次层级地图生成的区域总数上限
+
+    # 后台生成任务配置
+    JOB_WORKERS: int = 2                             # 本进程内执行生成任务的 worker 数量（0 时只由 scripts/worker.py 执行）
+    JOB_POLL_SECONDS: float = 1.0                    # 空闲 worker 与任务事件流轮询数据库的间隔（秒）
+    JOB_LEASE_SECONDS: int = 300                     # 任务心跳超时时间（秒），超时的任务视为 worker 已退出并重新排队
+    JOB_MAX_ATTEMPTS: int = 2                        # 任务因 worker 退出被重新执行的最大次数
+
+    # 响应缓存配置
+    RESPONSE_CACHE_ENABLED: bool = True              # 是否启用读接口响应缓存
+    RESPONSE_CACHE_MAX_ENTRIES: int = 2048           # 响应缓存最大条目数
+
+    # 响应压缩配置
+    RESPONSE_COMPRESSION_ENABLED: bool = True        # 是否启用 gzip/brotli 响应压缩
+    RESPONSE_COMPRESSION_MIN_SIZE: int = 1024        # 触发压缩的最小响应体大小（字节）
     
     # 日志配置
     LOG_LEVEL: str = "INFO"
     LOG_FILE: str = "logs/app.log"
+
+    # 访问日志与指标配置
+    METRICS_ENABLED: bool = True                     # 是否采集请求指标并开放 /metrics
+    ACCESS_LOG_ENABLED: bool = False                 # 是否输出访问日志
+    ACCESS_LOG_SAMPLE_RATE: float = 1.0              # 访问日志采样率（0~1，5xx 响应始终记录）
+    SERVER_TIMING_ENABLED: bool = False              # 是否在响应的 Server-Timing 头中返回生成各阶段耗时（调试模式下始终返回）
     
     @validator("SECRET_KEY")
     def validate_secret_key(cls, v: str) -> str:
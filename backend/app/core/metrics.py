@@ -0,0 +1,202 @@
+"""
+进程内指标收集
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import bisect
+import math
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+# 延迟直方图默认分桶（秒）
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0
+)
+
+# 响应大小直方图分桶（字节）
+SIZE_BUCKETS: Tuple[float, ...] = (
+    100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000
+)
+
+
+def _escape_label(value: str) -> str:
+    """转义 Prometheus 标签值"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """格式化标签集合"""
+    parts = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value: float) -> str:
+    """格式化指标数值"""
+    if math.isinf(value):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """带标签的计数器"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Sequence[str], amount: float = 1.0) -> None:
+        """
+        增加计数
+
+        Args:
+            labels: 与 label_names 对应的标签值
+            amount: 增量
+        """
+        key = tuple(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        """输出 Prometheus 文本格式"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_number(value)}")
+        return lines
+
+
+class Histogram:
+    """带标签的直方图（固定分桶）"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str],
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # 标签 -> [各分桶计数（非累计，最后一个为 +Inf）, 总和, 总数]
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, labels: Sequence[str], value: float) -> None:
+        """
+        记录一次观测值
+
+        Args:
+            labels: 与 label_names 对应的标签值
+            value: 观测值
+        """
+        key = tuple(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[key] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Dict[str, float]]:
+        """
+        获取各标签组合的汇总（次数、总和、平均值）
+
+        Returns:
+            标签 -> {"count", "sum", "avg"}
+        """
+        with self._lock:
+            return {
+                labels: {
+                    "count": series[2],
+                    "sum": series[1],
+                    "avg": series[1] / series[2] if series[2] else 0.0
+                }
+                for labels, series in self._series.items()
+            }
+
+    def render(self) -> List[str]:
+        """输出 Prometheus 文本格式"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, [list(series[0]), series[1], series[2]]) for labels, series in self._series.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_number(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}"
+                )
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_number(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表（按名称获取或创建指标）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        """获取或创建计数器"""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = Counter(name, documentation, label_names)
+                self._metrics[name] = metric
+            return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        """获取或创建直方图"""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = Histogram(name, documentation, label_names, buckets)
+                self._metrics[name] = metric
+            return metric
+
+    def render(self) -> str:
+        """
+        输出全部指标（Prometheus 文本格式）
+
+        Returns:
+            指标文本
+        """
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+metrics_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """获取指标注册表"""
+    return metrics_registry
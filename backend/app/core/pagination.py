@@ -0,0 +1,291 @@
+"""
+游标分页工具
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import base64
+import json
+from typing import Any, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import Date, DateTime, String, and_, asc, cast, desc, or_, type_coerce
+from sqlalchemy.orm import Query
+
+from app.core.config import settings
+from app.core.shared_state import SharedStateBackend, get_shared_state
+
+
+def _is_temporal(column: Any) -> bool:
+    """是否为日期时间列"""
+    target = getattr(column, "expression", column)
+    return isinstance(getattr(target, "type", None), (DateTime, Date))
+
+
+def _is_nullable(column: Any) -> bool:
+    """是否为可空的数据表列（SQL表达式视为不可空）"""
+    target = getattr(column, "expression", column)
+    return bool(getattr(target, "nullable", False))
+
+
+def cursor_value_expression(column: Any) -> Any:
+    """
+    构建写入游标的排序键取值表达式（只出现在 SELECT 中，不影响索引使用）
+
+    日期时间列取数据库中存储的原始文本：SQLite 中 func.now() 写入的时间不带
+    微秒，而 Python datetime 绑定参数带微秒，按解析后的值回传会导致同一秒内的
+    记录重复或遗漏。
+
+    Args:
+        column: 排序列
+
+    Returns:
+        取值表达式
+    """
+    return cast(column, String) if _is_temporal(column) else column
+
+
+def keyset_filter(column: Any, id_column: Any, sort_value: Any, last_id: int, descending: bool = False) -> Any:
+    """
+    构建"位于游标之后"的过滤条件
+
+    直接比较原始列，(排序列, ID) 上的索引可以完成范围扫描。可空列的 NULL 视为
+    最小值（升序在前、降序在后，与 SQLite 索引顺序一致），用显式的 IS NULL
+    分支处理：
+    - 升序：游标停在 NULL 时先在 NULL 中按 ID 继续，再接上全部非空值；停在
+      非空值时 NULL 已全部返回，只需范围比较
+    - 降序：游标停在非空值时范围比较之后接上全部 NULL；停在 NULL 时只在 NULL
+      中按 ID 继续
+
+    Args:
+        column: 排序列
+        id_column: 主键列
+        sort_value: 游标中的排序键
+        last_id: 游标中的记录ID
+        descending: 是否降序
+
+    Returns:
+        过滤条件
+    """
+    after_id = id_column < last_id if descending else id_column > last_id
+    if sort_value is None:
+        remaining_nulls = and_(column.is_(None), after_id)
+        return remaining_nulls if descending else or_(remaining_nulls, column.is_not(None))
+
+    if _is_temporal(column):
+        # 与游标取值一致，按存储文本比较
+        sort_value = type_coerce(sort_value, String)
+    after_value = column < sort_value if descending else column > sort_value
+    condition = or_(after_value, and_(column == sort_value, after_id))
+    if descending and _is_nullable(column):
+        condition = or_(condition, column.is_(None))
+    return condition
+
+
+def keyset_order(column: Any, id_column: Any, descending: bool = False) -> List[Any]:
+    """
+    构建与 keyset_filter 一致的排序（可空列的 NULL 升序在前、降序在后）
+
+    Args:
+        column: 排序列
+        id_column: 主键列
+        descending: 是否降序
+
+    Returns:
+        ORDER BY 子句列表
+    """
+    order = desc if descending else asc
+    key = order(column)
+    if _is_nullable(column):
+        key = key.nulls_last() if descending else key.nulls_first()
+    return [key, order(id_column)]
+
+
+def encode_cursor(sort_value: Any, row_id: int, signature: str = "") -> str:
+    """
+    编码分页游标
+
+    Args:
+        sort_value: 最后一条记录的排序键
+        row_id: 最后一条记录的ID
+        signature: 排序签名（排序字段与方向）
+
+    Returns:
+        不透明的游标字符串
+    """
+    payload = json.dumps([sort_value, row_id, signature], ensure_ascii=False, default=str)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, signature: str = "") -> Tuple[Any, int]:
+    """
+    解码分页游标
+
+    Args:
+        cursor: 游标字符串
+        signature: 当前请求的排序签名
+
+    Returns:
+        (排序键, 记录ID)
+
+    Raises:
+        HTTPException: 游标无效或与当前排序方式不匹配
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id, cursor_signature = json.loads(
+            base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        )
+        row_id = int(row_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+
+    if cursor_signature != signature:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="分页游标与当前排序方式不匹配"
+        )
+    return sort_value, row_id
+
+
+class KeysetPage:
+    """游标分页结果"""
+
+    def __init__(self, items: List[Any], next_cursor: Optional[str]):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_more(self) -> bool:
+        """是否还有下一页"""
+        return self.next_cursor is not None
+
+
+def paginate_keyset(
+    query: Query,
+    sort_column: Any,
+    id_column: Any,
+    limit: int,
+    descending: bool = False,
+    cursor: Optional[str] = None,
+    offset: int = 0,
+    signature: str = ""
+) -> KeysetPage:
+    """
+    按 (排序键, ID) 进行游标分页
+
+    提供游标时按上一页最后一条记录定位，复杂度与页码无关；未提供游标时
+    退化为偏移分页（兼容按页码访问），同样返回下一页游标。
+
+    Args:
+        query: 已应用筛选条件的查询（原有排序会被替换）
+        sort_column: 排序列
+        id_column: 主键列，用作排序的唯一性补充
+        limit: 每页数量
+        descending: 是否降序
+        cursor: 上一页返回的游标
+        offset: 未提供游标时的偏移量
+        signature: 排序签名，防止游标在不同排序方式间混用
+
+    Returns:
+        分页结果
+    """
+    single_entity = len(query.column_descriptions) == 1
+
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor, signature)
+        query = query.filter(keyset_filter(sort_column, id_column, sort_value, last_id, descending))
+        offset = 0
+
+    query = query.order_by(None).order_by(*keyset_order(sort_column, id_column, descending))
+    query = query.add_columns(
+        cursor_value_expression(sort_column).label("_cursor_key"), id_column.label("_cursor_id")
+    )
+    if offset:
+        query = query.offset(offset)
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[-2], last[-1], signature)
+
+    if single_entity:
+        items = [row[0] for row in rows]
+    else:
+        items = [tuple(row[:-2]) for row in rows]
+    return KeysetPage(items, next_cursor)
+
+
+class TotalCountCache:
+    """
+    近似总数缓存
+
+    翻页时复用最近一次的计数结果，只有首页或缓存过期时才执行 COUNT 查询
+    （列表附带的其他聚合值同样适用）。计数结果保存在共享状态后端中，多进程
+    部署时各工作进程共用。
+    """
+
+    def __init__(self, ttl: int = 30, state: Optional[SharedStateBackend] = None):
+        self.ttl = ttl
+        self._state = state
+
+    @property
+    def state(self) -> SharedStateBackend:
+        """计数结果所在的共享状态后端"""
+        if self._state is None:
+            self._state = get_shared_state()
+        return self._state
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """根据作用域与筛选参数生成缓存键"""
+        return "total_count:" + json.dumps(parts, ensure_ascii=False, default=str, sort_keys=True)
+
+    def get_total(self, key: str, query: Query, exact: bool = False) -> int:
+        """
+        获取总数
+
+        Args:
+            key: 缓存键
+            query: 计数查询
+            exact: 是否强制重新计数
+
+        Returns:
+            总数（exact为False时可能为近似值）
+        """
+        return self.get_value(key, lambda: query.order_by(None).count(), exact)
+
+    def get_value(self, key: str, compute: Callable[[], Any], exact: bool = False) -> Any:
+        """
+        获取缓存的聚合值
+
+        Args:
+            key: 缓存键
+            compute: 缓存未命中或需要精确值时执行的聚合查询
+            exact: 是否强制重新计算
+
+        Returns:
+            聚合值（exact为False时可能为近似值）
+        """
+        if not exact:
+            value = self.state.get(key)
+            if value is not None:
+                return value
+
+        value = compute()
+        self.state.set(key, value, ttl=self.ttl)
+        return value
+
+
+# 全局总数缓存实例
+total_count_cache = TotalCountCache(ttl=settings.PAGINATION_TOTAL_CACHE_SECONDS)
+
+
+def get_total_count_cache() -> TotalCountCache:
+    """获取总数缓存实例"""
+    return total_count_cache
@@ -0,0 +1,229 @@
+"""
+请求指标与访问日志中间件
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import logging
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.metrics import SIZE_BUCKETS, MetricsRegistry, get_metrics_registry
+from app.core.spans import collect_stage_timings, format_server_timing
+
+logger = logging.getLogger(__name__)
+
+# 访问日志记录器（经队列异步输出，不向上传播）
+ACCESS_LOGGER_NAME = "app.access"
+
+# 未匹配到路由的请求统一归入该标签，避免任意路径造成标签爆炸
+UNMATCHED_ROUTE = "<unmatched>"
+
+# 访问日志队列容量，队列满时丢弃新记录而不是阻塞请求
+ACCESS_LOG_QUEUE_SIZE = 10000
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """队列满时丢弃记录的 QueueHandler，格式化留给后台线程完成"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AccessLogger:
+    """
+    采样、异步的访问日志
+
+    请求路径上只做采样判断并把记录放入队列，格式化与写文件由 QueueListener
+    的后台线程完成，输出到根日志记录器已配置的处理器。5xx 响应不受采样影响。
+    """
+
+    def __init__(self, enabled: bool = False, sample_rate: float = 1.0):
+        self.enabled = enabled
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self._handler: Optional[_DroppingQueueHandler] = None
+        self._listener: Optional[QueueListener] = None
+        self._logger = logging.getLogger(ACCESS_LOGGER_NAME)
+
+    def start(self) -> None:
+        """启动后台输出线程（未启用或已启动时忽略）"""
+        if not self.enabled or self._listener is not None:
+            return
+        log_queue: queue.Queue = queue.Queue(maxsize=ACCESS_LOG_QUEUE_SIZE)
+        self._handler = _DroppingQueueHandler(log_queue)
+        self._listener = QueueListener(
+            log_queue, *logging.getLogger().handlers, respect_handler_level=True
+        )
+        self._logger.addHandler(self._handler)
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self._listener.start()
+
+    def stop(self) -> None:
+        """停止后台线程并输出队列中剩余的记录"""
+        if self._listener is None:
+            return
+        self._listener.stop()
+        self._logger.removeHandler(self._handler)
+        if self._handler.dropped:
+            logger.warning(f"访问日志队列已满，共丢弃 {self._handler.dropped} 条记录")
+        self._listener = None
+        self._handler = None
+
+    def log(self, method: str, path: str, status: int, duration: float, size: int) -> None:
+        """
+        记录一次访问（按采样率）
+
+        Args:
+            method: 请求方法
+            path: 请求路径（不含查询参数）
+            status: 响应状态码
+            duration: 处理耗时（秒）
+            size: 响应体字节数
+        """
+        if self._listener is None:
+            return
+        if status < 500 and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self._logger.info(
+            "%s %s %d %.1fms %dB", method, path, status, duration * 1000, size
+        )
+
+
+# 全局访问日志实例
+_access_logger: Optional[AccessLogger] = None
+
+
+def get_access_logger() -> AccessLogger:
+    """获取访问日志实例"""
+    global _access_logger
+    if _access_logger is None:
+        from app.core.config import settings
+        _access_logger = AccessLogger(
+            enabled=settings.ACCESS_LOG_ENABLED,
+            sample_rate=settings.ACCESS_LOG_SAMPLE_RATE
+        )
+    return _access_logger
+
+
+def route_template(scope: Scope) -> str:
+    """
+    获取请求匹配到的路由模板（如 /api/v1/novels/{novel_id}）
+
+    Args:
+        scope: ASGI scope（路由匹配后由路由器写入 route）
+
+    Returns:
+        路由模板，没有匹配到路由时返回 UNMATCHED_ROUTE
+    """
+    route = scope.get("route")
+    if route is None:
+        return UNMATCHED_ROUTE
+    template = getattr(route, "path", None) or ""
+
+    # 嵌套包含的路由器中 route.path 只是相对模板（可能为空），此时补上实际请求路径中的前缀
+    path_regex = getattr(route, "path_regex", None)
+    path = scope.get("path", "")
+    if path_regex is None or path_regex.match(path):
+        return template
+    index = path.find("/", 1)
+    while index != -1:
+        if path_regex.match(path[index:]):
+            return path[:index] + template
+        index = path.find("/", index + 1)
+    if path_regex.match(""):
+        return path
+    return template
+
+
+class RequestMetricsMiddleware:
+    """
+    请求指标中间件（纯 ASGI 实现）
+
+    记录请求方法、路由模板、状态码、处理耗时直方图与响应体大小，并添加
+    X-Process-Time 响应头。不缓冲响应体，流式响应（如 SSE）的耗时按整个
+    流结束计算。调试模式下输出跨域请求的 Origin 与响应的 CORS 头。
+
+    请求处理期间收集生成流程的阶段耗时（见 app.core.spans），开启
+    server_timing 时在响应开始前已结束的阶段写入 Server-Timing 响应头。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        registry: Optional[MetricsRegistry] = None,
+        access_logger: Optional[AccessLogger] = None,
+        debug_cors: bool = False,
+        server_timing: bool = False
+    ):
+        self.app = app
+        self.access_logger = access_logger or get_access_logger()
+        self.debug_cors = debug_cors
+        self.server_timing = server_timing
+        registry = registry or get_metrics_registry()
+        self.requests_total = registry.counter(
+            "http_requests_total", "HTTP请求总数", ("method", "route", "status")
+        )
+        self.request_duration = registry.histogram(
+            "http_request_duration_seconds", "HTTP请求处理耗时（秒）", ("method", "route")
+        )
+        self.response_size = registry.histogram(
+            "http_response_size_bytes", "HTTP响应体大小（字节）", ("method", "route"), SIZE_BUCKETS
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status = 500
+        size = 0
+        origin = Headers(scope=scope).get("origin") if self.debug_cors else None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(raw=list(message["headers"]))
+                headers["X-Process-Time"] = str(time.perf_counter() - start_time)
+                if self.server_timing and timings:
+                    headers["Server-Timing"] = format_server_timing(timings)
+                if origin:
+                    cors_headers = {
+                        key: value for key, value in headers.items()
+                        if key.startswith("access-control-")
+                    }
+                    logger.debug(f"CORS请求 - Origin: {origin}, Method: {scope['method']}, 响应头: {cors_headers}")
+                message = {**message, "headers": headers.raw}
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            with collect_stage_timings() as timings:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start_time
+            method = scope["method"]
+            route = route_template(scope)
+            self.requests_total.inc((method, route, str(status)))
+            self.request_duration.observe((method, route), duration)
+            self.response_size.observe((method, route), size)
+            self.access_logger.log(method, scope.get("path", ""), status, duration, size)
@@ -0,0 +1,178 @@
+"""
+响应缓存与ETag
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.core.config import settings
+from app.core.responses import encode_json
+from app.core.table_versions import TableVersions, get_table_versions
+
+logger = logging.getLogger(__name__)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断 If-None-Match 请求头是否命中当前 ETag（按弱比较规则）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class CacheLookup:
+    """
+    一次缓存查询的结果
+
+    未命中时路由照常构建响应数据，再调用 store() 写入缓存并返回响应；
+    版本快照在查询时获取，构建期间发生的提交会使本次写入的条目在下次访问时失效。
+    """
+
+    def __init__(
+        self,
+        cache: "ResponseCache",
+        request: Request,
+        key: Optional[Tuple],
+        versions: Tuple[int, ...],
+        response: Optional[Response] = None
+    ):
+        self._cache = cache
+        self._request = request
+        self._key = key
+        self._versions = versions
+        self.response = response
+
+    def store(self, payload: Any) -> Response:
+        """
+        序列化响应数据、写入缓存，并按 If-None-Match 返回 200 或 304
+
+        Args:
+            payload: 响应数据（字典或Pydantic模型）
+
+        Returns:
+            响应对象
+        """
+        body = encode_json(payload)
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        if self._key is not None:
+            self._cache._put(self._key, self._versions, etag, body)
+        return self._cache._build_response(self._request, etag, body)
+
+
+class ResponseCache:
+    """
+    读接口响应缓存
+
+    缓存键为 (用户, 路由路径, 查询参数)，每个条目记录生成时所依赖表的版本号
+    （见 app.core.table_versions，相关表有提交后版本递增），因此相关数据变更
+    后条目自动失效；未变更时直接复用已序列化的响应体，省去查询与序列化。
+    ETag 为响应体摘要（强校验），客户端携带 If-None-Match 且内容未变时返回 304。
+
+    表版本号保存在共享状态后端中，多进程部署时任一工作进程的提交都会使
+    所有进程中依赖该表的条目失效；响应体仍缓存在各进程内。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        enabled: bool = True,
+        versions: Optional[TableVersions] = None
+    ):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.versions = versions or get_table_versions()
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, Tuple[Tuple[int, ...], str, bytes]]" = OrderedDict()
+
+    def clear(self) -> None:
+        """清空全部缓存条目"""
+        with self._lock:
+            self._entries.clear()
+
+    # ------------------------------------------------------------------
+    # 查询与写入
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _table_names(models: Iterable[Any]) -> Tuple[str, ...]:
+        """将模型或表名统一为排序后的表名元组"""
+        names = {model if isinstance(model, str) else model.__table__.name for model in models}
+        return tuple(sorted(names))
+
+    def lookup(self, request: Request, user_id: Optional[int], models: Iterable[Any] = ()) -> CacheLookup:
+        """
+        查询缓存
+
+        Args:
+            request: 当前请求
+            user_id: 用户ID（不同用户的缓存互相隔离）
+            models: 响应依赖的模型（或表名），任一表有提交时缓存失效
+
+        Returns:
+            缓存查询结果，命中时 response 为可直接返回的响应
+        """
+        if not self.enabled:
+            return CacheLookup(self, request, None, ())
+
+        tables = self._table_names(models)
+        key = (
+            user_id,
+            request.url.path,
+            tuple(sorted(request.query_params.multi_items())),
+            tables
+        )
+        versions = self.versions.get(tables)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == versions:
+                self._entries.move_to_end(key)
+            else:
+                entry = None
+
+        if entry is None:
+            return CacheLookup(self, request, key, versions)
+        return CacheLookup(self, request, key, versions, self._build_response(request, entry[1], entry[2]))
+
+    def _put(self, key: Tuple, versions: Tuple[int, ...], etag: str, body: bytes) -> None:
+        """写入缓存条目（超过容量时淘汰最久未使用的条目）"""
+        with self._lock:
+            self._entries[key] = (versions, etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _build_response(request: Request, etag: str, body: bytes) -> Response:
+        """根据 If-None-Match 构建 200 或 304 响应"""
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+# 全局响应缓存实例
+response_cache = ResponseCache(
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    enabled=settings.RESPONSE_CACHE_ENABLED
+)
+
+
+def get_response_cache() -> ResponseCache:
+    """获取响应缓存实例"""
+    return response_cache
+
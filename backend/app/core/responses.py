@@ -0,0 +1,79 @@
+"""
+JSON响应序列化
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+# orjson 选项：允许非字符串键（如整数ID作为字典键）
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    """orjson 不支持的类型的转换（Pydantic 模型、Decimal、集合等）"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return jsonable_encoder(obj)
+
+
+def encode_json(content: Any) -> bytes:
+    """
+    将响应数据序列化为 JSON 字节串
+
+    datetime、date、Enum、UUID 等由 orjson 原生处理，嵌套的 Pydantic 模型
+    按 JSON 模式导出，无需事先经过 jsonable_encoder 逐层转换。
+
+    Args:
+        content: 响应数据
+
+    Returns:
+        JSON 字节串
+    """
+    if isinstance(content, BaseModel):
+        return content.model_dump_json().encode("utf-8")
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class ORJSONResponse(JSONResponse):
+    """使用 orjson 序列化的 JSON 响应（应用默认响应类）"""
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+def model_response(
+    model: BaseModel,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    直接用 model_dump_json 序列化 Pydantic 响应模型
+
+    跳过 FastAPI 对返回值的二次校验与 jsonable_encoder 转换，适用于已按
+    响应模型构造好的大响应（如章节正文、章节列表）。
+
+    Args:
+        model: 响应模型实例
+        status_code: 状态码
+        headers: 额外响应头
+
+    Returns:
+        响应对象
+    """
+    return Response(
+        content=model.model_dump_json(),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json"
+    )
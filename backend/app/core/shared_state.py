@@ -0,0 +1,486 @@
+"""
+跨进程共享状态
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 失效广播在共享存储中的计数键前缀
+INVALIDATION_PREFIX = "invalidate:"
+
+# 失效广播名称：角色模板目录（模板增删改后广播）
+TEMPLATE_CATALOG = "template_catalog"
+
+# 进程内后端缓存条目的容量上限
+MEMORY_MAX_ENTRIES = 4096
+
+# SQLite 后端每写入多少次清理一次过期条目
+SQLITE_PURGE_INTERVAL = 256
+
+# 令牌桶扣减的 Lua 脚本（Redis 后端，保证读-改-写原子性）
+TOKEN_BUCKET_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return allowed
+"""
+
+
+def _refill(tokens: float, updated_at: float, capacity: float, rate: float, now: float) -> float:
+    """按流逝时间补充令牌"""
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+class SharedStateBackend(ABC):
+    """
+    共享状态后端接口
+
+    值需可 JSON 序列化。计数器用于表版本、配置版本与失效广播，令牌桶用于
+    限流；所有写操作在后端内保证原子性，多个工作进程可同时使用。
+    """
+
+    name = "abstract"
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存值，不存在或已过期时返回 None"""
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """写入缓存值（ttl 为过期秒数，为空时不过期）"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """删除缓存值"""
+
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1) -> int:
+        """原子递增计数器并返回新值"""
+
+    @abstractmethod
+    def get_counters(self, keys: Sequence[str]) -> List[int]:
+        """批量读取计数器（不存在的计数器为 0）"""
+
+    @abstractmethod
+    def take_token(self, key: str, capacity: float, refill_per_second: float) -> bool:
+        """
+        从令牌桶中取一个令牌
+
+        Args:
+            key: 令牌桶键
+            capacity: 桶容量（允许的突发请求数）
+            refill_per_second: 每秒补充的令牌数
+
+        Returns:
+            是否取到令牌
+        """
+
+    def close(self) -> None:
+        """释放后端资源"""
+
+
+class MemoryStateBackend(SharedStateBackend):
+    """进程内后端（默认，单进程部署使用）"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._values: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                del self._values[key]
+                return None
+            self._values.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl if ttl else None)
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            value = self._counters.get(key, 0) + amount
+            self._counters[key] = value
+            return value
+
+    def get_counters(self, keys: Sequence[str]) -> List[int]:
+        with self._lock:
+            return [self._counters.get(key, 0) for key in keys]
+
+    def take_token(self, key: str, capacity: float, refill_per_second: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated_at, capacity, refill_per_second, now)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            return allowed
+
+
+class SQLiteStateBackend(SharedStateBackend):
+    """
+    SQLite 后端
+
+    同一台机器上的多个工作进程共享一个 WAL 模式的 SQLite 文件，无需网络服务。
+    每个线程使用独立连接；计数器用单条 UPSERT 递增，令牌桶在 IMMEDIATE
+    事务中完成读-改-写。
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._lock:
+            connection = self._connection()
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS shared_values (
+                    key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS shared_counters (
+                    key TEXT PRIMARY KEY, value INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS shared_buckets (
+                    key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL
+                );
+                """
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """获取当前线程的连接"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._connections.append(connection)
+        return connection
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM shared_values WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= time.time():
+            self.delete(key)
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        connection = self._connection()
+        now = time.time()
+        connection.execute(
+            "INSERT OR REPLACE INTO shared_values (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None)
+        )
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % SQLITE_PURGE_INTERVAL == 0
+        if purge:
+            connection.execute("DELETE FROM shared_values WHERE expires_at <= ?", (now,))
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM shared_values WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT INTO shared_counters (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                (key, amount)
+            )
+            value = connection.execute(
+                "SELECT value FROM shared_counters WHERE key = ?", (key,)
+            ).fetchone()[0]
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return value
+
+    def get_counters(self, keys: Sequence[str]) -> List[int]:
+        if not keys:
+            return []
+        placeholders = ", ".join("?" for _ in keys)
+        rows = dict(self._connection().execute(
+            f"SELECT key, value FROM shared_counters WHERE key IN ({placeholders})", tuple(keys)
+        ).fetchall())
+        return [rows.get(key, 0) for key in keys]
+
+    def take_token(self, key: str, capacity: float, refill_per_second: float) -> bool:
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated_at FROM shared_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens = capacity if row is None else _refill(row[0], row[1], capacity, refill_per_second, now)
+            allowed = tokens >= 1
+            connection.execute(
+                "INSERT OR REPLACE INTO shared_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                (key, tokens - 1 if allowed else tokens, now)
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return allowed
+
+    def close(self) -> None:
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+class RedisStateBackend(SharedStateBackend):
+    """
+    Redis 协议后端（Redis、KeyDB、Valkey 等，也可通过 unix:// 套接字本地连接）
+
+    需要安装 redis 客户端库。
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("使用 redis 共享状态后端需要安装 redis 客户端库（pip install redis）") from e
+        self.url = url
+        self._client = redis.Redis.from_url(url)
+        self._take_token_script = self._client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._client.get(key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._client.set(
+            key, json.dumps(value, ensure_ascii=False), px=int(ttl * 1000) if ttl else None
+        )
+
+    def delete(self, key: str) -> None:
+        self._client.delete(key)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        return int(self._client.incrby(key, amount))
+
+    def get_counters(self, keys: Sequence[str]) -> List[int]:
+        if not keys:
+            return []
+        return [int(value or 0) for value in self._client.mget(list(keys))]
+
+    def take_token(self, key: str, capacity: float, refill_per_second: float) -> bool:
+        return bool(self._take_token_script(keys=[key], args=[capacity, refill_per_second, time.time()]))
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def create_shared_state_backend(kind: str, url: str = "") -> SharedStateBackend:
+    """
+    创建共享状态后端
+
+    Args:
+        kind: 后端类型（memory / sqlite / redis）
+        url: sqlite 文件路径或 redis 连接地址
+
+    Returns:
+        共享状态后端
+
+    Raises:
+        ValueError: 不支持的后端类型
+    """
+    kind = (kind or "memory").lower()
+    if kind == "memory":
+        return MemoryStateBackend()
+    if kind == "sqlite":
+        return SQLiteStateBackend(url or "data/shared_state.db")
+    if kind == "redis":
+        return RedisStateBackend(url or "redis://localhost:6379/0")
+    raise ValueError(f"不支持的共享状态后端: {kind}")
+
+
+class InvalidationBus:
+    """
+    跨进程失效广播
+
+    每个广播名称对应共享存储中的一个计数器：broadcast() 递增计数器并立即在
+    本进程执行处理函数，其他工作进程由后台轮询发现计数器变化后执行。
+    """
+
+    def __init__(self, backend: SharedStateBackend, poll_interval: float = 1.0):
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._handlers: Dict[str, List[Tuple[Callable[[], None], bool]]] = {}
+        self._seen: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, name: str, handler: Callable[[], None], local: bool = True) -> None:
+        """
+        订阅失效广播
+
+        Args:
+            name: 广播名称
+            handler: 收到广播时执行的处理函数（无参数）
+            local: 本进程发出的广播是否也执行（本进程已增量更新时传 False）
+        """
+        with self._lock:
+            self._handlers.setdefault(name, []).append((handler, local))
+            if name not in self._seen:
+                self._seen[name] = self.backend.get_counters([INVALIDATION_PREFIX + name])[0]
+
+    def broadcast(self, name: str) -> None:
+        """
+        广播失效（本进程立即处理，其他进程在下次轮询时处理）
+
+        Args:
+            name: 广播名称
+        """
+        version = self.backend.incr(INVALIDATION_PREFIX + name)
+        with self._lock:
+            self._seen[name] = version
+            handlers = [handler for handler, local in self._handlers.get(name, ()) if local]
+        self._dispatch(name, handlers)
+
+    def poll(self) -> List[str]:
+        """
+        检查其他进程发出的广播并执行处理函数
+
+        Returns:
+            本次处理的广播名称
+        """
+        with self._lock:
+            names = list(self._handlers)
+        if not names:
+            return []
+        versions = self.backend.get_counters([INVALIDATION_PREFIX + name for name in names])
+        changed = []
+        for name, version in zip(names, versions):
+            with self._lock:
+                if self._seen.get(name, 0) == version:
+                    continue
+                self._seen[name] = version
+                handlers = [handler for handler, _ in self._handlers.get(name, ())]
+            self._dispatch(name, handlers)
+            changed.append(name)
+        return changed
+
+    @staticmethod
+    def _dispatch(name: str, handlers: List[Callable[[], None]]) -> None:
+        """执行处理函数（单个处理函数失败不影响其他处理函数）"""
+        for handler in handlers:
+            try:
+                handler()
+            except Exception as e:
+                logger.error(f"处理失效广播 {name} 失败: {str(e)}")
+
+    async def _run(self) -> None:
+        """后台轮询循环"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await asyncio.to_thread(self.poll)
+            except Exception as e:
+                logger.warning(f"轮询失效广播失败: {str(e)}")
+
+    def start(self) -> None:
+        """启动后台轮询（进程内后端无需轮询）"""
+        if self._task is None and not isinstance(self.backend, MemoryStateBackend):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台轮询"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+# 全局共享状态实例（首次使用时按配置创建）
+_shared_state: Optional[SharedStateBackend] = None
+_invalidation_bus: Optional[InvalidationBus] = None
+_init_lock = threading.Lock()
+
+
+def get_shared_state() -> SharedStateBackend:
+    """获取共享状态后端实例"""
+    global _shared_state
+    if _shared_state is None:
+        with _init_lock:
+            if _shared_state is None:
+                from app.core.config import settings
+                _shared_state = create_shared_state_backend(
+                    settings.SHARED_STATE_BACKEND, settings.SHARED_STATE_URL
+                )
+                logger.info(f"共享状态后端: {_shared_state.name}")
+    return _shared_state
+
+
+def get_invalidation_bus() -> InvalidationBus:
+    """获取失效广播实例"""
+    global _invalidation_bus
+    if _invalidation_bus is None:
+        backend = get_shared_state()
+        with _init_lock:
+            if _invalidation_bus is None:
+                from app.core.config import settings
+                _invalidation_bus = InvalidationBus(backend, settings.SHARED_STATE_POLL_SECONDS)
+    return _invalidation_bus
@@ -0,0 +1,125 @@
+"""
+生成流程分阶段耗时记录
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from app.core.metrics import get_metrics_registry
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# 当前请求（或后台任务）已记录的阶段耗时，未在收集范围内时为 None
+_stage_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("stage_timings", default=None)
+
+_stage_seconds = get_metrics_registry().histogram(
+    "generation_stage_seconds", "生成流程各阶段耗时（秒）", ("stage",)
+)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """
+    记录一个阶段的耗时
+
+    写入阶段耗时直方图；处于收集范围内时同时追加到当前请求的阶段列表。
+
+    Args:
+        stage: 阶段名（如 prompt_build、ai_ttfb）
+        seconds: 耗时（秒）
+    """
+    _stage_seconds.observe((stage,), seconds)
+    timings = _stage_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    记录代码块耗时（同步与异步代码中均可使用，异常退出时同样记录）
+
+    Args:
+        stage: 阶段名
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def timed(stage: str) -> Callable[[F], F]:
+    """
+    记录函数耗时的装饰器（支持普通函数与协程函数）
+
+    Args:
+        stage: 阶段名
+    """
+    def decorator(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+@contextmanager
+def collect_stage_timings() -> Iterator[List[Tuple[str, float]]]:
+    """
+    在当前上下文中收集阶段耗时
+
+    收集列表通过上下文变量传递，范围内创建的子任务与线程池调用共用同一个
+    列表。
+
+    Yields:
+        [(阶段名, 耗时秒数)]，按阶段结束顺序排列
+    """
+    timings: List[Tuple[str, float]] = []
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings.reset(token)
+
+
+def format_server_timing(timings: List[Tuple[str, float]]) -> str:
+    """
+    按 Server-Timing 头格式汇总阶段耗时
+
+    同名阶段合并为总耗时，多次出现时在 desc 中注明次数。阶段可以嵌套
+    （如 ai_call 包含 ai_ttfb 与 ai_body），各项之和不等于请求总耗时。
+
+    Args:
+        timings: 阶段耗时列表
+
+    Returns:
+        如 "context_load;dur=12.3, ai_call;dur=2915.0;desc=\"x2\""
+    """
+    totals: Dict[str, List[float]] = {}
+    for stage, seconds in timings:
+        entry = totals.setdefault(stage, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    parts = []
+    for stage, (seconds, count) in totals.items():
+        part = f"{stage};dur={seconds * 1000:.1f}"
+        if count > 1:
+            part += f';desc="x{int(count)}"'
+        parts.append(part)
+    return ", ".join(parts)
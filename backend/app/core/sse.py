@@ -0,0 +1,42 @@
+"""
+Server-Sent Events 工具
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import json
+from typing import Any, Dict
+
+# SSE 响应头：禁用缓存与反向代理缓冲，保证事件即时送达
+SSE_HEADERS: Dict[str, str] = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+
+def format_sse_event(event: str, data: Any) -> str:
+    """
+    编码一条 SSE 事件
+
+    Args:
+        event: 事件类型
+        data: 事件数据（序列化为单行JSON）
+
+    Returns:
+        SSE 文本帧
+    """
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def format_sse_comment(text: str = "keepalive") -> str:
+    """
+    编码一条 SSE 注释帧（客户端忽略，用于长时间无事件时保持连接）
+
+    Args:
+        text: 注释内容
+
+    Returns:
+        SSE 文本帧
+    """
+    return f": {text}\n\n"
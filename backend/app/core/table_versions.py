@@ -0,0 +1,112 @@
+"""
+数据表版本号
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+from typing import Any, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.shared_state import SharedStateBackend, get_shared_state
+
+# 会话中记录本事务写入过的表名的键
+TOUCHED_TABLES_KEY = "table_versions_touched_tables"
+
+# 表版本号在共享状态中的计数键前缀
+TABLE_VERSION_PREFIX = "table_version:"
+
+
+class TableVersions:
+    """
+    数据表版本号
+
+    SQLAlchemy 会话提交后（after_commit）递增本事务写入过的表的版本号。
+    依赖某些表的进程内缓存（响应缓存、AI配置、提示词模板等）记录生成时的
+    版本号，版本变化即视为过期。版本号保存在共享状态后端中，多进程部署时
+    任一工作进程的提交对所有进程可见。
+    """
+
+    def __init__(self, state: Optional[SharedStateBackend] = None):
+        self._state = state
+
+    @property
+    def state(self) -> SharedStateBackend:
+        """表版本号所在的共享状态后端"""
+        if self._state is None:
+            self._state = get_shared_state()
+        return self._state
+
+    def get(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        """
+        获取各表当前的版本号
+
+        Args:
+            tables: 表名
+
+        Returns:
+            与表名顺序一致的版本号
+        """
+        return tuple(self.state.get_counters([TABLE_VERSION_PREFIX + table for table in tables]))
+
+    def bump(self, tables: Iterable[str]) -> None:
+        """
+        递增表版本号，使依赖这些表的缓存失效
+
+        Args:
+            tables: 表名
+        """
+        for table in tables:
+            self.state.incr(TABLE_VERSION_PREFIX + table)
+
+
+# 全局表版本号实例
+table_versions = TableVersions()
+
+
+def get_table_versions() -> TableVersions:
+    """获取数据表版本号实例"""
+    return table_versions
+
+
+# ----------------------------------------------------------------------
+# 会话事件：记录事务写入的表，提交后递增版本号
+# ----------------------------------------------------------------------
+
+def _touched_tables(session: Session) -> Set[str]:
+    return session.info.setdefault(TOUCHED_TABLES_KEY, set())
+
+
+@event.listens_for(Session, "after_flush")
+def _record_flushed_tables(session: Session, flush_context: Any) -> None:
+    """记录工作单元刷新中新增、修改、删除的对象所在的表"""
+    touched = _touched_tables(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            touched.add(table.name)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _record_bulk_statement_tables(orm_execute_state: Any) -> None:
+    """记录通过 session.execute 执行的批量 INSERT/UPDATE/DELETE 语句所在的表"""
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        name = getattr(table, "name", None)
+        if name:
+            _touched_tables(orm_execute_state.session).add(name)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed_tables(session: Session) -> None:
+    """事务提交后递增本事务写入的表的版本号"""
+    touched = session.info.pop(TOUCHED_TABLES_KEY, None)
+    if touched:
+        table_versions.bump(touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_tables(session: Session) -> None:
+    """事务回滚后丢弃记录"""
+    session.info.pop(TOUCHED_TABLES_KEY, None)
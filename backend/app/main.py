@@ -5,16 +5,24 @@ Created: 2025-06-01
 """
 
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 import logging
 import time
 
 from app.core.config import settings
 from app.core.database import init_db, check_database_health
+from app.core.compression import CompressionMiddleware
+from app.core.metrics import get_metrics_registry
+from app.core.request_metrics import RequestMetricsMiddleware, get_access_logger
+from app.core.shared_state import MemoryStateBackend, get_invalidation_bus, get_shared_state
+from app.core.responses import ORJSONResponse
 from app.api.v1.api import api_router
+from app.api.v1.job_handlers import register_job_handlers
+from app.services.chapter_context_index import get_chapter_context_index
+from app.services.job_queue import get_job_queue
 
 
 # 配置日志
@@ -49,12 +57,28 @@ async def lifespan(app: FastAPI):
     else:
         logger.warning("数据库连接异常")
     
+    # 启动访问日志后台输出
+    get_access_logger().start()
+    
+    # 启动跨进程失效广播轮询
+    if settings.WORKERS > 1 and isinstance(get_shared_state(), MemoryStateBackend):
+        logger.warning("多进程部署使用进程内共享状态后端，各工作进程的缓存将互不一致，建议配置 sqlite 或 redis")
+    get_invalidation_bus().start()
+    
+    # 启动后台生成任务 worker（JOB_WORKERS 为0时由独立的 scripts/worker.py 执行）
+    get_job_queue().start()
+    
     logger.info(f"服务启动完成，运行在 {settings.HOST}:{settings.PORT}")
     
     yield
     
     # 关闭时执行
     logger.info("正在关闭服务...")
+    await get_job_queue().stop()
+    await get_invalidation_bus().stop()
+    get_chapter_context_index().flush_all()
+    get_shared_state().close()
+    get_access_logger().stop()
 
 
 # 创建FastAPI应用实例
@@ -65,6 +89,7 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -82,67 +107,35 @@ app.add_middleware(
     allowed_hosts=settings.ALLOWED_HOSTS
 )
 
+# 响应压缩中间件（gzip/brotli）
+if settings.RESPONSE_COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.RESPONSE_COMPRESSION_MIN_SIZE
+    )
 
-# 请求处理时间中间件
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    """添加请求处理时间头"""
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    return response
-
-
-# 请求日志中间件
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    """记录请求日志"""
-    logger.info(f"请求: {request.method} {request.url}")
-    response = await call_next(request)
-    logger.info(f"响应: {response.status_code}")
-    return response
-
-
-# CORS调试中间件
-@app.middleware("http")
-async def cors_debug_middleware(request: Request, call_next):
-    """CORS调试中间件"""
-    if settings.DEBUG:
-        origin = request.headers.get("origin")
-        method = request.method
-        
-        if origin:
-            logger.info(f"CORS请求 - Origin: {origin}, Method: {method}")
-        
-        # 处理预检请求
-        if method == "OPTIONS":
-            logger.info(f"预检请求 - Headers: {dict(request.headers)}")
-    
-    response = await call_next(request)
-    
-    if settings.DEBUG and request.headers.get("origin"):
-        cors_headers = {
-            k: v for k, v in response.headers.items()
-            if k.lower().startswith("access-control-")
-        }
-        logger.info(f"CORS响应头: {cors_headers}")
-    
-    return response
+# 请求指标与访问日志中间件（最外层，统计包含压缩在内的完整处理耗时与实际响应大小）
+if settings.METRICS_ENABLED or settings.ACCESS_LOG_ENABLED:
+    app.add_middleware(
+        RequestMetricsMiddleware,
+        debug_cors=settings.DEBUG,
+        server_timing=settings.DEBUG or settings.SERVER_TIMING_ENABLED
+    )
 
 
 # 全局异常处理器
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     """HTTP异常处理器"""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "success": False,
             "code": exc.status_code,
             "message": exc.detail,
             "timestamp": time.time()
-        }
+        },
+        headers=getattr(exc, "headers", None)
     )
 
 
@@ -150,7 +143,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 async def general_exception_handler(request: Request, exc: Exception):
     """通用异常处理器"""
     logger.error(f"未处理的异常: {exc}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "success": False,
@@ -178,6 +171,18 @@ async def health_check():
     }
 
 
+# 指标接口
+@app.get("/metrics", tags=["健康检查"], include_in_schema=False)
+async def metrics():
+    """请求指标（Prometheus 文本格式）"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="指标采集未启用")
+    return PlainTextResponse(
+        get_metrics_registry().render(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+
 # 根路径
 @app.get("/", tags=["根路径"])
 async def root():
@@ -198,6 +203,9 @@ app.include_router(
     tags=["API v1"]
 )
 
+# 注册后台生成任务类型（接口提交任务与本进程的 worker 执行任务均依赖注册）
+register_job_handlers(get_job_queue())
+
 
 # 应用信息接口
 @app.get("/info", tags=["应用信息"])
@@ -222,5 +230,6 @@ if __name__ == "__main__":
         host=settings.HOST,
         port=settings.PORT,
         reload=settings.RELOAD,
+        workers=None if settings.RELOAD else settings.WORKERS,
         log_level=settings.LOG_LEVEL.lower()
     )
\ No newline at end of file
@@ -7,7 +7,9 @@ from app.models.user import User
 from app.models.novel import Novel
 from app.models.prompt import Prompt
 from app.models.character import Character
+from app.models.character_tag import Tag, CharacterTag
 from app.models.chapter import Chapter
+from app.models.generation_job import GenerationJob
 from app.models.outline import RoughOutline, DetailedOutline
 from app.models.worldview import (
     Worldview, WorldMap, CultivationSystem,
@@ -24,7 +26,8 @@ from app.models.character_template import (
 )
 
 __all__ = [
-    "Base", "User", "Novel", "Prompt", "Character", "Chapter",
+    "Base", "User", "Novel", "Prompt", "Character", "Tag", "CharacterTag", "Chapter",
+    "GenerationJob",
     "RoughOutline", "DetailedOutline", "Worldview",
     "WorldMap", "CultivationSystem", "History", "Faction",
     "AIModelConfig", "BrainStormHistory", "BrainStormIdea",
@@ -100,7 +100,7 @@ class Character(Base, TimestampMixin, UserOwnedMixin):
         }
     
     def update_from_dict(self, data: dict) -> None:
-        """从字典更新数据"""
+        """从字典更新数据（标签变化时标签索引在刷新时同步）"""
         updatable_fields = [
             "name", "gender", "personality", "character_type",
             "worldview_id", "faction_id", "tags", "description",
@@ -117,16 +117,15 @@ class Character(Base, TimestampMixin, UserOwnedMixin):
         return self.tags if self.tags else []
     
     def add_tag(self, tag: str) -> None:
-        """添加标签"""
-        if not self.tags:
-            self.tags = []
-        if tag not in self.tags:
-            self.tags.append(tag)
+        """添加标签（整体赋值新列表，使变更被追踪并同步到标签索引）"""
+        tags = list(self.tags or [])
+        if tag not in tags:
+            self.tags = tags + [tag]
     
     def remove_tag(self, tag: str) -> None:
-        """移除标签"""
+        """移除标签（整体赋值新列表，使变更被追踪并同步到标签索引）"""
         if self.tags and tag in self.tags:
-            self.tags.remove(tag)
+            self.tags = [item for item in self.tags if item != tag]
     
     def __repr__(self):
         return f"<Character(id={self.id}, name='{self.name}', type='{self.character_type}')>"
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""
+角色标签索引数据模型
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+from typing import Any, Dict, Iterable, List, Mapping
+
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, delete, event, insert, inspect, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.models.base import Base
+from app.models.character import Character
+
+
+class Tag(Base):
+    """标签字典表"""
+
+    __tablename__ = "tags"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False, unique=True, comment="标签名")
+
+    def __repr__(self):
+        return f"<Tag(id={self.id}, name='{self.name}')>"
+
+
+class CharacterTag(Base):
+    """角色-标签关联表（Character.tags 的规范化索引）"""
+
+    __tablename__ = "character_tags"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tag_id = Column(Integer, ForeignKey("tags.id", ondelete="CASCADE"), nullable=False, comment="标签ID")
+    character_id = Column(Integer, ForeignKey("characters.id", ondelete="CASCADE"), nullable=False, comment="角色ID")
+
+    __table_args__ = (
+        Index("idx_character_tags_tag_character", "tag_id", "character_id", unique=True),
+        Index("idx_character_tags_character", "character_id"),
+    )
+
+    def __repr__(self):
+        return f"<CharacterTag(tag_id={self.tag_id}, character_id={self.character_id})>"
+
+
+def normalize_tags(tags: Any) -> List[str]:
+    """将标签值统一为去重、去空白后的字符串列表（保持原有顺序）"""
+    if not isinstance(tags, (list, tuple)):
+        return []
+    names = (str(tag).strip() for tag in tags if tag is not None)
+    return [name for name in dict.fromkeys(names) if name]
+
+
+def resolve_tag_ids(connection: Connection, names: Iterable[str]) -> Dict[str, int]:
+    """
+    获取标签名对应的ID，不存在的标签写入字典表
+
+    Args:
+        connection: 数据库连接
+        names: 标签名
+
+    Returns:
+        标签名 -> 标签ID
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+    tag_ids = dict(connection.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names))).all())
+    missing = [name for name in names if name not in tag_ids]
+    if missing:
+        connection.execute(insert(Tag), [{"name": name} for name in missing])
+        tag_ids.update(connection.execute(select(Tag.name, Tag.id).where(Tag.name.in_(missing))).all())
+    return tag_ids
+
+
+def index_character_tags(connection: Connection, character_tags: Mapping[int, Any]) -> None:
+    """
+    重写角色的标签索引
+
+    Args:
+        connection: 数据库连接
+        character_tags: 角色ID -> 标签列表（JSON 列中的原始值）
+    """
+    if not character_tags:
+        return
+    normalized = {character_id: normalize_tags(tags) for character_id, tags in character_tags.items()}
+    tag_ids = resolve_tag_ids(connection, (name for names in normalized.values() for name in names))
+
+    connection.execute(delete(CharacterTag).where(CharacterTag.character_id.in_(list(normalized))))
+    rows = [
+        {"tag_id": tag_ids[name], "character_id": character_id}
+        for character_id, names in normalized.items()
+        for name in names
+    ]
+    if rows:
+        connection.execute(insert(CharacterTag), rows)
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_character_tag_index(session: Session, flush_context: Any) -> None:
+    """工作单元刷新后同步新增、标签变化或已删除角色的标签索引"""
+    changed: Dict[int, Any] = {}
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Character) and obj.id is not None:
+            if obj in session.new or inspect(obj).attrs.tags.history.has_changes():
+                changed[obj.id] = obj.tags
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, Character) and obj.id is not None]
+
+    if not changed and not deleted:
+        return
+    connection = session.connection()
+    if deleted:
+        connection.execute(delete(CharacterTag).where(CharacterTag.character_id.in_(deleted)))
+    index_character_tags(connection, changed)
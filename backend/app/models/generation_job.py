@@ -0,0 +1,62 @@
+"""
+后台生成任务数据模型
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import enum
+
+from sqlalchemy import Column, DateTime, Index, Integer, JSON, String, Text
+
+from app.models.base import Base, TimestampMixin, UserOwnedMixin
+
+
+class GenerationJobStatus(str, enum.Enum):
+    """后台生成任务状态枚举"""
+    PENDING = "pending"       # 排队中
+    RUNNING = "running"       # 执行中
+    COMPLETED = "completed"   # 已完成
+    FAILED = "failed"         # 失败
+    CANCELLED = "cancelled"   # 已取消
+
+
+# 已结束的任务状态
+FINISHED_STATUSES = (
+    GenerationJobStatus.COMPLETED, GenerationJobStatus.FAILED, GenerationJobStatus.CANCELLED
+)
+
+
+class GenerationJob(Base, TimestampMixin, UserOwnedMixin):
+    """后台生成任务表（持久化的任务队列）"""
+
+    __tablename__ = "generation_jobs"
+
+    # 基础信息
+    id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String(50), nullable=False, comment="任务类型")
+    status = Column(String(20), nullable=False, default=GenerationJobStatus.PENDING, comment="任务状态")
+    payload = Column(JSON, comment="生成请求参数", default=dict)
+
+    # 执行信息（worker 通过条件更新认领任务，并定期刷新心跳）
+    worker_id = Column(String(100), nullable=True, comment="执行任务的worker")
+    attempts = Column(Integer, nullable=False, default=0, comment="已执行次数")
+    progress = Column(String(200), nullable=True, comment="当前进度说明")
+    started_at = Column(DateTime, nullable=True, comment="开始执行时间")
+    heartbeat_at = Column(DateTime, nullable=True, comment="最后心跳时间")
+    finished_at = Column(DateTime, nullable=True, comment="结束时间")
+
+    # 结果
+    result = Column(JSON, nullable=True, comment="生成结果（与同步接口的响应一致）")
+    error_code = Column(Integer, nullable=True, comment="失败时对应的HTTP状态码")
+    error_message = Column(Text, nullable=True, comment="错误信息")
+
+    __table_args__ = (
+        Index('idx_generation_job_status', 'status', 'id'),
+    )
+
+    def is_finished(self) -> bool:
+        """任务是否已结束（完成、失败或取消）"""
+        return self.status in FINISHED_STATUSES
+
+    def __repr__(self):
+        return f"<GenerationJob(id={self.id}, type='{self.job_type}', status='{self.status}')>"
@@ -0,0 +1,50 @@
+"""
+添加角色标签索引表
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+from app.core.database import get_db
+from app.models.character_tag import CharacterTag, Tag
+from app.services.character_tag_index import backfill_character_tags
+
+
+def upgrade():
+    """创建标签字典表与角色-标签关联表，并根据 characters.tags 回填索引"""
+    db = next(get_db())
+
+    try:
+        bind = db.get_bind()
+        Tag.__table__.create(bind=bind, checkfirst=True)
+        CharacterTag.__table__.create(bind=bind, checkfirst=True)
+
+        total = backfill_character_tags(db)
+        print(f"角色标签索引表创建成功，已回填{total}个角色")
+
+    except Exception as e:
+        db.rollback()
+        print(f"创建角色标签索引表失败: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+
+def downgrade():
+    """删除角色标签索引表"""
+    db = next(get_db())
+
+    try:
+        bind = db.get_bind()
+        CharacterTag.__table__.drop(bind=bind, checkfirst=True)
+        Tag.__table__.drop(bind=bind, checkfirst=True)
+        print("角色标签索引表删除成功")
+
+    except Exception as e:
+        print(f"删除角色标签索引表失败: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    upgrade()
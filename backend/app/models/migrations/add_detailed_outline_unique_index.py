@@ -0,0 +1,41 @@
+"""
+添加详细大纲章节号唯一索引
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+from alembic import op
+
+
+def upgrade():
+    """清理重复的章节大纲（每个章节号保留ID最小的一条），再为 (novel_id, chapter_number) 添加唯一索引"""
+    # 关联到重复大纲的章节改为关联保留的大纲
+    op.execute(
+        "UPDATE chapters SET outline_id = ("
+        " SELECT MIN(keep.id) FROM detailed_outlines keep"
+        " JOIN detailed_outlines dup"
+        " ON dup.novel_id = keep.novel_id AND dup.chapter_number = keep.chapter_number"
+        " WHERE dup.id = chapters.outline_id"
+        ") WHERE outline_id IS NOT NULL"
+    )
+
+    # 删除重复的大纲（派生表包装子查询，兼容不允许在 DELETE 中直接查询目标表的数据库）
+    op.execute(
+        "DELETE FROM detailed_outlines WHERE id NOT IN ("
+        " SELECT id FROM ("
+        " SELECT MIN(id) AS id FROM detailed_outlines GROUP BY novel_id, chapter_number"
+        " ) AS keep_ids"
+        ")"
+    )
+
+    op.create_index(
+        'idx_detailed_outline_novel_chapter',
+        'detailed_outlines',
+        ['novel_id', 'chapter_number'],
+        unique=True
+    )
+
+
+def downgrade():
+    """移除详细大纲章节号唯一索引（已删除的重复大纲不会恢复）"""
+    op.drop_index('idx_detailed_outline_novel_chapter', 'detailed_outlines')
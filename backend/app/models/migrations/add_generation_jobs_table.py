@@ -0,0 +1,42 @@
+"""
+添加后台生成任务表
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+from app.core.database import get_db
+from app.models.generation_job import GenerationJob
+
+
+def upgrade():
+    """创建后台生成任务表"""
+    db = next(get_db())
+
+    try:
+        GenerationJob.__table__.create(bind=db.get_bind(), checkfirst=True)
+        print("后台生成任务表创建成功")
+
+    except Exception as e:
+        print(f"创建后台生成任务表失败: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+
+def downgrade():
+    """删除后台生成任务表"""
+    db = next(get_db())
+
+    try:
+        GenerationJob.__table__.drop(bind=db.get_bind(), checkfirst=True)
+        print("后台生成任务表删除成功")
+
+    except Exception as e:
+        print(f"删除后台生成任务表失败: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    upgrade()
@@ -6,7 +6,7 @@ Created: 2025-06-01
 
 import enum
 from typing import Optional
-from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declared_attr
 
@@ -99,6 +99,11 @@ class DetailedOutline(Base, TimestampMixin, UserOwnedMixin):
     user = relationship("User", back_populates="detailed_outlines")
     novel = relationship("Novel", back_populates="detailed_outlines")
     
+    # 每部小说的每个章节号只有一份详细大纲（批量写入依赖该约束去重）
+    __table_args__ = (
+        Index('idx_detailed_outline_novel_chapter', 'novel_id', 'chapter_number', unique=True),
+    )
+    
     def to_dict(self) -> dict:
         """转换为字典"""
         return {
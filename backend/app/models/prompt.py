@@ -21,6 +21,8 @@ class PromptType(str, enum.Enum):
     DETAIL_OUTLINE = "detail_outline"  # 细致大纲生成
     CHARACTER = "character"            # 角色生成
     CHAPTER = "chapter"                # 章节内容生成
+    WORLD_MAP = "world_map"            # 地图区域生成
+    WORLD_VIEW_SECTION = "world_view_section"  # 世界观分段生成
 
 
 class Prompt(Base):
@@ -125,6 +125,12 @@ class User(Base):
         cascade="all, delete-orphan",
         lazy="select"
     )
+    generation_jobs = relationship(
+        "GenerationJob",
+        back_populates="user",
+        cascade="all, delete-orphan",
+        lazy="select"
+    )
     world_maps = relationship(
         "WorldMap",
         back_populates="user",
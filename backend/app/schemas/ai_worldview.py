@@ -104,4 +104,14 @@ class AIWorldviewResponse(BaseModel):
     geography: AIGeography = Field(..., description="地理信息")
     power_system: AIPowerSystem = Field(..., description="力量体系")
     history: AIHistory = Field(..., description="历史信息")
-    factions: List[AIFaction] = Field(default_factory=list, description="阵营势力")
\ No newline at end of file
+    factions: List[AIFaction] = Field(default_factory=list, description="阵营势力")
+
+
+class AIFactionSection(BaseModel):
+    """分段生成时的阵营势力部分"""
+    factions: List[AIFaction] = Field(default_factory=list, description="阵营势力")
+
+
+class AIArtifactSection(BaseModel):
+    """分段生成时的神器/遗物部分"""
+    artifacts: List[AIArtifact] = Field(default_factory=list, description="重要神器")
@@ -74,9 +74,11 @@ class BrainStormHistoryItem(BaseModel):
 class BrainStormHistoryResponse(BaseModel):
     """历史记录响应"""
     history: List[BrainStormHistoryItem] = Field(..., description="历史记录列表")
-    total: int = Field(..., description="总数")
+    total: Optional[int] = Field(None, description="总数（翻页时为近似值，未请求时为空）")
     limit: int = Field(..., description="限制数量")
     offset: int = Field(..., description="偏移量")
+    next_cursor: Optional[str] = Field(None, description="下一页游标")
+    has_more: bool = Field(default=False, description="是否还有下一页")
 
 
 class BrainStormHistoryDetail(BaseModel):
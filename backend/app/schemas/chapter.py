@@ -134,11 +134,13 @@ class ChapterSummaryResponse(BaseModel):
 class ChapterListResponse(BaseModel):
     """章节列表响应模式"""
     items: List[ChapterSummaryResponse] = Field(..., description="章节列表")
-    total: int = Field(..., description="总数量")
+    total: Optional[int] = Field(None, description="总数量（翻页时为近似值，未请求时为空）")
     page: int = Field(..., description="当前页码")
     page_size: int = Field(..., description="每页数量")
-    total_pages: int = Field(..., description="总页数")
+    total_pages: Optional[int] = Field(None, description="总页数")
     total_words: int = Field(default=0, description="总字数")
+    next_cursor: Optional[str] = Field(None, description="下一页游标")
+    has_more: bool = Field(default=False, description="是否还有下一页")
 
 
 class ChapterGenerationRequest(BaseModel):
@@ -188,6 +190,52 @@ class ChapterGenerationResponse(BaseModel):
     used_prompt_template: Optional[str] = Field(None, description="使用的提示词模板")
 
 
+class ChapterBatchGenerationRequest(BaseModel):
+    """批量生成章节请求模式（按详细大纲生成第N..M章）"""
+    novel_id: int = Field(..., description="小说ID")
+    start_chapter: int = Field(..., description="起始章节号", ge=1)
+    end_chapter: int = Field(..., description="结束章节号", ge=1)
+    prompt_template: Optional[str] = Field(None, description="提示词模板类型")
+    generation_params: dict = Field(default_factory=dict, description="生成参数配置")
+    user_suggestion: Optional[str] = Field(None, description="用户建议和要求")
+    include_worldview: bool = Field(default=True, description="是否包含世界观信息")
+    include_characters: bool = Field(default=True, description="是否包含大纲中的参与角色信息")
+    target_word_count: Optional[int] = Field(None, description="每章目标字数", ge=100, le=50000)
+
+    @validator('end_chapter')
+    def validate_chapter_range(cls, v, values):
+        """验证章节号范围"""
+        start = values.get('start_chapter')
+        if start is not None:
+            if v < start:
+                raise ValueError("End chapter must be >= start chapter")
+            if v - start + 1 > 100:  # 单个任务最多100章
+                raise ValueError("Too many chapters for one job (max 100)")
+        return v
+
+    @validator('generation_params')
+    def validate_generation_params(cls, v):
+        """验证生成参数"""
+        return ChapterGenerationRequest.validate_generation_params(v)
+
+
+class ChapterGenerationJobResponse(BaseModel):
+    """批量章节生成任务响应模式"""
+    id: int = Field(..., description="任务ID（即后台任务ID，可通过 /jobs/{id}/events 订阅状态）")
+    novel_id: int = Field(..., description="小说ID")
+    start_chapter: int = Field(..., description="起始章节号")
+    end_chapter: int = Field(..., description="结束章节号")
+    status: str = Field(..., description="任务状态")
+    total_chapters: int = Field(..., description="章节总数")
+    last_completed_chapter: Optional[int] = Field(None, description="最后完成的章节号")
+    current_chapter: Optional[int] = Field(None, description="正在生成的章节号")
+    results: List[dict] = Field(default_factory=list, description="逐章结果")
+    progress: Optional[str] = Field(None, description="当前进度说明")
+    error_message: Optional[str] = Field(None, description="错误信息")
+    created_at: datetime = Field(..., description="创建时间")
+    updated_at: datetime = Field(..., description="更新时间")
+
+
 class ChapterFilterRequest(BaseModel):
     """章节筛选请求模式"""
     title: Optional[str] = Field(None, description="标题模糊搜索")
@@ -117,11 +117,13 @@ class TemplateFilterOption(BaseModel):
 class CharacterTemplateListResponse(BaseModel):
     """角色模板列表响应模式"""
     characters: List[CharacterTemplateSummaryResponse] = Field(..., description="角色模板列表")
-    total: int = Field(..., description="总数量")
+    total: Optional[int] = Field(None, description="总数量（翻页时为近似值，未请求时为空）")
     page: int = Field(..., description="当前页码")
     page_size: int = Field(..., description="每页数量")
-    total_pages: int = Field(..., description="总页数")
+    total_pages: Optional[int] = Field(None, description="总页数")
     filters_available: Optional[Dict[str, List[TemplateFilterOption]]] = Field(None, description="可用的筛选选项")
+    next_cursor: Optional[str] = Field(None, description="下一页游标")
+    has_more: bool = Field(default=False, description="是否还有下一页")
 
 
 class UseTemplateRequest(BaseModel):
@@ -256,6 +258,8 @@ class SearchTemplatesRequest(BaseModel):
     search_fields: Optional[List[str]] = Field(None, description="搜索字段")
     fuzzy_search: bool = Field(default=True, description="是否模糊搜索")
     highlight: bool = Field(default=False, description="是否高亮匹配内容")
+    cursor: Optional[str] = Field(None, description="分页游标（优先于页码）")
+    include_total: bool = Field(default=True, description="是否返回总数")
 
 
 # === 管理员角色模板管理相关Schema ===
@@ -318,10 +322,12 @@ class CharacterTemplateDeleteResponse(BaseModel):
 class AdminTemplateListResponse(BaseModel):
     """管理员模板列表响应模式"""
     templates: List[CharacterTemplateResponse] = Field(..., description="模板列表")
-    total: int = Field(..., description="总数量")
+    total: Optional[int] = Field(None, description="总数量（未请求时为空）")
     page: int = Field(..., description="当前页码")
     page_size: int = Field(..., description="每页数量")
-    total_pages: int = Field(..., description="总页数")
+    total_pages: Optional[int] = Field(None, description="总页数")
+    next_cursor: Optional[str] = Field(None, description="下一页游标")
+    has_more: bool = Field(default=False, description="是否还有下一页")
 
 
 class TemplateStatusUpdateRequest(BaseModel):
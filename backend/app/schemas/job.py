@@ -0,0 +1,28 @@
+"""
+后台生成任务数据模式
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+from datetime import datetime
+from typing import Any, Optional
+
+from pydantic import BaseModel, Field
+
+
+class GenerationJobResponse(BaseModel):
+    """后台生成任务响应模式"""
+    id: int = Field(..., description="任务ID")
+    job_type: str = Field(..., description="任务类型")
+    status: str = Field(..., description="任务状态")
+    progress: Optional[str] = Field(None, description="当前进度说明")
+    attempts: int = Field(0, description="已执行次数")
+    result: Optional[Any] = Field(None, description="生成结果（与同步接口的响应一致）")
+    error_code: Optional[int] = Field(None, description="失败时对应的HTTP状态码")
+    error_message: Optional[str] = Field(None, description="错误信息")
+    created_at: datetime = Field(..., description="创建时间")
+    started_at: Optional[datetime] = Field(None, description="开始执行时间")
+    finished_at: Optional[datetime] = Field(None, description="结束时间")
+
+    class Config:
+        from_attributes = True
@@ -68,6 +68,7 @@ class DetailedOutlineCreate(DetailedOutlineBase):
 
 class DetailedOutlineUpdate(BaseModel):
     """更新详细大纲请求模式"""
+    chapter_number: Optional[int] = Field(None, description="章节号", ge=1)
     chapter_title: Optional[str] = Field(None, description="章节标题", max_length=200)
     plot_points: Optional[str] = Field(None, description="章节情节点")
     participating_characters: Optional[List[int]] = Field(None, description="参与角色ID列表")
@@ -253,6 +253,7 @@ class WorldviewGenerationRequest(BaseModel):
     genre: Optional[str] = Field(None, description="小说类型")
     themes: Optional[List[str]] = Field(default_factory=list, description="小说主题列表")
     style: Optional[str] = Field(None, description="写作风格")
+    decomposed: bool = Field(default=False, description="是否分段并发生成（先生成世界基础，再并发生成其余部分）")
     
     class Config:
         schema_extra = {
@@ -345,4 +346,24 @@ class WorldviewGenerationResponse(BaseModel):
     factions: List[SimpleFaction] = Field(default_factory=list, description="生成的阵营势力")
     
     # 统计
-    total_generated: int = Field(default=0, description="成功生成的项目数量")
\ No newline at end of file
+    total_generated: int = Field(default=0, description="成功生成的项目数量")
+
+
+class WorldMapTreeGenerationRequest(BaseModel):
+    """层级地图生成请求模式"""
+    depth: int = Field(default=3, ge=1, le=4, description="生成的层数")
+    branching: int = Field(default=3, ge=1, le=6, description="每个区域生成的子区域数量")
+    root_region_id: Optional[int] = Field(None, description="从该区域开始向下展开，为空时从顶层区域开始")
+    include: List[str] = Field(default_factory=list, description="需要包含的特征：climate/terrain/resources/population/culture")
+    suggestion: Optional[str] = Field(None, description="用户建议")
+    temperature: Optional[float] = Field(None, ge=0, le=100, description="温度(0-100)")
+    
+    class Config:
+        schema_extra = {
+            "example": {
+                "depth": 3,
+                "branching": 3,
+                "include": ["climate", "terrain"],
+                "suggestion": "大陆被一条天河分为南北两部分"
+            }
+        }
@@ -6,14 +6,24 @@ Created: 2025-06-01
 
 import logging
 import asyncio
-from typing import Dict, Any, Optional, List, Union
+import math
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Any, Optional, List, Type, Union
 from abc import ABC, abstractmethod
 import openai
+from fastapi import HTTPException
 from openai import AsyncOpenAI
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from app.core.config import get_settings
 from app.core.database import get_db
+from app.core.shared_state import get_shared_state
+from app.core.spans import record_stage, span
+from app.core.table_versions import get_table_versions
+from app.services.structured_recovery import recover_structured_response
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
@@ -40,9 +50,19 @@ class AIModelAdapter(ABC):
         response_format: Dict[str, Any],
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
+        response_model: Optional[Type[BaseModel]] = None,
         **kwargs
     ) -> Dict[str, Any]:
-        """生成结构化响应"""
+        """
+        生成结构化响应
+
+        Args:
+            prompt: 提示词
+            response_format: 响应格式说明
+            max_tokens: 输出上限
+            temperature: 采样温度
+            response_model: 期望的响应模型，JSON 解析失败时用于校验恢复出的部分结果
+        """
         pass
 
 
@@ -121,6 +141,7 @@ class OpenAIAdapter(AIModelAdapter):
         response_format: Dict[str, Any],
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
+        response_model: Optional[Type[BaseModel]] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """生成结构化响应"""
@@ -155,6 +176,12 @@ class OpenAIAdapter(AIModelAdapter):
             try:
                 return json.loads(json_str)
             except json.JSONDecodeError:
+                recovered = await recover_structured_response(
+                    self, full_prompt, json_str, response_model,
+                    max_tokens=max_tokens, temperature=temperature, **kwargs
+                )
+                if recovered is not None:
+                    return recovered
                 logger.warning(f"无法解析为JSON格式，返回原始文本: {response_text}")
                 return {"content": response_text}
 
@@ -265,12 +292,16 @@ class CustomHttpAdapter(AIModelAdapter):
                     )
             
             async with aiohttp.ClientSession(**session_kwargs) as session:
+                requested = time.perf_counter()
                 async with session.post(self.api_endpoint, **request_kwargs) as response:
+                    record_stage("ai_ttfb", time.perf_counter() - requested)
+                    # 任务被取消（如客户端断开）时 CancelledError 穿过 async with，由 aiohttp 关闭未读完的上游连接
                     if response.status != 200:
                         error_text = await response.text()
                         raise Exception(f"API调用失败: {response.status} - {error_text}")
                     
-                    result = await response.json()
+                    with span("ai_body"):
+                        result = await response.json()
                     
                     # 根据格式解析响应
                     if self.request_format == "openai_chat":
@@ -285,7 +316,6 @@ class CustomHttpAdapter(AIModelAdapter):
                             return result["content"].strip()
                         else:
                             return str(result).strip()
-                            
         except Exception as e:
             logger.error(f"自定义API调用失败: {str(e)}")
             raise AIServiceError(f"生成内容失败: {str(e)}")
@@ -296,6 +326,7 @@ class CustomHttpAdapter(AIModelAdapter):
         response_format: Dict[str, Any],
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
+        response_model: Optional[Type[BaseModel]] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """生成结构化响应"""
@@ -330,6 +361,12 @@ class CustomHttpAdapter(AIModelAdapter):
             try:
                 return json.loads(json_str)
             except json.JSONDecodeError:
+                recovered = await recover_structured_response(
+                    self, full_prompt, json_str, response_model,
+                    max_tokens=max_tokens, temperature=temperature, **kwargs
+                )
+                if recovered is not None:
+                    return recovered
                 logger.warning(f"无法解析为JSON格式，返回原始文本: {response_text}")
                 return {"content": response_text}
 
@@ -363,6 +400,7 @@ class ClaudeAdapter(AIModelAdapter):
         response_format: Dict[str, Any],
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
+        response_model: Optional[Type[BaseModel]] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """生成结构化响应"""
@@ -375,15 +413,52 @@ class AIServiceError(Exception):
     pass
 
 
+class AIRateLimitError(HTTPException):
+    """超出每分钟AI请求上限（各层按 HTTPException 原样抛出，接口返回 429）"""
+
+    def __init__(self, limit: int):
+        super().__init__(
+            status_code=429,
+            detail=f"AI请求过于频繁，每分钟最多{limit}次，请稍后再试",
+            headers={"Retry-After": str(max(1, math.ceil(60 / limit)))}
+        )
+
+
 class AIService:
     """AI服务统一接口"""
     
     def __init__(self):
         self.adapters: Dict[str, AIModelAdapter] = {}
         self.user_adapters: Dict[int, Dict[str, AIModelAdapter]] = {}  # 用户自定义适配器
+        # 加载各用户适配器时的配置表版本（版本未变化时不重复查询与创建适配器）
+        self._user_adapter_versions: Dict[int, int] = {}
         self.default_adapter: Optional[str] = None
+        # 并发调度：每个事件循环一个信号量，限制同时进行的AI请求数
+        self._request_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
         self._init_adapters()
     
+    def _request_slot(self) -> asyncio.Semaphore:
+        """获取当前事件循环的AI请求并发槽位"""
+        loop = asyncio.get_running_loop()
+        slot = self._request_slots.get(loop)
+        if slot is None:
+            slot = asyncio.Semaphore(max(1, settings.AI_MAX_CONCURRENT_REQUESTS))
+            self._request_slots[loop] = slot
+        return slot
+    
+    @asynccontextmanager
+    async def _acquire_request_slot(self) -> AsyncIterator[None]:
+        """占用一个AI请求并发槽位（排队等待时间记为 ai_slot_wait 阶段）"""
+        slot = self._request_slot()
+        with span("ai_slot_wait"):
+            await slot.acquire()
+        try:
+            yield
+        finally:
+            slot.release()
+    
     def _init_adapters(self):
         """初始化AI模型适配器"""
         try:
@@ -467,12 +542,32 @@ class AIService:
         except Exception as e:
             logger.error(f"AI适配器初始化失败: {str(e)}")
     
-    def load_user_adapters(self, user_id: int, db: Session):
-        """加载用户自定义适配器"""
+    @staticmethod
+    def _config_version() -> int:
+        """AI配置表的当前版本号（任一工作进程提交配置变更后递增）"""
+        from app.models.ai_model_config import AIModelConfig
+        return get_table_versions().get((AIModelConfig.__table__.name,))[0]
+    
+    def load_user_adapters(self, user_id: int, db: Session, force: bool = False):
+        """
+        加载用户自定义适配器
+        
+        配置表版本与上次加载时相同时直接复用已创建的适配器；配置在任一工作
+        进程中变更后版本递增，各进程在下次使用时重新加载。
+        
+        Args:
+            user_id: 用户ID
+            db: 数据库会话
+            force: 忽略版本强制重新加载
+        """
         try:
             from app.models.ai_model_config import AIModelConfig
             from app.services.http_adapter import AdapterFactory
             
+            version = self._config_version()
+            if not force and user_id in self.user_adapters and self._user_adapter_versions.get(user_id) == version:
+                return
+            
             # 查询用户的AI配置
             configs = db.query(AIModelConfig).filter(
                 AIModelConfig.user_id == user_id,
@@ -501,6 +596,7 @@ class AIService:
                 except Exception as e:
                     logger.error(f"加载用户 {user_id} 的适配器 {config.name} 失败: {str(e)}")
             
+            self._user_adapter_versions[user_id] = version
             logger.info(f"用户 {user_id} 共加载 {len(self.user_adapters[user_id])} 个适配器")
             
         except Exception as e:
@@ -539,6 +635,21 @@ class AIService:
         
         return self.adapters[name]
     
+    @staticmethod
+    def _check_rate_limit(user_id: Optional[int]) -> None:
+        """
+        按用户限流（令牌桶保存在共享状态中，多个工作进程共用同一额度）
+        
+        Raises:
+            AIRateLimitError: 超出每分钟请求上限
+        """
+        limit = settings.AI_RATE_LIMIT_PER_MINUTE
+        if limit <= 0:
+            return
+        key = f"rate_limit:ai:{user_id or 'anonymous'}"
+        if not get_shared_state().take_token(key, capacity=limit, refill_per_second=limit / 60.0):
+            raise AIRateLimitError(limit)
+    
     async def generate_text(
         self,
         prompt: str,
@@ -556,15 +667,18 @@ class AIService:
             self.load_user_adapters(user_id, db)
         
         adapter = self.get_adapter(adapter_name, user_id)
+        self._check_rate_limit(user_id)
         
         for attempt in range(retry_count):
             try:
-                result = await adapter.generate_text(
-                    prompt=prompt,
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                    **kwargs
-                )
+                async with self._acquire_request_slot():
+                    with span("ai_call"):
+                        result = await adapter.generate_text(
+                            prompt=prompt,
+                            max_tokens=max_tokens,
+                            temperature=temperature,
+                            **kwargs
+                        )
                 return result
                 
             except Exception as e:
@@ -585,26 +699,36 @@ class AIService:
         temperature: Optional[float] = None,
         retry_count: int = 3,
         db: Optional[Session] = None,
+        response_model: Optional[Type[BaseModel]] = None,
         **kwargs
     ) -> Dict[str, Any]:
-        """生成结构化响应（带重试机制）"""
+        """
+        生成结构化响应（带重试机制）
+
+        响应 JSON 被截断或格式错误时，适配器会先恢复已完整输出的部分并只续写
+        缺失的结尾（按 response_model 校验），不再整次重新生成。
+        """
         # 如果有用户ID和数据库连接，加载用户适配器
         if user_id and db:
             self.load_user_adapters(user_id, db)
         
         adapter = self.get_adapter(adapter_name, user_id)
-        max_tokens = 30000
+        self._check_rate_limit(user_id)
+        max_tokens = max_tokens or 30000
         
         for attempt in range(retry_count):
             try:
                 logger.info(f"请求参数为：prompt={prompt}, response_format={response_format}, max_tokens={max_tokens}, temperature={temperature}, kwargs={kwargs}")
-                result = await adapter.generate_structured_response(
-                    prompt=prompt,
-                    response_format=response_format,
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                    **kwargs
-                )
+                async with self._acquire_request_slot():
+                    with span("ai_call"):
+                        result = await adapter.generate_structured_response(
+                            prompt=prompt,
+                            response_format=response_format,
+                            max_tokens=max_tokens,
+                            temperature=temperature,
+                            response_model=response_model,
+                            **kwargs
+                        )
                 logger.info(f"生成结果: {result}")
                 return result
                 
@@ -12,7 +12,9 @@ from typing import Dict, Any, Optional, List
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
 
-from app.services.ai_service import get_ai_service, AIServiceError
+from app.core.pagination import paginate_keyset, get_total_count_cache
+from app.core.spans import timed
+from app.services.ai_service import get_ai_service, AIRateLimitError, AIServiceError
 from app.services.prompt_service import PromptService
 from app.models.prompt import PromptType
 from app.models.brain_storm import (
@@ -141,6 +143,8 @@ class BrainStormService:
             logger.info(f"用户 {user_id} 脑洞生成成功，生成 {len(generated_ideas)} 个创意")
             return response
             
+        except AIRateLimitError:
+            raise
         except Exception as e:
             logger.error(f"脑洞生成失败: {str(e)}")
             raise AIServiceError(f"脑洞生成失败: {str(e)}")
@@ -149,17 +153,37 @@ class BrainStormService:
         self,
         user_id: int,
         limit: int = 20,
-        offset: int = 0
+        offset: int = 0,
+        cursor: Optional[str] = None,
+        include_total: bool = True
     ) -> BrainStormHistoryResponse:
-        """获取生成历史"""
+        """获取生成历史（支持游标分页，提供游标时忽略偏移量）"""
         try:
             # 查询历史记录
             query = self.db.query(BrainStormHistory).filter(
                 BrainStormHistory.user_id == user_id
-            ).order_by(desc(BrainStormHistory.created_at))
+            )
+            
+            # 首页精确计数，翻页复用缓存的近似值
+            total = None
+            if include_total:
+                total = get_total_count_cache().get_total(
+                    get_total_count_cache().make_key("brain_storm_history", user_id),
+                    query,
+                    exact=not cursor and offset == 0
+                )
             
-            total = query.count()
-            history_records = query.offset(offset).limit(limit).all()
+            result = paginate_keyset(
+                query,
+                BrainStormHistory.created_at,
+                BrainStormHistory.id,
+                limit=limit,
+                descending=True,
+                cursor=cursor,
+                offset=offset,
+                signature="created_at:desc"
+            )
+            history_records = result.items
             
             # 转换为响应格式
             history_items = []
@@ -181,7 +205,9 @@ class BrainStormService:
                 history=history_items,
                 total=total,
                 limit=limit,
-                offset=offset
+                offset=offset,
+                next_cursor=result.next_cursor,
+                has_more=result.has_more
             )
             
         except Exception as e:
@@ -582,6 +608,7 @@ class BrainStormService:
             }
         }
     
+    @timed("persist")
     async def _save_generation_history(
         self,
         generation_id: str,
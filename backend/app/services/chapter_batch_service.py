@@ -0,0 +1,464 @@
+"""
+批量章节生成服务
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.database import SessionLocal
+from app.models.chapter import Chapter, ChapterStatus
+from app.models.generation_job import GenerationJob, GenerationJobStatus
+from app.models.outline import DetailedOutline
+from app.schemas.chapter import (
+    ChapterBatchGenerationRequest, ChapterGenerationJobResponse, ChapterGenerationRequest
+)
+from app.services.chapter_context_index import (
+    TAIL_CHARS, estimate_tokens, format_tail_section, get_chapter_context_index
+)
+from app.services.generation_context import (
+    GenerationContext, GenerationContextLoader, format_character, format_detailed_outline
+)
+from app.services.generation_service import get_generation_service
+from app.services.job_queue import current_job, get_job_queue
+from app.services.prompt_service import get_prompt_service
+
+logger = logging.getLogger(__name__)
+
+# 后台任务队列中的任务类型名
+BATCH_JOB_TYPE = "chapter_batch"
+
+# 未结束的任务状态
+ACTIVE_STATUSES = (GenerationJobStatus.PENDING, GenerationJobStatus.RUNNING)
+
+
+def batch_job_response(job: GenerationJob) -> ChapterGenerationJobResponse:
+    """
+    将批量生成的后台任务转换为批量任务响应
+
+    任务参数保存在 payload 中，逐章进度保存在 result 中。
+
+    Args:
+        job: chapter_batch 类型的后台任务
+
+    Returns:
+        批量任务响应
+    """
+    payload = job.payload or {}
+    progress = job.result or {}
+    return ChapterGenerationJobResponse(
+        id=job.id,
+        novel_id=payload["novel_id"],
+        start_chapter=payload["start_chapter"],
+        end_chapter=payload["end_chapter"],
+        status=job.status,
+        total_chapters=payload["end_chapter"] - payload["start_chapter"] + 1,
+        last_completed_chapter=progress.get("last_completed_chapter"),
+        current_chapter=None if job.is_finished() else progress.get("current_chapter"),
+        results=progress.get("results") or [],
+        progress=job.progress,
+        error_message=job.error_message,
+        created_at=job.created_at,
+        updated_at=job.updated_at
+    )
+
+
+class ChapterBatchGenerator:
+    """
+    批量章节生成器
+
+    按详细大纲依次生成第N..M章：小说、世界观、大纲与角色等共享上下文只加载
+    一次；第k章生成期间在线程中预先组装第k+1章的上下文（上一章结尾在第k章
+    完成后拼接）。每章与任务进度在同一事务中提交，服务重启或任务失败后从
+    最后提交的章节继续。
+
+    任务即后台任务队列中 chapter_batch 类型的 GenerationJob：生成参数保存在
+    payload，逐章进度保存在 result 并以执行的 worker 为条件写入。认领、心跳、
+    取消与中断后重新排队沿用队列的机制，多进程部署时同一任务只会由一个
+    worker 执行。
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self._session_factory = session_factory
+
+    # ------------------------------------------------------------------
+    # 任务管理
+    # ------------------------------------------------------------------
+
+    def create_job(
+        self,
+        db: Session,
+        user_id: int,
+        request: ChapterBatchGenerationRequest
+    ) -> GenerationJob:
+        """
+        创建批量生成任务并提交到后台任务队列
+
+        Args:
+            db: 数据库会话
+            user_id: 用户ID
+            request: 批量生成请求
+
+        Returns:
+            新建的后台任务
+
+        Raises:
+            ValueError: 大纲缺失或同一小说已有未结束的任务
+        """
+        running = db.query(GenerationJob.id).filter(
+            GenerationJob.job_type == BATCH_JOB_TYPE,
+            GenerationJob.status.in_(ACTIVE_STATUSES),
+            GenerationJob.payload["novel_id"].as_integer() == request.novel_id
+        ).first()
+        if running:
+            raise ValueError(f"该小说已有进行中的批量生成任务（任务ID: {running.id}）")
+
+        outlined = {
+            row.chapter_number for row in db.query(DetailedOutline.chapter_number).filter(
+                DetailedOutline.novel_id == request.novel_id,
+                DetailedOutline.user_id == user_id,
+                DetailedOutline.chapter_number.between(request.start_chapter, request.end_chapter)
+            )
+        }
+        missing = [
+            number for number in range(request.start_chapter, request.end_chapter + 1)
+            if number not in outlined
+        ]
+        if missing:
+            raise ValueError(f"以下章节缺少详细大纲: {', '.join(str(n) for n in missing[:20])}")
+
+        return get_job_queue().enqueue(db, user_id, BATCH_JOB_TYPE, request)
+
+    # ------------------------------------------------------------------
+    # 上下文
+    # ------------------------------------------------------------------
+
+    def _load_shared_context(
+        self,
+        db: Session,
+        user_id: int,
+        request: ChapterBatchGenerationRequest
+    ) -> Dict[str, Any]:
+        """一次性加载整个任务共享的上下文"""
+        loader = GenerationContextLoader(db, user_id)
+        context = loader.load(request.novel_id, include_worldviews=request.include_worldview)
+        if context is None:
+            raise ValueError("小说不存在")
+
+        # 转换为普通字典：ORM对象在提交后会过期，且预组装在其他线程中进行
+        outlines = {
+            outline.chapter_number: {
+                "id": outline.id,
+                "chapter_title": outline.chapter_title,
+                "outline_info": format_detailed_outline(outline),
+                "character_ids": outline.participating_character_ids[:20]
+            }
+            for outline in db.query(DetailedOutline).filter(
+                DetailedOutline.novel_id == request.novel_id,
+                DetailedOutline.user_id == user_id,
+                DetailedOutline.chapter_number.between(request.start_chapter, request.end_chapter)
+            )
+        }
+
+        characters: Dict[int, str] = {}
+        if request.include_characters:
+            character_ids = [
+                character_id
+                for outline in outlines.values()
+                for character_id in outline["character_ids"]
+            ]
+            characters = {
+                char.id: format_character(char) for char in loader.get_characters(request.novel_id, character_ids)
+            }
+
+        return {
+            "novel_info": context.novel_info,
+            "worldview_info": context.worldview_info,
+            "outlines": outlines,
+            "characters": characters
+        }
+
+    def _prepare_chapter(
+        self,
+        job_id: int,
+        novel_id: int,
+        shared: Dict[str, Any],
+        chapter_number: int,
+        available_before: int
+    ) -> Dict[str, Any]:
+        """
+        组装单章的生成上下文（在线程中执行，使用独立的数据库会话）
+
+        Args:
+            job_id: 任务ID
+            novel_id: 小说ID
+            shared: 共享上下文
+            chapter_number: 目标章节号
+            available_before: 已入库的章节上界（不含），小于目标章节号时
+                上一章结尾由调用方在上一章完成后拼接
+
+        Returns:
+            章节上下文
+        """
+        outline = shared["outlines"].get(chapter_number)
+        if outline is None:
+            raise ValueError(f"第{chapter_number}章缺少详细大纲")
+
+        outline_info = outline["outline_info"]
+        character_ids = outline["character_ids"]
+        character_info = "\n".join(
+            shared["characters"][cid] for cid in character_ids if cid in shared["characters"]
+        )
+
+        previous_chapters = ""
+        if chapter_number > 1:
+            index = get_chapter_context_index()
+            pending_tail = available_before < chapter_number
+            budget = index.token_budget - (TAIL_CHARS if pending_tail else 0)
+            db = self._session_factory()
+            try:
+                previous_chapters = index.build_context(
+                    db,
+                    novel_id,
+                    available_before,
+                    query="\n".join(part for part in [outline_info, character_info] if part),
+                    token_budget=max(budget, 1),
+                    include_tail=not pending_tail
+                )
+            finally:
+                db.close()
+
+        logger.debug(f"批量任务{job_id}: 第{chapter_number}章上下文已就绪（{estimate_tokens(previous_chapters)} tokens）")
+        return {
+            "outline": outline,
+            "outline_info": outline_info,
+            "character_ids": character_ids,
+            "character_info": character_info,
+            "previous_chapters": previous_chapters
+        }
+
+    def _prefetch(
+        self,
+        job_id: int,
+        novel_id: int,
+        shared: Dict[str, Any],
+        chapter_number: int,
+        available_before: int
+    ) -> asyncio.Task:
+        """在后台线程中预先组装章节上下文"""
+        return asyncio.create_task(asyncio.to_thread(
+            self._prepare_chapter, job_id, novel_id, shared, chapter_number, available_before
+        ))
+
+    # ------------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------------
+
+    def _update_owned(self, db: Session, job_id: int, owner: str, **values: Any) -> bool:
+        """
+        更新仍由本次执行持有的任务（不提交，由调用方与章节写入一起提交）
+
+        Returns:
+            任务未被取消或被其他 worker 接管时返回 True
+        """
+        updated = db.execute(
+            update(GenerationJob).where(
+                GenerationJob.id == job_id,
+                GenerationJob.status == GenerationJobStatus.RUNNING,
+                GenerationJob.worker_id == owner
+            ).values(**values)
+        ).rowcount
+        return bool(updated)
+
+    async def run(
+        self,
+        request: ChapterBatchGenerationRequest,
+        db: Session,
+        user_id: int
+    ) -> Dict[str, Any]:
+        """
+        执行任务，从最后提交的章节之后继续（后台任务队列的处理函数）
+
+        Args:
+            request: 批量生成请求
+            db: 数据库会话
+            user_id: 用户ID
+
+        Returns:
+            任务结束时的逐章进度（作为任务结果保存）
+        """
+        running = current_job()
+        if running is None:
+            raise RuntimeError("批量章节生成只能由后台任务队列执行")
+        job_id, owner = running
+        prefetch: Optional[asyncio.Task] = None
+        try:
+            job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+            progress: Dict[str, Any] = dict(job.result or {})
+            results: List[Dict[str, Any]] = list(progress.get("results") or [])
+            last_completed = progress.get("last_completed_chapter")
+            novel_id = request.novel_id
+            start_chapter = request.start_chapter if last_completed is None else last_completed + 1
+            end_chapter = request.end_chapter
+            shared = self._load_shared_context(db, user_id, request)
+            numbers: List[int] = list(range(start_chapter, end_chapter + 1))
+            existing = {
+                row.chapter_number: row.id for row in db.query(Chapter.chapter_number, Chapter.id).filter(
+                    Chapter.novel_id == novel_id,
+                    Chapter.chapter_number.in_(numbers)
+                )
+            } if numbers else {}
+
+            def save_progress(current: Optional[int], completed: Optional[int]) -> bool:
+                progress.update(results=results, last_completed_chapter=completed, current_chapter=current)
+                done = 0 if completed is None else completed - request.start_chapter + 1
+                message = f"第{current}章生成中" if current is not None else "执行中"
+                return self._update_owned(
+                    db, job_id, owner,
+                    result=dict(progress),
+                    progress=f"{message}（已完成{done}/{end_chapter - request.start_chapter + 1}章）"
+                )
+
+            generation_service = get_generation_service(get_prompt_service(db))
+            logger.info(f"批量任务{job_id}开始: 第{start_chapter}-{end_chapter}章")
+
+            # 上一章刚生成的内容，用于拼接到预组装的上下文前
+            previous_generated: Optional[Dict[str, Any]] = None
+
+            for position, number in enumerate(numbers):
+                if number in existing:
+                    # 章节已存在（如手动创建），跳过并保留原内容
+                    results.append({
+                        "chapter_number": number,
+                        "chapter_id": existing[number],
+                        "status": "skipped"
+                    })
+                    if not save_progress(None, number):
+                        db.rollback()
+                        logger.info(f"批量任务{job_id}已取消或被接管，停止于第{number}章")
+                        return progress
+                    db.commit()
+                    last_completed = number
+                    previous_generated = None
+                    continue
+
+                if not save_progress(number, last_completed):
+                    db.rollback()
+                    logger.info(f"批量任务{job_id}已取消或被接管，停止于第{number}章之前")
+                    return progress
+                db.commit()
+
+                if prefetch is not None:
+                    prepared = await prefetch
+                    prefetch = None
+                else:
+                    prepared = await asyncio.to_thread(
+                        self._prepare_chapter, job_id, novel_id, shared, number, number
+                    )
+
+                previous_chapters = prepared["previous_chapters"]
+                if previous_generated is not None:
+                    tail = format_tail_section(
+                        previous_generated["number"], previous_generated["title"], previous_generated["content"]
+                    )
+                    previous_chapters = "\n\n".join(part for part in [tail, previous_chapters] if part)
+
+                # 当前章节生成期间预先组装下一章的上下文
+                following = numbers[position + 1] if position + 1 < len(numbers) else None
+                if following is not None and following not in existing:
+                    prefetch = self._prefetch(job_id, novel_id, shared, following, number)
+
+                outline = prepared["outline"]
+                chapter_request = ChapterGenerationRequest(
+                    novel_id=novel_id,
+                    chapter_number=number,
+                    outline_id=outline["id"],
+                    character_ids=prepared["character_ids"],
+                    prompt_template=request.prompt_template,
+                    generation_params=request.generation_params,
+                    user_suggestion=request.user_suggestion,
+                    include_worldview=request.include_worldview,
+                    include_characters=request.include_characters,
+                    target_word_count=request.target_word_count
+                )
+                generation_result = await generation_service.generate_chapter(
+                    request=chapter_request,
+                    context=GenerationContext(
+                        novel_info=shared["novel_info"],
+                        worldview_info=shared["worldview_info"],
+                        character_info=prepared["character_info"],
+                        outline_info=prepared["outline_info"],
+                        previous_chapters=previous_chapters
+                    ),
+                    user_id=user_id,
+                    db=db
+                )
+                if not generation_result.success:
+                    raise ValueError(f"第{number}章生成失败: {generation_result.message}")
+
+                generated_data = generation_result.generation_data or {}
+                chapter = Chapter(
+                    novel_id=novel_id,
+                    title=generated_data.get("title") or outline["chapter_title"] or f"第{number}章",
+                    content=generation_result.generated_content,
+                    chapter_number=number,
+                    status=ChapterStatus.DRAFT,
+                    outline_id=outline["id"],
+                    character_ids=prepared["character_ids"],
+                    notes=f"AI批量生成于{generation_result.used_prompt_template}模板（任务{job_id}）",
+                    user_id=user_id
+                )
+                chapter.update_word_count()
+                db.add(chapter)
+                db.flush()
+
+                # 章节与任务进度在同一事务中提交；任务已取消或被接管时本章一并回滚
+                results.append({
+                    "chapter_number": number,
+                    "chapter_id": chapter.id,
+                    "title": chapter.title,
+                    "word_count": chapter.word_count,
+                    "status": "generated"
+                })
+                if not save_progress(None, number):
+                    db.rollback()
+                    logger.info(f"批量任务{job_id}已取消或被接管，丢弃第{number}章")
+                    return progress
+                db.commit()
+                last_completed = number
+                db.refresh(chapter)
+                get_chapter_context_index().index_chapter(chapter)
+                previous_generated = {"number": number, "title": chapter.title, "content": chapter.content}
+
+                logger.info(f"批量任务{job_id}: 第{number}章已生成（{chapter.word_count}字）")
+
+            logger.info(f"批量任务{job_id}完成")
+            return progress
+
+        except asyncio.CancelledError:
+            # 任务被取消或服务关闭：丢弃未提交的章节，由后台任务队列记录取消或重新排队
+            db.rollback()
+            logger.info(f"批量任务{job_id}执行中断")
+            raise
+        except Exception as e:
+            # 已提交的章节与进度保留，任务失败后可从最后提交的章节之后恢复
+            db.rollback()
+            logger.error(f"批量任务{job_id}失败: {e}")
+            raise
+        finally:
+            if prefetch is not None and not prefetch.done():
+                prefetch.cancel()
+
+
+# 全局批量章节生成器实例
+chapter_batch_generator = ChapterBatchGenerator()
+
+
+def get_chapter_batch_generator() -> ChapterBatchGenerator:
+    """获取批量章节生成器实例"""
+    return chapter_batch_generator
@@ -0,0 +1,721 @@
+"""
+章节上下文检索索引
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.chapter import Chapter, ChapterStatus
+
+logger = logging.getLogger(__name__)
+
+# 哈希特征维度（字符二元组哈希到固定维度，无需维护词表）
+FEATURE_DIM = 1024
+
+# 切块长度（字符）
+CHUNK_SIZE = 400
+
+# 每章摘要长度上限（字符）
+SUMMARY_CHARS = 200
+
+# 全文摘要时最多保留的句子数
+SUMMARY_SENTENCES = 4
+
+# 上一章结尾保留长度（字符）
+TAIL_CHARS = 400
+
+# 近期章节摘要数量
+RECENT_SUMMARIES = 3
+
+# 组装上下文时同步补建索引的章节数上限，超出时其余章节在后台线程中补建
+INLINE_RECONCILE_LIMIT = 8
+
+# 后台补建索引时每批处理的章节数（每批持有一次小说索引锁）
+BUILD_BATCH_SIZE = 20
+
+_SENTENCE_PATTERN = re.compile(r"[^。！？!?\n]+[。！？!?]?")
+_CJK_PATTERN = re.compile(r"[㐀-鿿]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的token数量（中文按字计，其他字符约4个计1个token）
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的token数
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def format_tail_section(number: int, title: str, tail: str) -> str:
+    """
+    格式化上一章结尾段落
+
+    Args:
+        number: 章节号
+        title: 章节标题
+        tail: 章节内容（超过 TAIL_CHARS 时只保留结尾）
+
+    Returns:
+        上下文段落文本
+    """
+    return f"【上一章结尾】第{number}章 {title}\n{(tail or '')[-TAIL_CHARS:]}"
+
+
+def _vectorize(text: str) -> np.ndarray:
+    """将文本转换为字符二元组的哈希词频向量（次线性缩放）"""
+    normalized = re.sub(r"\s+", "", text.lower())
+    if len(normalized) < 2:
+        return np.zeros(FEATURE_DIM, dtype=np.float32)
+    indices = [
+        zlib.crc32(normalized[i:i + 2].encode("utf-8")) % FEATURE_DIM
+        for i in range(len(normalized) - 1)
+    ]
+    counts = np.bincount(indices, minlength=FEATURE_DIM).astype(np.float32)
+    return np.log1p(counts)
+
+
+def _split_sentences(text: str) -> List[str]:
+    """按中英文句末标点与换行切分句子"""
+    return [s.strip() for s in _SENTENCE_PATTERN.findall(text or "") if s.strip()]
+
+
+def _chunk(text: str) -> List[str]:
+    """按句子边界将章节切分为不超过 CHUNK_SIZE 的片段"""
+    chunks: List[str] = []
+    current = ""
+    for sentence in _split_sentences(text):
+        if current and len(current) + len(sentence) > CHUNK_SIZE:
+            chunks.append(current)
+            current = ""
+        current += sentence[:CHUNK_SIZE]
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def summarize(text: str) -> str:
+    """
+    抽取式摘要：选出与全文最相似的若干句子，按原文顺序拼接
+
+    Args:
+        text: 章节内容
+
+    Returns:
+        摘要文本
+    """
+    sentences = _split_sentences(text)
+    if not sentences:
+        return ""
+    if sum(len(s) for s in sentences) <= SUMMARY_CHARS:
+        return "".join(sentences)
+
+    vectors = np.stack([_vectorize(s) for s in sentences])
+    centroid = vectors.sum(axis=0)
+    norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(centroid) or 1.0)
+    norms[norms == 0] = 1.0
+    scores = (vectors @ centroid) / norms
+    # 首句通常交代场景，适当加权
+    scores[0] += 0.1
+
+    chosen: List[int] = []
+    length = 0
+    for index in np.argsort(-scores):
+        if len(chosen) >= SUMMARY_SENTENCES:
+            break
+        if length + len(sentences[index]) > SUMMARY_CHARS and chosen:
+            continue
+        chosen.append(int(index))
+        length += len(sentences[index])
+    return "".join(sentences[i] for i in sorted(chosen))[:SUMMARY_CHARS]
+
+
+class _NovelStore:
+    """单部小说的章节索引（摘要 + 片段向量）"""
+
+    def __init__(self):
+        # 章节ID -> {number, title, summary, tail, fingerprint}
+        self.chapters: Dict[int, Dict[str, Any]] = {}
+        self.chunk_chapter_ids = np.zeros(0, dtype=np.int64)
+        self.chunk_numbers = np.zeros(0, dtype=np.int32)
+        self.vectors = np.zeros((0, FEATURE_DIM), dtype=np.float16)
+        self.texts: List[str] = []
+
+    def remove(self, chapter_id: int) -> None:
+        """移除章节的摘要与片段"""
+        self.chapters.pop(chapter_id, None)
+        keep = self.chunk_chapter_ids != chapter_id
+        if keep.all():
+            return
+        self.chunk_chapter_ids = self.chunk_chapter_ids[keep]
+        self.chunk_numbers = self.chunk_numbers[keep]
+        self.vectors = self.vectors[keep]
+        self.texts = [text for text, flag in zip(self.texts, keep) if flag]
+
+    def add(self, chapter_id: int, number: int, title: str, content: str, fingerprint: str) -> None:
+        """写入（或替换）章节的摘要与片段向量"""
+        self.remove(chapter_id)
+        content = content or ""
+        self.chapters[chapter_id] = {
+            "number": number,
+            "title": title,
+            "summary": summarize(content),
+            "tail": content[-TAIL_CHARS:],
+            "fingerprint": fingerprint
+        }
+        chunks = _chunk(content)
+        if not chunks:
+            return
+        vectors = np.stack([_vectorize(chunk) for chunk in chunks]).astype(np.float16)
+        self.chunk_chapter_ids = np.concatenate([
+            self.chunk_chapter_ids, np.full(len(chunks), chapter_id, dtype=np.int64)
+        ])
+        self.chunk_numbers = np.concatenate([
+            self.chunk_numbers, np.full(len(chunks), number, dtype=np.int32)
+        ])
+        self.vectors = np.concatenate([self.vectors, vectors])
+        self.texts.extend(chunks)
+
+
+class ChapterContextIndex:
+    """
+    章节上下文检索索引
+
+    为每部小说维护章节摘要与片段向量（字符二元组哈希TF-IDF，仅依赖numpy，
+    持久化为 .npz + .json）。章节保存时增量更新；生成章节时按token预算依次
+    组装上一章结尾、近期章节摘要、与当前章节最相关的历史片段以及更早章节
+    的摘要，使提示词规模不随章节数量增长。
+
+    与原先的前文查询一致，草稿状态的章节不进入索引。每部小说使用独立的锁；
+    首次为已有大量章节的小说组装上下文时，只同步补建近期章节，其余章节
+    由后台线程补建。
+
+    内存中最多保留 max_novels 部小说的索引与锁，超出时淘汰最久未用且未被
+    使用的小说（淘汰前先写盘）。索引变更后延迟 save_delay 秒合并写盘，
+    连续保存多个章节只重写一次文件；进程异常退出丢失的变更会在下次组装
+    上下文时通过对账补建。
+    """
+
+    def __init__(
+        self,
+        storage_dir: str,
+        token_budget: int = 3000,
+        top_k: int = 6,
+        session_factory: Callable[[], Session] = SessionLocal,
+        max_novels: int = 200,
+        save_delay: float = 5.0
+    ):
+        self.storage_dir = storage_dir
+        self.token_budget = token_budget
+        self.top_k = top_k
+        self.max_novels = max_novels
+        self.save_delay = save_delay
+        self._session_factory = session_factory
+        # 保护以下所有字典与集合，只在短时间内持有
+        self._lock = threading.Lock()
+        # 按最近使用排序，_stores 中的小说在 _novel_locks 中一定存在
+        self._novel_locks: "OrderedDict[int, threading.RLock]" = OrderedDict()
+        self._stores: Dict[int, _NovelStore] = {}
+        # 正在使用（等待或持有锁、后台补建中）的小说及使用者数量，不会被淘汰
+        self._pins: Dict[int, int] = {}
+        self._building: Set[int] = set()
+        # 有未写盘变更的小说及其延迟写盘定时器
+        self._dirty: Set[int] = set()
+        self._timers: Dict[int, threading.Timer] = {}
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+
+    def _paths(self, novel_id: int) -> Tuple[str, str]:
+        """返回小说索引的向量文件与元数据文件路径"""
+        base = os.path.join(self.storage_dir, f"novel_{novel_id}")
+        return base + ".npz", base + ".json"
+
+    def _load(self, novel_id: int) -> _NovelStore:
+        """从磁盘加载小说索引，文件缺失或损坏时返回空索引"""
+        store = _NovelStore()
+        vectors_path, meta_path = self._paths(novel_id)
+        if not (os.path.exists(vectors_path) and os.path.exists(meta_path)):
+            return store
+        try:
+            with np.load(vectors_path) as data:
+                store.chunk_chapter_ids = data["chapter_ids"]
+                store.chunk_numbers = data["numbers"]
+                store.vectors = data["vectors"]
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            store.texts = meta["texts"]
+            store.chapters = {int(k): v for k, v in meta["chapters"].items()}
+        except Exception as e:
+            logger.warning(f"加载章节索引失败，将重新构建: novel_id={novel_id}, {e}")
+            return _NovelStore()
+        return store
+
+    def _write(self, novel_id: int, store: _NovelStore) -> None:
+        """将小说索引写入磁盘"""
+        try:
+            os.makedirs(self.storage_dir, exist_ok=True)
+            vectors_path, meta_path = self._paths(novel_id)
+            np.savez_compressed(
+                vectors_path,
+                chapter_ids=store.chunk_chapter_ids,
+                numbers=store.chunk_numbers,
+                vectors=store.vectors
+            )
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"texts": store.texts, "chapters": store.chapters},
+                    f, ensure_ascii=False
+                )
+        except Exception as e:
+            logger.warning(f"保存章节索引失败: novel_id={novel_id}, {e}")
+
+    def _save(self, novel_id: int, store: _NovelStore) -> None:
+        """
+        标记小说索引待写盘，调用方需持有该小说的锁
+
+        save_delay 内的多次变更合并为一次写盘；save_delay 不大于0时立即写盘。
+        """
+        if self.save_delay <= 0:
+            self._write(novel_id, store)
+            return
+        with self._lock:
+            self._dirty.add(novel_id)
+            if novel_id in self._timers:
+                return
+            timer = threading.Timer(self.save_delay, self._flush_later, args=(novel_id,))
+            timer.daemon = True
+            self._timers[novel_id] = timer
+        timer.start()
+
+    def _flush(self, novel_id: int) -> None:
+        """立即写入小说索引的未写盘变更，调用方需持有该小说的锁"""
+        with self._lock:
+            if novel_id not in self._dirty:
+                return
+            self._dirty.discard(novel_id)
+            timer = self._timers.pop(novel_id, None)
+            store = self._stores.get(novel_id)
+        if timer is not None:
+            timer.cancel()
+        if store is not None:
+            self._write(novel_id, store)
+
+    def _flush_later(self, novel_id: int) -> None:
+        """延迟写盘定时器回调"""
+        with self._lock:
+            self._timers.pop(novel_id, None)
+            if novel_id not in self._dirty:
+                return
+        with self._novel_lock(novel_id):
+            self._flush(novel_id)
+
+    def flush_all(self) -> None:
+        """立即写入所有小说索引的未写盘变更（服务关闭时调用）"""
+        with self._lock:
+            dirty = list(self._dirty)
+        for novel_id in dirty:
+            with self._novel_lock(novel_id):
+                self._flush(novel_id)
+
+    @contextmanager
+    def _pinned(self, novel_id: int) -> Iterator[threading.RLock]:
+        """获取小说索引的锁（不加锁），使用期间该小说不会被淘汰"""
+        with self._lock:
+            lock = self._novel_locks.get(novel_id)
+            if lock is None:
+                lock = self._novel_locks[novel_id] = threading.RLock()
+            self._novel_locks.move_to_end(novel_id)
+            self._pins[novel_id] = self._pins.get(novel_id, 0) + 1
+        try:
+            yield lock
+        finally:
+            self._unpin(novel_id)
+            self._evict()
+
+    @contextmanager
+    def _novel_lock(self, novel_id: int) -> Iterator[None]:
+        """持有小说索引的锁（不同小说的索引互不阻塞）"""
+        with self._pinned(novel_id) as lock:
+            with lock:
+                yield
+
+    def _unpin(self, novel_id: int) -> None:
+        """减少小说的使用者数量"""
+        with self._lock:
+            count = self._pins.get(novel_id, 0) - 1
+            if count > 0:
+                self._pins[novel_id] = count
+            else:
+                self._pins.pop(novel_id, None)
+
+    def _evict(self) -> None:
+        """超出数量上限时淘汰最久未用且未被使用的小说，淘汰前写入未写盘的变更"""
+        while True:
+            with self._lock:
+                if len(self._novel_locks) <= self.max_novels:
+                    return
+                novel_id = next((key for key in self._novel_locks if key not in self._pins), None)
+                if novel_id is None:
+                    return
+                lock = self._novel_locks[novel_id]
+                # 写盘期间固定，防止被其他线程重复淘汰
+                self._pins[novel_id] = 1
+
+            with lock:
+                self._flush(novel_id)
+
+            self._unpin(novel_id)
+            with self._lock:
+                if novel_id in self._pins or novel_id in self._dirty:
+                    # 写盘期间又被使用，留待下次淘汰
+                    return
+                self._novel_locks.pop(novel_id, None)
+                self._stores.pop(novel_id, None)
+
+    def _get_store(self, novel_id: int) -> _NovelStore:
+        """获取（必要时加载）小说索引，调用方需持有该小说的锁"""
+        with self._lock:
+            store = self._stores.get(novel_id)
+        if store is None:
+            store = self._load(novel_id)
+            with self._lock:
+                self._stores[novel_id] = store
+        return store
+
+    @staticmethod
+    def _fingerprint(updated_at: Any, version: Any, word_count: Any) -> str:
+        """章节版本指纹，用于判断索引是否过期"""
+        return f"{updated_at}|{version}|{word_count}"
+
+    # ------------------------------------------------------------------
+    # 更新
+    # ------------------------------------------------------------------
+
+    def index_chapter(self, chapter: Chapter) -> None:
+        """
+        章节保存后更新索引（草稿章节移出索引）
+
+        Args:
+            chapter: 已提交的章节
+        """
+        try:
+            with self._novel_lock(chapter.novel_id):
+                store = self._get_store(chapter.novel_id)
+                if chapter.status == ChapterStatus.DRAFT:
+                    if chapter.id not in store.chapters:
+                        return
+                    store.remove(chapter.id)
+                else:
+                    store.add(
+                        chapter.id,
+                        chapter.chapter_number,
+                        chapter.title,
+                        chapter.content,
+                        self._fingerprint(chapter.updated_at, chapter.version, chapter.word_count)
+                    )
+                self._save(chapter.novel_id, store)
+        except Exception as e:
+            logger.warning(f"更新章节索引失败: chapter_id={chapter.id}, {e}")
+
+    def remove_chapter(self, novel_id: int, chapter_id: int) -> None:
+        """章节删除后移出索引"""
+        with self._novel_lock(novel_id):
+            store = self._get_store(novel_id)
+            if chapter_id in store.chapters:
+                store.remove(chapter_id)
+                self._save(novel_id, store)
+
+    def remove_novel(self, novel_id: int) -> None:
+        """
+        小说删除后丢弃其索引并删除索引文件
+
+        Args:
+            novel_id: 小说ID
+        """
+        with self._novel_lock(novel_id):
+            with self._lock:
+                self._stores.pop(novel_id, None)
+                self._dirty.discard(novel_id)
+                timer = self._timers.pop(novel_id, None)
+            if timer is not None:
+                timer.cancel()
+            for path in self._paths(novel_id):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"删除章节索引文件失败: {path}, {e}")
+
+    def _diff(self, db: Session, novel_id: int, store: _NovelStore) -> Tuple[List[Any], List[int]]:
+        """
+        与数据库对比（只查询轻量列）
+
+        Returns:
+            (需要补建的章节行, 已删除或转为草稿的章节ID)
+        """
+        rows = db.query(
+            Chapter.id, Chapter.chapter_number, Chapter.updated_at, Chapter.version, Chapter.word_count
+        ).filter(
+            Chapter.novel_id == novel_id,
+            Chapter.status != ChapterStatus.DRAFT
+        ).all()
+
+        current_ids = {row.id for row in rows}
+        stale = [
+            row for row in rows
+            if store.chapters.get(row.id, {}).get("fingerprint")
+            != self._fingerprint(row.updated_at, row.version, row.word_count)
+        ]
+        removed = [chapter_id for chapter_id in store.chapters if chapter_id not in current_ids]
+        return stale, removed
+
+    def _index_rows(self, db: Session, store: _NovelStore, rows: List[Any]) -> None:
+        """读取章节内容并写入索引"""
+        if not rows:
+            return
+        fingerprints = {
+            row.id: self._fingerprint(row.updated_at, row.version, row.word_count) for row in rows
+        }
+        chapters = db.query(
+            Chapter.id, Chapter.chapter_number, Chapter.title, Chapter.content
+        ).filter(Chapter.id.in_(list(fingerprints))).all()
+        for row in chapters:
+            store.add(row.id, row.chapter_number, row.title, row.content, fingerprints[row.id])
+
+    def _reconcile(self, db: Session, novel_id: int, store: _NovelStore, chapter_number: int) -> None:
+        """
+        与数据库对账：移除已删除的章节，补建缺失或已变更的章节
+
+        需要补建的章节较多时（如首次为已有章节的小说组装上下文），只同步补建
+        目标章节之前的近期章节，其余章节交给后台线程。
+        """
+        stale, removed = self._diff(db, novel_id, store)
+        for chapter_id in removed:
+            store.remove(chapter_id)
+
+        deferred = len(stale) > INLINE_RECONCILE_LIMIT
+        if deferred:
+            stale = sorted(
+                (row for row in stale if row.chapter_number < chapter_number),
+                key=lambda row: row.chapter_number
+            )[-(RECENT_SUMMARIES + 1):]
+        self._index_rows(db, store, stale)
+
+        if stale or removed:
+            logger.info(f"章节索引已对账: novel_id={novel_id}, 更新{len(stale)}章, 移除{len(removed)}章")
+            self._save(novel_id, store)
+        if deferred:
+            self._schedule_build(novel_id)
+
+    def _schedule_build(self, novel_id: int) -> None:
+        """在后台线程中补建小说索引（同一小说同时只有一个补建线程）"""
+        with self._lock:
+            if novel_id in self._building:
+                return
+            self._building.add(novel_id)
+        threading.Thread(
+            target=self._build, args=(novel_id,), name=f"chapter-index-{novel_id}", daemon=True
+        ).start()
+
+    def _build(self, novel_id: int) -> None:
+        """后台补建小说索引，分批持有锁，组装上下文的请求不会被长时间阻塞"""
+        db = self._session_factory()
+        try:
+            with self._pinned(novel_id) as lock:
+                with lock:
+                    store = self._get_store(novel_id)
+                    stale, _ = self._diff(db, novel_id, store)
+
+                for start in range(0, len(stale), BUILD_BATCH_SIZE):
+                    with lock:
+                        if self._stores.get(novel_id) is not store:
+                            # 索引已被丢弃（如小说已删除）
+                            return
+                        self._index_rows(db, store, stale[start:start + BUILD_BATCH_SIZE])
+                    db.rollback()
+
+                with lock:
+                    if self._stores.get(novel_id) is store:
+                        self._save(novel_id, store)
+            logger.info(f"章节索引后台补建完成: novel_id={novel_id}, {len(stale)}章")
+        except Exception as e:
+            logger.warning(f"章节索引后台补建失败: novel_id={novel_id}, {e}")
+        finally:
+            db.close()
+            with self._lock:
+                self._building.discard(novel_id)
+
+    # ------------------------------------------------------------------
+    # 检索
+    # ------------------------------------------------------------------
+
+    def _retrieve(
+        self,
+        store: _NovelStore,
+        query: str,
+        before_number: int,
+        exclude_numbers: set,
+        limit: int
+    ) -> List[int]:
+        """检索与查询最相关的片段下标"""
+        if not query or not len(store.texts):
+            return []
+        mask = store.chunk_numbers < before_number
+        if exclude_numbers:
+            mask &= ~np.isin(store.chunk_numbers, list(exclude_numbers))
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+
+        vectors = store.vectors[candidates].astype(np.float32)
+        document_frequency = (vectors > 0).sum(axis=0)
+        idf = np.log((1 + len(candidates)) / (1 + document_frequency)) + 1.0
+
+        weighted = vectors * idf
+        query_vector = _vectorize(query) * idf
+        query_norm = np.linalg.norm(query_vector)
+        if query_norm == 0:
+            return []
+        norms = np.linalg.norm(weighted, axis=1)
+        norms[norms == 0] = 1.0
+        scores = (weighted @ query_vector) / (norms * query_norm)
+
+        count = min(limit, len(candidates))
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[scores[top] > 0]
+        return [int(candidates[i]) for i in top]
+
+    def build_context(
+        self,
+        db: Session,
+        novel_id: int,
+        chapter_number: int,
+        query: str = "",
+        token_budget: Optional[int] = None,
+        include_tail: bool = True
+    ) -> str:
+        """
+        组装生成第 chapter_number 章时的前文上下文
+
+        同步执行数据库查询与向量计算，异步接口中通过 asyncio.to_thread 调用。
+
+        Args:
+            db: 数据库会话
+            novel_id: 小说ID
+            chapter_number: 目标章节号
+            query: 检索查询（大纲、角色、用户建议等）
+            token_budget: token预算，默认使用配置值
+            include_tail: 是否包含上一章结尾（由调用方自行拼接时传False）
+
+        Returns:
+            上下文文本，不超过token预算
+        """
+        budget = token_budget or self.token_budget
+
+        with self._novel_lock(novel_id):
+            # 只查询轻量列对账，正常情况下章节已在保存时完成索引
+            store = self._get_store(novel_id)
+            self._reconcile(db, novel_id, store, chapter_number)
+
+            previous = sorted(
+                (info for info in store.chapters.values() if info["number"] < chapter_number),
+                key=lambda info: info["number"]
+            )
+            if not previous:
+                return ""
+
+            sections: List[str] = []
+            used = 0
+
+            def append(text: str) -> bool:
+                nonlocal used
+                cost = estimate_tokens(text)
+                if used + cost > budget:
+                    return False
+                sections.append(text)
+                used += cost
+                return True
+
+            # 1. 上一章结尾，保证情节衔接
+            last = previous[-1]
+            if include_tail and last["tail"]:
+                append(format_tail_section(last["number"], last["title"], last["tail"]))
+
+            # 2. 近期章节摘要
+            recent = previous[-RECENT_SUMMARIES:]
+            recent_lines = [
+                f"第{info['number']}章 {info['title']}：{info['summary']}"
+                for info in recent if info["summary"]
+            ]
+            if recent_lines:
+                append("【近期章节摘要】\n" + "\n".join(recent_lines))
+
+            # 3. 与本章相关的历史片段
+            recent_numbers = {info["number"] for info in recent}
+            passages = []
+            for index in self._retrieve(store, query, chapter_number, recent_numbers, self.top_k):
+                passages.append((int(store.chunk_numbers[index]), store.texts[index]))
+            passage_lines = []
+            for number, text in sorted(passages):
+                line = f"（第{number}章）{text}"
+                if used + estimate_tokens(line) + 10 > budget:
+                    continue
+                passage_lines.append(line)
+                used += estimate_tokens(line)
+            if passage_lines:
+                sections.append("【相关前文片段】\n" + "\n".join(passage_lines))
+                used += 10
+
+            # 4. 更早章节摘要，按由近及远的顺序填充剩余预算
+            earlier_lines = []
+            for info in reversed(previous[:-RECENT_SUMMARIES]):
+                if not info["summary"]:
+                    continue
+                line = f"第{info['number']}章 {info['title']}：{info['summary']}"
+                cost = estimate_tokens(line)
+                if used + cost + 10 > budget:
+                    break
+                earlier_lines.append(line)
+                used += cost
+            if earlier_lines:
+                sections.append("【更早章节摘要】\n" + "\n".join(reversed(earlier_lines)))
+
+        return "\n\n".join(sections)
+
+
+# 全局章节上下文索引实例
+chapter_context_index = ChapterContextIndex(
+    storage_dir=settings.CHAPTER_INDEX_DIR,
+    token_budget=settings.CHAPTER_CONTEXT_TOKEN_BUDGET,
+    top_k=settings.CHAPTER_CONTEXT_TOP_K,
+    max_novels=settings.CHAPTER_INDEX_MAX_NOVELS,
+    save_delay=settings.CHAPTER_INDEX_SAVE_DELAY_SECONDS
+)
+
+
+def get_chapter_context_index() -> ChapterContextIndex:
+    """获取章节上下文检索索引实例"""
+    return chapter_context_index
@@ -0,0 +1,109 @@
+"""
+角色标签索引查询
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, intersect, select
+from sqlalchemy.orm import Session
+
+from app.models.character import Character
+from app.models.character_tag import CharacterTag, Tag, index_character_tags, normalize_tags
+
+logger = logging.getLogger(__name__)
+
+# 回填标签索引时每批处理的角色数量
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _tag_members(name: str):
+    """单个标签下的角色ID（走 (tag_id, character_id) 索引）"""
+    tag_id = select(Tag.id).where(Tag.name == name).scalar_subquery()
+    return select(CharacterTag.character_id).where(CharacterTag.tag_id == tag_id)
+
+
+def tag_filter(tags: Sequence[str], match_all: bool = True):
+    """
+    构建按标签筛选角色的条件
+
+    多标签且（match_all）时对各标签的角色ID集合取 INTERSECT，或时按标签ID
+    IN 列表取并集，两者都只扫描标签索引，不再逐行匹配 JSON 列。
+
+    Args:
+        tags: 标签名列表
+        match_all: True 表示必须包含全部标签，False 表示包含任一标签
+
+    Returns:
+        可用于 filter() 的条件
+    """
+    names = normalize_tags(list(tags))
+    if not names:
+        return Character.id.in_([])
+    if not match_all or len(names) == 1:
+        members = select(CharacterTag.character_id).join(
+            Tag, Tag.id == CharacterTag.tag_id
+        ).where(Tag.name.in_(names))
+        return Character.id.in_(members)
+    return Character.id.in_(intersect(*(_tag_members(name) for name in names)))
+
+
+def template_tag_counts(
+    db: Session,
+    names: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None
+) -> List[Tuple[str, int]]:
+    """
+    统计各标签下的模板角色数量
+
+    Args:
+        db: 数据库会话
+        names: 只统计这些标签（为空时统计全部）
+        limit: 返回数量上限（按数量降序）
+
+    Returns:
+        [(标签名, 模板数量)]
+    """
+    count = func.count(CharacterTag.character_id)
+    query = db.query(Tag.name, count).join(
+        CharacterTag, CharacterTag.tag_id == Tag.id
+    ).join(
+        Character, Character.id == CharacterTag.character_id
+    ).filter(
+        Character.is_template == True
+    )
+    if names is not None:
+        query = query.filter(Tag.name.in_(list(names)))
+    query = query.group_by(Tag.name).order_by(count.desc(), Tag.name)
+    if limit:
+        query = query.limit(limit)
+    return [(name, total) for name, total in query.all()]
+
+
+def backfill_character_tags(db: Session, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    根据 Character.tags 重建全部角色的标签索引（迁移或修复时使用）
+
+    Args:
+        db: 数据库会话
+        batch_size: 每批处理的角色数量
+
+    Returns:
+        处理的角色数量
+    """
+    last_id = 0
+    total = 0
+    while True:
+        rows = db.query(Character.id, Character.tags).filter(
+            Character.id > last_id
+        ).order_by(Character.id).limit(batch_size).all()
+        if not rows:
+            break
+        index_character_tags(db.connection(), {row.id: row.tags for row in rows})
+        last_id = rows[-1].id
+        total += len(rows)
+    db.commit()
+    logger.info(f"角色标签索引回填完成: {total}个角色")
+    return total
@@ -0,0 +1,278 @@
+"""
+生成上下文加载器
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session, selectinload
+
+from app.core.spans import timed
+from app.models.character import Character
+from app.models.novel import Novel
+from app.models.outline import DetailedOutline, RoughOutline
+from app.models.worldview import Worldview
+
+logger = logging.getLogger(__name__)
+
+
+def format_worldviews(worldviews: Iterable[Worldview]) -> str:
+    """格式化世界观信息（各世界观之间空行分隔，便于按条目截断）"""
+    return "\n\n".join(
+        f"世界名称: {wv.name}\n世界描述: {wv.description or '无'}"
+        for wv in worldviews
+    )
+
+
+def format_rough_outlines(rough_outlines: Iterable[RoughOutline]) -> str:
+    """格式化粗略大纲信息（各大纲之间空行分隔，便于按条目截断）"""
+    return "\n\n".join(
+        f"大纲类型: {ro.outline_type}\n标题: {ro.title}\n内容: {ro.content}"
+        for ro in sorted(rough_outlines, key=lambda ro: (ro.order_index or 0, ro.id))
+    )
+
+
+def format_character(character: Character) -> str:
+    """格式化单个角色信息（空字段省略）"""
+    lines = [f"角色名: {character.name}（ID: {character.id}）"]
+    for label, value in (
+        ("类型", character.character_type),
+        ("性格", character.personality),
+        ("能力", character.abilities),
+        ("描述", character.description),
+    ):
+        if value:
+            lines.append(f"{label}: {value}")
+    return "\n".join(lines)
+
+
+def format_characters(characters: Iterable[Character]) -> str:
+    """格式化角色列表信息（各角色之间空行分隔，便于按条目截断）"""
+    return "\n\n".join(format_character(character) for character in characters)
+
+
+def format_detailed_outline(outline: DetailedOutline) -> str:
+    """格式化单章详细大纲信息"""
+    text = f"章节大纲: {outline.chapter_title}\n情节点: {outline.plot_points}"
+    if outline.chapter_summary:
+        text += f"\n章节简介: {outline.chapter_summary}"
+    return text
+
+
+class GenerationContext:
+    """一次生成所需的上下文（已格式化为提示词片段）"""
+
+    def __init__(
+        self,
+        novel_info: Dict[str, Any],
+        worldview_info: str = "",
+        rough_outline_info: str = "",
+        character_info: str = "",
+        outline_info: str = "",
+        previous_chapters: str = ""
+    ):
+        self.novel_info = novel_info
+        self.worldview_info = worldview_info
+        self.rough_outline_info = rough_outline_info
+        self.character_info = character_info
+        self.outline_info = outline_info
+        self.previous_chapters = previous_chapters
+
+    def to_prompt_vars(self) -> Dict[str, Any]:
+        """
+        转换为提示词模板变量（缺失的片段以“无”占位）
+
+        Returns:
+            模板变量字典
+        """
+        return {
+            "title": self.novel_info.get("title") or "未命名小说",
+            "genre": self.novel_info.get("genre") or "通用",
+            "description": self.novel_info.get("description") or "暂无描述",
+            "tags": ", ".join(self.novel_info.get("tags") or []),
+            "worldview_info": self.worldview_info or "无",
+            "rough_outline_info": self.rough_outline_info or "无",
+            "character_info": self.character_info or "无",
+            "outline_info": self.outline_info or "无",
+            "previous_chapters": self.previous_chapters or "无（本章为开篇）"
+        }
+
+
+class GenerationContextLoader:
+    """
+    生成上下文加载器
+
+    按需批量加载小说、世界观、粗略大纲、角色与详细大纲：小说与所需的关联
+    集合通过一次主查询加 selectinload 批量获取，指定角色用一次 IN 查询获取。
+    加载结果在加载器实例内缓存，同一请求内的多次使用不会重复查询。
+    """
+
+    def __init__(self, db: Session, user_id: int):
+        self.db = db
+        self.user_id = user_id
+        self._cache: Dict[Tuple, Any] = {}
+
+    def _cached(self, key: Tuple, loader: Callable[[], Any]) -> Any:
+        """读取缓存，未命中时加载并写入"""
+        if key not in self._cache:
+            self._cache[key] = loader()
+        return self._cache[key]
+
+    def get_novel(
+        self,
+        novel_id: int,
+        include_worldviews: bool = False,
+        include_rough_outlines: bool = False,
+        include_characters: bool = False
+    ) -> Optional[Novel]:
+        """
+        获取当前用户的小说，并批量预加载所需的关联集合
+
+        Args:
+            novel_id: 小说ID
+            include_worldviews: 是否预加载世界观
+            include_rough_outlines: 是否预加载粗略大纲
+            include_characters: 是否预加载角色
+
+        Returns:
+            小说，不存在或无权访问时返回None
+        """
+        options = []
+        if include_worldviews:
+            options.append(selectinload(Novel.worldviews))
+        if include_rough_outlines:
+            options.append(selectinload(Novel.rough_outlines))
+        if include_characters:
+            options.append(selectinload(Novel.characters))
+
+        key = ("novel", novel_id, include_worldviews, include_rough_outlines, include_characters)
+        return self._cached(key, lambda: self.db.query(Novel).options(*options).filter(
+            Novel.id == novel_id,
+            Novel.user_id == self.user_id
+        ).first())
+
+    def get_characters(self, novel_id: int, character_ids: List[int]) -> List[Character]:
+        """
+        按ID批量获取当前用户在指定小说中的角色（保持传入顺序）
+
+        Args:
+            novel_id: 小说ID
+            character_ids: 角色ID列表
+
+        Returns:
+            角色列表
+        """
+        ids = tuple(dict.fromkeys(character_ids))
+        if not ids:
+            return []
+
+        def load() -> List[Character]:
+            found = {
+                character.id: character for character in self.db.query(Character).filter(
+                    Character.id.in_(ids),
+                    Character.novel_id == novel_id,
+                    Character.user_id == self.user_id
+                )
+            }
+            return [found[character_id] for character_id in ids if character_id in found]
+
+        return self._cached(("characters", novel_id, ids), load)
+
+    def get_worldview(self, novel_id: int, worldview_id: int) -> Optional[Worldview]:
+        """获取当前用户在指定小说中的世界观"""
+        return self._cached(("worldview", novel_id, worldview_id), lambda: self.db.query(Worldview).filter(
+            Worldview.id == worldview_id,
+            Worldview.novel_id == novel_id,
+            Worldview.user_id == self.user_id
+        ).first())
+
+    def get_detailed_outline(self, novel_id: int, outline_id: int) -> Optional[DetailedOutline]:
+        """获取当前用户在指定小说中的详细大纲"""
+        return self._cached(("detailed_outline", novel_id, outline_id), lambda: self.db.query(DetailedOutline).filter(
+            DetailedOutline.id == outline_id,
+            DetailedOutline.novel_id == novel_id,
+            DetailedOutline.user_id == self.user_id
+        ).first())
+
+    @staticmethod
+    def novel_info(novel: Novel) -> Dict[str, Any]:
+        """提取小说基本信息"""
+        return {
+            "title": novel.title,
+            "genre": getattr(novel.genre, "value", novel.genre) or "通用",
+            "description": novel.description or "",
+            "tags": novel.tags or []
+        }
+
+    @timed("context_load")
+    def load(
+        self,
+        novel_id: int,
+        include_worldviews: bool = False,
+        worldview_id: Optional[int] = None,
+        include_rough_outlines: bool = False,
+        include_characters: bool = False,
+        character_ids: Optional[List[int]] = None,
+        outline_id: Optional[int] = None
+    ) -> Optional[GenerationContext]:
+        """
+        加载一次生成所需的上下文
+
+        Args:
+            novel_id: 小说ID
+            include_worldviews: 是否包含小说的全部世界观
+            worldview_id: 只包含指定世界观（优先于 include_worldviews）
+            include_rough_outlines: 是否包含粗略大纲
+            include_characters: 是否包含小说的全部角色
+            character_ids: 只包含指定角色（优先于 include_characters）
+            outline_id: 本章对应的详细大纲ID
+
+        Returns:
+            生成上下文，小说不存在或无权访问时返回None
+        """
+        novel = self.get_novel(
+            novel_id,
+            include_worldviews=include_worldviews and worldview_id is None,
+            include_rough_outlines=include_rough_outlines,
+            include_characters=include_characters and character_ids is None
+        )
+        if novel is None:
+            return None
+
+        worldview_info = ""
+        if worldview_id is not None:
+            worldview = self.get_worldview(novel_id, worldview_id)
+            worldview_info = format_worldviews([worldview]) if worldview else ""
+        elif include_worldviews:
+            worldview_info = format_worldviews(
+                wv for wv in novel.worldviews if wv.user_id == self.user_id
+            )
+
+        rough_outline_info = ""
+        if include_rough_outlines:
+            rough_outline_info = format_rough_outlines(
+                ro for ro in novel.rough_outlines if ro.user_id == self.user_id
+            )
+
+        character_info = ""
+        if character_ids is not None:
+            character_info = format_characters(self.get_characters(novel_id, character_ids))
+        elif include_characters:
+            character_info = format_characters(
+                char for char in novel.characters if char.user_id == self.user_id
+            )
+
+        outline_info = ""
+        if outline_id is not None:
+            outline = self.get_detailed_outline(novel_id, outline_id)
+            outline_info = format_detailed_outline(outline) if outline else ""
+
+        return GenerationContext(
+            novel_info=self.novel_info(novel),
+            worldview_info=worldview_info,
+            rough_outline_info=rough_outline_info,
+            character_info=character_info,
+            outline_info=outline_info
+        )
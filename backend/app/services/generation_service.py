@@ -4,16 +4,25 @@ Author: AI Writer Team
 Created: 2025-06-01
 """
 
+import asyncio
 import logging
+import re
 import time
 import json
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 
-from app.services.ai_service import get_ai_service, AIServiceError
+from app.core.config import settings
+from app.core.spans import timed
+from app.services.ai_service import get_ai_service, AIRateLimitError, AIServiceError
 from app.services.prompt_service import PromptService
 from app.services.worldview_converter import WorldviewConverter
-from app.schemas.ai_worldview import AIWorldviewResponse
+from app.services.generation_context import GenerationContext
+from app.schemas.ai_worldview import (
+    AIWorldviewResponse, AIWorldBase, AIGeography, AIPowerSystem,
+    AIHistory, AIFactionSection, AIArtifactSection
+)
 from app.models.prompt import PromptType
+from app.models.outline import OutlineType
 from app.schemas.prompt import (
     NovelNameRequest, NovelIdeaRequest, BrainStormRequest,
     GenerationResponse, StructuredGenerationResponse
@@ -30,10 +39,7 @@ from app.schemas.worldview import (
     WorldviewGenerationRequest,
     WorldviewGenerationResponse,
     GeneratedWorldBase,
-    GeneratedPowerSystem,
-    GeneratedLocation,
-    GeneratedEra,
-    GeneratedArtifact
+    GeneratedPowerSystem
 )
 
 logger = logging.getLogger(__name__)
@@ -46,78 +52,6 @@ class GenerationService:
         self.prompt_service = prompt_service
         self.ai_service = get_ai_service()
     
-    def _normalize_levels(self, levels):
-        """标准化等级数据：将字符串列表转换为字典列表"""
-        if not levels:
-            return []
-        
-        normalized = []
-        for level in levels:
-            if isinstance(level, str):
-                # 如果是字符串，转换为字典格式
-                normalized.append({
-                    "name": level,
-                    "description": f"{level}等级",
-                    "requirements": "待定"
-                })
-            elif isinstance(level, dict):
-                # 如果已经是字典，直接使用
-                normalized.append(level)
-            else:
-                # 其他类型，转换为字符串后处理
-                normalized.append({
-                    "name": str(level),
-                    "description": f"{str(level)}等级",
-                    "requirements": "待定"
-                })
-        return normalized
-    
-    def _normalize_cultivation_methods(self, methods):
-        """标准化修炼方法：将字典列表转换为字符串列表"""
-        if not methods:
-            return []
-        
-        normalized = []
-        for method in methods:
-            if isinstance(method, dict):
-                # 如果是字典，提取名称或描述
-                if "name" in method:
-                    normalized.append(method["name"])
-                elif "description" in method:
-                    normalized.append(method["description"])
-                else:
-                    # 如果没有name或description，使用字典的字符串表示
-                    normalized.append(str(method))
-            elif isinstance(method, str):
-                # 如果已经是字符串，直接使用
-                normalized.append(method)
-            else:
-                # 其他类型，转换为字符串
-                normalized.append(str(method))
-        return normalized
-    
-    def _extract_unique_feature_names(self, features):
-        """提取特色功能名称：将字典列表转换为字符串列表"""
-        if not features:
-            return []
-        
-        normalized = []
-        for feature in features:
-            if isinstance(feature, dict):
-                # 如果是字典，提取名称
-                if "name" in feature:
-                    normalized.append(feature["name"])
-                else:
-                    # 如果没有name，使用字典的字符串表示
-                    normalized.append(str(feature))
-            elif isinstance(feature, str):
-                # 如果已经是字符串，直接使用
-                normalized.append(feature)
-            else:
-                # 其他类型，转换为字符串
-                normalized.append(str(feature))
-        return normalized
-
     async def generate_worldview(
         self,
         request: WorldviewGenerationRequest,
@@ -168,6 +102,10 @@ class GenerationService:
                 "novel_settings": final_novel_settings
             }
             
+            # 分段模式：先生成世界基础，再并发生成其余部分
+            if request.decomposed:
+                return await self._generate_worldview_decomposed(request, context_data, user_id, db)
+            
             # 构建提示词
             prompt = await self.prompt_service.build_prompt(
                 prompt_type=PromptType.WORLD_VIEW,
@@ -198,40 +136,29 @@ class GenerationService:
                 temperature=temperature,
                 max_tokens=max_tokens,
                 user_id=user_id,
-                db=db
+                db=db,
+                response_model=AIWorldviewResponse
             )
             
             generation_time = time.time() - start_time
             
-            # 使用转换器处理AI响应
-            try:
-                converted_data = WorldviewConverter.convert_ai_response(
-                    result, user_id or 0, request.novel_id
-                )
-                
-                # 计算总生成项数
-                total_items = (
-                    1 +  # worldview
-                    len(converted_data["world_maps"]) +
-                    len(converted_data["special_locations"]) +
-                    1 +  # cultivation_system
-                    len(converted_data["histories"]) +
-                    len(converted_data["artifacts"]) +
-                    len(converted_data["factions"])
-                )
-                
-                return WorldviewGenerationResponse(
-                    success=True,
-                    message=f"成功生成世界观及{total_items}个相关内容",
-                    **converted_data,
-                    total_generated=total_items
-                )
-                
-            except ValueError as e:
-                logger.error(f"世界观数据转换失败: {str(e)}")
-                # 降级处理：使用原有逻辑
-                return self._fallback_worldview_processing(result)
+            # 使用转换器处理AI响应（无法转换的字段或条目会被跳过并记录）
+            converted_data = WorldviewConverter.convert_ai_response(
+                result, user_id or 0, request.novel_id
+            )
+            
+            # 计算总生成项数
+            total_items = self._count_worldview_items(converted_data)
             
+            return WorldviewGenerationResponse(
+                success=True,
+                message=f"成功生成世界观及{total_items}个相关内容",
+                **converted_data,
+                total_generated=total_items
+            )
+            
+        except AIRateLimitError:
+            raise
         except Exception as e:
             logger.error(f"世界观生成失败: {str(e)}")
             return WorldviewGenerationResponse(
@@ -259,6 +186,239 @@ class GenerationService:
                 total_generated=0
             )
 
+    @staticmethod
+    def _count_worldview_items(converted_data: Dict[str, Any]) -> int:
+        """计算世界观生成结果的总项数（世界基础与力量体系各计1项）"""
+        return (
+            1 +  # worldview
+            len(converted_data["world_maps"]) +
+            len(converted_data["special_locations"]) +
+            1 +  # cultivation_system
+            len(converted_data["histories"]) +
+            len(converted_data["artifacts"]) +
+            len(converted_data["factions"])
+        )
+
+    # 世界观分段生成的各部分：标题、生成要求、返回格式示例、校验模型与输出上限
+    WORLDVIEW_SECTIONS = {
+        "world_base": {
+            "title": "世界基础设定",
+            "requirements": "1. 给出世界名称与整体描述\n2. 说明历史背景和基础设定\n3. 列出3-5条核心规则与3-5个世界特色",
+            "format": '{"name": "世界名称", "description": "基本世界观描述", "background": "历史背景和基础设定", '
+                      '"rules": ["核心规则"], "characteristics": ["世界特色"]}',
+            "model": AIWorldBase,
+            "max_tokens": 2000
+        },
+        "geography": {
+            "title": "地理",
+            "requirements": "1. 生成3-6个主要地图区域，说明气候与显著特征\n2. 生成2-4个具有特殊意义的地点",
+            "format": '{"map_regions": [{"name": "区域名称", "description": "区域描述", "climate": "气候特征", '
+                      '"notable_features": ["显著特征"]}], "special_locations": [{"name": "地点名称", '
+                      '"description": "地点描述", "significance": "地点重要性"}]}',
+            "model": AIGeography,
+            "max_tokens": 3000
+        },
+        "power_system": {
+            "title": "力量体系",
+            "requirements": "1. 给出体系名称与整体描述\n2. 按从低到高列出5-9个等级\n3. 列出体系特色与2-4种修炼方法",
+            "format": '{"name": "体系名称", "description": "体系描述", "levels": [{"name": "等级名称", '
+                      '"description": "等级描述"}], "unique_features": ["体系特色"], '
+                      '"cultivation_methods": [{"name": "方法名称", "description": "方法描述"}]}',
+            "model": AIPowerSystem,
+            "max_tokens": 3000
+        },
+        "history": {
+            "title": "历史",
+            "requirements": "1. 按时间顺序生成3-5个历史时代\n2. 每个时代列出2-4个关键事件",
+            "format": '{"eras": [{"name": "时代名称", "description": "时代概述", "key_events": ["关键事件"]}]}',
+            "model": AIHistory,
+            "max_tokens": 3000
+        },
+        "factions": {
+            "title": "阵营势力",
+            "requirements": "1. 生成3-6个阵营势力\n2. 说明理念目标、能力、组织结构与重要成员",
+            "format": '{"factions": [{"name": "阵营名称", "description": "组织描述", "ideology": "理念目标", '
+                      '"powers_and_abilities": ["能力"], "structure": "组织结构", "notable_members": ["重要成员"]}]}',
+            "model": AIFactionSection,
+            "max_tokens": 3000
+        },
+        "artifacts": {
+            "title": "神器遗物",
+            "requirements": "1. 生成2-4件重要的神器或遗物\n2. 说明其能力与在世界中的重要性",
+            "format": '{"artifacts": [{"name": "神器名称", "description": "描述", "significance": "重要性", '
+                      '"powers": ["神器能力"]}]}',
+            "model": AIArtifactSection,
+            "max_tokens": 2000
+        }
+    }
+
+    # 请求中的生成类型与分段的对应关系
+    WORLDVIEW_GENERATION_TYPES = {
+        "maps": ("geography",),
+        "cultivation": ("power_system",),
+        "history": ("history", "artifacts"),
+        "factions": ("factions",)
+    }
+
+    @staticmethod
+    def _format_world_base(world_base: Dict[str, Any]) -> str:
+        """将世界基础设定格式化为后续分段的提示词上下文"""
+        lines = [
+            f"世界名称：{world_base.get('name') or '未命名'}",
+            f"世界描述：{world_base.get('description') or '无'}",
+            f"历史背景：{world_base.get('background') or '无'}"
+        ]
+        if world_base.get("rules"):
+            lines.append(f"核心规则：{'；'.join(world_base['rules'])}")
+        if world_base.get("characteristics"):
+            lines.append(f"世界特色：{'；'.join(world_base['characteristics'])}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _unwrap_section_result(section: str, result: Any) -> Any:
+        """兼容模型把结果包在部分名下，或直接返回列表的情况"""
+        if isinstance(result, dict) and len(result) == 1 and isinstance(result.get(section), (dict, list)):
+            result = result[section]
+        if isinstance(result, list) and section in ("factions", "artifacts"):
+            result = {section: result}
+        return result
+
+    async def _generate_worldview_section(
+        self,
+        section: str,
+        context_data: Dict[str, Any],
+        user_input: Optional[str] = None,
+        user_id: Optional[int] = None,
+        db = None
+    ) -> Dict[str, Any]:
+        """
+        生成世界观的单个部分，解析或校验失败时只重试该部分
+
+        Args:
+            section: 部分名（WORLDVIEW_SECTIONS 的键）
+            context_data: 模板变量（需包含 world_base）
+            user_input: 用户建议
+            user_id: 用户ID
+            db: 数据库会话
+
+        Returns:
+            校验后的部分数据
+
+        Raises:
+            AIServiceError: 重试后仍然失败
+        """
+        spec = self.WORLDVIEW_SECTIONS[section]
+        prompt_template = await self.prompt_service.get_prompt_template(PromptType.WORLD_VIEW_SECTION)
+        prompt = self.prompt_service.render_prompt(
+            prompt_template,
+            {
+                **context_data,
+                "section_title": spec["title"],
+                "section_requirements": spec["requirements"],
+                "section_format": spec["format"]
+            },
+            user_input or "无"
+        )
+        temperature, _ = self._resolve_sampling(prompt_template)
+
+        last_error: Optional[Exception] = None
+        for attempt in range(1, settings.WORLDVIEW_SECTION_MAX_RETRIES + 2):
+            started = time.time()
+            try:
+                result = await self.ai_service.generate_structured_response(
+                    prompt=prompt,
+                    response_format=spec["model"].model_json_schema(),
+                    temperature=temperature,
+                    max_tokens=spec["max_tokens"],
+                    user_id=user_id,
+                    db=db,
+                    response_model=spec["model"]
+                )
+                data = spec["model"].model_validate(self._unwrap_section_result(section, result)).model_dump()
+                logger.info(f"世界观[{section}]生成完成（第{attempt}次，耗时{time.time() - started:.1f}秒）")
+                return data
+            except AIRateLimitError:
+                raise
+            except Exception as e:
+                last_error = e
+                logger.warning(f"世界观[{section}]第{attempt}次生成失败: {str(e)}")
+        raise AIServiceError(f"{spec['title']}生成失败: {str(last_error)}")
+
+    async def _generate_worldview_decomposed(
+        self,
+        request: WorldviewGenerationRequest,
+        context_data: Dict[str, Any],
+        user_id: Optional[int] = None,
+        db = None
+    ) -> WorldviewGenerationResponse:
+        """
+        分段生成世界观
+
+        先生成世界基础设定，再以其为上下文并发生成地理、力量体系、历史、阵营
+        与神器（每部分使用更小的返回格式），最后经 WorldviewConverter 合并。
+        总耗时约为世界基础加最慢的一个部分；单个部分失败时只重试该部分，
+        重试后仍失败的部分以空内容返回。
+
+        Args:
+            request: 世界观生成请求（generation_types 为空时生成全部部分）
+            context_data: 模板变量
+            user_id: 用户ID
+            db: 数据库会话
+
+        Returns:
+            世界观生成响应
+        """
+        start_time = time.time()
+        sections: Dict[str, Any] = {
+            "world_base": await self._generate_worldview_section(
+                "world_base",
+                {**context_data, "world_base": "（尚未设定，本次即为世界基础设定）"},
+                request.user_suggestion,
+                user_id,
+                db
+            )
+        }
+
+        selected = [
+            section
+            for key, names in self.WORLDVIEW_GENERATION_TYPES.items()
+            if not request.generation_types or key in request.generation_types
+            for section in names
+        ]
+        section_context = {**context_data, "world_base": self._format_world_base(sections["world_base"])}
+        results = await asyncio.gather(
+            *(
+                self._generate_worldview_section(section, section_context, request.user_suggestion, user_id, db)
+                for section in selected
+            ),
+            return_exceptions=True
+        )
+
+        failed = []
+        for section, result in zip(selected, results):
+            if isinstance(result, BaseException):
+                logger.error(f"世界观[{section}]生成失败: {str(result)}")
+                failed.append(self.WORLDVIEW_SECTIONS[section]["title"])
+            else:
+                sections[section] = result
+
+        converted_data = WorldviewConverter.convert_ai_response(
+            WorldviewConverter.merge_sections(sections), user_id or 0, request.novel_id
+        )
+        total_items = self._count_worldview_items(converted_data)
+        message = f"成功生成世界观及{total_items}个相关内容"
+        if failed:
+            message += f"（{'、'.join(failed)}生成失败）"
+        logger.info(f"世界观分段生成完成，耗时{time.time() - start_time:.1f}秒，失败部分: {failed or '无'}")
+
+        return WorldviewGenerationResponse(
+            success=True,
+            message=message,
+            **converted_data,
+            total_generated=total_items
+        )
+
+    @timed("context_load")
     async def _get_novel_settings(self, novel_id: int, db) -> Dict[str, Any]:
         """获取小说的基本设定信息"""
         try:
@@ -294,127 +454,6 @@ class GenerationService:
             logger.error(f"获取小说设定失败: {str(e)}")
             return {}
 
-    def _fallback_worldview_processing(self, result: Dict[str, Any]) -> WorldviewGenerationResponse:
-        """降级处理：使用原有逻辑处理世界观生成结果"""
-        try:
-            # 处理生成结果
-            worldview_data = result.get("world_base", {})
-            maps_data = result.get("geography", {}).get("map_regions", [])
-            special_locations = result.get("geography", {}).get("special_locations", [])
-            power_system = result.get("power_system", {})
-            history_data = result.get("history", {}).get("eras", [])
-            artifacts = result.get("history", {}).get("significant_artifacts", [])
-            factions_data = result.get("factions", [])
-            
-            # 转换地图数据为简化格式
-            simple_maps = []
-            for region in maps_data:
-                simple_maps.append({
-                    "name": region.get("name", ""),
-                    "description": region.get("description", ""),
-                    "climate": region.get("climate", ""),
-                    "notable_features": region.get("notable_features", [])
-                })
-            
-            # 转换阵营数据为简化格式
-            simple_factions = []
-            for faction in factions_data:
-                simple_factions.append({
-                    "name": faction.get("name", ""),
-                    "description": faction.get("description", ""),
-                    "ideology": faction.get("ideology", ""),
-                    "alliance": faction.get("alliance", faction.get("allies", ""))
-                })
-            
-            # 计算总生成项数
-            total_items = (
-                (1 if worldview_data else 0) +
-                len(simple_maps) +
-                len(special_locations) +
-                (1 if power_system else 0) +
-                len(history_data) +
-                len(artifacts) +
-                len(simple_factions)
-            )
-            
-            # 组织返回数据
-            response_data = {
-                "worldview": GeneratedWorldBase(
-                    name=worldview_data.get("name", "未命名世界"),
-                    description=worldview_data.get("description", ""),
-                    background=worldview_data.get("background", ""),
-                    rules=worldview_data.get("rules", []),
-                    characteristics=worldview_data.get("characteristics", [])
-                ),
-                "world_maps": simple_maps,
-                "special_locations": [
-                    GeneratedLocation(
-                        name=loc.get("name", ""),
-                        description=loc.get("description", ""),
-                        significance=loc.get("significance", ""),
-                        mysteries=loc.get("mysteries", [])
-                    ) for loc in special_locations
-                ],
-                "cultivation_system": GeneratedPowerSystem(
-                    name=power_system.get("name", ""),
-                    description=power_system.get("description", ""),
-                    levels=self._normalize_levels(power_system.get("levels", [])),
-                    unique_features=self._extract_unique_feature_names(power_system.get("unique_features", [])),
-                    cultivation_methods=self._normalize_cultivation_methods(power_system.get("cultivation_methods", []))
-                ),
-                "histories": [
-                    GeneratedEra(
-                        name=era.get("name", ""),
-                        description=era.get("description", ""),
-                        major_events=era.get("key_events", [])
-                    ) for era in history_data
-                ],
-                "artifacts": [
-                    GeneratedArtifact(
-                        name=art.get("name", ""),
-                        description=art.get("description", ""),
-                        powers=art.get("powers", []),
-                        history=art.get("significance", "")
-                    ) for art in artifacts
-                ],
-                "factions": simple_factions
-            }
-
-            return WorldviewGenerationResponse(
-                success=True,
-                message=f"成功生成世界观及{total_items}个相关内容（使用降级处理）",
-                **response_data,
-                total_generated=total_items
-            )
-            
-        except Exception as e:
-            logger.error(f"降级处理也失败: {str(e)}")
-            # 返回默认的空结果
-            return WorldviewGenerationResponse(
-                success=False,
-                message=f"世界观生成失败: {str(e)}",
-                worldview=GeneratedWorldBase(
-                    name="",
-                    description="",
-                    background="",
-                    rules=[],
-                    characteristics=[]
-                ),
-                cultivation_system=GeneratedPowerSystem(
-                    name="",
-                    description="",
-                    levels=[],
-                    unique_features=[],
-                    cultivation_methods=[]
-                ),
-                world_maps=[],
-                special_locations=[],
-                histories=[],
-                artifacts=[],
-                factions=[],
-                total_generated=0
-            )
-
     async def generate_novel_name(
         self,
         request: NovelNameRequest,
@@ -478,10 +517,96 @@ class GenerationService:
                 generation_time=round(generation_time, 2)
             )
             
+        except AIRateLimitError:
+            raise
         except Exception as e:
             logger.error(f"小说名生成失败: {str(e)}")
             raise AIServiceError(f"小说名生成失败: {str(e)}")
 
+    # 地图区域可选特征与提示词中的要求描述
+    MAP_FEATURE_REQUIREMENTS = {
+        "climate": "包含气候特征描述",
+        "terrain": "包含地形地貌描述",
+        "resources": "包含自然资源描述",
+        "population": "包含人口分布描述",
+        "culture": "包含文化特色描述"
+    }
+    MAP_REGION_FIELDS = ("climate", "terrain", "resources", "population", "culture")
+
+    @staticmethod
+    def _format_parent_region(parent_region: Dict[str, Any]) -> str:
+        """格式化父区域上下文（包含从顶层到父区域的路径）"""
+        path = parent_region.get("path") or [parent_region.get("region_name")]
+        return f"""父区域信息：
+- 名称：{parent_region.get("region_name")}
+- 所在位置：{" > ".join(str(name) for name in path)}
+- 描述：{parent_region.get("description") or "暂无描述"}
+- 气候：{parent_region.get("climate") or "未知"}
+- 地形：{parent_region.get("terrain") or "未知"}
+- 层级：{parent_region.get("level")}
+
+请生成这个父区域的子区域，确保与父区域的设定保持一致。"""
+
+    async def generate_map_regions(
+        self,
+        worldview_info: Dict[str, Any],
+        parent_region: Optional[Dict[str, Any]] = None,
+        count: int = 3,
+        include_features: Optional[List[str]] = None,
+        suggestion: Optional[str] = None,
+        user_id: Optional[int] = None,
+        db = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        生成一组地图区域（指定父区域时生成其子区域）
+
+        Args:
+            worldview_info: 世界观信息（name、description）
+            parent_region: 父区域信息（region_name、description、climate、terrain、level、path）
+            count: 生成数量
+            include_features: 需要包含的特征（climate/terrain/resources/population/culture）
+            suggestion: 用户建议
+            user_id: 用户ID
+            db: 数据库会话
+            temperature: 温度（0-100），为空时使用模板默认值
+            max_tokens: 最大token数，为空时使用模板默认值
+
+        Returns:
+            地图区域列表（可选特征缺失时补为空字符串）
+        """
+        include_features = include_features or []
+        feature_requirements = "\n".join(
+            f"{index}. {requirement}"
+            for index, requirement in enumerate(
+                (text for key, text in self.MAP_FEATURE_REQUIREMENTS.items() if key in include_features),
+                start=4
+            )
+        )
+        context_data = {
+            "worldview_name": worldview_info.get("name") or "未命名世界观",
+            "worldview_description": worldview_info.get("description") or "暂无描述",
+            "parent_context": self._format_parent_region(parent_region) if parent_region else "",
+            "generation_count": count,
+            "feature_requirements": feature_requirements
+        }
+
+        regions = await self._generate_structured_items(
+            PromptType.WORLD_MAP,
+            context_data,
+            ("generated_maps", "maps", "regions"),
+            user_input=suggestion or "无",
+            user_id=user_id,
+            db=db,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        for region in regions:
+            for field in self.MAP_REGION_FIELDS:
+                region.setdefault(field, "")
+        return regions
+
     async def generate_world_maps(
         self,
         worldview_id: int,
@@ -493,135 +618,35 @@ class GenerationService:
         """生成世界地图区域"""
         try:
             start_time = time.time()
+            request_params = request_params or {}
             
             logger.info(f"开始生成地图区域: worldview_id={worldview_id}, parent_region={parent_region}")
             
-            # 检查AI服务是否可用
-            if not self.ai_service.is_available(user_id=user_id):
-                raise AIServiceError("AI服务当前不可用")
-            
             # 获取世界观信息
             worldview_info = await self._get_worldview_context(worldview_id, db)
             
-            # 构建父区域上下文
-            parent_context = ""
+            parent_info = None
             if parent_region:
-                parent_context = f"""
-父区域信息：
-- 名称：{parent_region.region_name}
-- 描述：{parent_region.description}
-- 气候：{parent_region.climate or '未知'}
-- 地形：{parent_region.terrain or '未知'}
-- 层级：{parent_region.level}
-
-请生成这个父区域的子区域，确保与父区域的设定保持一致。
-"""
-            
-            # 获取请求参数
-            count = request_params.get("count", 3)
-            include_features = request_params.get("include", [])
-            user_suggestion = request_params.get("suggestion", "")
-            
-            # 构建上下文数据
-            context_data = {
-                "worldview_name": worldview_info.get("name", "未命名世界观"),
-                "worldview_description": worldview_info.get("description", ""),
-                "parent_context": parent_context,
-                "generation_count": count,
-                "include_climate": "climate" in include_features,
-                "include_terrain": "terrain" in include_features,
-                "include_resources": "resources" in include_features,
-                "include_population": "population" in include_features,
-                "include_culture": "culture" in include_features,
-                "user_suggestion": user_suggestion
-            }
-            
-            # 构建专门的地图生成提示词
-            map_prompt = f"""
-作为一个世界观设计师，请为"{worldview_info.get('name', '未命名世界观')}"生成{count}个地图区域。
-
-世界观背景：
-{worldview_info.get('description', '暂无描述')}
-
-{parent_context}
-
-生成要求：
-1. 生成{count}个不同的地图区域
-2. 每个区域都要有独特的特色和设定
-3. 区域之间要有逻辑联系和层次关系
-{'4. 包含气候特征描述' if 'climate' in include_features else ''}
-{'5. 包含地形地貌描述' if 'terrain' in include_features else ''}
-{'6. 包含自然资源描述' if 'resources' in include_features else ''}
-{'7. 包含人口分布描述' if 'population' in include_features else ''}
-{'8. 包含文化特色描述' if 'culture' in include_features else ''}
-
-用户建议：{user_suggestion}
-
-请按照以下JSON格式返回：
-{{
-    "generated_maps": [
-        {{
-            "name": "区域名称",
-            "description": "详细的区域描述，包含历史背景和特色",
-            "climate": "气候特征（如果需要）",
-            "terrain": "地形地貌（如果需要）",
-            "resources": "主要自然资源（如果需要）",
-            "population": "人口分布情况（如果需要）",
-            "culture": "文化特色（如果需要）"
-        }}
-    ]
-}}
-"""
-            
-            # 调用AI生成
-            result = await self.ai_service.generate_structured_response(
-                prompt=map_prompt,
-                response_format={
-                    "type": "object",
-                    "properties": {
-                        "generated_maps": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "name": {"type": "string"},
-                                    "description": {"type": "string"},
-                                    "climate": {"type": "string"},
-                                    "terrain": {"type": "string"},
-                                    "resources": {"type": "string"},
-                                    "population": {"type": "string"},
-                                    "culture": {"type": "string"}
-                                },
-                                "required": ["name", "description"]
-                            }
-                        }
-                    }
+                parent_info = {
+                    "region_name": parent_region.region_name,
+                    "description": parent_region.description,
+                    "climate": parent_region.climate,
+                    "terrain": parent_region.terrain,
+                    "level": parent_region.level
                 }
-                ,
-                temperature=0.7,
-                max_tokens=4000,
+            
+            generated_maps = await self.generate_map_regions(
+                worldview_info,
+                parent_region=parent_info,
+                count=request_params.get("count", 3),
+                include_features=request_params.get("include", []),
+                suggestion=request_params.get("suggestion", ""),
                 user_id=user_id,
                 db=db
             )
             
             generation_time = time.time() - start_time
             
-            # 处理生成结果
-            generated_maps = result.get("generated_maps", [])
-            
-            # 确保每个地图区域都有基本字段
-            for map_data in generated_maps:
-                if "climate" not in map_data:
-                    map_data["climate"] = ""
-                if "terrain" not in map_data:
-                    map_data["terrain"] = ""
-                if "resources" not in map_data:
-                    map_data["resources"] = ""
-                if "population" not in map_data:
-                    map_data["population"] = ""
-                if "culture" not in map_data:
-                    map_data["culture"] = ""
-            
             return {
                 "generated_maps": generated_maps,
                 "generation_time": round(generation_time, 2),
@@ -630,10 +655,13 @@ class GenerationService:
                 "worldview_id": worldview_id
             }
             
+        except AIRateLimitError:
+            raise
         except Exception as e:
             logger.error(f"地图生成失败: {str(e)}")
             raise AIServiceError(f"地图生成失败: {str(e)}")
     
+    @timed("context_load")
     async def _get_worldview_context(self, worldview_id: int, db) -> Dict[str, Any]:
         """获取世界观上下文信息"""
         try:
@@ -803,10 +831,339 @@ class GenerationService:
                 "worldview_id": worldview_id
             }
             
+        except AIRateLimitError:
+            raise
         except Exception as e:
             logger.error(f"修炼体系生成失败: {str(e)}")
             raise AIServiceError(f"修炼体系生成失败: {str(e)}")
 
+    # ------------------------------------------------------------------
+    # 大纲、角色与章节生成（上下文由 GenerationContextLoader 统一加载）
+    # ------------------------------------------------------------------
+
+    def _resolve_sampling(
+        self,
+        prompt_template,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> Tuple[float, int]:
+        """根据请求参数与模板默认值确定温度（0-100换算为0-1）和最大token数"""
+        if temperature is None:
+            temperature = prompt_template.default_temperature if prompt_template.default_temperature is not None else 70
+        max_tokens = max_tokens or prompt_template.default_max_tokens or 30000
+        return temperature / 100.0, max_tokens
+
+    async def _generate_structured_items(
+        self,
+        prompt_type: PromptType,
+        context_data: Dict[str, Any],
+        list_keys: Tuple[str, ...],
+        user_input: Optional[str] = None,
+        user_id: Optional[int] = None,
+        db = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        渲染提示词并生成结构化列表结果
+
+        Args:
+            prompt_type: 提示词类型
+            context_data: 模板变量
+            list_keys: 结果中列表字段的候选键名
+            user_input: 用户输入
+            user_id: 用户ID
+            db: 数据库会话
+            temperature: 温度（0-100），为空时使用模板默认值
+            max_tokens: 最大token数，为空时使用模板默认值
+
+        Returns:
+            生成的条目列表
+        """
+        if not self.ai_service.is_available(user_id=user_id):
+            raise AIServiceError("AI服务当前不可用")
+
+        prompt_template = await self.prompt_service.get_prompt_template(prompt_type)
+        prompt = self.prompt_service.render_prompt(prompt_template, context_data, user_input)
+
+        response_format = {}
+        if prompt_template.response_format:
+            try:
+                response_format = json.loads(prompt_template.response_format)
+            except json.JSONDecodeError:
+                logger.warning(f"{prompt_type}提示词响应格式解析失败，使用默认格式")
+
+        temperature, max_tokens = self._resolve_sampling(prompt_template, temperature, max_tokens)
+        result = await self.ai_service.generate_structured_response(
+            prompt=prompt,
+            response_format=response_format,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            user_id=user_id,
+            db=db
+        )
+        return self._extract_items(result, list_keys)
+
+    @staticmethod
+    def _extract_items(result: Any, list_keys: Tuple[str, ...]) -> List[Dict[str, Any]]:
+        """从结构化结果中取出条目列表（兼容直接返回列表或其他键名）"""
+        items: Any = []
+        if isinstance(result, list):
+            items = result
+        elif isinstance(result, dict):
+            for key in list_keys:
+                if isinstance(result.get(key), list):
+                    items = result[key]
+                    break
+            else:
+                items = next((value for value in result.values() if isinstance(value, list)), [])
+        return [item for item in items if isinstance(item, dict)]
+
+    async def generate_rough_outline(
+        self,
+        request: RoughOutlineGenerationRequest,
+        context: GenerationContext,
+        user_id: Optional[int] = None,
+        db = None
+    ) -> OutlineGenerationResponse:
+        """
+        生成粗略大纲
+
+        Args:
+            request: 粗略大纲生成请求
+            context: 生成上下文
+            user_id: 用户ID
+            db: 数据库会话
+
+        Returns:
+            大纲生成响应，generation_data 为大纲条目列表
+        """
+        try:
+            outline_types = [
+                getattr(outline_type, "value", outline_type) for outline_type in request.outline_types
+            ] or [outline_type.value for outline_type in OutlineType]
+            context_data = {
+                **context.to_prompt_vars(),
+                "outline_types": ", ".join(outline_types),
+                "target_chapters": request.target_chapters or "未指定"
+            }
+
+            items = await self._generate_structured_items(
+                PromptType.ROUGH_OUTLINE,
+                context_data,
+                ("outlines", "rough_outlines"),
+                user_input=request.user_suggestion,
+                user_id=user_id,
+                db=db
+            )
+
+            outlines = []
+            for item in items:
+                outline_type = str(item.get("outline_type") or "storyline")
+                if outline_type not in outline_types and outline_type.rstrip("s") in outline_types:
+                    outline_type = outline_type.rstrip("s")
+                outlines.append({**item, "outline_type": outline_type})
+
+            return OutlineGenerationResponse(
+                success=True,
+                message=f"成功生成{len(outlines)}个粗略大纲",
+                total_generated=len(outlines),
+                generation_data=outlines
+            )
+
+        except AIRateLimitError:
+            raise
+        except Exception as e:
+            logger.error(f"粗略大纲生成失败: {str(e)}")
+            return OutlineGenerationResponse(success=False, message=f"粗略大纲生成失败: {str(e)}")
+
+    async def generate_detailed_outline(
+        self,
+        request: DetailedOutlineGenerationRequest,
+        context: GenerationContext,
+        user_id: Optional[int] = None,
+        db = None
+    ) -> OutlineGenerationResponse:
+        """
+        生成详细大纲
+
+        Args:
+            request: 详细大纲生成请求
+            context: 生成上下文
+            user_id: 用户ID
+            db: 数据库会话
+
+        Returns:
+            大纲生成响应，generation_data 为按章节号排序的章节大纲列表
+        """
+        try:
+            context_data = {
+                **context.to_prompt_vars(),
+                "start_chapter": request.start_chapter,
+                "end_chapter": request.end_chapter
+            }
+
+            items = await self._generate_structured_items(
+                PromptType.DETAIL_OUTLINE,
+                context_data,
+                ("chapters", "detailed_outlines", "outlines"),
+                user_input=request.user_suggestion,
+                user_id=user_id,
+                db=db
+            )
+
+            chapters: Dict[int, Dict[str, Any]] = {}
+            for index, item in enumerate(items):
+                try:
+                    chapter_number = int(item.get("chapter_number"))
+                except (TypeError, ValueError):
+                    chapter_number = request.start_chapter + index
+                if not request.start_chapter <= chapter_number <= request.end_chapter:
+                    continue
+                chapters.setdefault(chapter_number, {**item, "chapter_number": chapter_number})
+
+            outlines = [chapters[number] for number in sorted(chapters)]
+            return OutlineGenerationResponse(
+                success=True,
+                message=f"成功生成{len(outlines)}个详细大纲",
+                total_generated=len(outlines),
+                generation_data=outlines
+            )
+
+        except AIRateLimitError:
+            raise
+        except Exception as e:
+            logger.error(f"详细大纲生成失败: {str(e)}")
+            return OutlineGenerationResponse(success=False, message=f"详细大纲生成失败: {str(e)}")
+
+    async def generate_characters(
+        self,
+        request: CharacterGenerationRequest,
+        context: GenerationContext,
+        user_id: Optional[int] = None,
+        db = None
+    ) -> CharacterGenerationResponse:
+        """
+        生成角色
+
+        Args:
+            request: 角色生成请求
+            context: 生成上下文
+            user_id: 用户ID
+            db: 数据库会话
+
+        Returns:
+            角色生成响应，generation_data 为角色数据列表
+        """
+        try:
+            character_types = [
+                getattr(character_type, "value", character_type) for character_type in request.character_types
+            ]
+            context_data = {
+                **context.to_prompt_vars(),
+                "character_count": request.character_count,
+                "character_types": ", ".join(character_types) or "不限"
+            }
+
+            items = await self._generate_structured_items(
+                PromptType.CHARACTER,
+                context_data,
+                ("characters",),
+                user_input=request.user_suggestion,
+                user_id=user_id,
+                db=db
+            )
+            characters = [item for item in items if item.get("name")][:request.character_count]
+
+            return CharacterGenerationResponse(
+                success=True,
+                message=f"成功生成{len(characters)}个角色",
+                total_generated=len(characters),
+                generation_data=characters
+            )
+
+        except AIRateLimitError:
+            raise
+        except Exception as e:
+            logger.error(f"角色生成失败: {str(e)}")
+            return CharacterGenerationResponse(success=False, message=f"角色生成失败: {str(e)}")
+
+    @staticmethod
+    def _split_chapter_title(text: str) -> Tuple[Optional[str], str]:
+        """拆分生成结果首行的“标题：xxx”与正文"""
+        content = (text or "").strip()
+        first_line, _, rest = content.partition("\n")
+        match = re.match(r"^[#\s]*(?:标题|章节标题)\s*[:：]\s*(.+)$", first_line.strip())
+        if match:
+            return match.group(1).strip(), rest.strip()
+        return None, content
+
+    async def generate_chapter(
+        self,
+        request: ChapterGenerationRequest,
+        context: GenerationContext,
+        user_id: Optional[int] = None,
+        db = None
+    ) -> ChapterGenerationResponse:
+        """
+        生成章节正文
+
+        Args:
+            request: 章节生成请求
+            context: 生成上下文（含前文回顾）
+            user_id: 用户ID
+            db: 数据库会话
+
+        Returns:
+            章节生成响应，generation_data 包含解析出的标题
+        """
+        try:
+            if not self.ai_service.is_available(user_id=user_id):
+                raise AIServiceError("AI服务当前不可用")
+
+            params = request.generation_params or {}
+            style = "，".join(
+                str(params[key]) for key in ("style", "tone", "perspective") if params.get(key)
+            ) or "贴合小说类型"
+            context_data = {
+                **context.to_prompt_vars(),
+                "chapter_number": request.chapter_number,
+                "target_word_count": request.target_word_count or 3000,
+                "style": style
+            }
+
+            prompt_template = await self.prompt_service.get_prompt_template(PromptType.CHAPTER)
+            prompt = self.prompt_service.render_prompt(prompt_template, context_data, request.user_suggestion)
+            temperature, max_tokens = self._resolve_sampling(
+                prompt_template, params.get("temperature"), params.get("max_tokens")
+            )
+
+            text = await self.ai_service.generate_text(
+                prompt=prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                user_id=user_id,
+                db=db
+            )
+            title, content = self._split_chapter_title(text)
+            if not content:
+                raise AIServiceError("生成内容为空")
+
+            return ChapterGenerationResponse(
+                success=True,
+                message=f"第{request.chapter_number}章生成成功",
+                generated_content=content,
+                word_count=len(re.sub(r"\s", "", content)),
+                generation_data={"title": title} if title else {},
+                used_prompt_template=prompt_template.name
+            )
+
+        except AIRateLimitError:
+            raise
+        except Exception as e:
+            logger.error(f"章节生成失败: {str(e)}")
+            return ChapterGenerationResponse(success=False, message=f"章节生成失败: {str(e)}")
+
     async def validate_generation_request(self, request: Dict[str, Any]) -> bool:
         """验证生成请求"""
         try:
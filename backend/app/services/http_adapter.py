@@ -7,12 +7,16 @@ Created: 2025-06-01
 import logging
 import json
 import asyncio
-from typing import Dict, Any, Optional, List, Union
+import time
+from typing import Dict, Any, Optional, List, Type, Union
 import aiohttp
 from aiohttp import ClientTimeout, ClientError
+from pydantic import BaseModel
 
+from app.core.spans import record_stage, span
 from app.models.ai_model_config import AIModelConfig, ModelType, RequestFormat
 from app.services.ai_service import AIModelAdapter, AIServiceError
+from app.services.structured_recovery import recover_structured_response
 
 logger = logging.getLogger(__name__)
 
@@ -274,19 +278,22 @@ class HTTPAdapter(AIModelAdapter):
                         proxy_config['password']
                     )
             
+            requested = time.perf_counter()
             async with session.post(
                 self.config.api_endpoint,
                 **request_kwargs
             ) as response:
-                
+                record_stage("ai_ttfb", time.perf_counter() - requested)
+                # 任务被取消（如客户端断开）时 CancelledError 穿过 async with，由 aiohttp 关闭未读完的上游连接
                 # 检查响应状态
                 if response.status != 200:
                     error_text = await response.text()
                     logger.error(f"API请求失败: {response.status} - {error_text}")
                     raise AIServiceError(f"API请求失败: {response.status} - {error_text}")
                 
-                # 解析响应
-                response_data = await response.json()
+                # 解析响应（读取响应体的时间即模型输出 token 的传输时间）
+                with span("ai_body"):
+                    response_data = await response.json()
                 logger.debug(f"API响应: {json.dumps(response_data, ensure_ascii=False, indent=2)}")
                 
                 # 提取内容
@@ -313,6 +320,7 @@ class HTTPAdapter(AIModelAdapter):
         response_format: Dict[str, Any],
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
+        response_model: Optional[Type[BaseModel]] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """生成结构化响应"""
@@ -348,6 +356,12 @@ class HTTPAdapter(AIModelAdapter):
         try:
             return json.loads(json_str)
         except json.JSONDecodeError:
+            recovered = await recover_structured_response(
+                self, full_prompt, json_str, response_model,
+                max_tokens=max_tokens, temperature=temperature, **kwargs
+            )
+            if recovered is not None:
+                return recovered
             logger.warning(f"无法解析为JSON格式，返回原始文本: {response_text}")
             return {"content": response_text, "raw_response": response_text}
     
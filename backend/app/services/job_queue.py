@@ -0,0 +1,504 @@
+"""
+后台生成任务队列
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Type
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.metrics import get_metrics_registry
+from app.core.spans import collect_stage_timings, format_server_timing
+from app.models.generation_job import FINISHED_STATUSES, GenerationJob, GenerationJobStatus
+
+logger = logging.getLogger(__name__)
+
+# 任务处理函数：(生成请求, 数据库会话, 用户ID) -> 与同步接口一致的响应
+JobHandler = Callable[[Any, Session, int], Awaitable[Any]]
+
+# 认领任务时与其他 worker 竞争失败后的重试次数
+CLAIM_ATTEMPTS = 3
+
+# 任务执行耗时直方图分桶（秒）
+JOB_DURATION_BUCKETS = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+# 处理函数执行期间的 (任务ID, worker 标识)，不在任务中执行时为 None
+_current_job: ContextVar[Optional[Tuple[int, str]]] = ContextVar("current_generation_job", default=None)
+
+
+def current_job() -> Optional[Tuple[int, str]]:
+    """
+    获取当前正在执行的任务
+
+    任务处理函数可据此读取自己的任务记录，并以 worker 标识为条件写入进度
+    （任务被取消或重新排队后写入不生效）。
+
+    Returns:
+        (任务ID, worker 标识)，不在任务处理函数中调用时返回 None
+    """
+    return _current_job.get()
+
+
+class JobType:
+    """已注册的任务类型"""
+
+    def __init__(self, name: str, request_model: Type[BaseModel], handler: JobHandler):
+        """
+        Args:
+            name: 任务类型名
+            request_model: 生成请求模型（任务参数按该模型持久化与还原）
+            handler: 任务处理函数
+        """
+        self.name = name
+        self.request_model = request_model
+        self.handler = handler
+
+
+class JobQueue:
+    """
+    后台生成任务队列
+
+    任务持久化在数据库的 generation_jobs 表中：接口只写入一行排队记录并立即
+    返回任务ID，worker 通过条件更新（status 仍为 pending 时才改为 running）
+    认领任务，多个进程（含 scripts/worker.py）可以共用同一张表而不会重复执行。
+    执行期间 worker 定期刷新心跳，心跳超时的任务视为 worker 已退出并重新排队；
+    结果与错误写回任务记录，供查询接口与事件流读取。
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self._session_factory = session_factory
+        self._job_types: Dict[str, JobType] = {}
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[int, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._listeners: Dict[int, Set[asyncio.Event]] = {}
+        self._last_requeue = 0.0
+        self._name = f"{socket.gethostname()}:{os.getpid()}"
+
+        registry = get_metrics_registry()
+        self._jobs_total = registry.counter(
+            "generation_jobs_total", "后台生成任务结束次数", ("job_type", "outcome")
+        )
+        self._job_seconds = registry.histogram(
+            "generation_job_seconds", "后台生成任务执行耗时（秒）", ("job_type",), JOB_DURATION_BUCKETS
+        )
+
+    # ------------------------------------------------------------------
+    # 任务类型与提交
+    # ------------------------------------------------------------------
+
+    def register(self, name: str, request_model: Type[BaseModel], handler: JobHandler) -> None:
+        """
+        注册任务类型
+
+        Args:
+            name: 任务类型名
+            request_model: 生成请求模型
+            handler: 任务处理函数，抛出 HTTPException 时按其状态码与详情记录失败
+        """
+        self._job_types[name] = JobType(name, request_model, handler)
+
+    def enqueue(self, db: Session, user_id: int, job_type: str, request: BaseModel) -> GenerationJob:
+        """
+        提交任务
+
+        Args:
+            db: 数据库会话
+            user_id: 用户ID
+            job_type: 任务类型名
+            request: 生成请求
+
+        Returns:
+            新建的任务
+
+        Raises:
+            ValueError: 任务类型未注册
+        """
+        if job_type not in self._job_types:
+            raise ValueError(f"未注册的任务类型: {job_type}")
+
+        job = GenerationJob(
+            job_type=job_type,
+            status=GenerationJobStatus.PENDING,
+            payload=request.model_dump(mode="json"),
+            progress="排队中",
+            user_id=user_id
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    def cancel(self, db: Session, job: GenerationJob) -> None:
+        """
+        取消任务
+
+        排队中的任务直接取消；执行中的任务在本进程时立即中断，在其他进程时
+        由执行它的 worker 在下一次心跳时发现并中断。
+
+        Args:
+            db: 数据库会话
+            job: 任务
+        """
+        db.execute(
+            update(GenerationJob).where(
+                GenerationJob.id == job.id,
+                GenerationJob.status.notin_(FINISHED_STATUSES)
+            ).values(
+                status=GenerationJobStatus.CANCELLED,
+                progress="已取消",
+                finished_at=datetime.utcnow()
+            )
+        )
+        db.commit()
+        task = self._running.get(job.id)
+        if task is not None and not task.done():
+            task.cancel()
+        self._notify(job.id)
+
+    def retry(self, db: Session, job: GenerationJob) -> bool:
+        """
+        将失败的任务重新排队
+
+        任务记录中的 result 保留，支持断点续做的处理函数可从中读取已完成的进度。
+
+        Args:
+            db: 数据库会话
+            job: 任务
+
+        Returns:
+            任务为失败状态并已重新排队时返回 True
+        """
+        retried = db.execute(
+            update(GenerationJob).where(
+                GenerationJob.id == job.id,
+                GenerationJob.status == GenerationJobStatus.FAILED
+            ).values(
+                status=GenerationJobStatus.PENDING,
+                worker_id=None,
+                attempts=0,
+                progress="重新排队",
+                error_code=None,
+                error_message=None,
+                finished_at=None
+            )
+        ).rowcount
+        db.commit()
+        if retried:
+            if self._wakeup is not None:
+                self._wakeup.set()
+            self._notify(job.id)
+        return bool(retried)
+
+    # ------------------------------------------------------------------
+    # 进度通知
+    # ------------------------------------------------------------------
+
+    def _notify(self, job_id: int) -> None:
+        """唤醒本进程中等待该任务变化的事件流"""
+        for event in self._listeners.get(job_id, ()):
+            event.set()
+
+    async def wait_for_update(self, job_id: int, timeout: float) -> None:
+        """
+        等待任务状态变化
+
+        本进程内的变化立即唤醒；其他进程中的变化由调用方在超时后重新查询。
+
+        Args:
+            job_id: 任务ID
+            timeout: 最长等待时间（秒）
+        """
+        event = asyncio.Event()
+        listeners = self._listeners.setdefault(job_id, set())
+        listeners.add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            listeners.discard(event)
+            if not listeners:
+                self._listeners.pop(job_id, None)
+
+    # ------------------------------------------------------------------
+    # 认领与心跳
+    # ------------------------------------------------------------------
+
+    def _requeue_stale(self, db: Session) -> None:
+        """将心跳超时的任务重新排队（超过最大执行次数的标记为失败）"""
+        interval = settings.JOB_LEASE_SECONDS / 4
+        if time.monotonic() - self._last_requeue < interval:
+            return
+        self._last_requeue = time.monotonic()
+
+        now = datetime.utcnow()
+        stale = (
+            GenerationJob.status == GenerationJobStatus.RUNNING,
+            GenerationJob.heartbeat_at < now - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        )
+        requeued = db.execute(
+            update(GenerationJob).where(
+                *stale, GenerationJob.attempts < settings.JOB_MAX_ATTEMPTS
+            ).values(
+                status=GenerationJobStatus.PENDING,
+                worker_id=None,
+                progress="执行中断，重新排队"
+            )
+        ).rowcount
+        failed = db.execute(
+            update(GenerationJob).where(*stale).values(
+                status=GenerationJobStatus.FAILED,
+                progress="执行失败",
+                error_code=500,
+                error_message="任务执行中断次数过多",
+                finished_at=now
+            )
+        ).rowcount
+        db.commit()
+        if requeued or failed:
+            logger.warning(f"心跳超时的任务: {requeued}个重新排队，{failed}个标记为失败")
+
+    def _claim(self, db: Session, worker_id: str) -> Optional[int]:
+        """
+        认领最早排队的任务
+
+        Args:
+            db: 数据库会话
+            worker_id: worker 标识
+
+        Returns:
+            认领到的任务ID，没有可执行的任务时返回 None
+        """
+        self._requeue_stale(db)
+        for _ in range(CLAIM_ATTEMPTS):
+            job_id = db.query(GenerationJob.id).filter(
+                GenerationJob.status == GenerationJobStatus.PENDING,
+                GenerationJob.job_type.in_(list(self._job_types))
+            ).order_by(GenerationJob.id).limit(1).scalar()
+            if job_id is None:
+                db.commit()
+                return None
+
+            now = datetime.utcnow()
+            claimed = db.execute(
+                update(GenerationJob).where(
+                    GenerationJob.id == job_id,
+                    GenerationJob.status == GenerationJobStatus.PENDING
+                ).values(
+                    status=GenerationJobStatus.RUNNING,
+                    worker_id=worker_id,
+                    attempts=GenerationJob.attempts + 1,
+                    progress="执行中",
+                    started_at=now,
+                    heartbeat_at=now
+                )
+            ).rowcount
+            db.commit()
+            if claimed:
+                return job_id
+        return None
+
+    def _update_job(self, job_id: int, owner: str, **values: Any) -> bool:
+        """
+        更新由该 worker 执行中的任务
+
+        Args:
+            job_id: 任务ID
+            owner: 执行任务的 worker 标识
+            **values: 要更新的字段
+
+        Returns:
+            任务仍由该 worker 执行（未被取消或重新排队）时返回 True
+        """
+        db = self._session_factory()
+        try:
+            updated = db.execute(
+                update(GenerationJob).where(
+                    GenerationJob.id == job_id,
+                    GenerationJob.status == GenerationJobStatus.RUNNING,
+                    GenerationJob.worker_id == owner
+                ).values(**values)
+            ).rowcount
+            db.commit()
+        finally:
+            db.close()
+        self._notify(job_id)
+        return bool(updated)
+
+    # ------------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------------
+
+    async def _execute(self, job_id: int, worker_id: str) -> None:
+        """执行已认领的任务，结果或错误写回任务记录"""
+        db = self._session_factory()
+        started = time.monotonic()
+        job_type_name = "unknown"
+        task: Optional[asyncio.Task] = None
+        try:
+            job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+            job_type_name = job.job_type
+            job_type = self._job_types[job.job_type]
+            request = job_type.request_model.model_validate(job.payload or {})
+            user_id = job.user_id
+            self._notify(job_id)
+            logger.info(f"任务{job_id}（{job_type_name}）开始执行，worker: {worker_id}")
+
+            # 任务创建时复制当前上下文，执行期间记录的阶段耗时写入 stage_timings
+            with collect_stage_timings() as stage_timings:
+                token = _current_job.set((job_id, worker_id))
+                try:
+                    task = asyncio.create_task(job_type.handler(request, db, user_id))
+                finally:
+                    _current_job.reset(token)
+            self._running[job_id] = task
+            heartbeat_interval = max(settings.JOB_LEASE_SECONDS / 3, 1.0)
+            while not task.done():
+                await asyncio.wait({task}, timeout=heartbeat_interval)
+                if not task.done() and not self._update_job(job_id, worker_id, heartbeat_at=datetime.utcnow()):
+                    # 任务已在其他进程中被取消，或心跳超时后被重新排队
+                    task.cancel()
+                    await asyncio.wait({task})
+
+            if task.cancelled():
+                db.rollback()
+                self._jobs_total.inc((job_type_name, "cancelled"))
+                logger.info(f"任务{job_id}已取消")
+                return
+
+            result = task.result()
+            values = {
+                "status": GenerationJobStatus.COMPLETED,
+                "progress": "已完成",
+                "result": jsonable_encoder(result),
+                "finished_at": datetime.utcnow()
+            }
+            # 生成服务返回 success=False 的响应时（同步接口原样返回）任务记为失败
+            if getattr(result, "success", True) is False:
+                values.update(
+                    status=GenerationJobStatus.FAILED,
+                    progress="执行失败",
+                    error_message=getattr(result, "message", None)
+                )
+            self._update_job(job_id, worker_id, **values)
+            self._jobs_total.inc((job_type_name, values["status"].value))
+            logger.info(
+                f"任务{job_id}执行结束: {values['status'].value}，"
+                f"阶段耗时: {format_server_timing(stage_timings) or '无'}"
+            )
+
+        except asyncio.CancelledError:
+            # 服务关闭：中断执行并重新排队，本次不计入执行次数
+            if task is not None and not task.done():
+                task.cancel()
+            db.rollback()
+            self._update_job(
+                job_id, worker_id,
+                status=GenerationJobStatus.PENDING,
+                worker_id=None,
+                attempts=GenerationJob.attempts - 1,
+                progress="服务重启，重新排队"
+            )
+            raise
+        except Exception as e:
+            db.rollback()
+            if isinstance(e, HTTPException):
+                error_code, error_message = e.status_code, str(e.detail)
+            else:
+                error_code, error_message = 500, str(e)
+            logger.error(f"任务{job_id}执行失败: {error_message}")
+            self._update_job(
+                job_id, worker_id,
+                status=GenerationJobStatus.FAILED,
+                progress="执行失败",
+                error_code=error_code,
+                error_message=error_message,
+                finished_at=datetime.utcnow()
+            )
+            self._jobs_total.inc((job_type_name, "failed"))
+        finally:
+            self._running.pop(job_id, None)
+            self._job_seconds.observe((job_type_name,), time.monotonic() - started)
+            db.close()
+
+    async def _worker_loop(self, worker_id: str) -> None:
+        """worker 主循环：认领并执行任务，空闲时等待新任务或轮询"""
+        while True:
+            db = self._session_factory()
+            try:
+                job_id = self._claim(db, worker_id)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"认领任务失败: {e}")
+                job_id = None
+            finally:
+                db.close()
+
+            if job_id is not None:
+                await self._execute(job_id, worker_id)
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self, workers: Optional[int] = None) -> None:
+        """
+        启动 worker
+
+        Args:
+            workers: worker 数量，默认使用 JOB_WORKERS 配置
+        """
+        count = settings.JOB_WORKERS if workers is None else workers
+        if self._workers or count <= 0 or not self._job_types:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker_loop(f"{self._name}:{index}"))
+            for index in range(count)
+        ]
+        logger.info(f"后台任务队列已启动: {count}个worker，任务类型: {', '.join(self._job_types)}")
+
+    async def stop(self) -> None:
+        """停止 worker，执行中的任务重新排队"""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def run(self, workers: int) -> None:
+        """启动 worker 并一直运行（供独立 worker 进程使用）"""
+        self.start(workers)
+        try:
+            await asyncio.gather(*self._workers)
+        finally:
+            await self.stop()
+
+
+# 全局任务队列实例
+job_queue = JobQueue()
+
+
+def get_job_queue() -> JobQueue:
+    """获取后台任务队列实例"""
+    return job_queue
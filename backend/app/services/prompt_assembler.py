@@ -0,0 +1,349 @@
+"""
+提示词组装器
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import enum
+import logging
+import threading
+from collections import OrderedDict
+from string import Formatter
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import get_metrics_registry
+from app.services.chapter_context_index import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 截断处的省略标记
+ELLIPSIS = "……"
+
+# 条目型片段的条目分隔符
+ITEM_SEPARATOR = "\n\n"
+
+# 预编译模板缓存容量
+TEMPLATE_CACHE_SIZE = 256
+
+# 提示词大小直方图分桶（估算token数）
+PROMPT_TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+
+class TruncationStrategy(str, enum.Enum):
+    """片段超出预算时的截断策略"""
+    HEAD = "head"        # 保留开头
+    TAIL = "tail"        # 保留结尾（如前文回顾）
+    MIDDLE = "middle"    # 保留首尾，省略中间
+    ITEMS = "items"      # 按条目保留前面的完整条目（如角色列表）
+    DROP = "drop"        # 超出时整体丢弃
+
+
+class SectionSpec:
+    """上下文片段的预算规则"""
+
+    def __init__(
+        self,
+        priority: int,
+        max_tokens: Optional[int] = None,
+        strategy: TruncationStrategy = TruncationStrategy.HEAD,
+        placeholder: str = "无"
+    ):
+        """
+        Args:
+            priority: 优先级，总预算不足时优先压缩数值小的片段
+            max_tokens: 单个片段的token上限，为空时不单独限制
+            strategy: 截断策略
+            placeholder: 片段被整体丢弃时的占位文本
+        """
+        self.priority = priority
+        self.max_tokens = max_tokens
+        self.strategy = strategy
+        self.placeholder = placeholder
+
+
+# 生成上下文变量的默认预算规则（未列出的变量视为固定内容，不参与截断）
+DEFAULT_SECTION_SPECS: Dict[str, SectionSpec] = {
+    "user_input": SectionSpec(priority=95, max_tokens=1000, placeholder=""),
+    "description": SectionSpec(priority=90, max_tokens=800, placeholder="暂无描述"),
+    "outline_info": SectionSpec(priority=85, max_tokens=2000),
+    "character_info": SectionSpec(priority=70, max_tokens=3000, strategy=TruncationStrategy.ITEMS),
+    "worldview_info": SectionSpec(priority=60, max_tokens=2500, strategy=TruncationStrategy.ITEMS),
+    "rough_outline_info": SectionSpec(priority=50, max_tokens=3000, strategy=TruncationStrategy.ITEMS),
+    "previous_chapters": SectionSpec(
+        priority=40, max_tokens=6000, strategy=TruncationStrategy.TAIL, placeholder="无（本章为开篇）"
+    ),
+    "parent_context": SectionSpec(priority=65, max_tokens=1500, strategy=TruncationStrategy.MIDDLE),
+}
+
+
+def truncate_to_tokens(text: str, max_tokens: int, from_end: bool = False) -> str:
+    """
+    按估算token数截取文本（二分查找最长的满足预算的前缀或后缀）
+
+    Args:
+        text: 文本
+        max_tokens: token上限
+        from_end: True 时保留结尾
+
+    Returns:
+        截取后的文本（不含省略标记）
+    """
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        part = text[-middle:] if from_end else text[:middle]
+        if estimate_tokens(part) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[len(text) - low:] if from_end else text[:low]
+
+
+def truncate_section(text: str, max_tokens: int, strategy: TruncationStrategy) -> str:
+    """
+    按截断策略将片段压缩到 max_tokens 以内
+
+    Args:
+        text: 片段文本
+        max_tokens: token上限
+        strategy: 截断策略
+
+    Returns:
+        截断后的文本，无法保留任何内容时返回空字符串
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    marker_tokens = estimate_tokens(ELLIPSIS)
+    if strategy == TruncationStrategy.DROP or max_tokens <= marker_tokens:
+        return ""
+
+    if strategy == TruncationStrategy.ITEMS:
+        kept: List[str] = []
+        used = marker_tokens
+        for item in text.split(ITEM_SEPARATOR):
+            cost = estimate_tokens(item) + 1
+            if used + cost > max_tokens:
+                break
+            kept.append(item)
+            used += cost
+        if kept:
+            return ITEM_SEPARATOR.join(kept) + ITEM_SEPARATOR + ELLIPSIS
+        # 第一个条目本身超出预算时退化为保留开头
+        strategy = TruncationStrategy.HEAD
+
+    budget = max_tokens - marker_tokens
+    if strategy == TruncationStrategy.TAIL:
+        return ELLIPSIS + truncate_to_tokens(text, budget, from_end=True)
+    if strategy == TruncationStrategy.MIDDLE:
+        head = truncate_to_tokens(text, budget // 2)
+        tail = truncate_to_tokens(text[len(head):], budget - estimate_tokens(head), from_end=True)
+        return head + ELLIPSIS + tail
+    return truncate_to_tokens(text, budget) + ELLIPSIS
+
+
+class CompiledTemplate:
+    """
+    预编译的提示词模板
+
+    模板文本只在编译时解析一次，渲染时按字面量与变量的片段列表一次拼接，
+    与 str.format 的语义一致（支持 {{ }} 转义、转换符与格式说明）。
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        self._parts: List[Tuple[str, Optional[str], Optional[str], str]] = []
+        self.fields: List[str] = []
+        formatter = Formatter()
+        for literal, field, format_spec, conversion in formatter.parse(template):
+            self._parts.append((literal, field, conversion, format_spec or ""))
+            if field is not None:
+                self.fields.append(field)
+        self.literal_text = "".join(part[0] for part in self._parts)
+        self.literal_tokens = estimate_tokens(self.literal_text)
+
+    def render(self, variables: Mapping[str, Any]) -> str:
+        """
+        渲染模板
+
+        Args:
+            variables: 模板变量
+
+        Returns:
+            渲染结果
+
+        Raises:
+            KeyError: 缺少模板变量
+        """
+        pieces: List[str] = []
+        for literal, field, conversion, format_spec in self._parts:
+            if literal:
+                pieces.append(literal)
+            if field is None:
+                continue
+            if field.isidentifier():
+                value = variables[field]
+                if conversion == "r":
+                    value = repr(value)
+                elif conversion == "a":
+                    value = ascii(value)
+                elif conversion == "s":
+                    value = str(value)
+                pieces.append(format(value, format_spec) if format_spec else str(value))
+            else:
+                # 属性或下标访问（如 {novel_settings[genre]}）交给 str.format 处理
+                spec = f"!{conversion}" if conversion else ""
+                spec += f":{format_spec}" if format_spec else ""
+                pieces.append(("{" + field + spec + "}").format(**variables))
+        return "".join(pieces)
+
+
+class AssembledPrompt:
+    """组装结果"""
+
+    def __init__(self, text: str, tokens: int, truncated: List[str]):
+        self.text = text
+        self.tokens = tokens
+        self.truncated = truncated
+
+
+class PromptAssembler:
+    """
+    提示词组装器
+
+    将模板变量中的上下文片段（世界观、角色、大纲、前文等）按类型化的规则
+    处理：先按各自的 token 上限截断，再在总预算不足时按优先级从低到高继续
+    压缩，最后用预编译模板一次渲染，并记录最终提示词大小。
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 24000,
+        section_specs: Optional[Dict[str, SectionSpec]] = None
+    ):
+        self.token_budget = token_budget
+        self.section_specs = section_specs if section_specs is not None else DEFAULT_SECTION_SPECS
+        self._lock = threading.Lock()
+        self._templates: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+        self._prompt_tokens = get_metrics_registry().histogram(
+            "prompt_tokens", "渲染后的提示词大小（估算token数）", ("prompt_type",), PROMPT_TOKEN_BUCKETS
+        )
+
+    def compile(self, template: str) -> CompiledTemplate:
+        """获取预编译模板（按模板文本缓存）"""
+        with self._lock:
+            compiled = self._templates.get(template)
+            if compiled is not None:
+                self._templates.move_to_end(template)
+                return compiled
+        compiled = CompiledTemplate(template)
+        with self._lock:
+            self._templates[template] = compiled
+            while len(self._templates) > TEMPLATE_CACHE_SIZE:
+                self._templates.popitem(last=False)
+        return compiled
+
+    def _fit_sections(
+        self,
+        sections: Dict[str, str],
+        available: int
+    ) -> Tuple[Dict[str, str], List[str]]:
+        """
+        将片段压缩到总预算以内
+
+        Args:
+            sections: 变量名 -> 片段文本
+            available: 片段可用的token总数
+
+        Returns:
+            (压缩后的片段, 被截断的变量名)
+        """
+        fitted: Dict[str, str] = {}
+        costs: Dict[str, int] = {}
+        truncated: List[str] = []
+
+        for name, text in sections.items():
+            spec = self.section_specs[name]
+            if spec.max_tokens is not None:
+                shortened = truncate_section(text, spec.max_tokens, spec.strategy)
+                if shortened != text:
+                    truncated.append(name)
+                text = shortened
+            fitted[name] = text
+            costs[name] = estimate_tokens(text)
+
+        overflow = sum(costs.values()) - max(available, 0)
+        if overflow > 0:
+            # 从低优先级片段开始压缩，直到放得下
+            for name in sorted(fitted, key=lambda key: self.section_specs[key].priority):
+                if overflow <= 0:
+                    break
+                spec = self.section_specs[name]
+                target = max(costs[name] - overflow, 0)
+                shortened = truncate_section(fitted[name], target, spec.strategy)
+                if shortened == fitted[name]:
+                    continue
+                overflow -= costs[name] - estimate_tokens(shortened)
+                fitted[name] = shortened
+                if name not in truncated:
+                    truncated.append(name)
+
+        for name, text in fitted.items():
+            if not text and sections[name]:
+                fitted[name] = self.section_specs[name].placeholder
+        return fitted, truncated
+
+    def assemble(
+        self,
+        template: str,
+        variables: Mapping[str, Any],
+        label: str = "unknown",
+        token_budget: Optional[int] = None
+    ) -> AssembledPrompt:
+        """
+        组装提示词
+
+        Args:
+            template: 模板文本（str.format 语法）
+            variables: 模板变量，名称在片段规则中的字符串变量按预算处理
+            label: 提示词类型（用于指标标签）
+            token_budget: 提示词token上限，默认使用组装器配置
+
+        Returns:
+            组装结果
+        """
+        compiled = self.compile(template)
+        budget = token_budget or self.token_budget
+
+        sections: Dict[str, str] = {}
+        fixed_tokens = compiled.literal_tokens
+        for field in dict.fromkeys(compiled.fields):
+            value = variables.get(field)
+            if field in self.section_specs and isinstance(value, str):
+                sections[field] = value
+            elif value is not None:
+                fixed_tokens += estimate_tokens(str(value))
+
+        fitted, truncated = self._fit_sections(sections, budget - fixed_tokens)
+        text = compiled.render({**variables, **fitted})
+        tokens = estimate_tokens(text)
+
+        self._prompt_tokens.observe((label,), tokens)
+        if truncated:
+            logger.info(f"提示词[{label}]超出预算，已截断片段: {', '.join(truncated)}（{tokens} tokens）")
+        else:
+            logger.debug(f"提示词[{label}]组装完成（{tokens} tokens）")
+        return AssembledPrompt(text, tokens, truncated)
+
+
+# 全局提示词组装器实例
+prompt_assembler = PromptAssembler(token_budget=settings.PROMPT_TOKEN_BUDGET)
+
+
+def get_prompt_assembler() -> PromptAssembler:
+    """获取提示词组装器实例"""
+    return prompt_assembler
@@ -5,21 +5,37 @@ Created: 2025-06-01
 """
 
 import logging
-from typing import List, Optional, Dict, Any
+import threading
+from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 
+from app.core.spans import span, timed
+from app.core.table_versions import get_table_versions
 from app.models.prompt import Prompt, PromptType
 from app.schemas.prompt import PromptCreate, PromptUpdate
+from app.services.prompt_assembler import get_prompt_assembler
 
 logger = logging.getLogger(__name__)
 
+# 进程内的生成模板缓存：类型 -> (prompts 表版本, 模板列值)；表版本在任一工作进程
+# 提交提示词变更后递增，缓存随之失效
+_template_snapshots: Dict[PromptType, Tuple[int, Dict[str, Any]]] = {}
+_template_snapshots_lock = threading.Lock()
+
+
+def _prompt_columns(prompt: Prompt) -> Dict[str, Any]:
+    """提取模板的列值（用于构建与会话无关的模板副本）"""
+    return {column.name: getattr(prompt, column.name) for column in Prompt.__table__.columns}
+
 
 class PromptService:
     """提示词管理服务"""
     
     def __init__(self, db: Session):
         self.db = db
+        # 请求内的模板缓存（服务实例随请求创建）
+        self._template_cache: Dict[PromptType, Prompt] = {}
     
     async def create_prompt(self, prompt_data: PromptCreate) -> Prompt:
         """创建提示词模板"""
@@ -115,6 +131,75 @@ class PromptService:
         
         return query.offset(skip).limit(limit).order_by(Prompt.created_at.desc()).all()
     
+    @timed("prompt_template")
+    async def get_prompt_template(self, prompt_type: PromptType) -> Prompt:
+        """
+        获取生成使用的提示词模板，数据库中没有启用的模板时使用内置默认模板
+        
+        模板按 prompts 表版本在进程内缓存，表未变更时不再查询数据库。
+        
+        Args:
+            prompt_type: 提示词类型
+            
+        Returns:
+            提示词模板（内置模板不会写入数据库）
+            
+        Raises:
+            ValueError: 没有该类型的模板
+        """
+        template = self._template_cache.get(prompt_type)
+        if template is not None:
+            return template
+        
+        version = get_table_versions().get((Prompt.__tablename__,))[0]
+        with _template_snapshots_lock:
+            snapshot = _template_snapshots.get(prompt_type)
+        if snapshot is not None and snapshot[0] == version:
+            template = Prompt(**snapshot[1])
+        else:
+            template = await self.get_default_prompt_by_type(prompt_type)
+            if template is None:
+                builtin = next(
+                    (item for item in self._get_default_prompt_templates() if item["type"] == prompt_type),
+                    None
+                )
+                if builtin is None:
+                    raise ValueError(f"未找到类型为 {prompt_type} 的提示词模板")
+                template = Prompt(**builtin)
+            with _template_snapshots_lock:
+                _template_snapshots[prompt_type] = (version, _prompt_columns(template))
+        
+        self._template_cache[prompt_type] = template
+        return template
+    
+    @timed("prompt_build")
+    def render_prompt(
+        self,
+        prompt_template: Prompt,
+        context_data: Dict[str, Any],
+        user_input: Optional[str] = None
+    ) -> str:
+        """
+        使用已获取的模板渲染提示词
+        
+        Args:
+            prompt_template: 提示词模板
+            context_data: 模板变量
+            user_input: 用户输入
+            
+        Returns:
+            完整的提示词（上下文片段已按token预算截断）
+        """
+        template_vars = {
+            "user_input": user_input or "",
+            **context_data
+        }
+        return get_prompt_assembler().assemble(
+            prompt_template.template,
+            template_vars,
+            label=getattr(prompt_template.type, "value", str(prompt_template.type))
+        ).text
+    
     async def build_prompt(
         self,
         prompt_type: PromptType,
@@ -124,18 +209,13 @@ class PromptService:
         """构建完整的提示词"""
         try:
             # 获取提示词模板
-            prompt_template = await self.get_default_prompt_by_type(prompt_type)
+            with span("prompt_template"):
+                prompt_template = await self.get_default_prompt_by_type(prompt_type)
             if not prompt_template:
                 raise ValueError(f"未找到类型为 {prompt_type} 的提示词模板")
             
-            # 构建上下文变量
-            template_vars = {
-                "user_input": user_input or "",
-                **context_data
-            }
-            
-            # 替换模板中的变量
-            final_prompt = prompt_template.template.format(**template_vars)
+            # 渲染模板（上下文片段按token预算截断）
+            final_prompt = self.render_prompt(prompt_template, context_data, user_input)
             
             logger.info(f"构建提示词成功: {prompt_type}")
             return final_prompt
@@ -147,15 +227,16 @@ class PromptService:
     async def init_default_prompts(self):
         """初始化默认提示词模板"""
         try:
-            # 检查是否已有提示词模板
-            existing_prompts = self.db.query(Prompt).all()
-            if len(existing_prompts) > 0:
+            # 只补充尚无模板的类型，已有模板保持不变
+            existing_types = {row.type for row in self.db.query(Prompt.type).distinct()}
+            default_prompts = [
+                prompt_data for prompt_data in self._get_default_prompt_templates()
+                if prompt_data["type"] not in existing_types
+            ]
+            if not default_prompts:
                 logger.info("提示词模板已存在，跳过初始化")
                 return
             
-            # 创建默认提示词模板
-            default_prompts = self._get_default_prompt_templates()
-            
             for prompt_data in default_prompts:
                 prompt = Prompt(**prompt_data)
                 self.db.add(prompt)
@@ -184,73 +265,73 @@ class PromptService:
 
 请生成一个包含以下要素的完整世界观体系，并按JSON格式返回：
 
-{
-  "world_base": {
+{{
+  "world_base": {{
     "name": "世界名称",
     "description": "基本世界观描述",
     "background": "历史背景和基础设定",
     "rules": ["核心规则1", "核心规则2", "..."],
     "characteristics": ["世界特色1", "世界特色2", "..."]
-  },
-  "geography": {
+  }},
+  "geography": {{
     "map_regions": [
-      {
+      {{
         "name": "区域名称",
         "type": "区域类型(大陆/海域/空域等)",
         "description": "区域描述",
         "features": ["地理特征1", "地理特征2", "..."],
         "resources": ["特色资源1", "特色资源2", "..."]
-      }
+      }}
     ],
     "special_locations": [
-      {
+      {{
         "name": "特殊地点名称",
         "description": "地点描述",
         "significance": "地点重要性",
         "mysteries": ["相关谜团1", "相关谜团2", "..."]
-      }
+      }}
     ]
-  },
-  "power_system": {
+  }},
+  "power_system": {{
     "name": "修炼/力量体系名称",
     "description": "体系整体描述",
     "levels": [
-      {
+      {{
         "name": "等级名称",
         "description": "等级描述",
         "requirements": "晋升要求",
         "abilities": ["能力1", "能力2", "..."]
-      }
+      }}
     ],
     "unique_features": ["特色1", "特色2", "..."],
     "cultivation_methods": ["修炼方法1", "修炼方法2", "..."]
-  },
-  "history": {
+  }},
+  "history": {{
     "eras": [
-      {
+      {{
         "name": "时代名称",
         "description": "时代概述",
         "major_events": [
-          {
+          {{
             "name": "事件名称",
             "description": "事件描述",
             "impact": "历史影响",
             "key_figures": ["重要人物1", "重要人物2", "..."]
-          }
+          }}
         ]
-      }
+      }}
     ],
     "significant_artifacts": [
-      {
+      {{
         "name": "神器/遗物名称",
         "description": "描述",
         "powers": ["能力1", "能力2", "..."],
         "history": "来历"
-      }
+      }}
     ]
-  },
+  }},
   "factions": [
-    {
+    {{
       "name": "势力名称",
       "type": "势力类型",
       "description": "势力描述",
@@ -258,15 +339,15 @@ class PromptService:
       "strength": "势力实力",
       "territory": "势力范围",
       "relationships": [
-        {
+        {{
           "faction": "相关势力名称",
           "type": "关系类型(同盟/敌对/竞争等)",
           "description": "关系描述"
-        }
+        }}
       ]
-    }
+    }}
   ]
-}""",
+}}""",
                 "description": "用于生成完整世界观体系的默认模板",
                 "response_format": '''
 {
@@ -454,6 +535,224 @@ class PromptService:
                 "response_format": '{"brainstorms": [{"style": "string", "concept": "string", "implementation": "string", "development": "string"}]}',
                 "default_max_tokens": 30000,
                 "default_temperature": 90
+            },
+            {
+                "name": "默认粗略大纲生成器",
+                "type": PromptType.ROUGH_OUTLINE,
+                "template": """请为以下小说规划粗略大纲。
+
+小说信息：
+- 标题：{title}
+- 类型：{genre}
+- 简介：{description}
+- 目标章节数：{target_chapters}
+
+世界观：
+{worldview_info}
+
+已有角色：
+{character_info}
+
+需要生成的大纲类型：{outline_types}
+（storyline=故事线，character_growth=角色成长路线，major_event=重大事件，plot_point=大情节点）
+
+用户要求：{user_input}
+
+请按照以下JSON格式返回，大情节点需给出起止章节：
+{{
+  "outlines": [
+    {{
+      "outline_type": "storyline",
+      "title": "大纲标题",
+      "content": "大纲内容描述",
+      "start_chapter": 1,
+      "end_chapter": 10
+    }}
+  ]
+}}""",
+                "description": "用于生成故事线、角色成长路线、重大事件与大情节点的默认模板",
+                "response_format": '{"outlines": [{"outline_type": "string", "title": "string", "content": "string", "start_chapter": "integer", "end_chapter": "integer"}]}',
+                "default_max_tokens": 30000,
+                "default_temperature": 75
+            },
+            {
+                "name": "默认细致大纲生成器",
+                "type": PromptType.DETAIL_OUTLINE,
+                "template": """请为以下小说的第{start_chapter}章到第{end_chapter}章编写逐章细致大纲。
+
+小说信息：
+- 标题：{title}
+- 类型：{genre}
+- 简介：{description}
+
+世界观：
+{worldview_info}
+
+粗略大纲：
+{rough_outline_info}
+
+角色（括号内为角色ID）：
+{character_info}
+
+用户要求：{user_input}
+
+每章需包含情节点、参与/入场/离场角色ID、章节简介及剧情标识，请按照以下JSON格式返回：
+{{
+  "chapters": [
+    {{
+      "chapter_number": {start_chapter},
+      "chapter_title": "章节标题",
+      "plot_points": "本章情节点",
+      "participating_characters": [1, 2],
+      "entering_characters": [],
+      "exiting_characters": [],
+      "chapter_summary": "章节简介",
+      "is_plot_end": false,
+      "is_new_plot": false,
+      "new_plot_summary": ""
+    }}
+  ]
+}}""",
+                "description": "用于按章节范围生成细致大纲的默认模板",
+                "response_format": '{"chapters": [{"chapter_number": "integer", "chapter_title": "string", "plot_points": "string", "participating_characters": ["integer"], "entering_characters": ["integer"], "exiting_characters": ["integer"], "chapter_summary": "string", "is_plot_end": "boolean", "is_new_plot": "boolean", "new_plot_summary": "string"}]}',
+                "default_max_tokens": 30000,
+                "default_temperature": 70
+            },
+            {
+                "name": "默认角色生成器",
+                "type": PromptType.CHARACTER,
+                "template": """请为以下小说设计{character_count}个角色。
+
+小说信息：
+- 标题：{title}
+- 类型：{genre}
+- 简介：{description}
+
+世界观：
+{worldview_info}
+
+已有角色（请勿重复）：
+{character_info}
+
+角色类型要求：{character_types}
+（protagonist=主角，supporting=配角，antagonist=反派，minor=龙套）
+
+用户要求：{user_input}
+
+请按照以下JSON格式返回：
+{{
+  "characters": [
+    {{
+      "name": "角色名",
+      "gender": "male/female/unknown/other",
+      "character_type": "protagonist/supporting/antagonist/minor",
+      "personality": "性格描述",
+      "description": "外貌与背景描述",
+      "abilities": "能力描述",
+      "tags": ["标签1", "标签2"]
+    }}
+  ]
+}}""",
+                "description": "用于生成小说角色的默认模板",
+                "response_format": '{"characters": [{"name": "string", "gender": "string", "character_type": "string", "personality": "string", "description": "string", "abilities": "string", "tags": ["string"]}]}',
+                "default_max_tokens": 30000,
+                "default_temperature": 80
+            },
+            {
+                "name": "默认章节生成器",
+                "type": PromptType.CHAPTER,
+                "template": """请创作小说《{title}》的第{chapter_number}章。
+
+小说信息：
+- 类型：{genre}
+- 简介：{description}
+
+世界观：
+{worldview_info}
+
+本章大纲：
+{outline_info}
+
+出场角色：
+{character_info}
+
+前文回顾：
+{previous_chapters}
+
+写作要求：
+- 目标字数：约{target_word_count}字
+- 风格：{style}
+- 与前文情节自然衔接，保持人物性格一致
+- 用户要求：{user_input}
+
+请直接输出正文，第一行为“标题：章节标题”，从第二行开始为章节正文。""",
+                "description": "用于生成章节正文的默认模板",
+                "response_format": None,
+                "default_max_tokens": 30000,
+                "default_temperature": 80
+            },
+            {
+                "name": "默认地图区域生成器",
+                "type": PromptType.WORLD_MAP,
+                "template": """作为一个世界观设计师，请为"{worldview_name}"生成{generation_count}个地图区域。
+
+世界观背景：
+{worldview_description}
+
+{parent_context}
+
+生成要求：
+1. 生成{generation_count}个不同的地图区域
+2. 每个区域都要有独特的特色和设定
+3. 区域之间要有逻辑联系和层次关系
+{feature_requirements}
+
+用户建议：{user_input}
+
+请按照以下JSON格式返回：
+{{
+  "generated_maps": [
+    {{
+      "name": "区域名称",
+      "description": "详细的区域描述，包含历史背景和特色",
+      "climate": "气候特征（如果需要）",
+      "terrain": "地形地貌（如果需要）",
+      "resources": "主要自然资源（如果需要）",
+      "population": "人口分布情况（如果需要）",
+      "culture": "文化特色（如果需要）"
+    }}
+  ]
+}}""",
+                "description": "用于生成世界地图区域（含子区域）的默认模板",
+                "response_format": '{"type": "object", "properties": {"generated_maps": {"type": "array", "items": {"type": "object", "properties": {"name": {"type": "string"}, "description": {"type": "string"}, "climate": {"type": "string"}, "terrain": {"type": "string"}, "resources": {"type": "string"}, "population": {"type": "string"}, "culture": {"type": "string"}}, "required": ["name", "description"]}}}}',
+                "default_max_tokens": 4000,
+                "default_temperature": 70
+            },
+            {
+                "name": "默认世界观分段生成器",
+                "type": PromptType.WORLD_VIEW_SECTION,
+                "template": """作为一个世界观设计师，请为小说设计世界观中的「{section_title}」部分。
+
+小说设定：
+- 小说类型：{genre}
+- 小说主题：{themes}
+- 写作风格：{style}
+- 世界观名称：{worldview_name}
+
+世界基础设定：
+{world_base}
+
+生成要求：
+{section_requirements}
+
+用户建议：{user_input}
+
+只需返回这一部分的内容，请按照以下JSON格式返回：
+{section_format}""",
+                "description": "用于分段并发生成世界观各部分（世界基础、地理、力量体系、历史、阵营、神器）的默认模板",
+                "response_format": None,
+                "default_max_tokens": 3000,
+                "default_temperature": 70
             }
         ]
 
@@ -0,0 +1,286 @@
+"""
+结构化响应的部分结果恢复
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+from app.core.config import settings
+from app.core.metrics import get_metrics_registry
+from app.core.spans import timed
+
+logger = logging.getLogger(__name__)
+
+# 回退查找可解析前缀时最多尝试的截断点数量
+MAX_CUT_ATTEMPTS = 64
+
+# 按校验错误剔除无效条目的最大轮数
+MAX_PRUNE_ROUNDS = 10
+
+CONTINUATION_INSTRUCTION = (
+    "\n\n上一次输出的JSON在中途中断，已输出的内容如下：\n{prefix}\n\n"
+    "请从中断处紧接着继续输出剩余的JSON内容，直到JSON完整结束。"
+    "不要重复已输出的内容，不要添加任何解释说明。"
+)
+
+_decoder = json.JSONDecoder()
+_recoveries = get_metrics_registry().counter(
+    "structured_recovery_total", "结构化响应解析失败后的恢复次数", ("outcome",)
+)
+
+
+class SalvageResult:
+    """从响应文本中抢救出的 JSON"""
+
+    def __init__(self, data: Any, complete: bool, prefix: str):
+        """
+        Args:
+            data: 解析出的数据（截断时只含完整的成员与条目）
+            complete: JSON 是否完整结束
+            prefix: 与 data 对应的原始文本前缀（续写时从这里接着输出）
+        """
+        self.data = data
+        self.complete = complete
+        self.prefix = prefix
+
+
+def _clean_trailing_commas(text: str) -> str:
+    """移除对象与数组中的尾随逗号（字符串内的内容保持原样）"""
+    result: List[str] = []
+    in_string = False
+    escaped = False
+    length = len(text)
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == ",":
+            following = index + 1
+            while following < length and text[following].isspace():
+                following += 1
+            if following < length and text[following] in "}]":
+                continue
+        result.append(char)
+    return "".join(result)
+
+
+def _cut_points(text: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    扫描 JSON 文本，记录可以安全截断的位置
+
+    安全截断点是某个成员或条目刚好完整结束（逗号前、括号闭合后）或容器刚
+    打开的位置，在该处截断并补上对应的闭合括号即可得到合法 JSON。
+
+    Args:
+        text: 文本
+        start: JSON 起始位置
+        end: 扫描终止位置（解析出错的位置）
+
+    Returns:
+        [(截断位置, 需要补上的闭合括号)]
+    """
+    stack: List[str] = []
+    points: List[Tuple[int, str]] = []
+    in_string = False
+    escaped = False
+    for index in range(start, end):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            points.append((index + 1, "".join(reversed(stack))))
+        elif char in "}]":
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                break
+            points.append((index + 1, "".join(reversed(stack))))
+        elif char == "," and stack:
+            points.append((index, "".join(reversed(stack))))
+    return points
+
+
+def salvage_json(text: str) -> Optional[SalvageResult]:
+    """
+    从可能被截断或格式错误的响应文本中解析 JSON
+
+    优先解析完整的 JSON（忽略前后的说明文字）；失败时在出错位置之前回退到
+    最近的安全截断点，只保留完整的顶层成员与数组条目。
+
+    Args:
+        text: 响应文本
+
+    Returns:
+        抢救结果，找不到任何可用的 JSON 时返回 None
+    """
+    match = re.search(r"[{\[]", text)
+    if not match:
+        return None
+    start = match.start()
+    text = _clean_trailing_commas(text)
+
+    try:
+        data, end = _decoder.raw_decode(text, start)
+        return SalvageResult(data, True, text[start:end])
+    except json.JSONDecodeError as e:
+        error_pos = e.pos
+
+    points = _cut_points(text, start, error_pos)
+    for cut, closers in reversed(points[-MAX_CUT_ATTEMPTS:]):
+        prefix = text[start:cut]
+        try:
+            data = json.loads(_clean_trailing_commas(prefix + closers))
+        except json.JSONDecodeError:
+            continue
+        return SalvageResult(data, False, prefix)
+    return None
+
+
+def _clean_continuation(text: str) -> str:
+    """去掉续写内容中的思考过程与代码块标记"""
+    text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL | re.IGNORECASE)
+    text = re.sub(r"^\s*```(?:json)?\s*", "", text, flags=re.IGNORECASE)
+    return re.sub(r"\s*```\s*$", "", text)
+
+
+def _innermost_item(data: Any, loc: Sequence[Any]) -> Optional[Tuple[List[Any], int]]:
+    """沿校验错误路径找到最内层的数组条目"""
+    found = None
+    current = data
+    for key in loc:
+        if isinstance(current, list) and isinstance(key, int) and 0 <= key < len(current):
+            found = (current, key)
+            current = current[key]
+        elif isinstance(current, dict) and key in current:
+            current = current[key]
+        else:
+            break
+    return found
+
+
+def prune_invalid_items(data: Any, response_model: Type[BaseModel]) -> Tuple[Any, int]:
+    """
+    按响应模型校验数据，剔除校验不通过的数组条目
+
+    截断后保留下来的对象可能缺少必填字段，这些条目会被剔除；不在数组条目
+    内的错误（如缺少顶层必填部分）保留原样，交给调用方处理。
+
+    Args:
+        data: 解析出的数据（原地修改）
+        response_model: 期望的响应模型
+
+    Returns:
+        (数据, 剔除的条目数量)
+    """
+    dropped = 0
+    for _ in range(MAX_PRUNE_ROUNDS):
+        try:
+            response_model.model_validate(data)
+            return data, dropped
+        except ValidationError as e:
+            targets: Dict[int, Tuple[List[Any], set]] = {}
+            unresolved = []
+            for error in e.errors():
+                found = _innermost_item(data, error["loc"])
+                if found is None:
+                    unresolved.append(error)
+                    continue
+                items, index = found
+                targets.setdefault(id(items), (items, set()))[1].add(index)
+            if not targets:
+                details = "; ".join(f"{error['loc']} {error['msg']}" for error in unresolved)
+                logger.warning(f"部分结果不满足{response_model.__name__}: {details}")
+                return data, dropped
+            for items, indexes in targets.values():
+                for index in sorted(indexes, reverse=True):
+                    del items[index]
+                    dropped += 1
+    return data, dropped
+
+
+@timed("json_repair")
+async def recover_structured_response(
+    adapter: Any,
+    prompt: str,
+    response_text: str,
+    response_model: Optional[Type[BaseModel]] = None,
+    max_tokens: Optional[int] = None,
+    temperature: Optional[float] = None,
+    **kwargs
+) -> Optional[Any]:
+    """
+    恢复解析失败的结构化响应
+
+    先抢救出已完整输出的成员与条目；JSON 未完整结束时，把已输出的前缀交给
+    模型只续写剩余部分（输出上限远小于整次生成），再按响应模型剔除无效条目。
+
+    Args:
+        adapter: 产生该响应的适配器（用于续写请求）
+        prompt: 原始完整提示词
+        response_text: 解析失败的响应文本
+        response_model: 期望的响应模型，为空时不校验
+        max_tokens: 原始请求的输出上限
+        temperature: 采样温度
+        **kwargs: 透传给适配器的参数
+
+    Returns:
+        恢复的数据，没有任何可用内容时返回 None
+    """
+    result = salvage_json(response_text)
+    if result is None:
+        _recoveries.inc(("failed",))
+        return None
+
+    continuation_tokens = min(max_tokens or settings.STRUCTURED_CONTINUATION_MAX_TOKENS,
+                              settings.STRUCTURED_CONTINUATION_MAX_TOKENS)
+    continuations = 0
+    while not result.complete and continuations < settings.STRUCTURED_RECOVERY_MAX_CONTINUATIONS:
+        continuations += 1
+        try:
+            continuation = await adapter.generate_text(
+                prompt + CONTINUATION_INSTRUCTION.format(prefix=result.prefix),
+                max_tokens=continuation_tokens,
+                temperature=temperature,
+                **kwargs
+            )
+        except Exception as e:
+            logger.warning(f"结构化响应续写失败，使用已解析的部分结果: {str(e)}")
+            break
+        combined = salvage_json(result.prefix + _clean_continuation(continuation))
+        if combined is not None:
+            result = combined
+
+    data = result.data
+    dropped = 0
+    if response_model is not None and isinstance(data, (dict, list)):
+        data, dropped = prune_invalid_items(data, response_model)
+
+    outcome = "complete" if result.complete else "partial"
+    _recoveries.inc((outcome,))
+    logger.warning(
+        f"结构化响应解析失败，已恢复{'完整' if result.complete else '部分'}结果"
+        f"（续写{continuations}次，剔除无效条目{dropped}个）"
+    )
+    return data
@@ -0,0 +1,551 @@
+"""
+角色模板推荐引擎
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.shared_state import TEMPLATE_CATALOG, get_invalidation_bus
+from app.models.character import Character
+from app.models.character_template import (
+    CharacterTemplateDetail, CharacterTemplateFavorite, CharacterTemplateUsage
+)
+
+logger = logging.getLogger(__name__)
+
+# 偏好向量中不同行为的权重
+USAGE_WEIGHT = 1.0
+FAVORITE_WEIGHT = 2.0
+
+# 共现扩展系数：用户偏好会沿着标签/类型共现关系扩散到相关特征
+COOCCURRENCE_ALPHA = 0.3
+
+# 流行度先验在综合得分中的占比
+POPULARITY_PRIOR = 0.1
+
+# 基于小说推荐时互补角色类型的加分
+COMPLEMENTARY_BONUS = 0.3
+COMPLEMENTARY_TYPES = ("protagonist", "antagonist", "supporting")
+
+TYPE_FEATURE_PREFIX = "type:"
+
+
+class _UserProfile:
+    """单个用户的推荐画像（偏好向量与行为集合）"""
+
+    def __init__(self):
+        self.template_weights: Dict[int, float] = {}
+        self.favorites: Set[int] = set()
+        self.used_by_novel: Dict[int, Set[int]] = {}
+        self.used_templates: Set[int] = set()
+        self.vector: Optional[np.ndarray] = None
+        self.catalog_version = -1
+        self.loaded_at = time.monotonic()
+
+    def add_weight(self, template_id: int, weight: float) -> None:
+        """累加某个模板在偏好中的权重"""
+        value = self.template_weights.get(template_id, 0.0) + weight
+        if value <= 0:
+            self.template_weights.pop(template_id, None)
+        else:
+            self.template_weights[template_id] = value
+
+
+class TemplateRecommender:
+    """
+    角色模板推荐引擎
+
+    启动后按需从数据库加载模板目录，预先计算标签/类型特征矩阵与共现矩阵，
+    并在内存中维护每个用户的偏好向量。使用、收藏事件会增量刷新对应状态，
+    推荐请求只做一次向量化打分和 Top-K 选择，无需逐条加载ORM对象。
+
+    用户画像按最近使用顺序保留至多 max_profiles 个，超过 profile_ttl 秒或
+    目录定期重建（对账）时丢弃，下次访问从数据库重新加载，以纠正其他工作
+    进程中发生、未通知到本进程的使用/收藏事件。数据库查询均在 _lock 之外执行。
+    """
+
+    def __init__(self, refresh_interval: int = 300, max_profiles: int = 10000, profile_ttl: int = 300):
+        self.refresh_interval = refresh_interval
+        self.max_profiles = max_profiles
+        self.profile_ttl = profile_ttl
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._dirty = True
+        self._built_at = 0.0
+        self._version = 0
+
+        # 模板目录
+        self._template_ids = np.zeros(0, dtype=np.int64)
+        self._row_index: Dict[int, int] = {}
+        self._summaries: List[Dict[str, Any]] = []
+        self._character_types: List[Optional[str]] = []
+
+        # 特征与统计
+        self._feature_index: Dict[str, int] = {}
+        self._features = np.zeros((0, 0), dtype=np.float32)
+        self._normalized = np.zeros((0, 0), dtype=np.float32)
+        self._cooccurrence = np.zeros((0, 0), dtype=np.float32)
+        self._usage_counts = np.zeros(0, dtype=np.float64)
+        self._ratings = np.zeros(0, dtype=np.float64)
+        self._is_popular = np.zeros(0, dtype=bool)
+        self._is_new = np.zeros(0, dtype=bool)
+
+        self._profiles: "OrderedDict[int, _UserProfile]" = OrderedDict()
+
+    # ------------------------------------------------------------------
+    # 目录构建
+    # ------------------------------------------------------------------
+
+    def invalidate(self) -> None:
+        """标记模板目录失效，下一次推荐时重新构建（模板增删改后调用）"""
+        with self._lock:
+            self._dirty = True
+
+    def _is_stale(self) -> bool:
+        return self._dirty or time.monotonic() - self._built_at > self.refresh_interval
+
+    def _ensure_catalog(self, db: Session) -> None:
+        """确保模板目录是最新的（同一时间只有一个线程重建，重建期间推荐仍使用旧目录）"""
+        if not self._is_stale():
+            return
+        with self._build_lock:
+            if not self._is_stale():
+                return
+            # 先清除标记：重建期间再次失效时，下一次推荐会重新构建
+            with self._lock:
+                self._dirty = False
+            try:
+                self._build_catalog(db)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    def _build_catalog(self, db: Session) -> None:
+        """从数据库构建模板特征矩阵（查询与计算在锁外进行，完成后整体替换）"""
+        rows = db.query(
+            Character.id,
+            Character.name,
+            Character.gender,
+            Character.character_type,
+            Character.tags,
+            Character.description,
+            CharacterTemplateDetail.usage_count,
+            CharacterTemplateDetail.rating,
+            CharacterTemplateDetail.is_popular,
+            CharacterTemplateDetail.is_new
+        ).join(
+            CharacterTemplateDetail,
+            Character.id == CharacterTemplateDetail.character_id
+        ).filter(
+            Character.is_template == True
+        ).order_by(Character.id).all()
+
+        feature_index: Dict[str, int] = {}
+        row_features: List[List[int]] = []
+        summaries: List[Dict[str, Any]] = []
+        character_types: List[Optional[str]] = []
+
+        for row in rows:
+            tags = row.tags or []
+            features = []
+            for name in self._feature_names(tags, row.character_type):
+                if name not in feature_index:
+                    feature_index[name] = len(feature_index)
+                features.append(feature_index[name])
+            row_features.append(features)
+            character_types.append(row.character_type)
+
+            description = row.description
+            if description and len(description) > 100:
+                description = description[:100] + "..."
+            summaries.append({
+                "id": row.id,
+                "name": row.name,
+                "gender": row.gender,
+                "character_type": row.character_type,
+                "tags": tags,
+                "description": description,
+                "is_template": True
+            })
+
+        count = len(rows)
+        features = np.zeros((count, len(feature_index)), dtype=np.float32)
+        for i, columns in enumerate(row_features):
+            if columns:
+                features[i, columns] = 1.0
+
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        normalized = features / norms
+
+        # 共现矩阵按特征出现次数归一化，得到 P(j|i) 近似值
+        cooccurrence = features.T @ features
+        occurrences = np.diag(cooccurrence).copy()
+        occurrences[occurrences == 0] = 1.0
+        cooccurrence = cooccurrence / occurrences[:, None]
+        np.fill_diagonal(cooccurrence, 0.0)
+
+        cooccurrence = cooccurrence.astype(np.float32)
+        template_ids = np.array([row.id for row in rows], dtype=np.int64)
+        usage_counts = np.array([row.usage_count or 0 for row in rows], dtype=np.float64)
+        ratings = np.array([row.rating or 0.0 for row in rows], dtype=np.float64)
+        is_popular = np.array([bool(row.is_popular) for row in rows], dtype=bool)
+        is_new = np.array([bool(row.is_new) for row in rows], dtype=bool)
+
+        with self._lock:
+            self._template_ids = template_ids
+            self._row_index = {row.id: i for i, row in enumerate(rows)}
+            self._summaries = summaries
+            self._character_types = character_types
+            self._feature_index = feature_index
+            self._features = features
+            self._normalized = normalized
+            self._cooccurrence = cooccurrence
+            self._usage_counts = usage_counts
+            self._ratings = ratings
+            self._is_popular = is_popular
+            self._is_new = is_new
+
+            # 定期对账：丢弃所有用户画像，下次访问时按数据库重新加载
+            self._profiles.clear()
+            self._version += 1
+            self._built_at = time.monotonic()
+        logger.info(f"角色模板推荐目录已构建: {count}个模板, {len(feature_index)}个特征")
+
+    @staticmethod
+    def _feature_names(tags: List[str], character_type: Optional[str]) -> List[str]:
+        """提取模板的特征名称（标签 + 角色类型）"""
+        names = [str(tag) for tag in dict.fromkeys(tags or [])]
+        if character_type:
+            names.append(f"{TYPE_FEATURE_PREFIX}{character_type}")
+        return names
+
+    def _vector_for(self, tags: List[str], character_type: Optional[str]) -> np.ndarray:
+        """将任意标签/类型映射到当前特征空间"""
+        vector = np.zeros(len(self._feature_index), dtype=np.float32)
+        for name in self._feature_names(tags, character_type):
+            column = self._feature_index.get(name)
+            if column is not None:
+                vector[column] += 1.0
+        return vector
+
+    # ------------------------------------------------------------------
+    # 用户画像
+    # ------------------------------------------------------------------
+
+    def _cached_profile(self, user_id: int) -> Optional[_UserProfile]:
+        """取出未过期的已加载画像并标记为最近使用（调用方需持有 _lock）"""
+        profile = self._profiles.get(user_id)
+        if profile is None:
+            return None
+        if time.monotonic() - profile.loaded_at > self.profile_ttl:
+            del self._profiles[user_id]
+            return None
+        self._profiles.move_to_end(user_id)
+        return profile
+
+    def _get_profile(self, db: Session, user_id: int) -> _UserProfile:
+        """获取用户画像，未加载或已过期时从数据库加载（查询不持有 _lock）"""
+        with self._lock:
+            profile = self._cached_profile(user_id)
+        if profile is not None:
+            return profile
+
+        profile = self._load_profile(db, user_id)
+        with self._lock:
+            # 并发加载时保留先写入的画像，之后的增量事件都记在它上面
+            existing = self._cached_profile(user_id)
+            if existing is not None:
+                return existing
+            self._profiles[user_id] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+        return profile
+
+    @staticmethod
+    def _load_profile(db: Session, user_id: int) -> _UserProfile:
+        """从使用记录与收藏记录构建用户画像"""
+        profile = _UserProfile()
+
+        usages = db.query(
+            CharacterTemplateUsage.template_id,
+            CharacterTemplateUsage.novel_id
+        ).filter(
+            CharacterTemplateUsage.user_id == user_id
+        ).all()
+        for template_id, novel_id in usages:
+            profile.add_weight(template_id, USAGE_WEIGHT)
+            profile.used_templates.add(template_id)
+            if novel_id is not None:
+                profile.used_by_novel.setdefault(novel_id, set()).add(template_id)
+
+        favorites = db.query(CharacterTemplateFavorite.character_id).filter(
+            CharacterTemplateFavorite.user_id == user_id
+        ).all()
+        for (template_id,) in favorites:
+            profile.add_weight(template_id, FAVORITE_WEIGHT)
+            profile.favorites.add(template_id)
+        return profile
+
+    def _refresh_vector(self, profile: _UserProfile) -> None:
+        """目录重建后按新的特征空间重新计算偏好向量（调用方需持有 _lock）"""
+        if profile.catalog_version != self._version:
+            profile.vector = self._compute_preference(profile)
+            profile.catalog_version = self._version
+
+    def _compute_preference(self, profile: _UserProfile) -> np.ndarray:
+        """根据行为权重重新计算用户偏好向量"""
+        vector = np.zeros(len(self._feature_index), dtype=np.float32)
+        for template_id, weight in profile.template_weights.items():
+            row = self._row_index.get(template_id)
+            if row is not None:
+                vector += weight * self._features[row]
+        return vector
+
+    def _apply_event(self, profile: _UserProfile, template_id: int, weight: float) -> None:
+        """将一次行为增量应用到已加载的偏好向量上"""
+        profile.add_weight(template_id, weight)
+        row = self._row_index.get(template_id)
+        if (
+            row is not None
+            and profile.vector is not None
+            and profile.catalog_version == self._version
+        ):
+            profile.vector = np.maximum(profile.vector + weight * self._features[row], 0.0)
+
+    def record_usage(self, user_id: int, template_id: int, novel_id: Optional[int] = None) -> None:
+        """
+        记录模板使用事件
+
+        Args:
+            user_id: 用户ID
+            template_id: 模板ID
+            novel_id: 使用该模板的小说ID
+        """
+        with self._lock:
+            row = self._row_index.get(template_id)
+            if row is not None:
+                self._usage_counts[row] += 1
+
+            profile = self._profiles.get(user_id)
+            if profile is None:
+                return
+            self._apply_event(profile, template_id, USAGE_WEIGHT)
+            profile.used_templates.add(template_id)
+            if novel_id is not None:
+                profile.used_by_novel.setdefault(novel_id, set()).add(template_id)
+
+    def record_favorite(self, user_id: int, template_id: int, is_favorited: bool) -> None:
+        """
+        记录收藏/取消收藏事件
+
+        Args:
+            user_id: 用户ID
+            template_id: 模板ID
+            is_favorited: 操作后是否处于收藏状态
+        """
+        with self._lock:
+            profile = self._profiles.get(user_id)
+            if profile is None:
+                return
+            if is_favorited and template_id not in profile.favorites:
+                profile.favorites.add(template_id)
+                self._apply_event(profile, template_id, FAVORITE_WEIGHT)
+            elif not is_favorited and template_id in profile.favorites:
+                profile.favorites.discard(template_id)
+                self._apply_event(profile, template_id, -FAVORITE_WEIGHT)
+
+    # ------------------------------------------------------------------
+    # 推荐
+    # ------------------------------------------------------------------
+
+    def _popularity(self) -> np.ndarray:
+        """归一化的流行度得分（0~1）"""
+        if not len(self._usage_counts):
+            return self._usage_counts
+        scaled = np.log1p(self._usage_counts)
+        peak = scaled.max()
+        return scaled / peak if peak > 0 else scaled
+
+    def _similarity(self, query: np.ndarray) -> np.ndarray:
+        """计算所有模板与查询向量的余弦相似度"""
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return np.zeros(len(self._template_ids), dtype=np.float64)
+        return (self._normalized @ (query / norm)).astype(np.float64)
+
+    def _expand(self, vector: np.ndarray) -> np.ndarray:
+        """沿共现关系扩展偏好向量"""
+        if not vector.any():
+            return vector
+        return vector + COOCCURRENCE_ALPHA * (vector @ self._cooccurrence)
+
+    def _top_k(self, scores: np.ndarray, limit: int) -> np.ndarray:
+        """选出得分最高的K个行（排除 -inf）"""
+        valid = np.flatnonzero(np.isfinite(scores))
+        if limit <= 0 or not len(valid):
+            return valid[:0]
+        if len(valid) > limit:
+            part = np.argpartition(-scores[valid], limit - 1)[:limit]
+            valid = valid[part]
+        # 得分相同按ID排序，保证结果稳定
+        order = np.lexsort((self._template_ids[valid], -scores[valid]))
+        return valid[order]
+
+    def recommend(
+        self,
+        db: Session,
+        user_id: int,
+        based_on: str = "popular",
+        novel_id: Optional[int] = None,
+        limit: int = 10,
+        exclude_used: bool = True,
+        novel_title: Optional[str] = None,
+        novel_genre: Optional[str] = None,
+        novel_characters: Optional[List[Tuple[Optional[List[str]], Optional[str]]]] = None
+    ) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        获取推荐的角色模板
+
+        Args:
+            db: 数据库会话
+            user_id: 当前用户ID
+            based_on: 推荐依据 (popular, usage_history, current_novel, similar)
+            novel_id: 小说ID
+            limit: 推荐数量
+            exclude_used: 是否排除该小说中已使用的模板
+            novel_title: 小说标题（基于小说推荐时使用）
+            novel_genre: 小说类型（基于小说推荐时使用）
+            novel_characters: 小说现有角色的 (标签, 角色类型) 列表
+
+        Returns:
+            (推荐模板字典列表, 推荐原因)
+        """
+        self._ensure_catalog(db)
+        profile = self._get_profile(db, user_id)
+
+        with self._lock:
+            self._refresh_vector(profile)
+            count = len(self._template_ids)
+            popularity = self._popularity()
+            scores = popularity.copy()
+            reason = "基于热门角色推荐"
+
+            if based_on == "usage_history":
+                if profile.template_weights and profile.vector is not None and profile.vector.any():
+                    similarity = self._similarity(self._expand(profile.vector))
+                    scores = (1 - POPULARITY_PRIOR) * similarity + POPULARITY_PRIOR * popularity
+                    reason = "基于您的使用历史推荐"
+                else:
+                    reason = "热门角色推荐"
+
+            elif based_on == "current_novel" and novel_id:
+                if novel_title is None:
+                    reason = "热门角色推荐"
+                else:
+                    novel_vector = np.zeros(len(self._feature_index), dtype=np.float32)
+                    novel_types = set()
+                    for tags, character_type in novel_characters or []:
+                        novel_vector += self._vector_for(tags or [], character_type)
+                        if character_type:
+                            novel_types.add(character_type)
+
+                    if novel_vector.any() or novel_types:
+                        complementary = [t for t in COMPLEMENTARY_TYPES if t not in novel_types]
+                        bonus = np.array(
+                            [COMPLEMENTARY_BONUS if t in complementary else 0.0 for t in self._character_types],
+                            dtype=np.float64
+                        )
+                        # 已有类型在相似度中不应加分，只保留标签相似
+                        for character_type in novel_types:
+                            column = self._feature_index.get(f"{TYPE_FEATURE_PREFIX}{character_type}")
+                            if column is not None:
+                                novel_vector[column] = 0.0
+                        similarity = self._similarity(self._expand(novel_vector))
+                        scores = similarity + bonus + POPULARITY_PRIOR * popularity
+                        reason = f"基于《{novel_title}》小说推荐"
+                    elif novel_genre:
+                        reason = f"适合{novel_genre}类型小说的角色"
+
+            elif based_on == "similar":
+                seeds = [
+                    self._row_index[t] for t in profile.favorites | profile.used_templates
+                    if t in self._row_index
+                ]
+                if seeds:
+                    centroid = self._normalized[seeds].mean(axis=0)
+                    scores = (1 - POPULARITY_PRIOR) * self._similarity(centroid) + POPULARITY_PRIOR * popularity
+                    scores[seeds] = -np.inf
+                    reason = "与您收藏和使用过的角色相似"
+
+            if exclude_used and novel_id:
+                for template_id in profile.used_by_novel.get(novel_id, ()):
+                    row = self._row_index.get(template_id)
+                    if row is not None:
+                        scores[row] = -np.inf
+
+            rows = self._top_k(scores, min(limit, count))
+            results = [self._build_result(row, float(scores[row]), profile) for row in rows]
+
+        return results, reason
+
+    def _build_result(self, row: int, score: float, profile: _UserProfile) -> Dict[str, Any]:
+        """根据缓存的摘要构建推荐结果"""
+        result = dict(self._summaries[row])
+        usage_count = int(self._usage_counts[row])
+        rating = float(self._ratings[row])
+        is_popular = bool(self._is_popular[row])
+        is_new = bool(self._is_new[row])
+        result.update({
+            "usage_count": usage_count,
+            "rating": rating,
+            "is_popular": is_popular,
+            "is_new": is_new,
+            "is_favorited": result["id"] in profile.favorites,
+            "recommendation_score": round(min(max(score, 0.0), 1.0), 4),
+            "fit_score": 0.7 + (0.3 * (rating / 5))
+        })
+
+        reasons = []
+        if is_popular:
+            reasons.append("热门角色")
+        if is_new:
+            reasons.append("新添加的角色")
+        character_type = self._character_types[row]
+        if character_type == "protagonist":
+            reasons.append("优秀的主角选择")
+        elif character_type == "antagonist":
+            reasons.append("出色的反派角色")
+        elif character_type == "supporting":
+            reasons.append("精彩的配角")
+        if not reasons:
+            reasons.append("可能适合您的故事")
+        result["recommendation_reasons"] = reasons
+        return result
+
+
+# 全局推荐引擎实例
+template_recommender = TemplateRecommender(
+    refresh_interval=settings.TEMPLATE_RECOMMENDER_REFRESH_SECONDS,
+    max_profiles=settings.TEMPLATE_RECOMMENDER_MAX_PROFILES,
+    profile_ttl=settings.TEMPLATE_RECOMMENDER_PROFILE_TTL_SECONDS
+)
+
+
+def get_template_recommender() -> TemplateRecommender:
+    """获取角色模板推荐引擎实例"""
+    return template_recommender
+
+
+# 任一工作进程修改模板后，各进程的推荐目录在下次推荐时重建
+get_invalidation_bus().subscribe(TEMPLATE_CATALOG, template_recommender.invalidate)
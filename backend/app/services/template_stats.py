@@ -0,0 +1,506 @@
+"""
+角色模板统计快照
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.shared_state import TEMPLATE_CATALOG, get_invalidation_bus
+from app.models.character import Character
+from app.models.character_template import (
+    CharacterTemplateDetail, CharacterTemplateFavorite, CharacterTemplateUsage
+)
+from app.models.novel import Novel
+from app.services.character_tag_index import template_tag_counts
+
+logger = logging.getLogger(__name__)
+
+POPULAR_TEMPLATE_LIMIT = 5
+TRENDING_TAG_LIMIT = 5
+USER_TAG_LIMIT = 3
+FILTER_OPTION_LIMIT = 20
+
+# 模板列表筛选面板展示的标签
+FILTER_TAGS = ["王者", "法师", "战士", "刺客", "坦克", "辅助", "射手", "善良", "邪恶", "中立"]
+
+# 小说类型显示名称
+GENRE_LABELS = {
+    "fantasy": "玄幻",
+    "romance": "言情",
+    "urban": "都市",
+    "historical": "历史",
+    "scifi": "科幻",
+    "wuxia": "武侠",
+    "xianxia": "仙侠",
+    "military": "军事",
+    "game": "游戏",
+    "suspense": "悬疑",
+    "other": "其他",
+}
+
+# 管理员列表计数维度：(性别, 角色类型, 是否热门, 是否新增)
+FacetKey = Tuple[Optional[str], Optional[str], Optional[bool], Optional[bool]]
+
+
+class _UserStats:
+    """单个用户的模板使用统计"""
+
+    def __init__(self, templates_used: int = 0, favorite_count: int = 0):
+        self.templates_used = templates_used
+        self.favorite_count = favorite_count
+        self.tag_counts: Dict[str, int] = {}
+        self.loaded_at = time.monotonic()
+
+
+class TemplateStatsSnapshot:
+    """
+    角色模板统计快照
+
+    在内存中物化模板总数、使用次数、热门模板、流行标签、类型分布、
+    管理员列表的筛选计数以及模板列表的筛选选项。使用、收藏与管理员事件会增量更新快照，并按
+    固定间隔与数据库对账；统计接口只读取快照，不再执行聚合查询。
+
+    用户统计按最近使用顺序保留至多 max_users 个，超过 user_ttl 秒或快照重建
+    时丢弃。数据库查询均在 _lock 之外执行，慢查询不会阻塞其他统计请求。
+    """
+
+    def __init__(self, refresh_interval: int = 300, max_users: int = 10000, user_ttl: int = 300):
+        self.refresh_interval = refresh_interval
+        self.max_users = max_users
+        self.user_ttl = user_ttl
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._dirty = True
+        self._built_at = 0.0
+
+        self._total_templates = 0
+        self._total_usages = 0
+        self._templates: Dict[int, Dict[str, Any]] = {}
+        self._popular_ids: List[int] = []
+        self._tag_weights: Dict[str, int] = {}
+        self._trending_tags: List[str] = []
+        self._genre_usages: Dict[str, int] = {}
+        self._facet_counts: Dict[FacetKey, int] = {}
+        self._filter_options: Dict[str, List[Tuple[str, int]]] = {}
+        self._users: "OrderedDict[int, _UserStats]" = OrderedDict()
+
+    # ------------------------------------------------------------------
+    # 快照构建
+    # ------------------------------------------------------------------
+
+    def invalidate(self) -> None:
+        """标记快照失效（管理员修改模板后调用），下次读取时重建"""
+        with self._lock:
+            self._dirty = True
+
+    def _is_stale(self) -> bool:
+        return self._dirty or time.monotonic() - self._built_at > self.refresh_interval
+
+    def _ensure_fresh(self, db: Session) -> None:
+        """确保快照可用，并定期与数据库对账（同一时间只有一个线程重建，重建期间读取旧快照）"""
+        if not self._is_stale():
+            return
+        with self._build_lock:
+            if self._is_stale():
+                self.rebuild(db)
+
+    def rebuild(self, db: Session) -> None:
+        """
+        从数据库全量重建统计快照
+
+        Args:
+            db: 数据库会话
+        """
+        rows = db.query(
+            Character.id,
+            Character.name,
+            Character.gender,
+            Character.character_type,
+            Character.tags,
+            Character.description,
+            Character.power_system,
+            Character.original_world,
+            CharacterTemplateDetail.id.label("detail_id"),
+            CharacterTemplateDetail.usage_count,
+            CharacterTemplateDetail.rating,
+            CharacterTemplateDetail.is_popular,
+            CharacterTemplateDetail.is_new
+        ).outerjoin(
+            CharacterTemplateDetail,
+            Character.id == CharacterTemplateDetail.character_id
+        ).filter(
+            Character.is_template == True
+        ).all()
+
+        total_usages = db.query(func.sum(CharacterTemplateDetail.usage_count)).scalar() or 0
+
+        genre_rows = db.query(
+            Novel.genre, func.count(CharacterTemplateUsage.id)
+        ).join(
+            Novel, Novel.id == CharacterTemplateUsage.novel_id
+        ).group_by(Novel.genre).all()
+
+        templates: Dict[int, Dict[str, Any]] = {}
+        tag_weights: Dict[str, int] = {}
+        facet_counts: Dict[FacetKey, int] = {}
+        gender_counts: Dict[str, int] = {}
+        power_system_counts: Dict[str, int] = {}
+        world_counts: Dict[str, int] = {}
+
+        for row in rows:
+            has_detail = row.detail_id is not None
+            usage_count = row.usage_count or 0
+            description = row.description
+            if description and len(description) > 100:
+                description = description[:100] + "..."
+
+            templates[row.id] = {
+                "id": row.id,
+                "name": row.name,
+                "gender": row.gender,
+                "character_type": row.character_type,
+                "tags": row.tags or [],
+                "description": description,
+                "is_template": True,
+                "has_detail": has_detail,
+                "usage_count": usage_count,
+                "rating": row.rating or 0.0,
+                "is_popular": bool(row.is_popular),
+                "is_new": bool(row.is_new)
+            }
+
+            for tag in dict.fromkeys(row.tags or []):
+                tag_weights[tag] = tag_weights.get(tag, 0) + 1 + usage_count
+
+            key = (
+                row.gender,
+                row.character_type,
+                row.is_popular if has_detail else None,
+                row.is_new if has_detail else None
+            )
+            facet_counts[key] = facet_counts.get(key, 0) + 1
+
+            if row.gender:
+                gender_counts[row.gender] = gender_counts.get(row.gender, 0) + 1
+            if row.power_system:
+                power_system_counts[row.power_system] = power_system_counts.get(row.power_system, 0) + 1
+            if row.original_world:
+                world_counts[row.original_world] = world_counts.get(row.original_world, 0) + 1
+
+        filter_options = {
+            "genders": sorted(gender_counts.items()),
+            "power_systems": self._top_counts(power_system_counts),
+            "worldviews": self._top_counts(world_counts),
+            "tags": sorted(
+                template_tag_counts(db, FILTER_TAGS),
+                key=lambda entry: FILTER_TAGS.index(entry[0])
+            )
+        }
+
+        with self._lock:
+            self._templates = templates
+            self._total_templates = len(templates)
+            self._total_usages = int(total_usages)
+            self._tag_weights = tag_weights
+            self._facet_counts = facet_counts
+            self._filter_options = filter_options
+            self._genre_usages = {
+                self._genre_key(genre): count for genre, count in genre_rows if genre
+            }
+            self._popular_ids = sorted(
+                (tid for tid, item in templates.items() if item["has_detail"]),
+                key=lambda tid: templates[tid]["usage_count"],
+                reverse=True
+            )[:POPULAR_TEMPLATE_LIMIT]
+            self._trending_tags = sorted(
+                tag_weights, key=lambda tag: tag_weights[tag], reverse=True
+            )[:TRENDING_TAG_LIMIT]
+            # 用户统计在下次访问时重新加载
+            self._users.clear()
+            self._dirty = False
+            self._built_at = time.monotonic()
+
+        logger.info(f"角色模板统计快照已构建: {len(templates)}个模板")
+
+    @staticmethod
+    def _genre_key(genre: Any) -> str:
+        """将小说类型统一为字符串"""
+        return genre.value if hasattr(genre, "value") else str(genre)
+
+    @staticmethod
+    def _top_counts(counts: Dict[str, int], limit: int = FILTER_OPTION_LIMIT) -> List[Tuple[str, int]]:
+        """按计数降序取前 limit 个取值"""
+        return sorted(counts.items(), key=lambda entry: (-entry[1], entry[0]))[:limit]
+
+    @staticmethod
+    def _promote(top: List[Any], key: Any, weights: Dict[Any, int], limit: int) -> List[Any]:
+        """
+        在权重只增不减的前提下维护 Top-N 列表
+
+        Args:
+            top: 当前Top-N列表
+            key: 权重刚刚增加的元素
+            weights: 元素权重
+            limit: 列表长度上限
+
+        Returns:
+            更新后的Top-N列表
+        """
+        if key in top:
+            candidates = top
+        elif len(top) < limit or weights[key] > weights[top[-1]]:
+            candidates = top + [key]
+        else:
+            return top
+        return sorted(candidates, key=lambda item: weights[item], reverse=True)[:limit]
+
+    def _cached_user(self, user_id: int) -> Optional[_UserStats]:
+        """取出未过期的用户统计并标记为最近使用（调用方需持有 _lock）"""
+        stats = self._users.get(user_id)
+        if stats is None:
+            return None
+        if time.monotonic() - stats.loaded_at > self.user_ttl:
+            del self._users[user_id]
+            return None
+        self._users.move_to_end(user_id)
+        return stats
+
+    def _load_user(self, db: Session, user_id: int) -> _UserStats:
+        """获取单个用户的统计，未加载或已过期时从数据库加载（查询不持有 _lock）"""
+        with self._lock:
+            stats = self._cached_user(user_id)
+        if stats is not None:
+            return stats
+
+        template_ids = [
+            row[0] for row in db.query(CharacterTemplateUsage.template_id).filter(
+                CharacterTemplateUsage.user_id == user_id
+            ).all()
+        ]
+        favorite_count = db.query(func.count(CharacterTemplateFavorite.id)).filter(
+            CharacterTemplateFavorite.user_id == user_id
+        ).scalar() or 0
+
+        with self._lock:
+            # 并发加载时保留先写入的统计，之后的增量事件都记在它上面
+            existing = self._cached_user(user_id)
+            if existing is not None:
+                return existing
+            stats = _UserStats(len(template_ids), favorite_count)
+            for template_id in template_ids:
+                self._add_user_tags(stats, template_id)
+            self._users[user_id] = stats
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return stats
+
+    def _add_user_tags(self, stats: _UserStats, template_id: int) -> None:
+        """累加用户使用过的模板标签"""
+        item = self._templates.get(template_id)
+        if item is None:
+            return
+        for tag in dict.fromkeys(item["tags"]):
+            stats.tag_counts[tag] = stats.tag_counts.get(tag, 0) + 1
+
+    # ------------------------------------------------------------------
+    # 事件
+    # ------------------------------------------------------------------
+
+    def _bump_template(self, template_id: int) -> None:
+        """模板使用次数加一，并维护热门模板与流行标签"""
+        item = self._templates.get(template_id)
+        if item is None or not item["has_detail"]:
+            return
+
+        self._total_usages += 1
+        item["usage_count"] += 1
+        usage_weights = {tid: self._templates[tid]["usage_count"] for tid in self._popular_ids}
+        usage_weights[template_id] = item["usage_count"]
+        self._popular_ids = self._promote(
+            self._popular_ids, template_id, usage_weights, POPULAR_TEMPLATE_LIMIT
+        )
+
+        for tag in dict.fromkeys(item["tags"]):
+            self._tag_weights[tag] = self._tag_weights.get(tag, 0) + 1
+            self._trending_tags = self._promote(
+                self._trending_tags, tag, self._tag_weights, TRENDING_TAG_LIMIT
+            )
+
+    def record_usage(self, user_id: int, template_id: int, novel_genre: Any = None) -> None:
+        """
+        记录模板使用事件
+
+        Args:
+            user_id: 用户ID
+            template_id: 模板ID
+            novel_genre: 使用模板的小说类型
+        """
+        with self._lock:
+            if self._dirty:
+                return
+            self._bump_template(template_id)
+
+            if novel_genre:
+                genre = self._genre_key(novel_genre)
+                self._genre_usages[genre] = self._genre_usages.get(genre, 0) + 1
+
+            stats = self._users.get(user_id)
+            if stats is not None:
+                stats.templates_used += 1
+                self._add_user_tags(stats, template_id)
+
+    def record_view(self, template_id: int) -> None:
+        """记录模板详情查看（详情查看同样计入使用次数）"""
+        with self._lock:
+            if not self._dirty:
+                self._bump_template(template_id)
+
+    def record_favorite(self, user_id: int, is_favorited: bool) -> None:
+        """
+        记录收藏/取消收藏事件
+
+        Args:
+            user_id: 用户ID
+            is_favorited: 操作后是否处于收藏状态
+        """
+        with self._lock:
+            stats = self._users.get(user_id)
+            if stats is not None:
+                stats.favorite_count = max(stats.favorite_count + (1 if is_favorited else -1), 0)
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def get_stats(self, db: Session, user_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        获取模板统计
+
+        Args:
+            db: 数据库会话（仅在快照需要重建时使用）
+            user_id: 当前用户ID
+
+        Returns:
+            与 GetTemplateStatsResponse 对应的统计字典
+        """
+        self._ensure_fresh(db)
+        stats = self._load_user(db, user_id) if user_id is not None else None
+
+        with self._lock:
+            popular_templates = []
+            for template_id in self._popular_ids:
+                item = dict(self._templates[template_id])
+                item.pop("has_detail")
+                popular_templates.append(item)
+
+            usage_by_genre = [
+                {"genre": GENRE_LABELS.get(genre, genre), "usage_count": count}
+                for genre, count in sorted(
+                    self._genre_usages.items(), key=lambda entry: entry[1], reverse=True
+                )
+            ]
+
+            result = {
+                "total_templates": self._total_templates,
+                "total_usages": self._total_usages,
+                "popular_templates": popular_templates,
+                "trending_tags": list(self._trending_tags),
+                "usage_by_genre": usage_by_genre,
+                "user_stats": None
+            }
+
+            if stats is not None:
+                most_used_tags = sorted(
+                    stats.tag_counts, key=lambda tag: stats.tag_counts[tag], reverse=True
+                )[:USER_TAG_LIMIT]
+                result["user_stats"] = {
+                    "templates_used": stats.templates_used,
+                    "favorite_count": stats.favorite_count,
+                    "most_used_tags": most_used_tags
+                }
+
+        return result
+
+    def count_templates(
+        self,
+        db: Session,
+        gender: Optional[str] = None,
+        character_type: Optional[str] = None,
+        is_popular: Optional[bool] = None,
+        is_new: Optional[bool] = None
+    ) -> int:
+        """
+        按筛选条件统计模板数量（管理员列表使用）
+
+        Args:
+            db: 数据库会话（仅在快照需要重建时使用）
+            gender: 性别筛选
+            character_type: 角色类型筛选
+            is_popular: 是否热门
+            is_new: 是否新增
+
+        Returns:
+            满足条件的模板数量
+        """
+        self._ensure_fresh(db)
+
+        with self._lock:
+            total = 0
+            for (key_gender, key_type, key_popular, key_new), count in self._facet_counts.items():
+                if gender and key_gender != gender:
+                    continue
+                if character_type and key_type != character_type:
+                    continue
+                if is_popular is not None and key_popular != is_popular:
+                    continue
+                if is_new is not None and key_new != is_new:
+                    continue
+                total += count
+            return total
+
+    def get_filter_options(self, db: Session) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        获取模板列表的筛选选项及计数（性别、力量体系、世界观、标签）
+
+        Args:
+            db: 数据库会话（仅在快照需要重建时使用）
+
+        Returns:
+            维度 -> [{"value", "label", "count"}]
+        """
+        self._ensure_fresh(db)
+
+        with self._lock:
+            return {
+                facet: [
+                    {"value": value, "label": value, "count": count}
+                    for value, count in options
+                ]
+                for facet, options in self._filter_options.items()
+            }
+
+
+# 全局统计快照实例
+template_stats = TemplateStatsSnapshot(
+    refresh_interval=settings.TEMPLATE_STATS_REFRESH_SECONDS,
+    max_users=settings.TEMPLATE_STATS_MAX_USERS,
+    user_ttl=settings.TEMPLATE_STATS_USER_TTL_SECONDS
+)
+
+
+def get_template_stats_snapshot() -> TemplateStatsSnapshot:
+    """获取角色模板统计快照实例"""
+    return template_stats
+
+
+# 任一工作进程修改模板后，各进程的统计快照在下次读取时重建
+get_invalidation_bus().subscribe(TEMPLATE_CATALOG, template_stats.invalidate)
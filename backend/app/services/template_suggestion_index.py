@@ -0,0 +1,357 @@
+"""
+角色模板搜索建议索引
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.shared_state import TEMPLATE_CATALOG, get_invalidation_bus
+from app.models.character import Character
+from app.models.character_template import CharacterTemplateDetail
+
+logger = logging.getLogger(__name__)
+
+# 建议类型及每种类型返回的最大数量（与原有接口保持一致）
+SUGGESTION_LIMITS = (
+    ("character_name", 5),
+    ("power_system", 3),
+    ("tag", 3),
+    ("worldview", 2),
+    ("popular_query", 2),
+)
+
+# 搜索词出现多少次后视为热门搜索
+POPULAR_QUERY_MIN_COUNT = 2
+
+# 最多保留的历史搜索词数量
+MAX_QUERY_HISTORY = 2000
+
+TermKey = Tuple[str, str]
+
+
+class TemplateSuggestionIndex:
+    """
+    角色模板搜索建议索引
+
+    将模板名称、标签、力量体系、原生世界以及热门搜索词的所有后缀保存在
+    有序数组中，通过二分查找完成子串匹配。查询会取出全部匹配的词条，先按
+    类型排序再截取，结果与词条的插入顺序无关。模板变更与使用事件会增量更新
+    索引与权重，查询过程不访问数据库。
+    """
+
+    def __init__(self, refresh_interval: int = 600):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._built_at = 0.0
+
+        # (后缀, 偏移, 类型, 原文) 有序数组
+        self._suffixes: List[Tuple[str, int, str, str]] = []
+        # 词条 -> [模板数量, 权重]
+        self._terms: Dict[TermKey, List[int]] = {}
+        # 模板ID -> (词条列表, 使用次数)
+        self._templates: Dict[int, Tuple[List[TermKey], int]] = {}
+        # 历史搜索词 -> 次数
+        self._query_counts: Dict[str, int] = {}
+
+    # ------------------------------------------------------------------
+    # 索引构建
+    # ------------------------------------------------------------------
+
+    def _ensure_loaded(self, db: Session) -> None:
+        """确保索引已加载，并定期与数据库对账"""
+        if self._loaded and time.monotonic() - self._built_at <= self.refresh_interval:
+            return
+        with self._lock:
+            if not self._loaded or time.monotonic() - self._built_at > self.refresh_interval:
+                self.rebuild(db)
+
+    def invalidate(self) -> None:
+        """标记索引失效，下一次查询时从数据库重建（其他工作进程修改模板后调用）"""
+        with self._lock:
+            self._loaded = False
+
+    def rebuild(self, db: Session) -> None:
+        """
+        从数据库全量重建索引（保留热门搜索词）
+
+        Args:
+            db: 数据库会话
+        """
+        rows = db.query(
+            Character.id,
+            Character.name,
+            Character.tags,
+            Character.power_system,
+            Character.original_world,
+            CharacterTemplateDetail.usage_count
+        ).outerjoin(
+            CharacterTemplateDetail,
+            Character.id == CharacterTemplateDetail.character_id
+        ).filter(
+            Character.is_template == True
+        ).all()
+
+        with self._lock:
+            self._suffixes = []
+            self._terms = {}
+            self._templates = {}
+
+            for row in rows:
+                self._add_template(
+                    row.id, row.name, row.tags, row.power_system,
+                    row.original_world, row.usage_count or 0, sort=False
+                )
+
+            for query, count in self._query_counts.items():
+                if count >= POPULAR_QUERY_MIN_COUNT:
+                    self._add_term(("popular_query", query), count, sort=False)
+
+            self._suffixes.sort()
+            self._loaded = True
+            self._built_at = time.monotonic()
+
+        logger.info(f"角色模板搜索建议索引已构建: {len(rows)}个模板, {len(self._terms)}个词条")
+
+    @staticmethod
+    def _template_terms(
+        name: Optional[str],
+        tags: Optional[List[str]],
+        power_system: Optional[str],
+        original_world: Optional[str]
+    ) -> List[TermKey]:
+        """提取模板对应的索引词条"""
+        terms: List[TermKey] = []
+        if name:
+            terms.append(("character_name", name))
+        for tag in dict.fromkeys(tags or []):
+            if tag:
+                terms.append(("tag", str(tag)))
+        if power_system:
+            terms.append(("power_system", power_system))
+        if original_world:
+            terms.append(("worldview", original_world))
+        return terms
+
+    def _add_term(self, term: TermKey, weight: int, sort: bool = True) -> None:
+        """增加词条的模板计数与权重，新词条写入后缀数组"""
+        stats = self._terms.get(term)
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += weight
+            return
+
+        self._terms[term] = [1, weight]
+        term_type, text = term
+        lowered = text.lower()
+        for offset in range(len(lowered)):
+            entry = (lowered[offset:], offset, term_type, text)
+            if sort:
+                insort(self._suffixes, entry)
+            else:
+                self._suffixes.append(entry)
+
+    def _remove_term(self, term: TermKey, weight: int) -> None:
+        """减少词条的模板计数与权重，计数归零时移出后缀数组"""
+        stats = self._terms.get(term)
+        if stats is None:
+            return
+        stats[0] -= 1
+        stats[1] -= weight
+        if stats[0] > 0:
+            return
+
+        del self._terms[term]
+        term_type, text = term
+        lowered = text.lower()
+        for offset in range(len(lowered)):
+            entry = (lowered[offset:], offset, term_type, text)
+            position = bisect_left(self._suffixes, entry)
+            if position < len(self._suffixes) and self._suffixes[position] == entry:
+                del self._suffixes[position]
+
+    def _add_template(
+        self,
+        template_id: int,
+        name: Optional[str],
+        tags: Optional[List[str]],
+        power_system: Optional[str],
+        original_world: Optional[str],
+        usage_count: int,
+        sort: bool = True
+    ) -> None:
+        """将模板的全部词条加入索引"""
+        terms = self._template_terms(name, tags, power_system, original_world)
+        for term in terms:
+            self._add_term(term, usage_count, sort=sort)
+        self._templates[template_id] = (terms, usage_count)
+
+    def _drop_template(self, template_id: int) -> Optional[int]:
+        """将模板的全部词条移出索引，返回其使用次数"""
+        entry = self._templates.pop(template_id, None)
+        if entry is None:
+            return None
+        terms, usage_count = entry
+        for term in terms:
+            self._remove_term(term, usage_count)
+        return usage_count
+
+    # ------------------------------------------------------------------
+    # 增量更新
+    # ------------------------------------------------------------------
+
+    def upsert_template(self, template: Character, usage_count: Optional[int] = None) -> None:
+        """
+        新增或更新模板在索引中的词条
+
+        Args:
+            template: 模板角色
+            usage_count: 使用次数，为空时沿用索引中的记录
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            previous = self._drop_template(template.id)
+            if not template.is_template:
+                return
+            if usage_count is None:
+                usage_count = previous or 0
+            self._add_template(
+                template.id, template.name, template.tags,
+                template.power_system, template.original_world, usage_count
+            )
+
+    def remove_template(self, template_id: int) -> None:
+        """从索引中移除模板"""
+        with self._lock:
+            if self._loaded:
+                self._drop_template(template_id)
+
+    def record_usage(self, template_id: int, count: int = 1) -> None:
+        """
+        记录模板使用，提升其相关词条的权重
+
+        Args:
+            template_id: 模板ID
+            count: 增加的使用次数
+        """
+        with self._lock:
+            entry = self._templates.get(template_id)
+            if entry is None:
+                return
+            terms, usage_count = entry
+            for term in terms:
+                self._terms[term][1] += count
+            self._templates[template_id] = (terms, usage_count + count)
+
+    def record_query(self, query: str) -> None:
+        """
+        记录一次搜索词，达到阈值后作为热门搜索进入索引
+
+        Args:
+            query: 搜索关键词
+        """
+        query = (query or "").strip()
+        if not query or len(query) > 50:
+            return
+
+        with self._lock:
+            count = self._query_counts.get(query, 0) + 1
+            self._query_counts[query] = count
+
+            term = ("popular_query", query)
+            if self._loaded:
+                if count == POPULAR_QUERY_MIN_COUNT:
+                    self._add_term(term, count)
+                elif count > POPULAR_QUERY_MIN_COUNT:
+                    self._terms[term][1] = count
+
+            if len(self._query_counts) > MAX_QUERY_HISTORY:
+                # 淘汰搜索次数最少的一半历史
+                ordered = sorted(self._query_counts.items(), key=lambda item: item[1])
+                for stale, stale_count in ordered[:MAX_QUERY_HISTORY // 2]:
+                    del self._query_counts[stale]
+                    if self._loaded and stale_count >= POPULAR_QUERY_MIN_COUNT:
+                        self._remove_term(("popular_query", stale), 0)
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def suggest(self, db: Session, q: str) -> List[Dict[str, object]]:
+        """
+        获取搜索建议
+
+        Args:
+            db: 数据库会话（仅在索引未加载或需要对账时使用）
+            q: 搜索关键词
+
+        Returns:
+            建议列表，元素包含 text、type、match_count
+        """
+        self._ensure_loaded(db)
+
+        needle = q.strip().lower()
+        if not needle:
+            return []
+
+        with self._lock:
+            # offset 越小越好：前缀匹配优先于子串匹配
+            matches: Dict[TermKey, int] = {}
+            position = bisect_left(self._suffixes, (needle,))
+            while position < len(self._suffixes):
+                suffix, offset, term_type, text = self._suffixes[position]
+                if not suffix.startswith(needle):
+                    break
+                key = (term_type, text)
+                if key not in matches or offset < matches[key]:
+                    matches[key] = offset
+                position += 1
+
+            grouped: Dict[str, List[Tuple[int, int, int, str]]] = {}
+            for (term_type, text), offset in matches.items():
+                count, weight = self._terms[(term_type, text)]
+                grouped.setdefault(term_type, []).append(
+                    (0 if offset == 0 else 1, -weight, -count, text)
+                )
+
+        suggestions = []
+        for term_type, limit in SUGGESTION_LIMITS:
+            candidates = heapq.nsmallest(limit, grouped.get(term_type, []))
+            for _, weight, count, text in candidates:
+                if term_type == "character_name":
+                    match_count = 1
+                elif term_type == "popular_query":
+                    match_count = -weight
+                else:
+                    match_count = -count
+                suggestions.append({
+                    "text": text,
+                    "type": term_type,
+                    "match_count": match_count
+                })
+        return suggestions
+
+
+# 全局搜索建议索引实例
+template_suggestion_index = TemplateSuggestionIndex(
+    refresh_interval=settings.TEMPLATE_SUGGESTION_REFRESH_SECONDS
+)
+
+
+def get_template_suggestion_index() -> TemplateSuggestionIndex:
+    """获取角色模板搜索建议索引实例"""
+    return template_suggestion_index
+
+
+# 发出广播的工作进程已增量更新索引，只有其他进程需要重建
+get_invalidation_bus().subscribe(TEMPLATE_CATALOG, template_suggestion_index.invalidate, local=False)
@@ -0,0 +1,222 @@
+"""
+层级地图生成服务
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.worldview import WorldMap, Worldview
+from app.schemas.worldview import WorldMapTreeGenerationRequest
+from app.services.generation_service import get_generation_service
+from app.services.prompt_service import get_prompt_service
+from app.services.worldview_converter import WorldviewConverter
+
+logger = logging.getLogger(__name__)
+
+# 每层保存后返回的区域字段
+SAVED_REGION_FIELDS = ("region_name", "description", "climate", "terrain", "level", "parent_region_id")
+
+
+class WorldMapTreeGenerator:
+    """
+    层级地图生成器
+
+    从顶层（或指定区域）开始逐层向下展开：同一层所有区域的子区域并发生成
+    （并发数受 AI 服务的请求调度限制），每层生成结果用一次批量插入写入
+    world_maps 并提交，随后作为下一层的父区域。总耗时约为“层数 × 单次调用”，
+    与区域数量无关。生成过程以事件流的形式逐层返回进度。
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self._session_factory = session_factory
+
+    @staticmethod
+    def _load_paths(db: Session, worldview_id: int) -> Dict[int, List[str]]:
+        """一次查询世界观的全部区域，计算每个区域从顶层开始的名称路径"""
+        rows = db.query(WorldMap.id, WorldMap.region_name, WorldMap.parent_region_id).filter(
+            WorldMap.worldview_id == worldview_id
+        ).all()
+        nodes = {row.id: row for row in rows}
+        paths: Dict[int, List[str]] = {}
+
+        def resolve(region_id: int, seen: frozenset = frozenset()) -> List[str]:
+            if region_id in paths:
+                return paths[region_id]
+            node = nodes[region_id]
+            parent_id = node.parent_region_id
+            if parent_id in nodes and parent_id not in seen:
+                path = resolve(parent_id, seen | {region_id}) + [node.region_name]
+            else:
+                path = [node.region_name]
+            paths[region_id] = path
+            return path
+
+        for region_id in nodes:
+            resolve(region_id)
+        return paths
+
+    async def expand(
+        self,
+        worldview_id: int,
+        user_id: int,
+        request: WorldMapTreeGenerationRequest
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        逐层生成并保存地图区域
+
+        Args:
+            worldview_id: 世界观ID
+            user_id: 用户ID
+            request: 层级地图生成请求
+
+        Yields:
+            进度事件 {"event": 事件类型, "data": 事件数据}，事件类型依次为
+            started、level_started、level_completed（每层各一次）、completed，
+            出错时为 error
+        """
+        start_time = time.time()
+        db = self._session_factory()
+        try:
+            worldview = db.query(Worldview).filter(
+                Worldview.id == worldview_id,
+                Worldview.user_id == user_id
+            ).first()
+            if not worldview:
+                yield {"event": "error", "data": {"message": "世界观不存在或无权访问"}}
+                return
+            worldview_info = {"name": worldview.name, "description": worldview.description or ""}
+
+            frontier: List[Optional[Dict[str, Any]]] = [None]
+            level = 0
+            if request.root_region_id:
+                root = db.query(WorldMap).filter(
+                    WorldMap.id == request.root_region_id,
+                    WorldMap.worldview_id == worldview_id,
+                    WorldMap.user_id == user_id
+                ).first()
+                if not root:
+                    yield {"event": "error", "data": {"message": "起始区域不存在"}}
+                    return
+                frontier = [{
+                    "id": root.id,
+                    "region_name": root.region_name,
+                    "description": root.description,
+                    "climate": root.climate,
+                    "terrain": root.terrain,
+                    "level": root.level,
+                    "path": self._load_paths(db, worldview_id).get(root.id)
+                }]
+                level = root.level or 1
+
+            generation_service = get_generation_service(get_prompt_service(db))
+            remaining = settings.WORLD_MAP_TREE_MAX_REGIONS
+            total_saved = 0
+            levels_completed = 0
+
+            yield {"event": "started", "data": {
+                "worldview_id": worldview_id,
+                "root_region_id": request.root_region_id,
+                "depth": request.depth,
+                "branching": request.branching
+            }}
+
+            for _ in range(request.depth):
+                # 按区域总数上限为本层每个父区域分配生成数量
+                plan = []
+                for parent in frontier:
+                    count = min(request.branching, remaining)
+                    if count <= 0:
+                        break
+                    plan.append((parent, count))
+                    remaining -= count
+                if not plan:
+                    break
+
+                level += 1
+                yield {"event": "level_started", "data": {"level": level, "parent_count": len(plan)}}
+
+                results = await asyncio.gather(*(
+                    generation_service.generate_map_regions(
+                        worldview_info,
+                        parent_region=parent,
+                        count=count,
+                        include_features=request.include,
+                        suggestion=request.suggestion,
+                        user_id=user_id,
+                        db=db,
+                        temperature=request.temperature
+                    )
+                    for parent, count in plan
+                ), return_exceptions=True)
+
+                rows = []
+                failed_parents = []
+                errors = []
+                for (parent, count), result in zip(plan, results):
+                    parent_id = parent["id"] if parent else None
+                    if isinstance(result, BaseException):
+                        logger.warning(f"子区域生成失败: worldview_id={worldview_id}, parent_region_id={parent_id}, error={result}")
+                        failed_parents.append(parent_id)
+                        errors.append(result)
+                        remaining += count
+                        continue
+                    regions = result[:count]
+                    remaining += count - len(regions)
+                    rows.extend(WorldviewConverter.convert_map_regions(regions, level, parent_id))
+
+                if len(errors) == len(plan):
+                    raise errors[0]
+
+                saved = WorldviewConverter.insert_rows(
+                    db, "world_maps", rows, worldview_id, user_id, returning=SAVED_REGION_FIELDS
+                )
+                db.commit()
+
+                paths = {parent["id"]: parent["path"] for parent, _ in plan if parent}
+                frontier = []
+                for region in saved:
+                    parent_path = paths.get(region["parent_region_id"]) or []
+                    region["path"] = parent_path + [region["region_name"]]
+                    frontier.append(region)
+
+                total_saved += len(saved)
+                levels_completed += 1
+                yield {"event": "level_completed", "data": {
+                    "level": level,
+                    "regions": saved,
+                    "failed_parent_ids": failed_parents,
+                    "total_saved": total_saved
+                }}
+                if not frontier:
+                    break
+
+            yield {"event": "completed", "data": {
+                "worldview_id": worldview_id,
+                "levels": levels_completed,
+                "total_count": total_saved,
+                "generation_time": round(time.time() - start_time, 2)
+            }}
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"层级地图生成失败: worldview_id={worldview_id}, error={str(e)}")
+            yield {"event": "error", "data": {"message": f"层级地图生成失败: {str(e)}"}}
+        finally:
+            db.close()
+
+
+# 全局层级地图生成器实例
+world_map_tree_generator = WorldMapTreeGenerator()
+
+
+def get_world_map_tree_generator() -> WorldMapTreeGenerator:
+    """获取层级地图生成器实例"""
+    return world_map_tree_generator
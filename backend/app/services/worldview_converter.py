@@ -6,21 +6,247 @@ Created: 2025-06-03
 """
 
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+from typing_extensions import Annotated, TypedDict
+from pydantic import (
+    AliasChoices, AliasPath, BeforeValidator, Field, TypeAdapter,
+    ValidationError, ValidationInfo, WrapValidator, model_validator
+)
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app.core.spans import timed
+from app.models.worldview import WorldMap, CultivationSystem, History, Faction
 from app.schemas.ai_worldview import AIWorldviewResponse
 from app.schemas.worldview import (
     WorldMapResponse, CultivationSystemResponse, 
     HistoryResponse, FactionResponse,
     GeneratedWorldBase, GeneratedPowerSystem,
-    GeneratedLocation, GeneratedEra, GeneratedArtifact
+    GeneratedLocation, GeneratedEra, GeneratedArtifact,
+    SimpleMapRegion, SimpleFaction
 )
 
 logger = logging.getLogger(__name__)
 
+# 数据库格式中的子表名与模型的对应关系（按插入顺序）
+DATABASE_MODELS = {
+    "world_maps": WorldMap,
+    "cultivation_systems": CultivationSystem,
+    "histories": History,
+    "factions": Faction
+}
+
+
+def _join_items(items: Any, separator: str = ", ") -> str:
+    """将AI返回的列表（元素可能是字符串或带name的字典）拼接为文本"""
+    if not isinstance(items, list):
+        return ""
+    return separator.join(
+        str(item.get("name") or item.get("description") or "") if isinstance(item, dict) else str(item)
+        for item in items
+    )
+
+
+def _to_text(value: Any) -> str:
+    """宽松转换为字符串：None 为空串，字典取 name/description，列表拼接"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return _to_text(value.get("name") or value.get("description"))
+    if isinstance(value, (list, tuple)):
+        return "、".join(text for text in (_to_text(item) for item in value) if text)
+    return str(value)
+
+
+def _has_content(section: Any) -> bool:
+    """部分是否为至少包含一个非空字段的对象"""
+    return isinstance(section, dict) and any(
+        value not in (None, "", [], {}) for value in section.values()
+    )
+
+
+def _to_text_list(value: Any) -> List[str]:
+    """宽松转换为字符串列表：单个值包装为列表，空值被丢弃"""
+    if value is None:
+        return []
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    return [text for text in (_to_text(item) for item in value) if text]
+
+
+def _to_level(value: Any) -> Any:
+    """等级可以只给名称，此时补全为等级字典"""
+    if isinstance(value, dict):
+        return {"name": _to_text(value.get("name")), "description": _to_text(value.get("description"))}
+    name = _to_text(value)
+    return {"name": name, "description": f"{name}等级"}
+
+
+def _to_event(value: Any) -> Any:
+    """历史事件统一为 {name, description}"""
+    if isinstance(value, dict):
+        name = _to_text(value.get("name") or value.get("description"))
+        return {"name": name, "description": _to_text(value.get("description")) or name}
+    text = _to_text(value)
+    return {"name": text, "description": text}
+
+
+def _lenient_items(value: Any, handler: Any, info: ValidationInfo) -> List[Any]:
+    """逐条校验列表，跳过无法转换的条目并记录到校验上下文的 errors 中"""
+    errors = info.context.get("errors") if isinstance(info.context, dict) else None
+    if value is None:
+        return []
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    items = []
+    for index, item in enumerate(value):
+        try:
+            items.extend(handler([item]))
+        except ValidationError as e:
+            if errors is not None:
+                reason = "; ".join(error["msg"] for error in e.errors())
+                errors.append(f"{info.field_name}[{index}]: {reason}")
+    return items
+
+
+def _lenient_section(value: Any, handler: Any, info: ValidationInfo) -> Any:
+    """校验单个部分，无法转换时使用空内容并记录到校验上下文的 errors 中"""
+    errors = info.context.get("errors") if isinstance(info.context, dict) else None
+    if not isinstance(value, dict):
+        if value is not None and errors is not None:
+            errors.append(f"{info.field_name}: 期望对象，实际为{type(value).__name__}")
+        return handler({})
+    try:
+        return handler(value)
+    except ValidationError as e:
+        if errors is not None:
+            errors.append(f"{info.field_name}: {'; '.join(error['msg'] for error in e.errors())}")
+        return handler({})
+
+
+Text = Annotated[str, BeforeValidator(_to_text)]
+TextList = Annotated[List[str], BeforeValidator(_to_text_list)]
+
+
+class _NamedItem:
+    """条目只给出名称字符串时补全为字典"""
+
+    @model_validator(mode="before")
+    @classmethod
+    def _from_name(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            return {"name": value}
+        return value
+
+
+class _WorldBase(GeneratedWorldBase):
+    name: Text = Field("未命名世界", description="世界名称")
+    description: Text = Field("", description="世界描述")
+    background: Text = Field("", description="历史背景和基础设定")
+    rules: TextList = Field(default_factory=list, description="核心规则")
+    characteristics: TextList = Field(default_factory=list, description="世界特色")
+
+
+class _MapRegion(_NamedItem, SimpleMapRegion):
+    name: Text = Field(..., description="区域名称")
+    description: Text = Field("", description="区域描述")
+    climate: Text = Field("", description="气候特征")
+    notable_features: TextList = Field(default_factory=list, description="显著特征")
+
+
+class _Location(_NamedItem, GeneratedLocation):
+    name: Text = Field(..., description="地点名称")
+    description: Text = Field("", description="地点描述")
+    significance: Text = Field("", description="地点重要性")
+    mysteries: TextList = Field(default_factory=list, description="相关谜团")
+
+
+class _PowerSystem(GeneratedPowerSystem):
+    name: Text = Field("", description="体系名称")
+    description: Text = Field("", description="体系描述")
+    levels: Annotated[List[Annotated[dict, BeforeValidator(_to_level)]], WrapValidator(_lenient_items)] = Field(
+        default_factory=list, description="等级体系"
+    )
+    unique_features: TextList = Field(default_factory=list, description="特色功能")
+    cultivation_methods: TextList = Field(default_factory=list, description="修炼方法")
+
+
+class _Era(_NamedItem, GeneratedEra):
+    name: Text = Field(..., description="时代名称")
+    description: Text = Field("", description="时代概述")
+    major_events: Annotated[List[Annotated[dict, BeforeValidator(_to_event)]], WrapValidator(_lenient_items)] = Field(
+        default_factory=list, validation_alias=AliasChoices("major_events", "key_events"), description="重大事件"
+    )
+
+
+class _Artifact(_NamedItem, GeneratedArtifact):
+    name: Text = Field(..., description="神器名称")
+    description: Text = Field("", description="描述")
+    powers: TextList = Field(default_factory=list, description="能力列表")
+    history: Text = Field("", validation_alias=AliasChoices("history", "significance"), description="来历")
+
+
+class _Faction(_NamedItem, SimpleFaction):
+    name: Text = Field(..., description="阵营名称")
+    description: Text = Field("", description="组织描述")
+    ideology: Text = Field("", description="理念目标")
+    alliance: Text = Field("", validation_alias=AliasChoices("alliance", "allies"), description="联盟关系")
+
+
+class _ConvertedWorldview(TypedDict):
+    """AI响应结构到生成响应结构的映射（一次校验完成转换）"""
+    worldview: Annotated[_WorldBase, WrapValidator(_lenient_section), Field(default_factory=_WorldBase, validation_alias="world_base")]
+    world_maps: Annotated[List[_MapRegion], WrapValidator(_lenient_items), Field(
+        default_factory=list, validation_alias=AliasChoices(AliasPath("geography", "map_regions"), "world_maps")
+    )]
+    special_locations: Annotated[List[_Location], WrapValidator(_lenient_items), Field(
+        default_factory=list, validation_alias=AliasChoices(AliasPath("geography", "special_locations"), "special_locations")
+    )]
+    cultivation_system: Annotated[_PowerSystem, WrapValidator(_lenient_section), Field(
+        default_factory=_PowerSystem, validation_alias=AliasChoices("power_system", "cultivation_system")
+    )]
+    histories: Annotated[List[_Era], WrapValidator(_lenient_items), Field(
+        default_factory=list, validation_alias=AliasChoices(AliasPath("history", "eras"), "histories")
+    )]
+    artifacts: Annotated[List[_Artifact], WrapValidator(_lenient_items), Field(
+        default_factory=list, validation_alias=AliasChoices(AliasPath("history", "significant_artifacts"), "artifacts")
+    )]
+    factions: Annotated[List[_Faction], WrapValidator(_lenient_items), Field(default_factory=list)]
+
+
+_conversion_adapter = TypeAdapter(_ConvertedWorldview)
+
 
 class WorldviewConverter:
     """世界观数据转换器"""
     
+    @staticmethod
+    @timed("worldview_convert")
+    def convert(ai_response: Any) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        一次遍历将AI原始响应校验并转换为生成响应格式
+        
+        字段按 validation_alias 从AI结构映射到响应结构，字符串与列表宽松转换，
+        无法转换的条目被跳过并记录，不影响其余内容。
+        
+        Args:
+            ai_response: AI返回的原始数据
+            
+        Returns:
+            (转换后的数据, 被跳过的字段或条目及原因)
+            
+        Raises:
+            ValueError: 响应不是JSON对象，或缺少世界基础设定（world_base）
+        """
+        if not isinstance(ai_response, dict):
+            raise ValueError(f"数据转换失败: 期望JSON对象，实际为{type(ai_response).__name__}")
+        if not _has_content(ai_response.get("world_base")):
+            raise ValueError("数据转换失败: 响应中缺少世界基础设定（world_base）")
+        errors: List[str] = []
+        converted = _conversion_adapter.validate_python(ai_response, context={"errors": errors})
+        return converted, errors
+    
     @staticmethod
     def convert_ai_response(ai_response: Dict[str, Any], user_id: int, novel_id: int) -> Dict[str, Any]:
         """
@@ -33,105 +259,42 @@ class WorldviewConverter:
             
         Returns:
             转换后的数据
-        """
-        try:
-            # 解析AI响应
-            parsed_response = AIWorldviewResponse(**ai_response)
-            
-            # 转换基础世界信息
-            worldview = GeneratedWorldBase(
-                name=parsed_response.world_base.name,
-                description=parsed_response.world_base.description,
-                background=parsed_response.world_base.background,
-                rules=parsed_response.world_base.rules,
-                characteristics=parsed_response.world_base.characteristics
-            )
-            
-            # 转换地理信息 - 保持原始格式用于前端显示
-            world_maps = []
-            for region in parsed_response.geography.map_regions:
-                world_maps.append({
-                    "name": region.name,
-                    "description": region.description,
-                    "climate": region.climate or "",
-                    "notable_features": region.notable_features or []
-                })
-            
-            # 转换特殊地点
-            special_locations = [
-                GeneratedLocation(
-                    name=loc.name,
-                    description=loc.description,
-                    significance=loc.significance or "",  # 处理可能缺失的significance字段
-                    mysteries=[]  # AI响应中没有mysteries字段
-                ) for loc in parsed_response.geography.special_locations
-            ]
-            
-            # 转换力量体系
-            cultivation_system = GeneratedPowerSystem(
-                name=parsed_response.power_system.name,
-                description=parsed_response.power_system.description,
-                levels=[
-                    {
-                        "name": level.name,
-                        "description": level.description
-                    } for level in parsed_response.power_system.levels
-                ],
-                unique_features=[
-                    feature.name if hasattr(feature, 'name') else str(feature)
-                    for feature in parsed_response.power_system.unique_features
-                ],
-                cultivation_methods=[
-                    method.name for method in parsed_response.power_system.cultivation_methods
-                ]
-            )
-            
-            # 转换历史信息
-            histories = [
-                GeneratedEra(
-                    name=era.name,
-                    description=era.description,
-                    major_events=[
-                        {"name": event, "description": event} for event in era.key_events
-                    ]
-                ) for era in parsed_response.history.eras
-            ]
-            
-            # 转换神器
-            artifacts = [
-                GeneratedArtifact(
-                    name=artifact.name,
-                    description=artifact.description,
-                    powers=artifact.powers or [],  # 使用AI返回的powers字段
-                    history=artifact.significance or ""  # 使用significance字段作为历史
-                ) for artifact in parsed_response.history.significant_artifacts
-            ]
-            
-            # 转换阵营 - 保持原始格式用于前端显示
-            factions = []
-            for faction in parsed_response.factions:
-                factions.append({
-                    "name": faction.name,
-                    "description": faction.description,
-                    "ideology": faction.ideology or "",
-                    "powers_and_abilities": faction.powers_and_abilities or [],
-                    "structure": faction.structure or "",
-                    "notable_members": faction.notable_members or []
-                })
             
-            return {
-                "worldview": worldview,
-                "world_maps": world_maps,
-                "special_locations": special_locations,
-                "cultivation_system": cultivation_system,
-                "histories": histories,
-                "artifacts": artifacts,
-                "factions": factions
-            }
+        Raises:
+            ValueError: 响应不是JSON对象，或缺少世界基础设定（world_base）
+        """
+        converted, errors = WorldviewConverter.convert(ai_response)
+        if errors:
+            logger.warning(f"世界观数据转换跳过{len(errors)}项（小说ID: {novel_id}）: {'; '.join(errors)}")
+        return converted
+    
+    @staticmethod
+    def merge_sections(sections: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        将分段生成的各部分合并为完整的AI响应结构（缺失的部分以空内容补齐）
+        
+        Args:
+            sections: 部分名 -> 该部分的生成结果（world_base、geography、
+                power_system、history、factions、artifacts）
             
-        except Exception as e:
-            logger.error(f"世界观数据转换失败: {str(e)}")
-            raise ValueError(f"数据转换失败: {str(e)}")
+        Returns:
+            与 AIWorldviewResponse 结构一致的字典
+        """
+        geography = sections.get("geography") or {}
+        history = sections.get("history") or {}
+        return {
+            "world_base": sections["world_base"],
+            "geography": {
+                "map_regions": geography.get("map_regions", []),
+                "special_locations": geography.get("special_locations", [])
+            },
+            "power_system": sections.get("power_system") or {"name": "", "description": ""},
+            "history": {
+                "eras": history.get("eras", []),
+                "significant_artifacts": (sections.get("artifacts") or {}).get("artifacts", [])
+            },
+            "factions": (sections.get("factions") or {}).get("factions", [])
+        }
     
     @staticmethod
     def convert_to_database_format(ai_response: Dict[str, Any], worldview_id: int, user_id: int) -> Dict[str, List]:
@@ -217,4 +380,231 @@ class WorldviewConverter:
             
         except Exception as e:
             logger.error(f"数据库格式转换失败: {str(e)}")
-            raise ValueError(f"数据库格式转换失败: {str(e)}")
\ No newline at end of file
+            raise ValueError(f"数据库格式转换失败: {str(e)}")
+
+    @staticmethod
+    def convert_map_regions(
+        regions: List[Any],
+        level: int = 1,
+        parent_region_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        将前端提交的地图区域转换为数据库行
+
+        Args:
+            regions: 地图区域列表
+            level: 区域层级
+            parent_region_id: 父区域ID
+
+        Returns:
+            world_maps 表的行字典列表
+        """
+        rows = []
+        for region in regions:
+            if not isinstance(region, dict):
+                logger.warning(f"跳过无效的地图区域数据: {region!r}")
+                continue
+            description = region.get("description") or ""
+            features = _join_items(region.get("notable_features"))
+            if features:
+                description += f"\n\n特色地点：{features}"
+            rows.append({
+                "region_name": region.get("name") or "",
+                "description": description,
+                "climate": region.get("climate") or None,
+                "terrain": region.get("terrain") or None,
+                "resources": region.get("resources") or None,
+                "population": region.get("population") or None,
+                "culture": region.get("culture") or None,
+                "parent_region_id": parent_region_id,
+                "level": level
+            })
+        return rows
+
+    @staticmethod
+    def convert_cultivation_levels(
+        system_name: str,
+        levels: List[Any],
+        default_method: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        将修炼体系的等级列表转换为数据库行
+
+        Args:
+            system_name: 体系名称
+            levels: 等级列表（字典或等级名称）
+            default_method: 等级未提供修炼方法时使用的体系级描述
+
+        Returns:
+            cultivation_systems 表的行字典列表
+        """
+        rows = []
+        for idx, level in enumerate(levels):
+            if isinstance(level, dict):
+                rows.append({
+                    "system_name": system_name,
+                    "level_name": level.get("name") or f"第{idx + 1}级",
+                    "description": level.get("description") or "",
+                    "level_order": idx + 1,
+                    "cultivation_method": level.get("cultivation_method") or default_method,
+                    "required_resources": level.get("required_resources") or None,
+                    "breakthrough_condition": level.get("breakthrough_condition") or None,
+                    "power_description": level.get("power_description") or None
+                })
+            else:
+                rows.append({
+                    "system_name": system_name,
+                    "level_name": str(level),
+                    "description": f"{level}等级",
+                    "level_order": idx + 1,
+                    "cultivation_method": default_method,
+                    "required_resources": None,
+                    "breakthrough_condition": None,
+                    "power_description": None
+                })
+        return rows
+
+    @staticmethod
+    def convert_generated_to_database_format(generated_data: Dict[str, Any]) -> Dict[str, List]:
+        """
+        将前端提交的生成结果（convert_ai_response 的输出格式）转换为数据库格式
+
+        Args:
+            generated_data: 生成结果，包含 world_maps、cultivation_system、histories、factions
+
+        Returns:
+            与 convert_to_database_format 相同结构的数据库格式数据
+
+        Raises:
+            ValueError: 缺少世界观基础信息（worldview）
+        """
+        if not _has_content(generated_data.get("worldview")):
+            raise ValueError("生成结果中缺少世界观基础信息（worldview）")
+
+        world_maps = WorldviewConverter.convert_map_regions(generated_data.get("world_maps") or [])
+
+        cultivation_systems = []
+        cultivation_system = generated_data.get("cultivation_system") or {}
+        if isinstance(cultivation_system, dict) and cultivation_system:
+            system_description = cultivation_system.get("description") or ""
+            unique_features = _join_items(cultivation_system.get("unique_features"))
+            cultivation_methods = _join_items(cultivation_system.get("cultivation_methods"))
+            if unique_features:
+                system_description += f"\n\n特色功能：{unique_features}"
+            if cultivation_methods:
+                system_description += f"\n\n修炼方法：{cultivation_methods}"
+            cultivation_systems = WorldviewConverter.convert_cultivation_levels(
+                cultivation_system.get("name") or "未命名修炼体系",
+                cultivation_system.get("levels") or [],
+                default_method=system_description or None
+            )
+
+        histories = []
+        for idx, era in enumerate(generated_data.get("histories") or []):
+            if not isinstance(era, dict):
+                logger.warning(f"跳过无效的历史数据: {era!r}")
+                continue
+            description = era.get("description") or ""
+            major_events = _join_items(era.get("major_events"), "; ")
+            if major_events:
+                description += f"\n\n重大事件：{major_events}"
+            histories.append({
+                "event_name": era.get("name") or f"历史事件{idx + 1}",
+                "time_period": era.get("time_period") or None,
+                "time_order": idx + 1,
+                "event_type": None,
+                "description": description,
+                "participants": None,
+                "consequences": None,
+                "related_locations": None
+            })
+
+        factions = []
+        for faction in generated_data.get("factions") or []:
+            if not isinstance(faction, dict):
+                logger.warning(f"跳过无效的阵营数据: {faction!r}")
+                continue
+            alliance = faction.get("alliance")
+            factions.append({
+                "name": faction.get("name") or "",
+                "faction_type": "organization",
+                "description": faction.get("description") or "",
+                "leader": None,
+                "territory": None,
+                "power_level": None,
+                "ideology": faction.get("ideology") or "",
+                "allies": [alliance] if alliance else [],
+                "enemies": None,
+                "member_count": None
+            })
+
+        return {
+            "world_maps": world_maps,
+            "cultivation_systems": cultivation_systems,
+            "histories": histories,
+            "factions": factions
+        }
+
+    @staticmethod
+    def insert_rows(
+        db: Session,
+        table: str,
+        rows: List[Dict[str, Any]],
+        worldview_id: int,
+        user_id: int,
+        returning: Sequence[str] = ()
+    ) -> List[Dict[str, Any]]:
+        """
+        以一次 executemany 批量插入某个子表的行（不提交事务）
+
+        Args:
+            db: 数据库会话
+            table: 子表名（DATABASE_MODELS 的键）
+            rows: 行字典列表
+            worldview_id: 世界观ID
+            user_id: 用户ID
+            returning: 需要返回的列名，为空时不返回插入结果
+
+        Returns:
+            按ID排序的返回行字典列表（未指定 returning 时为空列表）
+        """
+        if not rows:
+            return []
+
+        model = DATABASE_MODELS[table]
+        params = [{**row, "worldview_id": worldview_id, "user_id": user_id} for row in rows]
+        if not returning:
+            db.execute(insert(model), params)
+            return []
+
+        columns = [getattr(model, name) for name in returning]
+        result = db.execute(insert(model).returning(model.id, *columns), params)
+        inserted = [dict(zip(("id", *returning), row)) for row in result]
+        inserted.sort(key=lambda item: item["id"])
+        return inserted
+
+    @staticmethod
+    def bulk_insert(
+        db: Session,
+        database_data: Dict[str, List],
+        worldview_id: int,
+        user_id: int
+    ) -> Dict[str, int]:
+        """
+        将数据库格式数据写入各子表，每张表一次 executemany（不提交事务）
+
+        Args:
+            db: 数据库会话
+            database_data: convert_to_database_format 或 convert_generated_to_database_format 的结果
+            worldview_id: 世界观ID
+            user_id: 用户ID
+
+        Returns:
+            各子表的插入行数
+        """
+        counts = {}
+        for table in DATABASE_MODELS:
+            rows = database_data.get(table) or []
+            WorldviewConverter.insert_rows(db, table, rows, worldview_id, user_id)
+            counts[table] = len(rows)
+        return counts
@@ -0,0 +1,144 @@
+"""
+世界观整体加载服务
+Author: AI Writer Team
+Created: 2026-10-19
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session, selectinload
+
+from app.models.worldview import CultivationSystem, Faction, History, WorldMap, Worldview
+
+logger = logging.getLogger(__name__)
+
+
+def _column_keys(model: Any) -> List[str]:
+    """获取模型映射的全部列属性名"""
+    return [column.key for column in model.__table__.columns]
+
+
+# 各模型序列化使用的列（与对应的 *Response 模式字段一致）
+WORLDVIEW_COLUMNS = _column_keys(Worldview)
+WORLD_MAP_COLUMNS = _column_keys(WorldMap)
+CULTIVATION_COLUMNS = _column_keys(CultivationSystem)
+HISTORY_COLUMNS = _column_keys(History)
+FACTION_COLUMNS = _column_keys(Faction)
+
+
+def _to_dict(obj: Any, columns: List[str]) -> Dict[str, Any]:
+    """将ORM对象的列值复制为字典"""
+    return {key: getattr(obj, key) for key in columns}
+
+
+def build_region_tree(regions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    由扁平的区域列表构建区域树（O(n)，不触发任何查询）
+
+    父区域不在列表中的区域作为根节点；若数据中存在环，环上第一个未被访问的
+    区域会从其父区域下摘出并作为根节点，保证结果是一棵有限的树。子区域保持
+    输入列表中的顺序。
+
+    Args:
+        regions: 区域字典列表（包含 id 与 parent_region_id）
+
+    Returns:
+        根区域列表，每个区域带 children 子列表
+    """
+    nodes = {region["id"]: {**region, "children": []} for region in regions}
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node["parent_region_id"])
+        if parent is None or parent is node:
+            roots.append(node)
+        else:
+            parent["children"].append(node)
+
+    visited = set()
+
+    def visit(start: Dict[str, Any]) -> None:
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            visited.add(node["id"])
+            stack.extend(node["children"])
+
+    for root in roots:
+        visit(root)
+
+    if len(visited) < len(nodes):
+        logger.warning(f"区域数据存在循环引用，{len(nodes) - len(visited)} 个区域将被断开后作为根区域")
+        for node in nodes.values():
+            if node["id"] in visited:
+                continue
+            parent = nodes[node["parent_region_id"]]
+            parent["children"] = [child for child in parent["children"] if child is not node]
+            roots.append(node)
+            visit(node)
+
+    return roots
+
+
+def load_worldview_tree(db: Session, worldview_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    一次性加载世界观及其全部子数据
+
+    世界观与地图、修炼体系、历史、阵营通过一次主查询加 selectinload 批量
+    获取（共5条查询），地图区域在内存中组装为树，不会逐节点访问惰性关系。
+
+    Args:
+        db: 数据库会话
+        worldview_id: 世界观ID
+        user_id: 用户ID
+
+    Returns:
+        世界观数据字典，不存在或无权访问时返回None
+    """
+    worldview = db.query(Worldview).options(
+        selectinload(Worldview.world_maps),
+        selectinload(Worldview.cultivation_systems),
+        selectinload(Worldview.histories),
+        selectinload(Worldview.factions)
+    ).filter(
+        Worldview.id == worldview_id,
+        Worldview.user_id == user_id
+    ).first()
+    if not worldview:
+        return None
+
+    def owned(items: List[Any], columns: List[str], sort_key) -> List[Dict[str, Any]]:
+        rows = [_to_dict(item, columns) for item in items if item.user_id == user_id]
+        rows.sort(key=sort_key)
+        return rows
+
+    world_maps = owned(
+        worldview.world_maps, WORLD_MAP_COLUMNS,
+        lambda row: (row["level"] or 0, row["region_name"], row["id"])
+    )
+    cultivation_systems = owned(
+        worldview.cultivation_systems, CULTIVATION_COLUMNS,
+        lambda row: (row["system_name"], row["level_order"], row["id"])
+    )
+    histories = owned(
+        worldview.histories, HISTORY_COLUMNS,
+        lambda row: (row["time_order"], row["id"])
+    )
+    factions = owned(
+        worldview.factions, FACTION_COLUMNS,
+        lambda row: (row["faction_type"], row["name"], row["id"])
+    )
+
+    return {
+        "worldview": _to_dict(worldview, WORLDVIEW_COLUMNS),
+        "world_maps": build_region_tree(world_maps),
+        "cultivation_systems": cultivation_systems,
+        "histories": histories,
+        "factions": factions,
+        "counts": {
+            "world_maps": len(world_maps),
+            "cultivation_systems": len(cultivation_systems),
+            "histories": len(histories),
+            "factions": len(factions)
+        }
+    }
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+后台生成任务 worker 进程
+Author: AI Writer Team
+Created: 2026-10-19
+
+与 API 服务共用数据库中的任务表，可启动多个进程横向扩展生成吞吐量。
+API 服务配置 JOB_WORKERS=0 时，任务全部由本进程执行。
+首次使用前执行 app/models/migrations/add_generation_jobs_table.py 创建任务表。
+
+用法:
+    python scripts/worker.py --workers 4
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api.v1.job_handlers import register_job_handlers
+from app.core.config import settings
+from app.core.shared_state import get_invalidation_bus, get_shared_state
+from app.services.job_queue import get_job_queue
+
+logger = logging.getLogger("worker")
+
+
+async def main(workers: int) -> None:
+    """启动 worker 并运行到进程退出"""
+    queue = get_job_queue()
+    register_job_handlers(queue)
+    bus = get_invalidation_bus()
+    bus.start()
+    try:
+        await queue.run(workers)
+    finally:
+        await bus.stop()
+        get_shared_state().close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="后台生成任务 worker")
+    parser.add_argument(
+        "--workers", type=int, default=max(settings.JOB_WORKERS, 1),
+        help="并发执行的任务数量（默认取 JOB_WORKERS 配置）"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=getattr(logging, settings.LOG_LEVEL.upper()),
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    logger.info(f"worker 进程启动: {args.workers}个并发任务")
+    try:
+        asyncio.run(main(args.workers))
+    except KeyboardInterrupt:
+        logger.info("worker 进程已退出")
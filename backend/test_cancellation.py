@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+客户端断开取消测试
+测试客户端断开时取消进行中的生成并返回499，以及正常完成与异常时的行为
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI, Request
+from starlette.types import Message
+
+from app.core.cancellation import CLIENT_CLOSED_REQUEST, cancel_on_disconnect
+from app.core.metrics import MetricsRegistry
+from app.core.request_metrics import AccessLogger, RequestMetricsMiddleware
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Generation:
+    """模拟的生成调用，记录是否完成或被取消"""
+
+    def __init__(self, duration: float, error: Optional[Exception] = None):
+        self.duration = duration
+        self.error = error
+        self.finished = False
+        self.cancelled = False
+
+    async def run(self) -> dict:
+        try:
+            await asyncio.sleep(self.duration)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        self.finished = True
+        return {"content": "生成内容"}
+
+
+def create_app(generation: Generation):
+    """创建带请求指标中间件的生成接口，返回应用与请求计数器"""
+    test_app = FastAPI()
+
+    @test_app.post("/generate")
+    async def generate(request: Request):
+        return await cancel_on_disconnect(request, generation.run(), "test")
+
+    registry = MetricsRegistry()
+    test_app.add_middleware(RequestMetricsMiddleware, registry=registry, access_logger=AccessLogger())
+    counter = registry.counter("http_requests_total", "HTTP请求总数", ("method", "route", "status"))
+    return test_app, counter
+
+
+def run(test_app, disconnect_after: Optional[float]) -> List[Message]:
+    """发送一次请求，disconnect_after 秒后客户端断开（为空时不断开），返回响应消息"""
+    messages: List[Message] = []
+
+    async def main():
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            if disconnect_after is None:
+                await asyncio.Event().wait()
+            await asyncio.sleep(disconnect_after)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": "/generate", "raw_path": b"/generate", "root_path": "",
+            "query_string": b"", "headers": [], "client": ("127.0.0.1", 1234), "server": ("test", 80)
+        }
+        await test_app(scope, receive, send)
+
+    asyncio.run(main())
+    return messages
+
+
+def test_disconnect_cancels_generation():
+    """客户端断开时立即取消生成并返回499，请求指标按499记录"""
+    generation = Generation(duration=10)
+    test_app, counter = create_app(generation)
+
+    started = time.monotonic()
+    messages = run(test_app, disconnect_after=0.05)
+    elapsed = time.monotonic() - started
+
+    assert generation.cancelled and not generation.finished
+    assert elapsed < 5
+    assert messages[0]["status"] == CLIENT_CLOSED_REQUEST
+    assert counter._values == {("POST", "/generate", str(CLIENT_CLOSED_REQUEST)): 1}
+    logger.info("断开取消返回499: ✅ 成功")
+
+
+def test_completes_without_disconnect():
+    """客户端未断开时正常返回生成结果"""
+    generation = Generation(duration=0.01)
+    test_app, _ = create_app(generation)
+
+    messages = run(test_app, disconnect_after=None)
+
+    assert generation.finished and not generation.cancelled
+    assert messages[0]["status"] == 200
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    assert "生成内容".encode() in body
+    logger.info("正常完成: ✅ 成功")
+
+
+def test_generation_error_propagates():
+    """生成出错时异常原样抛出，不被当作断开"""
+    generation = Generation(duration=0.01, error=ValueError("生成失败"))
+    test_app, _ = create_app(generation)
+
+    try:
+        run(test_app, disconnect_after=None)
+        raise AssertionError("应当抛出 ValueError")
+    except ValueError as e:
+        assert str(e) == "生成失败"
+    assert not generation.cancelled
+    logger.info("生成异常: ✅ 成功")
+
+
+def main():
+    """主函数"""
+    logger.info("开始客户端断开取消测试")
+
+    test_disconnect_cancels_generation()
+    test_completes_without_disconnect()
+    test_generation_error_propagates()
+
+    logger.info("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+章节上下文检索索引测试
+测试小说索引的LRU淘汰、使用中的小说不被淘汰以及延迟合并写盘
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app.models  # noqa: F401  注册全部模型
+from app.models.chapter import Chapter, ChapterStatus
+from app.services.chapter_context_index import ChapterContextIndex
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def make_chapter(novel_id: int, number: int) -> Chapter:
+    """构造已完成的章节（不写入数据库）"""
+    return Chapter(
+        id=novel_id * 1000 + number,
+        novel_id=novel_id,
+        chapter_number=number,
+        title=f"第{number}章",
+        content=f"小说{novel_id}的第{number}章。主角踏上了新的旅程。" * 10,
+        status=ChapterStatus.COMPLETED,
+        version=1,
+        word_count=100
+    )
+
+
+def count_writes(index: ChapterContextIndex) -> list:
+    """记录每次写盘的小说ID"""
+    writes = []
+    original = index._write
+
+    def write(novel_id, store):
+        writes.append(novel_id)
+        original(novel_id, store)
+
+    index._write = write
+    return writes
+
+
+def test_lru_eviction():
+    """超出上限时淘汰最久未用的小说，淘汰前写盘，再次使用时从磁盘加载"""
+    with tempfile.TemporaryDirectory() as storage_dir:
+        index = ChapterContextIndex(storage_dir, max_novels=2, save_delay=3600)
+        writes = count_writes(index)
+
+        for novel_id in (1, 2, 3):
+            index.index_chapter(make_chapter(novel_id, 1))
+
+        assert list(index._novel_locks) == [2, 3]
+        assert set(index._stores) == {2, 3}
+        assert writes == [1]
+        assert os.path.exists(os.path.join(storage_dir, "novel_1.npz"))
+
+        with index._novel_lock(1):
+            store = index._get_store(1)
+            assert list(store.chapters) == [1001]
+        assert list(index._novel_locks) == [3, 1]
+        logger.info("LRU淘汰: ✅ 成功")
+
+
+def test_pinned_novel_not_evicted():
+    """正在使用的小说不会被淘汰"""
+    with tempfile.TemporaryDirectory() as storage_dir:
+        index = ChapterContextIndex(storage_dir, max_novels=1, save_delay=0)
+
+        with index._pinned(1):
+            index.index_chapter(make_chapter(1, 1))
+            index.index_chapter(make_chapter(2, 1))
+            # 小说1使用中，淘汰的是刚用完的小说2
+            assert list(index._novel_locks) == [1]
+
+        assert list(index._stores) == [1]
+        assert not index._pins
+        logger.info("使用中不淘汰: ✅ 成功")
+
+
+def test_debounced_save():
+    """延迟时间内的多次变更只写一次盘，flush_all 立即写入"""
+    with tempfile.TemporaryDirectory() as storage_dir:
+        index = ChapterContextIndex(storage_dir, save_delay=0.2)
+        writes = count_writes(index)
+
+        for number in range(1, 6):
+            index.index_chapter(make_chapter(1, number))
+        assert writes == []
+
+        time.sleep(0.5)
+        assert writes == [1]
+        assert not index._dirty and not index._timers
+
+        index.index_chapter(make_chapter(1, 6))
+        index.index_chapter(make_chapter(2, 1))
+        index.flush_all()
+        assert sorted(writes[1:]) == [1, 2]
+
+        reloaded = ChapterContextIndex(storage_dir)
+        with reloaded._novel_lock(1):
+            assert len(reloaded._get_store(1).chapters) == 6
+        logger.info("延迟合并写盘: ✅ 成功")
+
+
+def test_remove_novel_cancels_pending_save():
+    """删除小说时取消未写盘的变更，不会重新生成索引文件"""
+    with tempfile.TemporaryDirectory() as storage_dir:
+        index = ChapterContextIndex(storage_dir, save_delay=0.1)
+        index.index_chapter(make_chapter(1, 1))
+
+        index.remove_novel(1)
+        time.sleep(0.3)
+
+        assert os.listdir(storage_dir) == []
+        logger.info("删除小说取消写盘: ✅ 成功")
+
+
+def main():
+    """主函数"""
+    logger.info("开始章节上下文索引测试")
+
+    test_lru_eviction()
+    test_pinned_novel_not_evicted()
+    test_debounced_save()
+    test_remove_novel_cancels_pending_save()
+
+    logger.info("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+响应压缩中间件测试
+测试流式响应的逐块压缩与刷新、完整响应的压缩阈值以及SSE与已编码响应的透传
+"""
+
+import asyncio
+import gzip
+import logging
+import os
+import sys
+import zlib
+from typing import List
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from starlette.datastructures import Headers
+from starlette.types import Message
+
+from app.core import compression
+from app.core.compression import CompressionMiddleware, choose_encoding
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHUNKS = [f"第{i}段生成内容，主角继续前行。\n".encode() * 20 for i in range(5)]
+
+
+def make_app(content_type: str, chunks: List[bytes], extra_headers=()):
+    """构造按分块发送响应体的 ASGI 应用"""
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type.encode()), *extra_headers]
+        if len(chunks) == 1:
+            headers.append((b"content-length", str(len(chunks[0])).encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for index, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": index < len(chunks) - 1})
+    return app
+
+
+def run(app, accept_encoding: str = "gzip, deflate", minimum_size: int = 1024) -> List[Message]:
+    """经压缩中间件执行一次请求，返回发出的全部 ASGI 消息"""
+    messages: List[Message] = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    }
+    asyncio.run(CompressionMiddleware(app, minimum_size=minimum_size)(scope, receive, send))
+    return messages
+
+
+def test_streamed_response_compressed():
+    """流式响应逐块压缩，每块到达后即可解压出对应内容，不带 Content-Length"""
+    messages = run(make_app("text/plain; charset=utf-8", CHUNKS))
+    headers = Headers(raw=messages[0]["headers"])
+
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    assert "Accept-Encoding" in headers["vary"]
+
+    bodies = messages[1:]
+    assert len(bodies) == len(CHUNKS)
+    assert [message["more_body"] for message in bodies] == [True] * (len(CHUNKS) - 1) + [False]
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk, message in zip(CHUNKS, bodies):
+        assert decompressor.decompress(message["body"]) == chunk
+    assert decompressor.eof
+    assert sum(len(message["body"]) for message in bodies) < sum(len(chunk) for chunk in CHUNKS)
+    logger.info("流式响应压缩: ✅ 成功")
+
+
+def test_complete_response_threshold():
+    """完整响应超过阈值时压缩并更新 Content-Length，小于阈值时原样发送"""
+    body = b"".join(CHUNKS)
+    messages = run(make_app("application/json", [body]))
+    headers = Headers(raw=messages[0]["headers"])
+    assert headers["content-encoding"] == "gzip"
+    assert int(headers["content-length"]) == len(messages[1]["body"])
+    assert gzip.decompress(messages[1]["body"]) == body
+
+    messages = run(make_app("application/json", [b'{"ok": true}']))
+    headers = Headers(raw=messages[0]["headers"])
+    assert "content-encoding" not in headers
+    assert messages[1]["body"] == b'{"ok": true}'
+    logger.info("完整响应阈值: ✅ 成功")
+
+
+def test_passthrough():
+    """SSE事件流、已编码的响应与不接受压缩的请求原样透传"""
+    for app, accept_encoding in (
+        (make_app("text/event-stream", CHUNKS), "gzip"),
+        (make_app("text/plain", CHUNKS, [(b"content-encoding", b"identity")]), "gzip"),
+        (make_app("text/plain", CHUNKS), "gzip;q=0"),
+        (make_app("text/plain", CHUNKS), ""),
+    ):
+        messages = run(app, accept_encoding)
+        assert Headers(raw=messages[0]["headers"]).get("content-encoding") in (None, "identity")
+        assert [message["body"] for message in messages[1:]] == CHUNKS
+    logger.info("透传: ✅ 成功")
+
+
+def test_choose_encoding():
+    """按 Accept-Encoding 选择压缩算法，忽略 q=0 的编码"""
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("*") == "gzip"
+    assert choose_encoding("gzip;q=0, deflate") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("br, gzip") == ("br" if compression.brotli is not None else "gzip")
+    logger.info("压缩算法选择: ✅ 成功")
+
+
+def test_streamed_brotli():
+    """安装 brotli 时流式响应同样逐块压缩"""
+    if compression.brotli is None:
+        logger.info("未安装 brotli，跳过")
+        return
+    messages = run(make_app("text/plain", CHUNKS), "br")
+    assert Headers(raw=messages[0]["headers"])["content-encoding"] == "br"
+    decompressor = compression.brotli.Decompressor()
+    for chunk, message in zip(CHUNKS, messages[1:]):
+        assert decompressor.process(message["body"]) == chunk
+    logger.info("brotli流式压缩: ✅ 成功")
+
+
+def main():
+    """主函数"""
+    logger.info("开始响应压缩测试")
+
+    test_streamed_response_compressed()
+    test_complete_response_threshold()
+    test_passthrough()
+    test_choose_encoding()
+    test_streamed_brotli()
+
+    logger.info("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+详细大纲写入测试
+测试批量写入时的章节号冲突、接口的章节号冲突处理以及唯一索引迁移的去重
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  注册全部模型
+from app.api.v1.outline import (
+    bulk_create_detailed_outlines, create_detailed_outline, update_detailed_outline
+)
+from app.models.base import Base
+from app.models.migrations import add_detailed_outline_unique_index
+from app.models.novel import Novel, NovelGenre
+from app.models.outline import DetailedOutline
+from app.models.user import User
+from app.schemas.outline import DetailedOutlineCreate, DetailedOutlineUpdate
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def create_session(url: str = "sqlite://"):
+    """创建数据库并写入一个用户、一部小说和第2章的详细大纲"""
+    if url == "sqlite://":
+        engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    user = User(username="writer", email="writer@test.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    novel = Novel(title="测试小说", genre=NovelGenre.FANTASY, author="作者", user_id=user.id)
+    db.add(novel)
+    db.flush()
+    db.add(DetailedOutline(
+        novel_id=novel.id, chapter_number=2, chapter_title="原有大纲", plot_points="原有情节", user_id=user.id
+    ))
+    db.commit()
+    return engine, db, user, novel
+
+
+def chapter_numbers(db, novel_id):
+    """小说已有大纲的章节号"""
+    return [
+        row.chapter_number for row in db.query(DetailedOutline.chapter_number).filter(
+            DetailedOutline.novel_id == novel_id
+        ).order_by(DetailedOutline.chapter_number)
+    ]
+
+
+def test_bulk_create_skips_conflicts():
+    """已存在、批内重复与无效的章节号被跳过，原有大纲不被覆盖"""
+    engine, db, user, novel = create_session()
+    items = [
+        {"chapter_number": 1, "chapter_title": "第一章", "plot_points": "开端"},
+        {"chapter_number": 2, "chapter_title": "覆盖", "plot_points": "不应写入"},
+        {"chapter_number": "3", "chapter_title": "第三章"},
+        {"chapter_number": 3, "chapter_title": "重复"},
+        {"chapter_number": "第四章"}
+    ]
+
+    created = bulk_create_detailed_outlines(db, novel.id, user.id, items)
+    db.commit()
+
+    assert [(o.chapter_number, o.chapter_title) for o in created] == [(1, "第一章"), (3, "第三章")]
+    assert created[1].plot_points == "" and created[1].participating_characters == []
+    assert chapter_numbers(db, novel.id) == [1, 2, 3]
+    existing = db.query(DetailedOutline).filter(DetailedOutline.chapter_number == 2).one()
+    assert existing.chapter_title == "原有大纲"
+    logger.info("批量写入跳过冲突: ✅ 成功")
+
+
+def test_bulk_create_concurrent_conflict():
+    """查询已有章节号之后被并发写入的章节由 ON CONFLICT 跳过，不抛出异常"""
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'outlines.db')}"
+        engine, db, user, novel = create_session(url)
+        other = create_engine(url)
+
+        inserted = []
+
+        def insert_concurrently(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO detailed_outlines") and not inserted:
+                inserted.append(True)
+                with other.begin() as other_conn:
+                    other_conn.execute(
+                        text("INSERT INTO detailed_outlines (novel_id, chapter_number, chapter_title, plot_points, "
+                             "user_id, created_at, updated_at) VALUES (:novel_id, 4, '并发写入', '', :user_id, "
+                             "CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"),
+                        {"novel_id": novel.id, "user_id": user.id}
+                    )
+
+        event.listen(engine, "before_cursor_execute", insert_concurrently)
+        items = [{"chapter_number": 4, "plot_points": "生成"}, {"chapter_number": 5, "plot_points": "生成"}]
+        created = bulk_create_detailed_outlines(db, novel.id, user.id, items)
+        db.commit()
+
+        assert [o.chapter_number for o in created] == [5]
+        concurrent = db.query(DetailedOutline).filter(DetailedOutline.chapter_number == 4).one()
+        assert concurrent.chapter_title == "并发写入"
+        db.close()
+        other.dispose()
+        engine.dispose()
+    logger.info("并发写入冲突: ✅ 成功")
+
+
+def test_update_chapter_number_conflict():
+    """修改为已有大纲的章节号时返回400，修改为空闲章节号时成功"""
+    engine, db, user, novel = create_session()
+    outline = DetailedOutline(novel_id=novel.id, chapter_number=5, plot_points="情节", user_id=user.id)
+    db.add(outline)
+    db.commit()
+
+    try:
+        asyncio.run(update_detailed_outline(outline.id, DetailedOutlineUpdate(chapter_number=2), db, user))
+        raise AssertionError("应当返回400")
+    except HTTPException as e:
+        assert e.status_code == 400
+        assert e.detail == "章节 2 的详细大纲已存在"
+
+    result = asyncio.run(update_detailed_outline(
+        outline.id, DetailedOutlineUpdate(chapter_number=5, chapter_title="标题不变章节号"), db, user
+    ))
+    assert result.chapter_title == "标题不变章节号"
+
+    result = asyncio.run(update_detailed_outline(outline.id, DetailedOutlineUpdate(chapter_number=6), db, user))
+    assert result.chapter_number == 6
+    assert chapter_numbers(db, novel.id) == [2, 6]
+    logger.info("修改章节号冲突: ✅ 成功")
+
+
+def test_create_chapter_number_conflict():
+    """创建已有章节号的大纲时返回400"""
+    engine, db, user, novel = create_session()
+    request = DetailedOutlineCreate(novel_id=novel.id, chapter_number=2, plot_points="情节")
+
+    try:
+        asyncio.run(create_detailed_outline(request, db, user))
+        raise AssertionError("应当返回400")
+    except HTTPException as e:
+        assert e.status_code == 400
+    logger.info("创建章节号冲突: ✅ 成功")
+
+
+def test_migration_dedupes_before_index():
+    """迁移保留每个章节号ID最小的大纲，章节改为关联保留的大纲，再创建唯一索引"""
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE detailed_outlines (id INTEGER PRIMARY KEY, novel_id INTEGER, chapter_number INTEGER)"))
+        conn.execute(text("CREATE TABLE chapters (id INTEGER PRIMARY KEY, outline_id INTEGER)"))
+        conn.execute(text(
+            "INSERT INTO detailed_outlines VALUES (1, 1, 1), (2, 1, 2), (3, 1, 1), (4, 2, 1), (5, 1, 2), (6, 1, 1)"
+        ))
+        conn.execute(text("INSERT INTO chapters VALUES (1, 6), (2, 5), (3, 4), (4, NULL)"))
+
+        with Operations.context(MigrationContext.configure(conn)):
+            add_detailed_outline_unique_index.upgrade()
+
+        outlines = conn.execute(text("SELECT id FROM detailed_outlines ORDER BY id")).scalars().all()
+        chapters = conn.execute(text("SELECT outline_id FROM chapters ORDER BY id")).scalars().all()
+        indexes = conn.execute(text("PRAGMA index_list('detailed_outlines')")).fetchall()
+
+    assert outlines == [1, 2, 4]
+    assert chapters == [1, 2, 4, None]
+    assert any(row[1] == "idx_detailed_outline_novel_chapter" and row[2] == 1 for row in indexes)
+    logger.info("唯一索引迁移去重: ✅ 成功")
+
+
+def main():
+    """主函数"""
+    logger.info("开始详细大纲写入测试")
+
+    test_bulk_create_skips_conflicts()
+    test_bulk_create_concurrent_conflict()
+    test_update_chapter_number_conflict()
+    test_create_chapter_number_conflict()
+    test_migration_dedupes_before_index()
+
+    logger.info("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+游标分页测试
+测试游标翻页的边界（同值、NULL、混合时间格式、末页）与索引使用
+"""
+
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import HTTPException
+from sqlalchemy import Column, DateTime, Index, Integer, create_engine, text
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.pagination import TotalCountCache, paginate_keyset
+from app.core.shared_state import MemoryStateBackend
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TestBase = declarative_base()
+
+
+class Entry(TestBase):
+    """测试用数据表"""
+    __tablename__ = "pagination_entries"
+
+    id = Column(Integer, primary_key=True)
+    owner = Column(Integer, nullable=False)
+    rank = Column(Integer, nullable=False)
+    score = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_entries_owner_rank", "owner", "rank"),
+        Index("ix_entries_owner_created", "owner", "created_at"),
+    )
+
+
+def create_session():
+    """创建内存数据库：排序键大量重复，含 NULL，时间列混合有无微秒两种存储格式"""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    TestBase.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    for i in range(1, 24):
+        score = None if i % 5 == 0 else i % 4
+        if i % 6 == 0:
+            created_at = None
+        elif i % 2:
+            # func.now() 写入的格式（不带微秒）
+            created_at = f"2026-10-19 10:00:{i % 3:02d}"
+        else:
+            # Python datetime 写入的格式（带微秒）
+            created_at = f"2026-10-19 10:00:{i % 3:02d}.{i:06d}"
+        db.execute(
+            text("INSERT INTO pagination_entries (id, owner, rank, score, created_at) "
+                 "VALUES (:id, 1, :rank, :score, :created_at)"),
+            {"id": i, "rank": i % 3, "score": score, "created_at": created_at}
+        )
+    db.commit()
+    return db
+
+
+def collect(db, sort_column, descending, limit):
+    """按游标逐页读取全部记录，返回ID列表与页数"""
+    ids, pages, cursor = [], 0, None
+    signature = f"{sort_column.key}:{descending}"
+    while True:
+        page = paginate_keyset(
+            db.query(Entry).filter(Entry.owner == 1), sort_column, Entry.id,
+            limit=limit, descending=descending, cursor=cursor, signature=signature
+        )
+        ids.extend(entry.id for entry in page.items)
+        pages += 1
+        if not page.has_more:
+            return ids, pages
+        cursor = page.next_cursor
+
+
+def expected_ids(db, sort_column, descending):
+    """按 (排序键, ID) 在 Python 中排序得到的期望顺序（NULL 视为最小值）"""
+    column = sort_column.key
+    rows = db.execute(text(f"SELECT id, {column} FROM pagination_entries")).fetchall()
+    rows.sort(key=lambda row: (row[1] is not None, row[1] if row[1] is not None else 0, row[0]))
+    if descending:
+        rows.reverse()
+    return [row[0] for row in rows]
+
+
+def test_cursor_walk_matches_order():
+    """各种排序列与方向、各种页大小下逐页读取无重复、无遗漏"""
+    db = create_session()
+    for sort_column in (Entry.rank, Entry.score, Entry.created_at):
+        for descending in (False, True):
+            expected = expected_ids(db, sort_column, descending)
+            for limit in (1, 4, 5, 23, 50):
+                ids, _ = collect(db, sort_column, descending, limit)
+                assert ids == expected, (sort_column.key, descending, limit, ids)
+    logger.info("逐页读取: ✅ 成功")
+
+
+def test_last_page_boundary():
+    """记录数恰好是页大小的整数倍时，最后一页不返回游标"""
+    db = create_session()
+    db.execute(text("DELETE FROM pagination_entries WHERE id > 20"))
+    db.commit()
+
+    ids, pages = collect(db, Entry.rank, False, 5)
+
+    assert len(ids) == 20
+    assert pages == 4
+    logger.info("末页边界: ✅ 成功")
+
+
+def test_offset_fallback():
+    """没有游标时按偏移量分页，并返回可继续使用的游标"""
+    db = create_session()
+    expected = expected_ids(db, Entry.score, True)
+
+    page = paginate_keyset(
+        db.query(Entry), Entry.score, Entry.id, limit=5, descending=True, offset=10, signature="s"
+    )
+    assert [entry.id for entry in page.items] == expected[10:15]
+
+    page = paginate_keyset(
+        db.query(Entry), Entry.score, Entry.id, limit=5, descending=True,
+        cursor=page.next_cursor, signature="s"
+    )
+    assert [entry.id for entry in page.items] == expected[15:20]
+    logger.info("偏移量分页: ✅ 成功")
+
+
+def test_invalid_cursor():
+    """无效游标或排序方式不匹配的游标返回400"""
+    db = create_session()
+    page = paginate_keyset(db.query(Entry), Entry.rank, Entry.id, limit=5, signature="rank:asc")
+
+    for cursor, signature in (("不是游标", "rank:asc"), (page.next_cursor, "rank:desc")):
+        try:
+            paginate_keyset(db.query(Entry), Entry.rank, Entry.id, limit=5, cursor=cursor, signature=signature)
+        except HTTPException as e:
+            assert e.status_code == 400
+            continue
+        raise AssertionError("应当返回400")
+    logger.info("无效游标: ✅ 成功")
+
+
+def test_cursor_query_uses_index():
+    """游标查询直接比较原始列，由 (owner, 排序列) 索引完成范围扫描与排序"""
+    db = create_session()
+    page = paginate_keyset(db.query(Entry).filter(Entry.owner == 1), Entry.rank, Entry.id, limit=5)
+    query = db.query(Entry).filter(Entry.owner == 1)
+
+    captured = []
+    original_all = type(query).all
+
+    def capture(self):
+        captured.append(str(self.statement.compile(compile_kwargs={"literal_binds": True})))
+        return original_all(self)
+
+    type(query).all = capture
+    try:
+        paginate_keyset(query, Entry.rank, Entry.id, limit=5, cursor=page.next_cursor)
+    finally:
+        type(query).all = original_all
+
+    plan = " ".join(row[-1] for row in db.execute(text("EXPLAIN QUERY PLAN " + captured[0])))
+    assert "ix_entries_owner_rank" in plan, plan
+    assert "TEMP B-TREE" not in plan, plan
+    assert "CAST" not in captured[0].split("WHERE", 1)[1], captured[0]
+    logger.info(f"索引范围扫描: ✅ 成功 ({plan})")
+
+
+def test_cached_aggregate():
+    """聚合值在翻页时复用缓存，首页重新计算"""
+    cache = TotalCountCache(ttl=60, state=MemoryStateBackend())
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls) * 100
+
+    assert cache.get_value("words", compute, exact=True) == 100
+    assert cache.get_value("words", compute) == 100
+    assert cache.get_value("words", compute, exact=True) == 200
+    assert len(calls) == 2
+    logger.info("聚合值缓存: ✅ 成功")
+
+
+def main():
+    """主函数"""
+    logger.info("开始游标分页测试")
+
+    test_cursor_walk_matches_order()
+    test_last_page_boundary()
+    test_offset_fallback()
+    test_invalid_cursor()
+    test_cursor_query_uses_index()
+    test_cached_aggregate()
+
+    logger.info("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+提示词组装器测试
+测试片段的截断策略、总预算不足时按优先级压缩以及截断记录
+"""
+
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.chapter_context_index import estimate_tokens
+from app.services.prompt_assembler import (
+    ELLIPSIS, ITEM_SEPARATOR, PromptAssembler, SectionSpec, TruncationStrategy, truncate_section
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHARACTERS = ITEM_SEPARATOR.join(f"角色名: 人物{i}\n描述: " + "性格沉稳的剑客" * 20 for i in range(30))
+PREVIOUS = "".join(f"第{i}段前文内容。" for i in range(2000))
+
+
+def test_truncation_strategies():
+    """各截断策略都压缩到上限以内并保留相应的部分"""
+    for strategy in TruncationStrategy:
+        result = truncate_section(PREVIOUS, 300, strategy)
+        assert estimate_tokens(result) <= 300, strategy
+
+    assert truncate_section(PREVIOUS, 300, TruncationStrategy.HEAD).startswith("第0段")
+    assert truncate_section(PREVIOUS, 300, TruncationStrategy.TAIL).endswith("第1999段前文内容。")
+    assert truncate_section(PREVIOUS, 300, TruncationStrategy.DROP) == ""
+
+    items = truncate_section(CHARACTERS, 500, TruncationStrategy.ITEMS)
+    kept = items.split(ITEM_SEPARATOR)
+    assert kept[-1] == ELLIPSIS
+    assert all(item in CHARACTERS.split(ITEM_SEPARATOR) for item in kept[:-1])
+    assert truncate_section("短文本", 300, TruncationStrategy.HEAD) == "短文本"
+    logger.info("截断策略: ✅ 成功")
+
+
+def test_budget_trimming_by_priority():
+    """总预算不足时从低优先级片段开始压缩，高优先级片段保持完整"""
+    assembler = PromptAssembler(token_budget=1500, section_specs={
+        "outline_info": SectionSpec(priority=85),
+        "character_info": SectionSpec(priority=70, strategy=TruncationStrategy.ITEMS),
+        "previous_chapters": SectionSpec(priority=40, strategy=TruncationStrategy.TAIL),
+    })
+    outline = "主角离开家乡，拜师学艺。" * 20
+
+    result = assembler.assemble(
+        "大纲:\n{outline_info}\n角色:\n{character_info}\n前文:\n{previous_chapters}\n标题:{title}",
+        {"outline_info": outline, "character_info": CHARACTERS, "previous_chapters": PREVIOUS, "title": "剑心"}
+    )
+
+    assert result.tokens <= 1500
+    assert result.tokens == estimate_tokens(result.text)
+    assert outline in result.text
+    assert "标题:剑心" in result.text
+    assert result.truncated == ["previous_chapters", "character_info"]
+    logger.info("按优先级压缩: ✅ 成功")
+
+
+def test_truncated_only_when_shrunk():
+    """只记录内容确实被缩短的片段，空片段与未压缩的片段不计入"""
+    assembler = PromptAssembler(token_budget=800, section_specs={
+        "outline_info": SectionSpec(priority=85, max_tokens=5000),
+        "worldview_info": SectionSpec(priority=10, placeholder="暂无世界观"),
+        "previous_chapters": SectionSpec(priority=40, strategy=TruncationStrategy.TAIL),
+    })
+
+    result = assembler.assemble(
+        "{worldview_info}\n{outline_info}\n{previous_chapters}",
+        {"worldview_info": "", "outline_info": "大纲", "previous_chapters": PREVIOUS}
+    )
+
+    assert result.truncated == ["previous_chapters"]
+    assert result.tokens <= 800
+    assert result.text.startswith("\n大纲\n" + ELLIPSIS)
+
+    result = assembler.assemble(
+        "{worldview_info}\n{outline_info}\n{previous_chapters}",
+        {"worldview_info": "", "outline_info": "大纲", "previous_chapters": "前文"}
+    )
+    assert result.truncated == []
+    logger.info("截断记录: ✅ 成功")
+
+
+def main():
+    """主函数"""
+    logger.info("开始提示词组装器测试")
+
+    test_truncation_strategies()
+    test_budget_trimming_by_priority()
+    test_truncated_only_when_shrunk()
+
+    logger.info("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+请求指标中间件测试
+测试路由模板标签（嵌套路由器、空路径路由、挂载子应用）与未匹配请求的标签
+"""
+
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.metrics import MetricsRegistry
+from app.core.request_metrics import UNMATCHED_ROUTE, AccessLogger, RequestMetricsMiddleware
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def create_client():
+    """创建带请求指标中间件的应用，返回测试客户端与请求计数器"""
+    novels = APIRouter()
+
+    @novels.get("")
+    async def list_novels():
+        return []
+
+    @novels.get("/{novel_id}")
+    async def get_novel(novel_id: int):
+        return {"id": novel_id}
+
+    api = APIRouter()
+    api.include_router(novels, prefix="/novels")
+
+    sub = FastAPI()
+
+    @sub.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"id": item_id}
+
+    app = FastAPI()
+    app.include_router(api, prefix="/api/v1")
+    app.mount("/sub", sub)
+
+    registry = MetricsRegistry()
+    app.add_middleware(RequestMetricsMiddleware, registry=registry, access_logger=AccessLogger())
+    counter = registry.counter("http_requests_total", "HTTP请求总数", ("method", "route", "status"))
+    return TestClient(app), counter
+
+
+def test_route_labels():
+    """请求按路由模板计数，路径参数不进入标签"""
+    client, counter = create_client()
+
+    client.get("/api/v1/novels/1")
+    client.get("/api/v1/novels/2")
+    client.get("/sub/items/3")
+
+    assert counter._values[("GET", "/api/v1/novels/{novel_id}", "200")] == 2
+    assert counter._values[("GET", "/sub/items/{item_id}", "200")] == 1
+    logger.info("路由模板标签: ✅ 成功")
+
+
+def test_empty_path_route():
+    """路径为空的路由使用前缀作为标签，而不是归入未匹配"""
+    client, counter = create_client()
+
+    response = client.get("/api/v1/novels")
+
+    assert response.status_code == 200
+    assert counter._values == {("GET", "/api/v1/novels", "200"): 1}
+    logger.info("空路径路由标签: ✅ 成功")
+
+
+def test_unmatched_route():
+    """没有匹配到路由的请求归入同一个标签"""
+    client, counter = create_client()
+
+    client.get("/missing/1")
+    client.get("/missing/2")
+
+    assert counter._values == {("GET", UNMATCHED_ROUTE, "404"): 2}
+    logger.info("未匹配请求标签: ✅ 成功")
+
+
+def main():
+    """主函数"""
+    logger.info("开始请求指标测试")
+
+    test_route_labels()
+    test_empty_path_route()
+    test_unmatched_route()
+
+    logger.info("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+响应缓存测试
+测试ETag与304响应、缓存命中时不查询数据库、相关表提交后失效以及缓存键隔离
+"""
+
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  注册全部模型
+from app.core.response_cache import ResponseCache, _etag_matches
+from app.models.base import Base
+from app.models.character import Character
+from app.models.novel import Novel, NovelGenre
+from app.models.user import User
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def create_client(max_entries: int = 100):
+    """创建带缓存小说详情接口的应用，返回测试客户端、数据库会话、小说ID与SQL语句记录"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    user = User(username="writer", email="writer@test.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    novel = Novel(title="测试小说", genre=NovelGenre.FANTASY, author="作者", user_id=user.id)
+    db.add(novel)
+    db.commit()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    cache = ResponseCache(max_entries=max_entries)
+    test_app = FastAPI()
+
+    @test_app.get("/novels/{novel_id}")
+    async def get_novel(novel_id: int, request: Request, user_id: int = 1):
+        cached = cache.lookup(request, user_id, (Novel,))
+        if cached.response is not None:
+            return cached.response
+        row = db.query(Novel).filter(Novel.id == novel_id).one()
+        return cached.store({"id": row.id, "title": row.title})
+
+    return TestClient(test_app), db, novel.id, statements
+
+
+def test_etag_and_not_modified():
+    """首次请求返回ETag，再次请求命中缓存不查询数据库，ETag一致时返回304"""
+    client, db, novel_id, statements = create_client()
+
+    first = client.get(f"/novels/{novel_id}")
+    assert first.status_code == 200
+    assert first.json() == {"id": novel_id, "title": "测试小说"}
+    etag = first.headers["etag"]
+
+    statements.clear()
+    second = client.get(f"/novels/{novel_id}")
+    assert second.status_code == 200
+    assert second.headers["etag"] == etag
+    assert second.content == first.content
+    assert statements == []
+
+    not_modified = client.get(f"/novels/{novel_id}", headers={"If-None-Match": f'W/{etag}, "other"'})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+    logger.info("ETag与304: ✅ 成功")
+
+
+def test_invalidated_on_commit():
+    """依赖的表有提交后缓存失效，旧ETag返回新内容；无关表的提交不影响缓存"""
+    client, db, novel_id, statements = create_client()
+    etag = client.get(f"/novels/{novel_id}").headers["etag"]
+
+    db.add(Character(name="无关角色", gender="male", character_type="minor", user_id=1))
+    db.commit()
+    statements.clear()
+    assert client.get(f"/novels/{novel_id}", headers={"If-None-Match": etag}).status_code == 304
+    assert statements == []
+
+    db.query(Novel).filter(Novel.id == novel_id).one().title = "新标题"
+    db.commit()
+
+    response = client.get(f"/novels/{novel_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["title"] == "新标题"
+    assert response.headers["etag"] != etag
+    assert statements
+
+    db.query(Novel).filter(Novel.id == novel_id).one().title = "未提交"
+    db.rollback()
+    assert client.get(f"/novels/{novel_id}", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+    logger.info("提交后失效: ✅ 成功")
+
+
+def test_cache_key_isolation():
+    """不同用户与不同查询参数分别缓存，超出容量时淘汰最久未使用的条目"""
+    client, db, novel_id, statements = create_client(max_entries=2)
+
+    client.get(f"/novels/{novel_id}?user_id=1")
+    client.get(f"/novels/{novel_id}?user_id=2")
+    statements.clear()
+    client.get(f"/novels/{novel_id}?user_id=1")
+    assert statements == []
+
+    client.get(f"/novels/{novel_id}?user_id=3")
+    statements.clear()
+    client.get(f"/novels/{novel_id}?user_id=2")
+    assert statements
+    logger.info("缓存键隔离: ✅ 成功")
+
+
+def test_etag_matching():
+    """If-None-Match 按弱比较规则匹配"""
+    assert _etag_matches('"abc"', '"abc"')
+    assert _etag_matches('W/"abc"', '"abc"')
+    assert _etag_matches('"x", "abc"', '"abc"')
+    assert _etag_matches("*", '"abc"')
+    assert not _etag_matches('"abd"', '"abc"')
+    assert not _etag_matches(None, '"abc"')
+    logger.info("ETag匹配: ✅ 成功")
+
+
+def main():
+    """主函数"""
+    logger.info("开始响应缓存测试")
+
+    test_etag_and_not_modified()
+    test_invalidated_on_commit()
+    test_cache_key_isolation()
+    test_etag_matching()
+
+    logger.info("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()
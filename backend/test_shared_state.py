@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+共享状态后端测试
+测试进程内与SQLite后端的缓存值、计数器、令牌桶，多实例间的可见性以及失效广播
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.shared_state import (
+    InvalidationBus, MemoryStateBackend, SQLiteStateBackend, create_shared_state_backend
+)
+from app.core.table_versions import TableVersions
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def check_backend(backend):
+    """对单个后端执行通用的读写检查"""
+    assert backend.get("missing") is None
+    backend.set("config", {"name": "默认配置", "ids": [1, 2]})
+    assert backend.get("config") == {"name": "默认配置", "ids": [1, 2]}
+    backend.delete("config")
+    assert backend.get("config") is None
+
+    backend.set("short", "值", ttl=0.05)
+    assert backend.get("short") == "值"
+    time.sleep(0.1)
+    assert backend.get("short") is None
+
+    assert backend.incr("version:a") == 1
+    assert backend.incr("version:a", 2) == 3
+    assert backend.get_counters(["version:a", "version:b"]) == [3, 0]
+    assert backend.get_counters([]) == []
+
+    assert [backend.take_token("bucket", capacity=3, refill_per_second=0.001) for _ in range(4)] == [
+        True, True, True, False
+    ]
+    assert backend.take_token("bucket:fast", capacity=1, refill_per_second=50)
+    assert not backend.take_token("bucket:fast", capacity=1, refill_per_second=50)
+    time.sleep(0.05)
+    assert backend.take_token("bucket:fast", capacity=1, refill_per_second=50)
+
+
+def test_memory_backend():
+    """进程内后端的缓存值、计数器与令牌桶，超出容量时淘汰最久未使用的值"""
+    check_backend(MemoryStateBackend())
+
+    backend = MemoryStateBackend(max_entries=2)
+    for key in ("a", "b", "c"):
+        backend.set(key, key)
+    assert backend.get("a") is None and backend.get("c") == "c"
+    logger.info("进程内后端: ✅ 成功")
+
+
+def test_sqlite_backend_shared():
+    """SQLite后端的写入对打开同一文件的其他实例（其他工作进程）可见"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "state.db")
+        first, second = SQLiteStateBackend(path), SQLiteStateBackend(path)
+        check_backend(first)
+
+        first.set("shared", [1, "二"])
+        assert second.get("shared") == [1, "二"]
+        assert second.get_counters(["version:a"]) == [3]
+        assert not second.take_token("bucket", capacity=3, refill_per_second=0.001)
+
+        versions = TableVersions(second)
+        TableVersions(first).bump(["novels"])
+        assert versions.get(["novels", "chapters"]) == (1, 0)
+
+        first.close()
+        second.close()
+    logger.info("SQLite后端跨实例共享: ✅ 成功")
+
+
+def test_sqlite_concurrent_counters():
+    """多个实例在多个线程中同时递增计数器与取令牌时不丢失更新"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "state.db")
+        backends = [SQLiteStateBackend(path) for _ in range(2)]
+        allowed = []
+
+        def work(backend):
+            for _ in range(50):
+                backend.incr("counter")
+                allowed.append(backend.take_token("limit", capacity=30, refill_per_second=0.001))
+
+        threads = [threading.Thread(target=work, args=(backends[i % 2],)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert backends[0].get_counters(["counter"]) == [200]
+        assert sum(allowed) == 30
+        for backend in backends:
+            backend.close()
+    logger.info("SQLite并发原子性: ✅ 成功")
+
+
+def test_invalidation_bus():
+    """广播在本进程立即处理，其他进程在轮询时处理；local=False 的订阅只处理其他进程的广播"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "state.db")
+        local_bus = InvalidationBus(SQLiteStateBackend(path))
+        remote_bus = InvalidationBus(SQLiteStateBackend(path))
+        calls = []
+
+        local_bus.subscribe("catalog", lambda: calls.append("local"))
+        local_bus.subscribe("catalog", lambda: calls.append("local_remote_only"), local=False)
+        remote_bus.subscribe("catalog", lambda: calls.append("remote"))
+
+        local_bus.broadcast("catalog")
+        assert calls == ["local"]
+        assert local_bus.poll() == []
+
+        assert remote_bus.poll() == ["catalog"]
+        assert calls == ["local", "remote"]
+        assert remote_bus.poll() == []
+
+        remote_bus.broadcast("catalog")
+        assert local_bus.poll() == ["catalog"]
+        assert calls == ["local", "remote", "remote", "local", "local_remote_only"]
+
+        local_bus.backend.close()
+        remote_bus.backend.close()
+    logger.info("失效广播: ✅ 成功")
+
+
+def test_create_backend():
+    """按配置创建后端，不支持的类型抛出 ValueError"""
+    assert isinstance(create_shared_state_backend(""), MemoryStateBackend)
+    with tempfile.TemporaryDirectory() as directory:
+        backend = create_shared_state_backend("SQLite", os.path.join(directory, "nested", "state.db"))
+        assert isinstance(backend, SQLiteStateBackend)
+        backend.close()
+    try:
+        create_shared_state_backend("memcached")
+        raise AssertionError("应当抛出 ValueError")
+    except ValueError:
+        pass
+    logger.info("创建后端: ✅ 成功")
+
+
+def main():
+    """主函数"""
+    logger.info("开始共享状态后端测试")
+
+    test_memory_backend()
+    test_sqlite_backend_shared()
+    test_sqlite_concurrent_counters()
+    test_invalidation_bus()
+    test_create_backend()
+
+    logger.info("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+结构化响应部分结果恢复测试
+测试截断JSON的抢救、安全截断点扫描与无效条目剔除
+"""
+
+import json
+import logging
+import os
+import sys
+from typing import List
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pydantic import BaseModel
+
+from app.services.structured_recovery import (
+    _clean_trailing_commas, _cut_points, prune_invalid_items, salvage_json
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Faction(BaseModel):
+    """测试用势力条目"""
+    name: str
+    description: str
+
+
+class FactionList(BaseModel):
+    """测试用势力列表响应"""
+    factions: List[Faction]
+
+
+def test_complete_json_with_prose():
+    """JSON前后带说明文字时仍能完整解析"""
+    text = '以下是生成结果：\n{"factions": [{"name": "天医宗", "description": "正道领袖"}]}\n希望对你有帮助。'
+    result = salvage_json(text)
+
+    assert result is not None
+    assert result.complete
+    assert result.data == {"factions": [{"name": "天医宗", "description": "正道领袖"}]}
+    assert result.prefix.startswith("{") and result.prefix.endswith("}")
+    logger.info("前后说明文字: ✅ 成功")
+
+
+def test_truncated_array():
+    """数组在条目中途截断时只保留完整的成员，残缺条目交给剔除处理"""
+    text = '{"factions": [{"name": "天医宗", "description": "正道领袖"}, {"name": "无相殿", "descr'
+    result = salvage_json(text)
+
+    assert result is not None
+    assert not result.complete
+    assert result.data == {"factions": [
+        {"name": "天医宗", "description": "正道领袖"},
+        {"name": "无相殿"}
+    ]}
+    # 前缀停在最后一个完整成员之后，续写从这里接着输出
+    assert result.prefix == '{"factions": [{"name": "天医宗", "description": "正道领袖"}, {"name": "无相殿"'
+
+    pruned, dropped = prune_invalid_items(result.data, FactionList)
+    assert dropped == 1
+    assert pruned == {"factions": [{"name": "天医宗", "description": "正道领袖"}]}
+    logger.info("截断数组: ✅ 成功")
+
+
+def test_truncated_object():
+    """对象在成员中途截断时只保留完整的成员"""
+    text = '{"world_base": {"name": "九州"}, "factions": [{"name": "天医宗"}], "history": "上古'
+    result = salvage_json(text)
+
+    assert result is not None
+    assert not result.complete
+    assert result.data == {"world_base": {"name": "九州"}, "factions": [{"name": "天医宗"}]}
+    logger.info("截断对象: ✅ 成功")
+
+
+def test_truncated_after_prose():
+    """截断的JSON前有说明文字时仍从JSON起始处抢救"""
+    text = '好的，结果如下：{"factions": [{"name": "天医宗", "description": "正道领袖"}, {"na'
+    result = salvage_json(text)
+
+    assert result is not None
+    assert not result.complete
+    assert result.data == {"factions": [{"name": "天医宗", "description": "正道领袖"}, {}]}
+    logger.info("说明文字后截断: ✅ 成功")
+
+
+def test_comma_inside_string():
+    """字符串中的逗号与括号不被当作截断点，也不被清理"""
+    text = '{"factions": [{"name": "天医宗", "description": "正道领袖,]不容侵犯,}"}, {"na'
+    result = salvage_json(text)
+
+    assert result is not None
+    assert result.data["factions"][0] == {"name": "天医宗", "description": "正道领袖,]不容侵犯,}"}
+
+    start = text.index("{")
+    points = _cut_points(text, start, len(text))
+    string_start = text.index('"正道领袖')
+    string_end = text.index('"', string_start + 1)
+    assert all(not string_start < cut <= string_end for cut, _ in points)
+    logger.info("字符串内逗号: ✅ 成功")
+
+
+def test_cut_points_closers():
+    """安全截断点附带正确的闭合括号"""
+    text = '{"a": [1, 2'
+    points = _cut_points(text, 0, len(text))
+
+    assert (1, "}") in points
+    assert (7, "]}") in points
+    assert (8, "]}") in points
+    for cut, closers in points:
+        json.loads(_clean_trailing_commas(text[:cut] + closers))
+    logger.info("截断点闭合括号: ✅ 成功")
+
+
+def test_clean_trailing_commas():
+    """只移除字符串外的尾随逗号"""
+    text = '{"tags": ["剑修", "丹修",], "note": "甲, ]乙,}",}'
+    cleaned = _clean_trailing_commas(text)
+
+    assert json.loads(cleaned) == {"tags": ["剑修", "丹修"], "note": "甲, ]乙,}"}
+    # 转义引号不会提前结束字符串
+    escaped = '{"quote": "他说\\",}", "list": [1,]}'
+    assert json.loads(_clean_trailing_commas(escaped)) == {"quote": '他说",}', "list": [1]}
+    logger.info("尾随逗号清理: ✅ 成功")
+
+
+def test_prune_invalid_items():
+    """剔除缺少必填字段的数组条目，保留有效条目"""
+    data = {
+        "factions": [
+            {"name": "天医宗", "description": "正道领袖"},
+            {"name": "无相殿"},
+            {"name": "万剑阁", "description": "剑修圣地"},
+            {"description": "缺少名称"}
+        ]
+    }
+    pruned, dropped = prune_invalid_items(data, FactionList)
+
+    assert dropped == 2
+    assert [item["name"] for item in pruned["factions"]] == ["天医宗", "万剑阁"]
+    FactionList.model_validate(pruned)
+    logger.info("剔除无效条目: ✅ 成功")
+
+
+def test_prune_keeps_top_level_errors():
+    """缺少顶层必填部分时不剔除，原样返回交给调用方"""
+    data = {"world_base": {"name": "九州"}}
+    pruned, dropped = prune_invalid_items(data, FactionList)
+
+    assert dropped == 0
+    assert pruned == {"world_base": {"name": "九州"}}
+    logger.info("顶层错误保留: ✅ 成功")
+
+
+def test_no_json():
+    """没有任何JSON时返回None"""
+    assert salvage_json("抱歉，我无法完成这个请求。") is None
+    logger.info("无JSON: ✅ 成功")
+
+
+def main():
+    """主函数"""
+    logger.info("开始结构化响应恢复测试")
+
+    test_complete_json_with_prose()
+    test_truncated_array()
+    test_truncated_object()
+    test_truncated_after_prose()
+    test_comma_inside_string()
+    test_cut_points_closers()
+    test_clean_trailing_commas()
+    test_prune_invalid_items()
+    test_prune_keeps_top_level_errors()
+    test_no_json()
+
+    logger.info("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()
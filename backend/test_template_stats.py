@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+角色模板统计快照测试
+测试用户统计的加载、LRU淘汰与过期，以及加载时不持有快照锁
+"""
+
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  注册全部模型
+from app.models.base import Base
+from app.models.character import Character
+from app.models.character_template import (
+    CharacterTemplateDetail, CharacterTemplateFavorite, CharacterTemplateUsage
+)
+from app.models.novel import Novel, NovelGenre
+from app.models.user import User
+from app.services.template_stats import TemplateStatsSnapshot
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def create_session():
+    """创建内存数据库并写入两个用户、三个模板及使用与收藏记录"""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    users = [User(username=f"user{i}", email=f"user{i}@test.com", password_hash="x") for i in range(3)]
+    db.add_all(users)
+    db.flush()
+    novel = Novel(title="测试小说", genre=NovelGenre.FANTASY, author="作者", user_id=users[0].id)
+    db.add(novel)
+
+    templates = []
+    for i, tags in enumerate([["法师", "善良"], ["战士"], ["法师", "邪恶"]]):
+        template = Character(
+            name=f"模板{i}", gender="male", character_type="supporting",
+            tags=tags, is_template=True, user_id=users[0].id
+        )
+        db.add(template)
+        db.flush()
+        db.add(CharacterTemplateDetail(character_id=template.id, usage_count=i))
+        templates.append(template)
+    db.flush()
+
+    for template in (templates[0], templates[2]):
+        db.add(CharacterTemplateUsage(template_id=template.id, user_id=users[0].id, novel_id=novel.id))
+    db.add(CharacterTemplateFavorite(character_id=templates[1].id, user_id=users[0].id))
+    db.commit()
+    return engine, db, [user.id for user in users], [template.id for template in templates]
+
+
+def test_user_stats():
+    """用户统计包含使用数量、收藏数量与常用标签"""
+    engine, db, user_ids, _ = create_session()
+    snapshot = TemplateStatsSnapshot()
+
+    result = snapshot.get_stats(db, user_ids[0])
+
+    assert result["total_templates"] == 3
+    assert result["user_stats"]["templates_used"] == 2
+    assert result["user_stats"]["favorite_count"] == 1
+    assert result["user_stats"]["most_used_tags"][0] == "法师"
+    logger.info("用户统计: ✅ 成功")
+
+
+def test_user_stats_bounded():
+    """超出上限时淘汰最久未访问的用户，过期的用户统计重新加载"""
+    engine, db, user_ids, _ = create_session()
+    snapshot = TemplateStatsSnapshot(max_users=2, user_ttl=3600)
+
+    for user_id in user_ids:
+        snapshot.get_stats(db, user_id)
+    assert list(snapshot._users) == user_ids[1:]
+
+    snapshot.get_stats(db, user_ids[1])
+    assert list(snapshot._users) == [user_ids[2], user_ids[1]]
+
+    snapshot.user_ttl = 0
+    stale = snapshot._users[user_ids[1]]
+    time.sleep(0.01)
+    snapshot.get_stats(db, user_ids[1])
+    assert snapshot._users[user_ids[1]] is not stale
+    logger.info("用户统计上限与过期: ✅ 成功")
+
+
+def test_queries_outside_lock():
+    """重建快照与加载用户统计时不持有快照锁"""
+    engine, db, user_ids, _ = create_session()
+    snapshot = TemplateStatsSnapshot()
+    held = []
+
+    def record(*args, **kwargs):
+        held.append(snapshot._lock._is_owned())
+
+    event.listen(engine, "before_cursor_execute", record)
+    snapshot.get_stats(db, user_ids[0])
+    event.remove(engine, "before_cursor_execute", record)
+
+    assert held and not any(held)
+    logger.info("锁外查询: ✅ 成功")
+
+
+def test_events_update_loaded_user():
+    """使用与收藏事件增量更新已加载的用户统计"""
+    engine, db, user_ids, template_ids = create_session()
+    snapshot = TemplateStatsSnapshot()
+    snapshot.get_stats(db, user_ids[0])
+
+    snapshot.record_usage(user_ids[0], template_ids[1], NovelGenre.FANTASY)
+    snapshot.record_favorite(user_ids[0], False)
+    result = snapshot.get_stats(db, user_ids[0])
+
+    assert result["total_usages"] == 0 + 1 + 2 + 1
+    assert result["user_stats"]["templates_used"] == 3
+    assert result["user_stats"]["favorite_count"] == 0
+    logger.info("增量事件: ✅ 成功")
+
+
+def main():
+    """主函数"""
+    logger.info("开始模板统计快照测试")
+
+    test_user_stats()
+    test_user_stats_bounded()
+    test_queries_outside_lock()
+    test_events_update_loaded_user()
+
+    logger.info("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()
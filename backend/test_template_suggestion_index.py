@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+角色模板搜索建议索引测试
+测试大量匹配时的排序与截取、前缀优先以及增量更新
+"""
+
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.template_suggestion_index import TemplateSuggestionIndex
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def build_index(templates):
+    """不经过数据库直接构建索引：templates 为 (ID, 名称, 标签, 力量体系, 世界, 使用次数)"""
+    index = TemplateSuggestionIndex(refresh_interval=3600)
+    for template_id, name, tags, power_system, world, usage_count in templates:
+        index._add_template(template_id, name, tags, power_system, world, usage_count, sort=False)
+    index._suffixes.sort()
+    index._loaded = True
+    index._built_at = time.monotonic()
+    return index
+
+
+def texts(suggestions, term_type):
+    """取出某一类型的建议文本"""
+    return [item["text"] for item in suggestions if item["type"] == term_type]
+
+
+def test_ranking_covers_all_matches():
+    """匹配数量很多时，排在有序数组末尾的高权重词条也能被选中"""
+    templates = [(i, f"剑客{i:04d}", [], None, None, 1) for i in range(5000)]
+    # "剑客王" 的后缀排在所有 "剑客0000"~"剑客4999" 之后
+    templates.append((9999, "剑客王", [], None, None, 500))
+    index = build_index(templates)
+
+    names = texts(index.suggest(None, "剑客"), "character_name")
+
+    assert len(names) == 5
+    assert names[0] == "剑客王"
+    logger.info("大量匹配排序: ✅ 成功")
+
+
+def test_prefix_before_substring():
+    """前缀匹配优先于子串匹配，同类按权重排序"""
+    index = build_index([
+        (1, "青云剑仙", [], None, None, 100),
+        (2, "剑仙李白", [], None, None, 1),
+        (3, "剑心", [], None, None, 5),
+    ])
+
+    names = texts(index.suggest(None, "剑"), "character_name")
+
+    assert names == ["剑心", "剑仙李白", "青云剑仙"]
+    logger.info("前缀优先: ✅ 成功")
+
+
+def test_type_limits_and_counts():
+    """每种类型按上限截取，标签的 match_count 为使用该标签的模板数量"""
+    templates = [(i, f"角色{i}", ["火系", f"火焰{i}"], "火灵根", None, i) for i in range(10)]
+    index = build_index(templates)
+
+    suggestions = index.suggest(None, "火")
+    tags = [item for item in suggestions if item["type"] == "tag"]
+    power_systems = [item for item in suggestions if item["type"] == "power_system"]
+
+    assert len(tags) == 3
+    assert tags[0] == {"text": "火系", "type": "tag", "match_count": 10}
+    assert power_systems == [{"text": "火灵根", "type": "power_system", "match_count": 10}]
+    logger.info("类型上限: ✅ 成功")
+
+
+def test_incremental_updates():
+    """使用事件提升权重，删除模板后词条移出索引"""
+    index = build_index([
+        (1, "天剑", [], None, None, 1),
+        (2, "天刀", [], None, None, 2),
+    ])
+    assert texts(index.suggest(None, "天"), "character_name") == ["天刀", "天剑"]
+
+    index.record_usage(1, 5)
+    assert texts(index.suggest(None, "天"), "character_name") == ["天剑", "天刀"]
+
+    index.remove_template(1)
+    assert texts(index.suggest(None, "天"), "character_name") == ["天刀"]
+    assert index.suggest(None, "剑") == []
+    logger.info("增量更新: ✅ 成功")
+
+
+def main():
+    """主函数"""
+    logger.info("开始搜索建议索引测试")
+
+    test_ranking_covers_all_matches()
+    test_prefix_before_substring()
+    test_type_limits_and_counts()
+    test_incremental_updates()
+
+    logger.info("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -50,5 +50,59 @@ def test_conversion():
         print("❌ 无法提取JSON数据")
         return False
 
+def test_missing_world_base():
+    """缺少或为空的世界基础设定应视为转换失败"""
+    cases = {
+        "空对象": {},
+        "原始文本": {"content": "这是一段没有按格式输出的世界观描述"},
+        "空world_base": {"world_base": {}, "factions": [{"name": "天医宗"}]},
+        "world_base字段全空": {"world_base": {"name": "", "rules": []}},
+        "world_base非对象": {"world_base": "九州大陆"}
+    }
+
+    for name, data in cases.items():
+        try:
+            WorldviewConverter.convert_ai_response(data, user_id=1, novel_id=1)
+        except ValueError as e:
+            print(f"✅ {name}: 转换失败 - {str(e)}")
+            continue
+        print(f"❌ {name}: 未报错")
+        raise AssertionError(f"{name} 应当转换失败")
+
+    return True
+
+
+def test_partial_world_base():
+    """世界基础只有部分字段时正常转换，缺失字段使用默认值"""
+    result = WorldviewConverter.convert_ai_response(
+        {"world_base": {"name": "九州"}}, user_id=1, novel_id=1
+    )
+    assert result["worldview"].name == "九州"
+    assert result["world_maps"] == []
+    print("✅ 部分字段的世界基础转换成功")
+    return True
+
+
+def test_missing_generated_worldview():
+    """保存生成结果时缺少世界观基础信息应视为失败"""
+    for data in ({}, {"worldview": {}}, {"world_maps": [{"name": "东域"}]}):
+        try:
+            WorldviewConverter.convert_generated_to_database_format(data)
+        except ValueError as e:
+            print(f"✅ {list(data) or '空对象'}: 转换失败 - {str(e)}")
+            continue
+        raise AssertionError(f"{data} 应当转换失败")
+
+    database_data = WorldviewConverter.convert_generated_to_database_format(
+        {"worldview": {"name": "九州"}, "world_maps": [{"name": "东域"}]}
+    )
+    assert len(database_data["world_maps"]) == 1
+    print("✅ 包含世界观基础信息的生成结果转换成功")
+    return True
+
+
 if __name__ == "__main__":
-    test_conversion()
\ No newline at end of file
+    test_conversion()
+    test_missing_world_base()
+    test_partial_world_base()
+    test_missing_generated_worldview()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+世界观分段生成测试
+测试结构化生成请求的输出上限传递，以及分段生成时各部分使用自己的输出上限
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from pydantic import BaseModel
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  注册全部模型
+from app.models.base import Base
+from app.schemas.ai_worldview import AIPowerSystem, AIWorldBase
+from app.schemas.worldview import WorldviewGenerationRequest
+from app.services.ai_service import AIModelAdapter, AIService
+from app.services.generation_service import GenerationService
+from app.services.prompt_service import PromptService
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class RecordingAdapter(AIModelAdapter):
+    """记录每次请求的输出上限，并返回满足校验模型的最小结果"""
+
+    def __init__(self):
+        self.calls: List[Tuple[Optional[int], Optional[Type[BaseModel]]]] = []
+
+    async def generate_text(self, prompt: str, max_tokens: Optional[int] = None,
+                            temperature: Optional[float] = None, **kwargs) -> str:
+        self.calls.append((max_tokens, None))
+        return "生成内容"
+
+    async def generate_structured_response(
+        self,
+        prompt: str,
+        response_format: Dict[str, Any],
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        response_model: Optional[Type[BaseModel]] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        self.calls.append((max_tokens, response_model))
+        if response_model in (AIWorldBase, AIPowerSystem):
+            return {"name": "九州", "description": "描述", "background": "背景"}
+        return {}
+
+
+def create_ai_service() -> Tuple[AIService, RecordingAdapter]:
+    """创建只包含记录适配器的AI服务"""
+    service = AIService()
+    adapter = RecordingAdapter()
+    service.adapters = {"recording": adapter}
+    service.default_adapter = "recording"
+    return service, adapter
+
+
+def test_structured_max_tokens_passed():
+    """调用方指定的输出上限原样传给适配器，未指定时使用默认上限"""
+    service, adapter = create_ai_service()
+
+    asyncio.run(service.generate_structured_response("提示词", {}, max_tokens=2000))
+    asyncio.run(service.generate_structured_response("提示词", {}))
+
+    assert [max_tokens for max_tokens, _ in adapter.calls] == [2000, 30000]
+    logger.info("输出上限传递: ✅ 成功")
+
+
+def test_section_max_tokens_honoured():
+    """分段生成时每个部分按自己的输出上限请求"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    generation_service = GenerationService(PromptService(db))
+    generation_service.ai_service, adapter = create_ai_service()
+
+    request = WorldviewGenerationRequest(novel_id=1, include_novel_settings=False, decomposed=True)
+    response = asyncio.run(generation_service.generate_worldview(request))
+
+    assert response.success
+    sections = GenerationService.WORLDVIEW_SECTIONS
+    expected = sorted((spec["max_tokens"], spec["model"].__name__) for spec in sections.values())
+    actual = sorted((max_tokens, model.__name__) for max_tokens, model in adapter.calls)
+    assert actual == expected
+    assert adapter.calls[0] == (sections["world_base"]["max_tokens"], AIWorldBase)
+    logger.info("分段输出上限: ✅ 成功")
+
+
+def main():
+    """主函数"""
+    logger.info("开始世界观分段生成测试")
+
+    test_structured_max_tokens_passed()
+    test_section_max_tokens_honoured()
+
+    logger.info("\n测试完成！")
+
+
+if __name__ == "__main__":
+    main()